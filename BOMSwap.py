@@ -1,29 +1,97 @@
-﻿import argparse
+﻿import time
+_startup_time = time.perf_counter()  # 程序开始加载的时间，用于统计启动耗时
+import argparse
 import logging
-import pandas as pd
+import logging.handlers
+import importlib
 from pathlib import Path
 from pathlib import Path
 import os
-import time
 import sys
 import json
-import openpyxl
-import openpyxl.utils
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+import re
+import hashlib
+import lzma
+import struct
+import pickle
+import zlib
+import sqlite3
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, StringVar
 import tkinter.messagebox
+import threading
+import queue
 from threading import Thread
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+import atexit
 import traceback  # 增加traceback模块用于详细错误信息
+from collections import deque
+import bisect
+import itertools
 
-# 添加更新功能所需的库
-import requests
+# 添加更新功能所需的库（requests和packaging在检查更新时才导入）
 import tempfile
 import shutil
 import zipfile
 import subprocess
 import platform
-from packaging import version as pkg_version
+
+class LazyImport:
+    """
+    延迟导入的模块或模块中的对象，第一次使用时才导入
+
+    pandas、openpyxl导入较慢，延迟导入后主窗口可以先显示。导入后用真实对象替换本模块中的同名全局变量，
+    之后的访问不再经过代理。
+    """
+    def __init__(self, alias, module_name, attr=None):
+        self._alias = alias
+        self._module_name = module_name
+        self._attr = attr
+
+    def _load(self):
+        target = importlib.import_module(self._module_name)
+        if self._attr:
+            target = getattr(target, self._attr)
+        globals()[self._alias] = target
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+pd = LazyImport('pd', 'pandas')
+openpyxl = LazyImport('openpyxl', 'openpyxl')
+Font = LazyImport('Font', 'openpyxl.styles', 'Font')
+PatternFill = LazyImport('PatternFill', 'openpyxl.styles', 'PatternFill')
+Border = LazyImport('Border', 'openpyxl.styles', 'Border')
+Side = LazyImport('Side', 'openpyxl.styles', 'Side')
+Alignment = LazyImport('Alignment', 'openpyxl.styles', 'Alignment')
+WriteOnlyCell = LazyImport('WriteOnlyCell', 'openpyxl.cell', 'WriteOnlyCell')
+
+# 处理引擎使用的延迟导入对象
+ENGINE_MODULE_NAMES = ('pd', 'openpyxl', 'Font', 'PatternFill', 'Border', 'Side', 'Alignment', 'WriteOnlyCell')
+
+def engine_modules_loaded():
+    """处理引擎使用的模块是否都已导入"""
+    return not any(isinstance(globals()[name], LazyImport) for name in ENGINE_MODULE_NAMES)
+
+def preload_modules():
+    """导入处理引擎使用的模块（pandas、openpyxl），在后台线程或处理进程启动时调用"""
+    start_time = time.perf_counter()
+    for name in ENGINE_MODULE_NAMES:
+        target = globals()[name]
+        if isinstance(target, LazyImport):
+            target._load()
+    logging.info(f"处理模块导入完成，耗时{time.perf_counter() - start_time:.2f}秒")
+
+# 可选依赖：安装tkinterdnd2后批量处理窗口支持直接拖入文件和文件夹
+try:
+    from tkinterdnd2 import TkinterDnD, DND_FILES
+except ImportError:
+    TkinterDnD = None
 
 # 定义版本信息和更新相关常量
 APP_NAME = "BOM替代料工具"
@@ -35,36 +103,55 @@ UPDATE_CHECK_INTERVAL = 7  # 天
 # 定义下载重试次数和超时时间
 DOWNLOAD_MAX_RETRIES = 3  # 最大重试次数
 DOWNLOAD_TIMEOUT = 30     # 下载超时时间(秒)
-DOWNLOAD_CHUNK_SIZE = 8192  # 下载块大小
+DOWNLOAD_CHUNK_SIZE = 8192  # 下载块大小（最小值，实际块大小根据下载速度在此与DOWNLOAD_MAX_CHUNK_SIZE之间调整）
+DOWNLOAD_MAX_CHUNK_SIZE = 1024 * 1024  # 最大下载块大小
+DOWNLOAD_SEGMENTS = 4  # 服务器支持Range请求时同时下载的分段数
+DOWNLOAD_MIN_SEGMENT_SIZE = 1024 * 1024  # 每个分段的最小字节数，小文件不分段
+DOWNLOAD_PROGRESS_INTERVAL = 0.2  # 下载进度回调的最小间隔(秒)
+DELTA_MAGIC = b'BOMSWAPDELTA1'  # 增量更新包的文件头
+DELTA_BLOCK_SIZE = 2048  # 生成增量更新包时匹配旧版本的块大小
+DELTA_LITERAL_CHUNK = 1024 * 1024  # 增量更新包中单条新增数据的最大字节数
+
+# 检查更新：有条件请求，短连接超时，失败后按指数退避重试
+UPDATE_API_URL = os.environ.get('BOMSWAP_UPDATE_URL', GITHUB_API_URL)  # 可通过环境变量指向本地测试服务器
+UPDATE_CONNECT_TIMEOUT = 3  # 检查更新的连接超时时间(秒)，离线时很快失败
+UPDATE_READ_TIMEOUT = 10    # 检查更新的读取超时时间(秒)
+UPDATE_RETRY_BASE = 3600    # 检查失败后首次重试的间隔(秒)，之后每次失败翻倍，最长UPDATE_CHECK_INTERVAL天
+UPDATE_STARTUP_DELAY = 2    # 启动后延迟检查更新的时间(秒)，让主界面先加载完成
 
 # 配置文件路径
 # 在程序目录下创建配置文件
+_program_dir = None  # 程序目录，每个进程只确定一次
+
 def get_program_dir():
-    """获取程序目录"""
+    """获取程序目录（每个进程只确定一次）"""
+    global _program_dir
+    if _program_dir is None:
+        _program_dir = detect_program_dir()
+    return _program_dir
+
+def detect_program_dir():
+    """确定程序目录"""
     try:
         # 首先尝试获取exe文件所在目录（打包环境）
         if getattr(sys, 'frozen', False):
             exe_dir = os.path.dirname(sys.executable)
-            print(f"使用exe所在目录: {exe_dir}")
             logging.info(f"使用exe所在目录: {exe_dir}")
             return exe_dir
 
         # 如果不是frozen环境，尝试使用resource_path获取程序目录
         base_path = os.path.dirname(resource_path(""))
-        print(f"使用打包环境程序目录: {base_path}")
         logging.info(f"使用打包环境程序目录: {base_path}")
         return base_path
     except Exception as e:
         # 如果上述方法都失败，使用__file__获取程序目录（开发环境）
         try:
             program_dir = os.path.dirname(os.path.abspath(__file__))
-            print(f"使用开发环境程序目录: {program_dir}")
             logging.info(f"使用开发环境程序目录: {program_dir}")
             return program_dir
         except Exception as e2:
             # 如果所有方法都失败，使用当前工作目录
             current_dir = os.getcwd()
-            print(f"所有方法获取程序目录失败，使用当前工作目录: {current_dir}, 错误: {e}, {e2}")
             logging.error(f"所有方法获取程序目录失败，使用当前工作目录: {current_dir}, 错误: {e}, {e2}")
             return current_dir
 
@@ -73,8 +160,11 @@ CONFIG_FILE = os.path.join(get_program_dir(), "config.json")
 
 # 性能优化：缓存一些常用的配置和计算结果
 _config_cache = None
+_config_lock = threading.RLock()  # 保护_config_cache，界面线程、处理线程和检查更新线程都会读写配置
 _default_font = None
 _config_file_path = None  # 保存成功加载的配置文件路径
+root = None  # 主窗口，create_gui中创建
+startup_benchmark = False  # 启动耗时测试模式：主窗口显示完成后输出耗时并退出
 
 # 定义全局颜色变量
 header_bg_color = "0078D4"  # 微软蓝
@@ -82,9 +172,14 @@ default_highlight_color = "FFFFC0"  # 浅黄色，用于替代料
 
 # 删除不再需要的ensure_config_dir函数
 
+_writable_dirs = {}  # 目录是否可写的判断结果，每个目录每个进程只检查一次
+
 def check_directory_writable(directory):
     """
-    检查目录是否可写，通过尝试创建一个临时文件
+    检查目录是否可写，结果按目录缓存
+
+    不创建临时文件测试写入（网络目录上每次测试都很慢），而是使用os.access判断；
+    实际写入失败时由mark_directory_unwritable更正判断结果。
 
     Args:
         directory: 要检查的目录路径
@@ -92,49 +187,47 @@ def check_directory_writable(directory):
     Returns:
         bool: 目录是否可写
     """
+    directory = os.path.abspath(directory)
+    if directory not in _writable_dirs:
+        _writable_dirs[directory] = probe_directory_writable(directory)
+    return _writable_dirs[directory]
+
+def mark_directory_unwritable(directory):
+    """记录目录实际写入失败，之后不再尝试写入该目录"""
+    _writable_dirs[os.path.abspath(directory)] = False
+
+def probe_directory_writable(directory):
+    """检查目录是否存在（不存在时创建）且有写权限"""
     if not os.path.exists(directory):
         try:
             os.makedirs(directory)
-            print(f"创建目录成功: {directory}")
             logging.info(f"创建目录成功: {directory}")
         except Exception as e:
-            print(f"创建目录失败: {e}")
             logging.error(f"创建目录失败: {e}")
             return False
 
     # 检查目录是否可写
     if not os.access(directory, os.W_OK):
-        print(f"警告: 目录不可写: {directory}")
         logging.warning(f"目录不可写: {directory}")
         return False
 
-    # 尝试创建临时文件
-    test_file = os.path.join(directory, "write_test.tmp")
-    try:
-        with open(test_file, 'w') as f:
-            f.write("测试写入权限")
-        os.remove(test_file)
-        print(f"目录可写: {directory}")
-        logging.info(f"目录可写: {directory}")
-        return True
-    except Exception as e:
-        print(f"目录写入测试失败: {directory}, 错误: {e}")
-        logging.error(f"目录写入测试失败: {directory}, 错误: {e}")
-        return False
+    logging.info(f"目录可写: {directory}")
+    return True
 
-def save_config(config):
-    """保存配置到文件"""
-    global _config_cache, _config_file_path, CONFIG_FILE
+_config_save_dirs = None  # 可以保存配置文件的目录列表，每个进程只确定一次
+
+def get_config_save_dirs():
+    """
+    获取可以保存配置文件的目录，按优先级排列：程序目录、当前工作目录、用户文档目录、用户主目录
 
-    # 更新缓存
-    _config_cache = config
+    Returns:
+        list: (目录, 描述)列表
+    """
+    global _config_save_dirs
+    if _config_save_dirs is not None:
+        return _config_save_dirs
 
-    # 获取程序目录
     program_dir = get_program_dir()
-    print(f"尝试保存配置到程序目录: {program_dir}")
-    logging.info(f"尝试保存配置到程序目录: {program_dir}")
-
-    # 尝试的保存路径列表
     save_paths = []
 
     # 1. 首先尝试程序目录
@@ -151,7 +244,6 @@ def save_config(config):
         if os.path.exists(user_docs) and program_dir != user_docs and current_dir != user_docs:
             save_paths.append((user_docs, "用户文档目录"))
     except Exception as e:
-        print(f"获取用户文档目录失败: {e}")
         logging.error(f"获取用户文档目录失败: {e}")
 
     # 4. 尝试用户主目录
@@ -160,47 +252,141 @@ def save_config(config):
         if program_dir != user_home and current_dir != user_home:
             save_paths.append((user_home, "用户主目录"))
     except Exception as e:
-        print(f"获取用户主目录失败: {e}")
         logging.error(f"获取用户主目录失败: {e}")
 
-    # 依次尝试每个路径
-    for save_dir, dir_desc in save_paths:
+    _config_save_dirs = save_paths
+    return save_paths
+
+CONFIG_SAVE_DELAY = 1.0  # 配置修改后延迟保存的秒数，连续修改只写一次文件
+
+# 保护待保存的配置和延迟保存定时器；同时需要_config_lock时先取得_config_lock，
+# 缓存的更新和待保存内容的更新在同一次加锁中完成，不会用较早的配置覆盖较新的保存
+_config_save_lock = threading.RLock()
+_pending_config_text = None  # 已修改但尚未写入文件的配置内容
+_config_save_timer = None  # 延迟保存定时器
+
+def serialize_config(config):
+    """把配置转换为写入文件的JSON文本"""
+    return json.dumps(config, ensure_ascii=False, indent=4)
+
+def save_config(config):
+    """立即保存配置到文件（用于用户在设置窗口中点击保存等需要确认结果的场合）"""
+    global _config_cache, _pending_config_text
+
+    # 更新缓存并丢弃尚未写入的较早修改
+    with _config_lock, _config_save_lock:
+        _config_cache = config
+        cancel_config_save_timer()
+        _pending_config_text = None
+        return write_config_text(serialize_config(config))
+
+def mark_config_dirty(config):
+    """
+    记录配置已修改，延迟CONFIG_SAVE_DELAY秒后在后台线程写入文件
+
+    选择文件、处理过程中自动更新配置时使用，调用方不会等待文件写入；
+    期间的多次修改合并为一次写入，程序退出时写入尚未保存的修改。
+
+    Args:
+        config: 修改后的配置
+    """
+    global _config_cache, _pending_config_text, _config_save_timer
+
+    with _config_lock, _config_save_lock:
+        _config_cache = config
+        # 在调用线程中转换为文本，后台线程写入时配置字典可能仍在被修改
+        _pending_config_text = serialize_config(config)
+        cancel_config_save_timer()
+        _config_save_timer = threading.Timer(CONFIG_SAVE_DELAY, flush_config)
+        _config_save_timer.daemon = True
+        _config_save_timer.start()
+
+def cancel_config_save_timer():
+    """取消尚未执行的延迟保存（调用方需持有_config_save_lock）"""
+    global _config_save_timer
+    if _config_save_timer is not None:
+        _config_save_timer.cancel()
+        _config_save_timer = None
+
+def flush_config():
+    """
+    写入尚未保存的配置修改
+
+    Returns:
+        bool: 没有待保存的修改或保存成功时返回True
+    """
+    global _pending_config_text
+    with _config_save_lock:
+        cancel_config_save_timer()
+        text = _pending_config_text
+        _pending_config_text = None
+        if text is None:
+            return True
+        return write_config_text(text)
+
+atexit.register(flush_config)
+
+def write_config_file(config_path, text):
+    """
+    原子地写入配置文件：先写入同目录下的临时文件，再替换原文件，程序中途退出也不会留下写了一半的配置文件
+
+    Args:
+        config_path: 配置文件路径
+        text: 配置内容
+    """
+    temp_path = config_path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, config_path)
+    except Exception:
         try:
-            # 检查目录是否可写
-            if check_directory_writable(save_dir):
-                config_path = os.path.join(save_dir, 'config.json')
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        except OSError:
+            pass
+        raise
 
-                # 尝试保存配置
-                try:
-                    with open(config_path, 'w', encoding='utf-8') as f:
-                        json.dump(config, f, ensure_ascii=False, indent=4)
-
-                    print(f"配置已成功保存到{dir_desc}: {config_path}")
-                    logging.info(f"配置已成功保存到{dir_desc}: {config_path}")
-
-                    # 更新成功加载的配置文件路径
-                    _config_file_path = config_path
-
-                    # 如果不是保存到程序目录，且程序目录是CONFIG_FILE的目录，更新CONFIG_FILE
-                    if save_dir != program_dir and os.path.dirname(CONFIG_FILE) == program_dir:
-                        CONFIG_FILE = config_path
-                        print(f"已更新CONFIG_FILE路径为: {CONFIG_FILE}")
-                        logging.info(f"已更新CONFIG_FILE路径为: {CONFIG_FILE}")
-
-                    return True
-                except Exception as e:
-                    print(f"保存配置到{dir_desc}失败: {e}")
-                    logging.error(f"保存配置到{dir_desc}失败: {e}")
-                    # 继续尝试下一个路径
-            else:
-                print(f"{dir_desc}不可写: {save_dir}")
-                logging.warning(f"{dir_desc}不可写: {save_dir}")
+def write_config_text(text):
+    """写入配置文件，优先写入已加载的配置文件，该目录不可写时依次尝试其他目录"""
+    global _config_file_path, CONFIG_FILE
+
+    program_dir = get_program_dir()
+    save_paths = list(get_config_save_dirs())
+    if _config_file_path:
+        known_dir = os.path.dirname(_config_file_path)
+        save_paths = [(known_dir, "配置文件所在目录")] + [path for path in save_paths if path[0] != known_dir]
+
+    # 依次尝试每个路径，目录可写性只在第一次保存时检查
+    for save_dir, dir_desc in save_paths:
+        if not check_directory_writable(save_dir):
+            continue
+        config_path = os.path.join(save_dir, 'config.json')
+
+        # 尝试保存配置
+        try:
+            write_config_file(config_path, text)
         except Exception as e:
-            print(f"检查{dir_desc}可写性时出错: {e}")
-            logging.error(f"检查{dir_desc}可写性时出错: {e}")
+            logging.error(f"保存配置到{dir_desc}失败: {e}")
+            # 记录该目录不可写，继续尝试下一个路径
+            mark_directory_unwritable(save_dir)
+            continue
+
+        logging.info(f"配置已成功保存到{dir_desc}: {config_path}")
+
+        # 更新成功加载的配置文件路径
+        if config_path != _config_file_path:
+            _config_file_path = config_path
+            logging.info(f"配置已保存到{dir_desc}: {config_path}")
+
+            # 如果不是保存到程序目录，且程序目录是CONFIG_FILE的目录，更新CONFIG_FILE
+            if save_dir != program_dir and os.path.dirname(CONFIG_FILE) == program_dir:
+                CONFIG_FILE = config_path
+                logging.info(f"已更新CONFIG_FILE路径为: {CONFIG_FILE}")
+
+        return True
 
     # 所有路径都尝试失败
-    print("所有尝试的路径都无法保存配置文件")
     logging.error("所有尝试的路径都无法保存配置文件")
 
     # 最后尝试直接保存到CONFIG_FILE指定的路径
@@ -210,17 +396,14 @@ def save_config(config):
         if not os.path.exists(config_dir):
             os.makedirs(config_dir)
 
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        write_config_file(CONFIG_FILE, text)
 
-        print(f"配置已成功保存到CONFIG_FILE路径: {CONFIG_FILE}")
         logging.info(f"配置已成功保存到CONFIG_FILE路径: {CONFIG_FILE}")
 
         # 更新成功加载的配置文件路径
         _config_file_path = CONFIG_FILE
         return True
     except Exception as e:
-        print(f"保存配置到CONFIG_FILE路径失败: {e}")
         logging.error(f"保存配置到CONFIG_FILE路径失败: {e}")
         return False
 
@@ -233,7 +416,6 @@ def load_default_config(use_builtin_defaults=False):
     """
     # 如果要求使用内置默认配置，直接返回内置默认值
     if use_builtin_defaults:
-        print("使用内置默认配置")
         logging.info("使用内置默认配置")
         return get_builtin_default_config()
 
@@ -244,7 +426,6 @@ def load_default_config(use_builtin_defaults=False):
     program_dir = get_program_dir()
     program_config = os.path.join(program_dir, 'config.json')
     possible_paths.append(program_config)
-    print(f"使用程序目录配置路径: {program_config}")
     logging.info(f"使用程序目录配置路径: {program_config}")
 
     # 如果程序目录与当前工作目录不同，也尝试从当前工作目录加载
@@ -252,37 +433,34 @@ def load_default_config(use_builtin_defaults=False):
     if program_dir != current_dir:
         current_config = os.path.join(current_dir, 'config.json')
         possible_paths.append(current_config)
-        print(f"备用：当前工作目录配置路径: {current_config}")
         logging.info(f"备用：当前工作目录配置路径: {current_config}")
 
     # 打印当前工作目录和程序目录，帮助调试
-    print(f"当前工作目录: {os.getcwd()}")
-    print(f"程序目录: {os.path.dirname(os.path.abspath(__file__))}")
+    logging.debug(f"当前工作目录: {os.getcwd()}")
+    logging.debug(f"程序目录: {os.path.dirname(os.path.abspath(__file__))}")
 
     # 尝试从每个可能的路径加载配置
     for config_path in possible_paths:
-        print(f"尝试加载配置文件: {config_path}")
         logging.info(f"尝试加载配置文件: {config_path}")
 
         if os.path.exists(config_path):
-            print(f"配置文件存在: {config_path}")
             logging.info(f"配置文件存在: {config_path}")
 
             try:
                 with open(config_path, 'r', encoding='utf-8') as f:
                     file_content = f.read()
-                    print(f"配置文件内容: {file_content}")
+                    logging.debug(f"配置文件内容: {file_content}")
 
                     # 重新打开文件进行JSON解析
                     f.seek(0)
                     default_settings = json.load(f)
 
                 # 打印加载的配置内容，用于调试
-                print(f"从文件加载的配置内容: {default_settings}")
+                logging.debug(f"从文件加载的配置内容: {default_settings}")
 
                 # 检查配置文件中是否包含必要的键
                 if 'bom_header_mapping' not in default_settings or 'sub_header_mapping' not in default_settings:
-                    print(f"配置文件 {config_path} 缺少必要的键，跳过")
+                    logging.warning(f"配置文件 {config_path} 缺少必要的键，跳过")
                     continue
 
                 # 添加其他必要的默认配置项
@@ -293,13 +471,31 @@ def load_default_config(use_builtin_defaults=False):
                     'sub_header_mapping': default_settings['sub_header_mapping'],
                     'highlight_color': default_settings.get('highlight_color', default_highlight_color),
                     'last_update_check': 0,  # 上次检查更新的时间戳
-                    'last_used_header_mapping': {}  # 上次使用的表头映射
+                    'update_cache': {},  # 缓存的最新发布信息和ETag
+                    'last_used_header_mapping': {},  # 上次使用的表头映射
+                    'prune_columns': default_settings.get('prune_columns', False),  # 是否只读取映射列
+                    'passthrough_columns': default_settings.get('passthrough_columns', []),  # 额外保留的列
+                    'chunked_mode': default_settings.get('chunked_mode', False),  # 是否分块处理
+                    'chunk_rows': default_settings.get('chunk_rows', 5000),  # 每块最大行数
+                    'memory_budget_mb': default_settings.get('memory_budget_mb', 512),  # 分块处理的内存预算
+                    'parallel_workers': default_settings.get('parallel_workers', 1),  # 并行处理的进程数
+                    'process_all_sheets': default_settings.get('process_all_sheets', False),  # 是否处理所有BOM工作表
+                    'variant_columns': default_settings.get('variant_columns', []),  # 变体列
+                    'dnp_markers': default_settings.get('dnp_markers', ['DNP', 'NC', 'NF', 'NP', '不贴']),  # 不贴装标记
+                    'use_worker_process': default_settings.get('use_worker_process', True),  # 是否在常驻进程中处理
+                    'queue_workers': default_settings.get('queue_workers', 1),  # 批量处理同时使用的进程数
+                    'dry_run_sample_rows': default_settings.get('dry_run_sample_rows', 0),  # 预览统计时处理的行数
+                    'header_profiles': default_settings.get('header_profiles', {}),  # 表头配置方案
+                    'auto_select_profile': default_settings.get('auto_select_profile', True),  # 是否按表头自动选择方案
+                    'log_level': default_settings.get('log_level', 'INFO'),  # 日志级别
+                    'quiet_mode': default_settings.get('quiet_mode', False),  # 安静模式
+                    'prefetch_updates': default_settings.get('prefetch_updates', False),  # 是否在后台预下载更新
+                    'prefetch_limit_kbps': default_settings.get('prefetch_limit_kbps', 256)  # 后台预下载限速
                 }
 
-                print(f"从配置文件加载配置成功: {config_path}")
-                print(f"加载的BOM表头映射: {default_config['bom_header_mapping']}")
-                print(f"加载的替代料表表头映射: {default_config['sub_header_mapping']}")
                 logging.info(f"从配置文件加载配置成功: {config_path}")
+                logging.debug(f"加载的BOM表头映射: {default_config['bom_header_mapping']}")
+                logging.debug(f"加载的替代料表表头映射: {default_config['sub_header_mapping']}")
 
                 # 将成功加载的配置文件路径保存到全局变量，方便后续保存配置
                 global _config_file_path
@@ -307,12 +503,10 @@ def load_default_config(use_builtin_defaults=False):
 
                 return default_config
             except Exception as e:
-                print(f"加载配置文件失败: {config_path}, 错误: {e}")
                 logging.error(f"加载配置文件失败: {config_path}, 错误: {e}")
                 # 继续尝试下一个路径
 
     # 如果所有路径都加载失败，使用内置默认配置
-    print("所有配置文件加载失败，使用内置默认配置")
     logging.info("所有配置文件加载失败，使用内置默认配置")
     return get_builtin_default_config()
 
@@ -341,24 +535,95 @@ def get_builtin_default_config():
         },
         'highlight_color': default_highlight_color,
         'last_update_check': 0,
-        'last_used_header_mapping': {}
+        'update_cache': {},  # 缓存的最新发布信息、ETag和连续失败次数，用于有条件请求和失败退避
+        'last_used_header_mapping': {},
+        'prune_columns': False,  # 只读取映射列和保留列，适用于列很多的PLM导出文件
+        'passthrough_columns': [],  # 开启列裁剪时额外保留到输出中的BOM列
+        'chunked_mode': False,  # 分块处理超大BOM，中间结果写入临时磁盘存储
+        'chunk_rows': 5000,  # 每块最大行数，实际行数还受内存预算限制
+        'memory_budget_mb': 512,  # 分块处理的内存预算（MB）
+        'parallel_workers': 1,  # 并行处理的进程数，1为单进程，0为使用全部CPU核心
+        'process_all_sheets': False,  # 处理工作簿中所有包含BOM表头的工作表
+        'variant_columns': [],  # 变体列，每列对应一个装配变体，单元格中填写该变体不贴装的位号或DNP标记
+        'dnp_markers': ['DNP', 'NC', 'NF', 'NP', '不贴'],  # 表示整行不贴装的标记
+        'use_worker_process': True,  # 在常驻子进程中处理，界面保持响应，重复处理无需预热
+        'queue_workers': 1,  # 批量处理队列同时使用的处理进程数，1为逐个处理
+        'dry_run_sample_rows': 0,  # 预览统计时每个工作表只处理前N行，0为处理全部行
+        'header_profiles': {},  # 表头配置方案，方案名 -> 表头映射、高亮颜色和输出选项
+        'auto_select_profile': True,  # 处理时按BOM表头自动选择最匹配的表头配置方案
+        'log_level': 'INFO',  # 日志文件记录的级别：DEBUG、INFO、WARNING、ERROR
+        'quiet_mode': False,  # 安静模式，不记录逐行处理日志（如每个合并的料号）
+        'prefetch_updates': False,  # 发现新版本时在后台限速下载到临时目录，确认更新后立即安装
+        'prefetch_limit_kbps': 256  # 后台预下载的限速（KB/s），0为不限速
     }
 
+class FrozenConfig(dict):
+    """
+    只读的配置字典，作为处理任务的配置快照
+
+    处理过程中需要修改配置时应调用update_config_values，直接修改快照会抛出TypeError。
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('配置快照是只读的，请使用update_config_values修改配置')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        # 发送到常驻处理进程时按普通字典重建，不经过被禁用的__setitem__
+        return (FrozenConfig, (dict(self),))
+
+def freeze_config(value):
+    """
+    递归地把配置转换为只读结构：字典转为FrozenConfig，列表转为元组
+
+    Args:
+        value: 配置或配置中的值
+
+    Returns:
+        只读的配置或值
+    """
+    if isinstance(value, dict):
+        return FrozenConfig({key: freeze_config(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_config(item) for item in value)
+    return value
+
+def get_config_snapshot():
+    """
+    获取当前配置的只读快照
+
+    每个处理任务开始时取一次快照，整个任务都使用这份配置；任务之间、任务与设置窗口之间互不影响，
+    批量处理时多个任务可以共用同一份快照。
+
+    Returns:
+        FrozenConfig: 配置快照
+    """
+    with _config_lock:
+        config = load_config()
+        if isinstance(config, FrozenConfig):
+            return config
+        return freeze_config(config)
+
 def load_config():
-    """加载配置文件，如果不存在则创建默认配置"""
+    """加载配置，返回所有调用者共享的配置缓存，第一次调用时读取配置文件"""
+    with _config_lock:
+        # 如果缓存存在且有效，直接返回缓存
+        if _config_cache is not None:
+            logging.debug("使用缓存的配置")
+            return _config_cache
+        return read_config()
+
+def read_config():
+    """读取配置文件，如果不存在则创建默认配置"""
     global _config_cache, _config_file_path, CONFIG_FILE
 
-    # 如果缓存存在且有效，直接返回缓存
-    if _config_cache is not None:
-        print("使用缓存的配置")
-        return _config_cache
-
     # 加载默认配置
     default_config = load_default_config()
 
     # 打印默认配置中的表头映射，用于调试
-    print("默认配置中的BOM表头映射:", default_config['bom_header_mapping'])
-    print("默认配置中的替代料表表头映射:", default_config['sub_header_mapping'])
+    logging.debug(f"默认配置中的BOM表头映射: {default_config['bom_header_mapping']}")
+    logging.debug(f"默认配置中的替代料表表头映射: {default_config['sub_header_mapping']}")
 
     # 尝试加载的配置文件路径列表
     config_paths = []
@@ -372,47 +637,20 @@ def load_config():
         if not _config_file_path or CONFIG_FILE != _config_file_path:
             config_paths.append((CONFIG_FILE, "CONFIG_FILE路径"))
 
-    # 3. 尝试程序目录下的config.json
-    program_dir = get_program_dir()
-    program_config = os.path.join(program_dir, 'config.json')
-    if os.path.exists(program_config) and program_config not in [p[0] for p in config_paths]:
-        config_paths.append((program_config, "程序目录"))
-
-    # 4. 尝试当前工作目录下的config.json
-    current_dir = os.getcwd()
-    current_config = os.path.join(current_dir, 'config.json')
-    if os.path.exists(current_config) and current_config not in [p[0] for p in config_paths]:
-        config_paths.append((current_config, "当前工作目录"))
-
-    # 5. 尝试用户文档目录下的config.json
-    try:
-        user_docs = os.path.join(os.path.expanduser("~"), "Documents")
-        user_docs_config = os.path.join(user_docs, 'config.json')
-        if os.path.exists(user_docs_config) and user_docs_config not in [p[0] for p in config_paths]:
-            config_paths.append((user_docs_config, "用户文档目录"))
-    except Exception as e:
-        print(f"获取用户文档目录失败: {e}")
-        logging.error(f"获取用户文档目录失败: {e}")
-
-    # 6. 尝试用户主目录下的config.json
-    try:
-        user_home = os.path.expanduser("~")
-        user_home_config = os.path.join(user_home, 'config.json')
-        if os.path.exists(user_home_config) and user_home_config not in [p[0] for p in config_paths]:
-            config_paths.append((user_home_config, "用户主目录"))
-    except Exception as e:
-        print(f"获取用户主目录失败: {e}")
-        logging.error(f"获取用户主目录失败: {e}")
+    # 3. 尝试程序目录、当前工作目录、用户文档目录和用户主目录下的config.json
+    for config_dir, dir_desc in get_config_save_dirs():
+        dir_config = os.path.join(config_dir, 'config.json')
+        if os.path.exists(dir_config) and dir_config not in [p[0] for p in config_paths]:
+            config_paths.append((dir_config, dir_desc))
 
     # 依次尝试每个配置文件路径
     for config_path, path_desc in config_paths:
-        print(f"尝试从{path_desc}加载配置: {config_path}")
         logging.info(f"尝试从{path_desc}加载配置: {config_path}")
 
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 file_content = f.read()
-                print(f"配置文件内容: {file_content[:100]}..." if len(file_content) > 100 else file_content)
+                logging.debug(f"配置文件内容: {file_content[:100]}..." if len(file_content) > 100 else file_content)
 
                 # 重新打开文件进行JSON解析
                 f.seek(0)
@@ -428,11 +666,10 @@ def load_config():
                         if sub_key not in user_config[key]:
                             user_config[key][sub_key] = sub_value
 
-            # 打印加载的配置内容
-            print(f"从{path_desc}加载配置成功: {config_path}")
-            print(f"加载的BOM表头映射: {user_config['bom_header_mapping']}")
-            print(f"加载的替代料表表头映射: {user_config['sub_header_mapping']}")
+            # 记录加载的配置内容
             logging.info(f"从{path_desc}加载配置成功: {config_path}")
+            logging.debug(f"加载的BOM表头映射: {user_config['bom_header_mapping']}")
+            logging.debug(f"加载的替代料表表头映射: {user_config['sub_header_mapping']}")
 
             # 更新成功加载的配置文件路径
             _config_file_path = config_path
@@ -440,27 +677,22 @@ def load_config():
             # 如果加载的不是CONFIG_FILE路径，更新CONFIG_FILE
             if config_path != CONFIG_FILE:
                 CONFIG_FILE = config_path
-                print(f"已更新CONFIG_FILE路径为: {CONFIG_FILE}")
                 logging.info(f"已更新CONFIG_FILE路径为: {CONFIG_FILE}")
 
             _config_cache = user_config
             return user_config
         except Exception as e:
-            print(f"从{path_desc}加载配置失败: {e}")
             logging.error(f"从{path_desc}加载配置失败: {e}")
             # 继续尝试下一个路径
 
     # 所有路径都加载失败，创建默认配置
-    print("所有配置文件加载失败，创建默认配置")
     logging.info("所有配置文件加载失败，创建默认配置")
 
     # 保存默认配置
     save_success = save_config(default_config)
     if save_success:
-        print("成功创建默认配置文件")
         logging.info("成功创建默认配置文件")
     else:
-        print("创建默认配置文件失败，将使用内存中的默认配置")
         logging.warning("创建默认配置文件失败，将使用内存中的默认配置")
 
     _config_cache = default_config
@@ -471,20 +703,17 @@ def resource_path(relative_path):
     try:
         # PyInstaller创建临时文件夹，将路径存储在_MEIPASS中
         base_path = sys._MEIPASS
-        print(f"使用PyInstaller打包环境临时路径: {base_path}")
         logging.info(f"使用PyInstaller打包环境临时路径: {base_path}")
 
         # 对于配置文件，我们需要使用应用程序的实际安装目录，而不是临时目录
         if relative_path == "config.json":
             # 获取exe文件所在目录
             exe_dir = os.path.dirname(sys.executable)
-            print(f"检测到配置文件请求，使用exe所在目录: {exe_dir}")
             logging.info(f"检测到配置文件请求，使用exe所在目录: {exe_dir}")
             return os.path.join(exe_dir, relative_path)
     except Exception as e:
         # 如果不是打包环境，使用当前路径
         base_path = os.path.abspath(".")
-        print(f"使用开发环境路径: {base_path}, 原因: {str(e)}")
         logging.info(f"使用开发环境路径: {base_path}")
 
     full_path = os.path.join(base_path, relative_path)
@@ -495,17 +724,88 @@ def resource_path(relative_path):
 
     # 检查路径是否存在
     if relative_path and not os.path.exists(full_path) and relative_path != "config.json":
-        print(f"警告: 资源路径不存在: {full_path}")
         logging.warning(f"资源路径不存在: {full_path}")
 
     return full_path
 
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        stream=None
-    )
+LOG_FILE_NAME = 'BOMSwap.log'  # 日志文件名，保存在程序目录（不可写时依次尝试其他目录）
+RUN_SUMMARY_FILE_NAME = 'BOMSwap_runs.jsonl'  # 运行摘要文件名，与日志文件在同一目录，每次处理追加一行JSON
+LOG_MAX_BYTES = 2 * 1024 * 1024  # 单个日志文件的最大字节数，超过后滚动
+LOG_BACKUP_COUNT = 3  # 保留的旧日志文件数
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')  # 可选的日志级别
+LOG_FORMAT = '%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+
+_log_queue = None  # 日志队列，界面进程和常驻处理进程的日志记录都放入该队列
+_log_listener = None  # 从日志队列取出记录写入文件的后台线程
+_quiet_mode = False  # 安静模式：不记录逐行处理日志，处理超大BOM时减少日志开销
+
+def get_log_file_path():
+    """获取日志文件路径：与配置文件相同，依次使用程序目录、当前工作目录等第一个可写的目录，都不可写时使用系统临时目录"""
+    for log_dir, _ in get_config_save_dirs():
+        if check_directory_writable(log_dir):
+            return os.path.join(log_dir, LOG_FILE_NAME)
+    return os.path.join(tempfile.gettempdir(), LOG_FILE_NAME)
+
+def setup_logging(log_queue=None):
+    """
+    配置日志：记录日志的线程只把记录放入队列，由后台线程写入滚动日志文件，不等待文件和控制台输出
+
+    界面进程中创建日志队列并启动QueueListener，警告以上的日志同时输出到控制台；
+    常驻处理进程传入界面进程的日志队列，日志统一由界面进程写入同一个文件。
+
+    Args:
+        log_queue: 界面进程的日志队列，常驻处理进程中使用
+    """
+    global _log_queue, _log_listener
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+
+    if log_queue is None:
+        if _log_listener is not None:
+            return
+        # 常驻处理进程以spawn方式启动，队列需要使用相同的方式创建
+        log_queue = multiprocessing.get_context('spawn').Queue(-1)
+        formatter = logging.Formatter(LOG_FORMAT)
+        file_handler = logging.handlers.RotatingFileHandler(
+            get_log_file_path(), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+        )
+        file_handler.setFormatter(formatter)
+        handlers = [file_handler]
+        # 打包成无控制台的exe时没有标准错误输出
+        if sys.stderr is not None:
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.WARNING)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+        _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(stop_logging)
+
+    _log_queue = log_queue
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+def stop_logging():
+    """停止日志后台线程，写入队列中剩余的日志（程序退出时调用）"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def apply_logging_config(config):
+    """
+    按配置设置日志级别和安静模式
+
+    Args:
+        config: 配置
+    """
+    global _quiet_mode
+    level = str(config.get('log_level', 'INFO')).upper()
+    if level not in LOG_LEVELS:
+        level = 'INFO'
+    logging.getLogger().setLevel(getattr(logging, level))
+    _quiet_mode = bool(config.get('quiet_mode', False))
 
 def parse_args():
     parser = argparse.ArgumentParser(description='BOM替代料工具')
@@ -521,7 +821,7 @@ import tkinter.messagebox
 
 def create_gui():
     global root, status_var, progress, bom_var, sub_var, update_manager
-    root = tk.Tk()
+    root = TkinterDnD.Tk() if TkinterDnD is not None else tk.Tk()
     root.withdraw()
     try:
         # 获取图标资源路径
@@ -543,14 +843,14 @@ def create_gui():
                     root.iconbitmap(path)
                     break
     except Exception as e:
-        print(f"图标加载错误: {e}")
+        logging.warning(f"图标加载错误: {e}")
         # 图标加载失败时继续运行程序
         pass
     root.title(f'BOM替代料工具 v{APP_VERSION} | 小航  2025.5.12')
 
     # 创建更新管理器
     global update_manager
-    update_manager = UpdateManager(root)
+    update_manager = UpdateManager(root, status_callback=update_status)
 
     # 设置UI主题和样式
     style = ttk.Style()
@@ -648,20 +948,16 @@ def create_gui():
     config = load_config()
 
     # 打印配置中的替代料表路径，用于调试
-    print("配置中的替代料表路径:", config.get('default_sub_path', ''))
     logging.info(f"配置中的替代料表路径: {config.get('default_sub_path', '')}")
 
     # 如果有默认替代料表路径，自动加载
     if config.get('default_sub_path') and os.path.exists(config.get('default_sub_path')):
-        print(f"自动加载替代料表路径: {config['default_sub_path']}")
         logging.info(f"自动加载替代料表路径: {config['default_sub_path']}")
         sub_var.set(config['default_sub_path'])
     else:
         if not config.get('default_sub_path'):
-            print("配置中没有替代料表路径")
             logging.info("配置中没有替代料表路径")
         elif not os.path.exists(config.get('default_sub_path')):
-            print(f"替代料表路径不存在: {config.get('default_sub_path')}")
             logging.info(f"替代料表路径不存在: {config.get('default_sub_path')}")
 
     # 主容器
@@ -767,17 +1063,52 @@ def create_gui():
                           width=6)  # 减小按钮宽度
     sub_button.pack(side='right')
 
+    # 当前加载的替代料表版本（修改时间、行数、替代组数）
+    global sub_info_label
+    sub_info_label = ttk.Label(file_container, text='', font=(default_font_family, 9), foreground='#666666')
+    sub_info_label.pack(anchor='w', padx=(88, 0), pady=(3, 0))
+
     # 操作按钮框架
     button_frame = ttk.Frame(main_frame)
     button_frame.pack(fill='x', pady=(0, 8))  # 减小操作按钮下方间距，原来是10
 
     # 开始处理按钮
+    global start_button, cancel_button, dry_run_button
     start_button = ttk.Button(button_frame, text='开始处理',
-                            command=lambda: Thread(target=process_files).start(),
+                            command=start_processing,
                             style='Primary.TButton',
                             width=12)  # 减小按钮宽度，原来是15
     start_button.pack(side='left')
 
+    # 预览统计按钮，只运行处理引擎查看统计和变更摘要，不写出结果文件
+    dry_run_button = ttk.Button(button_frame, text='预览统计',
+                              command=lambda: start_processing(dry_run=True),
+                              width=10)
+    dry_run_button.pack(side='left', padx=(8, 0))
+
+    # 取消按钮，处理过程中可用
+    cancel_button = ttk.Button(button_frame, text='取消',
+                             command=cancel_processing,
+                             state='disabled',
+                             width=8)
+    cancel_button.pack(side='left', padx=(8, 0))
+
+    # 合并详情按钮，处理完成且存在合并物料时可用
+    global merge_report_button
+    merge_report_button = ttk.Button(button_frame, text='合并详情', command=show_merge_report,
+                                     state='disabled', width=14)
+    merge_report_button.pack(side='left', padx=(8, 0))
+
+    # 结果预览按钮，处理完成后可用
+    global result_preview_button
+    result_preview_button = ttk.Button(button_frame, text='结果预览', command=show_result_preview,
+                                       state='disabled', width=10)
+    result_preview_button.pack(side='left', padx=(8, 0))
+
+    # 批量处理按钮，打开批量处理队列窗口
+    ttk.Button(button_frame, text='批量处理', command=show_job_queue,
+               width=10).pack(side='left', padx=(8, 0))
+
     # 状态提示区域
     status_frame = ttk.LabelFrame(main_frame, text=' 处理进度 ', padding=(12, 8))  # 减小padding，原来是(15, 10)
     status_frame.pack(fill='both', expand=True)
@@ -788,7 +1119,7 @@ def create_gui():
 
     # 进度条 - 改进样式
     global progress
-    progress = ttk.Progressbar(progress_container, orient='horizontal', mode='determinate', length=400)
+    progress = ttk.Progressbar(progress_container, orient='horizontal', mode='determinate', length=400, maximum=100)
     progress.pack(side='left', fill='x', expand=True, padx=(0, 8))
 
     # 百分比标签
@@ -796,6 +1127,11 @@ def create_gui():
     progress_percent = ttk.Label(progress_container, text='0%', width=5)
     progress_percent.pack(side='left')
 
+    # 进度详情标签：当前阶段、吞吐量和预计剩余时间
+    global progress_detail
+    progress_detail = ttk.Label(status_frame, text='', font=(default_font_family, 9), foreground=mac_subtle_text)
+    progress_detail.pack(fill='x', pady=(0, 6))
+
     # 添加滚动条和文本区域
     status_container = ttk.Frame(status_frame)
     status_container.pack(fill='both', expand=True)
@@ -847,8 +1183,37 @@ def create_gui():
                    background='#0078D4',
                    troughcolor='#E6E6E6')
 
+    # 启动界面事件轮询
+    root.after(GUI_POLL_INTERVAL_MS, process_gui_events)
+
+    # 提前启动常驻处理进程并预加载替代料表，第一次处理时无需等待
+    if config.get('use_worker_process', True):
+        engine_worker.start()
+    if sub_var.get():
+        reload_substitute_table(sub_var.get())
+    # 替代料表被修改后自动重新加载
+    root.after(SUB_WATCH_INTERVAL_MS, watch_substitute_table)
+    root.protocol('WM_DELETE_WINDOW', close_main_window)
+
+    # 主窗口显示完成后记录启动耗时，再在后台导入处理模块和检查更新
+    root.after_idle(report_startup_time)
+    if not startup_benchmark:
+        Thread(target=preload_modules, daemon=True).start()
+        Thread(target=update_manager.check_updates_on_startup, daemon=True).start()
+
     root.mainloop()
 
+def report_startup_time():
+    """记录从程序开始加载到主窗口显示完成的耗时；启动耗时测试模式下输出各阶段耗时后退出"""
+    elapsed = time.perf_counter() - _startup_time
+    logging.info(f"启动耗时: {elapsed:.3f}秒（主窗口显示完成）")
+    if startup_benchmark:
+        print(f"模块加载: {_module_loaded_time - _startup_time:.3f}秒")
+        print(f"主窗口显示: {elapsed:.3f}秒")
+        print(f"启动时已导入的模块: pandas={'pandas' in sys.modules}, openpyxl={'openpyxl' in sys.modules}, "
+              f"requests={'requests' in sys.modules}")
+        close_main_window()
+
 def select_file(var, ext, is_sub_file=False):
     """选择文件
 
@@ -884,184 +1249,1449 @@ def select_file(var, ext, is_sub_file=False):
 
         # 如果是BOM文件，保存目录到配置
         if not is_sub_file:
-            config['last_bom_dir'] = os.path.dirname(filename)
-            save_config(config)
+            update_config_values({'last_bom_dir': os.path.dirname(filename)})
 
         # 如果是替代料文件，直接设置为默认路径并保存
         if is_sub_file:
             # 如果路径变更，更新配置
             if filename != config['default_sub_path']:
-                config['default_sub_path'] = filename
-                save_config(config)
-                print(f"已自动将 {filename} 设置为默认替代料表路径")
+                update_config_values({'default_sub_path': filename})
                 logging.info(f"已自动将 {filename} 设置为默认替代料表路径")
 
+            # 空闲时在后台预加载新的替代料表
+            if not processing_lock.locked():
+                reload_substitute_table(filename)
+
 def update_progress(value):
-    global root
-    if root and root.winfo_exists():
-        root.after(0, lambda: [
-            progress.config(value=value),
-            progress_percent.config(text=f'{int(value)}%'),
-            root.update_idletasks()
-        ])
+    """投递进度更新事件，由界面主循环统一刷新进度条
+
+    Args:
+        value: 进度百分比（0-100）
+    """
+    if has_gui_events():
+        post_gui_event('progress', value)
 
 def update_status(message, color=None):
-    """更新状态文本
+    """向状态日志追加消息，由界面主循环统一追加到状态文本
+
+    可在任意线程中调用，每行的显示样式在投递前确定，实际的控件操作只在Tk主线程中进行。
 
     Args:
         message: 状态消息
         color: 文本颜色（可选）
     """
-    global status_text, update_manager
-    if status_text:
-        status_text.config(state=tk.NORMAL)  # 临时允许编辑
-        status_text.delete(1.0, tk.END)  # 清除现有内容
-
-        # 使用标签和颜色美化文本显示
-        lines = message.split('\n')
-        for line in lines:
-            if any(marker in line for marker in ["✅", "📊", "📋", "🔄"]):
-                # 部分标题使用蓝色粗体
-                status_text.insert(tk.END, line + "\n", 'title')
-            elif line.startswith("-"):
-                # 分隔线使用灰色
-                status_text.insert(tk.END, line + "\n", 'separator')
-            elif "处理完成" in line:
-                # 完成提示使用绿色
-                status_text.insert(tk.END, line + "\n", 'success')
-            elif line.strip().startswith("•"):
-                # 统计项目使用黑色
-                status_text.insert(tk.END, line + "\n", 'item')
-            elif "物料" in line and ":" in line:
-                # 物料标题使用蓝色
-                status_text.insert(tk.END, line + "\n", 'subtitle')
-            elif color:
-                # 使用指定颜色
-                # 创建临时标签
-                tag_name = f"color_{color.replace('#', '')}"
-                if not tag_name in status_text.tag_names():
-                    status_text.tag_configure(tag_name, foreground=color)
-                status_text.insert(tk.END, line + "\n", tag_name)
-            else:
-                # 普通文本
-                status_text.insert(tk.END, line + "\n")
+    if has_gui_events():
+        post_gui_event('status', [(line, classify_status_line(line, color)) for line in message.split('\n')])
 
-        status_text.see(1.0)  # 滚动到顶部
-        status_text.config(state=tk.DISABLED)  # 恢复只读状态
+def classify_status_line(line, color=None):
+    """
+    确定状态日志中一行文本的显示样式
 
-        # 更新窗口
-        if root and root.winfo_exists():
-            root.update_idletasks()
+    Args:
+        line: 一行文本
+        color: 文本颜色（可选）
 
-    # 如果更新管理器存在，更新其状态栏方法
-    if 'update_manager' in globals() and update_manager:
-        # 覆盖UpdateManager类的_update_status方法
-        update_manager._update_status = lambda msg, clr=None: update_status(msg, clr)
+    Returns:
+        str: 标签名，普通文本返回空字符串
+    """
+    if any(marker in line for marker in ["✅", "📊", "📋", "🔄"]):
+        # 部分标题使用蓝色粗体
+        return 'title'
+    if line.startswith("-"):
+        # 分隔线使用灰色
+        return 'separator'
+    if "处理完成" in line:
+        # 完成提示使用绿色
+        return 'success'
+    if line.strip().startswith("•"):
+        # 统计项目使用黑色
+        return 'item'
+    if "物料" in line and ":" in line:
+        # 物料标题使用蓝色
+        return 'subtitle'
+    if color:
+        # 使用指定颜色
+        return f"color_{color.replace('#', '')}"
+    return ''
+
+def update_progress_detail(text):
+    """投递进度详情（当前阶段、吞吐量、预计剩余时间）更新事件
 
-def show_help():
-    """显示使用帮助对话框，带有标签页和格式化文本"""
-    help_window = tk.Toplevel()
-    help_window.withdraw()  # 先隐藏窗口，避免闪烁
-    help_window.title("BOM替代料工具 - 使用帮助")
+    Args:
+        text: 进度详情文本
+    """
+    if has_gui_events():
+        post_gui_event('progress_detail', text)
+
+def render_progress(value):
+    """在Tk主线程中刷新进度条和百分比标签"""
+    if progress is not None:
+        progress.config(value=value)
+    if progress_percent is not None:
+        progress_percent.config(text=f'{int(value)}%')
+
+def render_progress_detail(text):
+    """在Tk主线程中刷新进度详情标签"""
+    if progress_detail is not None:
+        progress_detail.config(text=text)
+
+# 状态日志最多保留的行数，超出时丢弃最早的行
+STATUS_LOG_MAX_LINES = 2000
+status_log = deque(maxlen=STATUS_LOG_MAX_LINES)  # 当前显示的状态日志 (文本, 标签)
+
+def render_status_lines(lines):
+    """
+    在Tk主线程中把新的状态行追加到状态文本，超出上限时删除最早的行
 
-    # 设置窗口尺寸和位置
-    window_width = 700
-    window_height = 550
+    Args:
+        lines: (文本, 标签)列表
+    """
+    lines = list(lines)[-STATUS_LOG_MAX_LINES:]
+    status_log.extend(lines)
+    if not status_text:
+        return
 
-    # 计算窗口居中位置
-    screen_width = help_window.winfo_screenwidth()
-    screen_height = help_window.winfo_screenheight()
-    center_x = int((screen_width - window_width) / 2)
-    center_y = int((screen_height - window_height) / 2)
+    insert_args = []
+    for line, tag in lines:
+        if tag.startswith('color_') and tag not in status_text.tag_names():
+            status_text.tag_configure(tag, foreground='#' + tag[len('color_'):])
+        insert_args.extend((line + "\n", tag))
+
+    status_text.config(state=tk.NORMAL)  # 临时允许编辑
+    first_new_line = int(status_text.index('end-1c').split('.')[0])
+    status_text.insert(tk.END, *insert_args)
+
+    # 只保留最近的STATUS_LOG_MAX_LINES行
+    line_count = int(status_text.index('end-1c').split('.')[0]) - 1
+    if line_count > STATUS_LOG_MAX_LINES:
+        removed = line_count - STATUS_LOG_MAX_LINES
+        status_text.delete('1.0', f'{removed + 1}.0')
+        first_new_line = max(first_new_line - removed, 1)
+    status_text.config(state=tk.DISABLED)  # 恢复只读状态
+
+    # 滚动到末尾，新内容较长时保证其第一行可见
+    status_text.see(tk.END)
+    status_text.see(f'{first_new_line}.0')
+
+# ==================== 界面事件队列 ====================
+# 处理线程只向队列投递事件，由Tk主循环定时取出后更新界面，避免在后台线程中操作控件
+gui_event_queue = queue.Queue()
+GUI_POLL_INTERVAL_MS = 50  # 界面事件轮询间隔（毫秒）
+GUI_MAX_EVENTS_PER_POLL = 1000  # 每次轮询最多处理的事件数，避免长时间占用主循环
+GUI_MAX_WARNING_LINES = 20  # 合并警告对话框中最多列出的条数
+_pending_warnings = []  # 等待合并显示的警告 (标题, 内容)
+
+def has_gui_events():
+    """是否有接收界面事件的一方：界面进程本身，或通过管道连接界面进程的常驻处理进程"""
+    return root is not None or _worker_conn is not None
+
+# 当前线程的事件处理函数，批量任务在当前进程中处理时把事件记录到任务中，不显示在主界面
+_event_sink = threading.local()
+
+def post_gui_event(kind, *args):
+    """向界面事件队列投递事件（线程安全）
+
+    在常驻处理进程中，事件通过管道发送给界面进程，再由界面进程放入事件队列；
+    当前线程设置了事件处理函数时（在当前进程中处理批量任务），事件交给该函数处理。
 
-    # 设置窗口位置
-    help_window.geometry(f"{window_width}x{window_height}+{center_x}+{center_y}")
+    Args:
+        kind: 事件类型（progress/progress_detail/status/merge_report/result_preview/queue_job/substitute_info/
+              config_update/job_state/warning/error/custom_error/flush_warnings）
+        args: 事件参数
+    """
+    handler = getattr(_event_sink, 'handler', None)
+    if handler is not None:
+        handler(kind, args)
+    elif _worker_conn is not None:
+        _worker_conn.send(('event', kind, args))
+    else:
+        gui_event_queue.put((kind, args))
 
-    # 设置窗口图标（如果可用）
-    try:
-        icon_path = resource_path('DSC01.ico')
-        if os.path.exists(icon_path):
-            help_window.iconbitmap(icon_path)
-    except Exception:
-        pass
+def update_config_values(values):
+    """
+    更新部分配置项，稍后在后台保存，处理过程不等待配置文件写入
 
-    # 设置样式
-    style = ttk.Style()
-    style.configure("Tab.TFrame", background="#f5f5f5")
+    常驻处理进程中只把修改发回界面进程，由界面进程统一保存，避免两个进程同时写配置文件。
 
-    # 创建主框架
-    main_frame = ttk.Frame(help_window, padding=10)
-    main_frame.pack(fill='both', expand=True)
+    Args:
+        values: 需要更新的配置项
+    """
+    if _worker_conn is not None:
+        post_gui_event('config_update', values)
+        return
+    with _config_lock:
+        config = load_config()
+        config.update(values)
+        mark_config_dirty(config)
 
-    # 创建标签页控件
-    tab_control = ttk.Notebook(main_frame)
+def notify_warning(title, message):
+    """提示警告；有界面时暂存，待本次处理结束后合并为一个对话框显示
 
-    # 创建各个标签页
-    tab_overview = ttk.Frame(tab_control, style="Tab.TFrame")
-    tab_updates = ttk.Frame(tab_control, style="Tab.TFrame")
-    tab_usage = ttk.Frame(tab_control, style="Tab.TFrame")
-    tab_contact = ttk.Frame(tab_control, style="Tab.TFrame")
+    Args:
+        title: 警告标题
+        message: 警告内容
+    """
+    if has_gui_events():
+        post_gui_event('warning', title, message)
+    else:
+        tkinter.messagebox.showwarning(title, message)
 
-    tab_control.add(tab_overview, text=" 概览 ")
-    tab_control.add(tab_updates, text=" 更新说明 ")
-    tab_control.add(tab_usage, text=" 使用方法 ")
-    tab_control.add(tab_contact, text=" 技术支持 ")
+def notify_error(title, message, custom=False):
+    """提示错误；有界面时交由Tk主线程显示对话框
 
-    tab_control.pack(fill="both", expand=True)
+    Args:
+        title: 错误标题
+        message: 错误内容
+        custom: 是否使用自定义错误对话框
+    """
+    if has_gui_events():
+        post_gui_event('custom_error' if custom else 'error', title, message)
+    elif custom:
+        show_custom_error(title, message)
+    else:
+        tkinter.messagebox.showerror(title, message)
 
-    # === 概览标签页内容 ===
-    overview_frame = ttk.Frame(tab_overview, padding=15)
-    overview_frame.pack(fill='both', expand=True)
+def flush_gui_warnings():
+    """通知界面把暂存的警告合并显示"""
+    if has_gui_events():
+        post_gui_event('flush_warnings')
 
-    # 标题
-    title_label = ttk.Label(overview_frame,
-                         text="BOM替代料工具",
-                         font=('微软雅黑', 16, 'bold'))
-    title_label.pack(anchor='w', pady=(0, 10))
+# ==================== 常驻处理进程 ====================
+# 处理在常驻子进程中进行，界面进程只负责显示，不会因处理占用GIL而卡顿；
+# 子进程保留已导入的模块和替代料表缓存，重复处理时无需再次预热
+_worker_conn = None  # 常驻处理进程中连接界面进程的管道
 
-    # 当前版本
-    version_frame = ttk.Frame(overview_frame)
-    version_frame.pack(fill='x', pady=(0, 15))
+def engine_worker_main(conn, worker_cancel_event, log_queue=None):
+    """
+    常驻处理进程入口：循环接收任务并执行，处理事件和结果通过管道发回界面进程
 
-    version_label = ttk.Label(version_frame,
-                            text="当前版本：v2.5",
-                            font=('微软雅黑', 10, 'bold'))
-    version_label.pack(side='left')
+    Args:
+        conn: 连接界面进程的管道
+        worker_cancel_event: 界面进程设置的取消标志（multiprocessing.Event）
+        log_queue: 界面进程的日志队列，未配置日志时为None
+    """
+    global _worker_conn, cancel_event, _config_cache
+    setup_logging(log_queue)
+    _worker_conn = conn
+    cancel_event = worker_cancel_event
+    # 处理进程启动后先导入处理模块，第一次处理时无需等待
+    preload_modules()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # 界面进程已退出
+            break
+
+        if message[0] == 'stop':
+            break
+        elif message[0] == 'preload':
+            # 预先读取替代料表，第一次处理时直接使用缓存
+            _, sub_path, config = message
+            _config_cache = config
+            try:
+                preload_substitute_table(sub_path, config)
+            finally:
+                conn.send(('done', None))
+        elif message[0] == 'run':
+            _, bom_path, sub_path, config, dry_run = message
+            # 每次处理使用界面进程发来的配置快照
+            _config_cache = config
+            result = None
+            try:
+                result = process_files(bom_path, sub_path, dry_run=dry_run, config=config)
+            finally:
+                conn.send(('done', result))
 
-    date_label = ttk.Label(version_frame,
-                         text="发布日期：2025年5月12日",
-                         font=('微软雅黑', 10))
-    date_label.pack(side='right')
+class EngineWorker:
+    """
+    界面进程中的常驻处理进程句柄，负责启动、派发任务、转发事件和停止
+    """
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        self.cancel_event = None
+        # 处理进程逐个执行请求，同一时间只有一个线程收发管道消息
+        self.request_lock = threading.Lock()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """启动常驻处理进程（异步启动，不等待模块导入完成）"""
+        if self.is_alive():
+            return
+        # 统一使用spawn方式，避免在已创建Tk窗口的进程中fork
+        context = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = context.Pipe()
+        self.cancel_event = context.Event()
+        # 处理进程内部还会创建进程池，因此不能设为守护进程
+        self.process = context.Process(target=engine_worker_main, args=(child_conn, self.cancel_event, _log_queue),
+                                       name='BOMSwapEngine')
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        logging.info(f"常驻处理进程已启动，PID: {self.process.pid}")
+
+    def request(self, message, event_handler=None):
+        """
+        向处理进程发送一个请求并等待完成，期间把收到的事件转发到界面事件队列
+
+        Args:
+            message: 请求消息
+            event_handler: 处理事件的函数(kind, args)，默认放入界面事件队列
+
+        Returns:
+            请求的结果
+        """
+        with self.request_lock:
+            self.start()
+            self.conn.send(message)
+            while True:
+                try:
+                    reply = self.conn.recv()
+                except (EOFError, OSError):
+                    self.stop()
+                    raise RuntimeError("处理进程意外退出，请重新开始处理")
+                if reply[0] == 'event':
+                    if event_handler is not None:
+                        event_handler(reply[1], reply[2])
+                    else:
+                        gui_event_queue.put((reply[1], reply[2]))
+                elif reply[0] == 'done':
+                    return reply[1]
 
-    ttk.Separator(overview_frame, orient='horizontal').pack(fill='x', pady=10)
+    def preload(self, sub_path, config):
+        """让处理进程在后台预先读取替代料表并建立索引，不等待完成"""
+        if not sub_path or not os.path.exists(sub_path):
+            return
 
-    # 工具概述
-    overview_text = tk.Text(overview_frame, wrap=tk.WORD, height=20,
-                          font=('微软雅黑', 10), background="#f9f9f9",
-                          padx=15, pady=15, borderwidth=1, relief="solid")
-    overview_text.pack(fill='both', expand=True)
+        def run():
+            try:
+                self.request(('preload', sub_path, config))
+            except Exception as e:
+                logging.warning(f"预加载替代料表失败: {e}")
+
+        Thread(target=run, daemon=True).start()
+
+    def run_job(self, bom_path, sub_path, config, event_handler=None, dry_run=False):
+        """
+        在常驻处理进程中执行一次处理，阻塞直到处理结束，期间把收到的事件转发到界面事件队列
+
+        Args:
+            bom_path: BOM文件路径
+            sub_path: 替代料表路径
+            config: 当前配置
+            event_handler: 处理事件的函数(kind, args)，默认放入界面事件队列
+            dry_run: 是否为预览统计（不写出结果文件）
+
+        Returns:
+            list: process_files的返回值，即输出文件路径列表，失败或取消时为None
+        """
+        self.start()
+        return self.request(('run', bom_path, sub_path, config, dry_run), event_handler)
+
+    def reset_cancel(self):
+        """
+        清除取消标志，在开始一次处理或一批任务前调用
+
+        批量处理时各任务之间不清除，否则任务开始前的取消请求会被清掉，该任务仍会完整执行。
+        """
+        if self.cancel_event is not None:
+            self.cancel_event.clear()
+
+    def cancel(self):
+        """请求取消处理进程中正在执行的任务"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def stop(self):
+        """停止常驻处理进程"""
+        if self.process is None:
+            return
+        try:
+            if self.process.is_alive():
+                self.conn.send(('stop',))
+                self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=2)
+        except (OSError, ValueError) as e:
+            logging.warning(f"停止处理进程时出错: {e}")
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+            self.process = None
+            self.conn = None
+
+engine_worker = EngineWorker()
+atexit.register(engine_worker.stop)
+# 批量处理队列使用的处理进程，第一个即engine_worker，其余按批量处理进程数按需启动
+queue_engine_workers = [engine_worker]
+
+# 同一时间只允许一个处理任务，避免多个线程同时使用全局状态
+processing_lock = threading.Lock()
+start_button = None
+dry_run_button = None
+cancel_button = None
+
+def close_main_window():
+    """关闭主窗口前停止常驻处理进程，并写入尚未保存的配置修改"""
+    cancel_event.set()
+    for worker in queue_engine_workers:
+        worker.cancel()
+        worker.stop()
+    flush_config()
+    root.destroy()
+
+def start_processing(dry_run=False):
+    """在后台线程中开始处理；已有任务在运行时不再启动新任务
 
-    overview_content = """BOM替代料工具是一款专业的电子制造业辅助软件，专为解决电子BOM（物料清单）管理过程中的替代料处理而设计。
+    Args:
+        dry_run: 是否只预览统计，不写出结果文件
+    """
+    if not processing_lock.acquire(blocking=False):
+        tkinter.messagebox.showinfo('提示', '当前任务正在处理中，请等待完成或先取消')
+        return
 
-本工具能自动识别并处理BOM表中的替代料关系，显著提高物料管理效率和准确性。主要功能包括：
+    cancel_event.clear()
+    engine_worker.reset_cancel()
+    render_job_state(True)
+    bom_path = bom_var.get()
+    sub_path = sub_var.get()
+    # 本次处理使用开始时的配置快照，处理过程中修改设置不影响本次处理
+    config = get_config_snapshot()
 
-• BOM自动重构 - 生成带完整替代料标识的新BOM
-• 相同料号智能合并 - 自动合并相同物料的多个条目
-• 位号统计精确化 - 准确计算每个物料的位号数量
-• 表头配置功能 - 支持自定义BOM表头字段名称
+    def run():
+        try:
+            if config.get('use_worker_process', True):
+                engine_worker.run_job(bom_path, sub_path, config, dry_run=dry_run)
+            else:
+                process_files(bom_path, sub_path, dry_run=dry_run, config=config)
+        except Exception as e:
+            logging.error(f"处理进程出错: {e}", exc_info=True)
+            update_progress(0)
+            update_status(f'处理失败：{translate_error_to_chinese(e)}')
+            notify_error('处理失败', str(e))
+        finally:
+            processing_lock.release()
+            post_gui_event('job_state', False)
+
+    Thread(target=run, daemon=True).start()
+
+def cancel_processing():
+    """请求取消当前处理任务，处理引擎会在下一个检查点停止"""
+    if processing_lock.locked() and not cancel_event.is_set():
+        cancel_event.set()
+        for worker in queue_engine_workers:
+            worker.cancel()
+        update_status('正在取消处理...', '#FF8C00')
+        if cancel_button is not None:
+            cancel_button.config(state='disabled')
+
+def render_job_state(running):
+    """在Tk主线程中根据任务是否在运行切换开始和取消按钮的状态"""
+    if start_button is not None:
+        start_button.config(state='disabled' if running else 'normal')
+    if cancel_button is not None:
+        cancel_button.config(state='normal' if running else 'disabled')
+    if dry_run_button is not None:
+        dry_run_button.config(state='disabled' if running else 'normal')
+    for button in job_queue_buttons.get('idle', []):
+        if button.winfo_exists():
+            button.config(state='disabled' if running else 'normal')
+    for button in job_queue_buttons.get('running', []):
+        if button.winfo_exists():
+            button.config(state='normal' if running else 'disabled')
+
+def show_pending_warnings():
+    """在Tk主线程中把暂存的警告合并为一个对话框显示"""
+    if not _pending_warnings:
+        return
+    warnings = list(_pending_warnings)
+    _pending_warnings.clear()
 
-推荐使用场景：
-- PCB生产物料清单处理
-- BOM标准化与一致性检查
-- 物料替代关系管理
-- 供应链物料优化
-"""
+    if len(warnings) == 1:
+        tkinter.messagebox.showwarning(*warnings[0], parent=root)
+        return
 
-    overview_text.insert(tk.END, overview_content)
-    overview_text.config(state=tk.DISABLED)
+    lines = [f"• {message}" for _, message in warnings[:GUI_MAX_WARNING_LINES]]
+    if len(warnings) > GUI_MAX_WARNING_LINES:
+        lines.append(f"……其余{len(warnings) - GUI_MAX_WARNING_LINES}条警告请查看日志")
+    tkinter.messagebox.showwarning('警告', f"处理过程中出现{len(warnings)}条警告：\n\n" + "\n".join(lines),
+                                   parent=root)
+
+# ==================== 合并详情面板 ====================
+# 合并详情可能有成千上万条，不写入状态日志，而是在打开面板时分批插入表格，并支持搜索
+MERGE_REPORT_COLUMNS = [('序号', 50), ('工作表', 90), ('料号', 140), ('描述', 260),
+                        ('制造商料号', 140), ('制造商', 110), ('合并行数', 70), ('合并后位号数', 90)]
+MERGE_REPORT_BATCH_ROWS = 500  # 每批插入表格的行数
+MERGE_REPORT_SEARCH_DELAY_MS = 200  # 搜索输入停止后延迟筛选的时间（毫秒）
+merge_report = []  # 最近一次处理的合并详情，元素为(显示值元组, 小写搜索文本)
+merge_report_button = None
+
+def format_report_value(value):
+    """把合并详情中的值转换为显示文本，空值显示为空字符串"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    return str(value)
+
+def publish_merge_report(rows):
+    """
+    把合并详情交给界面（线程安全）
 
-    # === 更新说明标签页内容 ===
-    updates_frame = ttk.Frame(tab_updates, padding=15)
+    Args:
+        rows: 合并详情行列表，每行为按MERGE_REPORT_COLUMNS排列的元组
+    """
+    if has_gui_events():
+        post_gui_event('merge_report', rows)
+
+def set_merge_report(rows):
+    """在Tk主线程中保存合并详情、预先生成搜索文本并更新按钮状态"""
+    merge_report[:] = [(row, ' '.join(str(value) for value in row).lower()) for row in rows]
+    if merge_report_button is not None:
+        if merge_report:
+            merge_report_button.config(text=f'合并详情({len(merge_report)})', state='normal')
+        else:
+            merge_report_button.config(text='合并详情', state='disabled')
+
+def show_merge_report():
+    """显示可搜索的合并详情面板"""
+    window = tk.Toplevel(root)
+    window.title('相同物料合并详情')
+    window.geometry('900x500')
+    window.transient(root)
+
+    main_frame = ttk.Frame(window, padding=10)
+    main_frame.pack(fill='both', expand=True)
+
+    # 搜索栏
+    search_frame = ttk.Frame(main_frame)
+    search_frame.pack(fill='x', pady=(0, 8))
+    ttk.Label(search_frame, text='搜索:').pack(side='left', padx=(0, 5))
+    search_var = tk.StringVar()
+    search_entry = ttk.Entry(search_frame, textvariable=search_var, width=40)
+    search_entry.pack(side='left')
+    count_label = ttk.Label(search_frame, text='')
+    count_label.pack(side='right')
+
+    # 表格
+    table_frame = ttk.Frame(main_frame)
+    table_frame.pack(fill='both', expand=True)
+    column_names = [name for name, _ in MERGE_REPORT_COLUMNS]
+    tree = ttk.Treeview(table_frame, columns=column_names, show='headings')
+    for name, width in MERGE_REPORT_COLUMNS:
+        tree.heading(name, text=name)
+        tree.column(name, width=width, anchor='w')
+    y_scroll = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+    x_scroll = ttk.Scrollbar(table_frame, orient='horizontal', command=tree.xview)
+    tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+    y_scroll.pack(side='right', fill='y')
+    x_scroll.pack(side='bottom', fill='x')
+    tree.pack(fill='both', expand=True)
+
+    # generation用于丢弃已过期的分批插入任务
+    state = {'generation': 0, 'search_job': None}
+
+    def render(matches):
+        state['generation'] += 1
+        generation = state['generation']
+        tree.delete(*tree.get_children())
+        count_label.config(text=f'共{len(matches)}条')
+
+        def insert_batch(start):
+            if generation != state['generation'] or not window.winfo_exists():
+                return
+            for row in matches[start:start + MERGE_REPORT_BATCH_ROWS]:
+                tree.insert('', 'end', values=row)
+            if start + MERGE_REPORT_BATCH_ROWS < len(matches):
+                window.after(1, insert_batch, start + MERGE_REPORT_BATCH_ROWS)
+
+        insert_batch(0)
+
+    def apply_filter():
+        state['search_job'] = None
+        keyword = search_var.get().strip().lower()
+        render([row for row, text in merge_report if keyword in text])
+
+    def on_search_changed(*_):
+        if state['search_job']:
+            window.after_cancel(state['search_job'])
+        state['search_job'] = window.after(MERGE_REPORT_SEARCH_DELAY_MS, apply_filter)
+
+    search_var.trace_add('write', on_search_changed)
+    window.bind('<Escape>', lambda event: window.destroy())
+    search_entry.focus_set()
+    apply_filter()
+
+# ==================== 结果预览 ====================
+# 处理完成后在程序内预览结果，表格只渲染可见的一屏行，十万行以上也能流畅滚动
+PREVIEW_MAX_ROWS = 200000  # 每个工作表最多预览的行数
+PREVIEW_ROW_HEIGHT = 20  # 预览表格行高（像素）
+PREVIEW_FILTER_DELAY_MS = 250  # 筛选输入停止后延迟筛选的时间（毫秒）
+result_preview = []  # 最近一次处理的结果预览，每项为build_preview_sheet的返回值
+result_preview_button = None
+
+def build_preview_sheet(title, columns, rows, pn_column):
+    """
+    生成一个工作表的结果预览数据
+
+    Args:
+        title: 工作表名
+        columns: 输出列名
+        rows: 按columns排列的行值元组的可迭代对象
+        pn_column: 料号列名，用于料号搜索
+
+    Returns:
+        dict: 预览数据，超过PREVIEW_MAX_ROWS的行不保留
+    """
+    rows = list(itertools.islice(rows, PREVIEW_MAX_ROWS + 1))
+    return {
+        'title': title,
+        'columns': list(columns),
+        'rows': rows[:PREVIEW_MAX_ROWS],
+        'truncated': len(rows) > PREVIEW_MAX_ROWS,
+        'pn_column': pn_column
+    }
+
+def publish_result_preview(sheets):
+    """把结果预览交给界面（线程安全）"""
+    if has_gui_events():
+        post_gui_event('result_preview', sheets)
+
+def set_result_preview(sheets):
+    """在Tk主线程中保存结果预览并更新按钮状态"""
+    result_preview[:] = sheets
+    if result_preview_button is not None:
+        result_preview_button.config(state='normal' if result_preview else 'disabled')
+
+class VirtualTable:
+    """
+    虚拟滚动表格：Treeview中只保留可见的一屏行，滚动时替换这些行的内容
+
+    数据行保存在rows中，view为当前显示（筛选后）的行号列表，offset为第一可见行在view中的位置。
+    """
+    def __init__(self, parent, highlight_color):
+        self.frame = ttk.Frame(parent)
+        ttk.Style().configure('Preview.Treeview', rowheight=PREVIEW_ROW_HEIGHT)
+        self.tree = ttk.Treeview(self.frame, show='headings', style='Preview.Treeview', selectmode='browse')
+        self.y_scroll = ttk.Scrollbar(self.frame, orient='vertical', command=self.on_scrollbar)
+        x_scroll = ttk.Scrollbar(self.frame, orient='horizontal', command=self.tree.xview)
+        self.tree.configure(xscrollcommand=x_scroll.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.y_scroll.grid(row=0, column=1, sticky='ns')
+        x_scroll.grid(row=1, column=0, sticky='ew')
+        self.frame.rowconfigure(0, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+
+        # 替代料行使用与输出文件相同的高亮颜色
+        self.tree.tag_configure('substitute', background=f'#{highlight_color}')
+
+        self.rows = []
+        self.view = range(0)
+        self.offset = 0
+        self.page_size = 1
+        self.substitute_col = None
+
+        # 滚动由本类处理，不使用Treeview自身的滚动
+        self.tree.bind('<Configure>', lambda event: self.refresh())
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3) or 'break')
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3) or 'break')
+        self.tree.bind('<Up>', lambda event: self.scroll(-1) or 'break')
+        self.tree.bind('<Down>', lambda event: self.scroll(1) or 'break')
+        self.tree.bind('<Prior>', lambda event: self.scroll(-self.page_size) or 'break')
+        self.tree.bind('<Next>', lambda event: self.scroll(self.page_size) or 'break')
+
+    def set_data(self, columns, rows):
+        """设置表格的列和全部数据行"""
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=columns)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=max(60, min(220, len(str(col)) * 14)), anchor='w', stretch=False)
+        self.rows = rows
+        self.substitute_col = columns.index('操作类型') if '操作类型' in columns else None
+        self.set_view(range(len(rows)))
+
+    def set_view(self, view):
+        """设置当前显示的行号列表（升序），并回到第一行"""
+        self.view = view
+        self.offset = 0
+        self.refresh()
+
+    def scroll_to(self, position):
+        """滚动到view中的指定位置"""
+        self.offset = position
+        self.refresh()
+
+    def scroll(self, delta):
+        self.scroll_to(self.offset + delta)
+
+    def on_scrollbar(self, action, *args):
+        if action == 'moveto':
+            self.scroll_to(int(float(args[0]) * len(self.view)))
+        elif action == 'scroll':
+            amount = int(args[0])
+            if args[1] == 'pages':
+                amount *= self.page_size
+            self.scroll(amount)
+
+    def on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def refresh(self):
+        """按当前位置重新填充可见行"""
+        # 减去表头高度后计算一屏能显示的行数
+        self.page_size = max(1, (self.tree.winfo_height() - 25) // PREVIEW_ROW_HEIGHT)
+        self.offset = max(0, min(self.offset, len(self.view) - self.page_size))
+        count = max(0, min(self.page_size, len(self.view) - self.offset))
+
+        items = self.tree.get_children()
+        if len(items) > count:
+            self.tree.delete(*items[count:])
+            items = items[:count]
+        for position in range(count):
+            row = self.rows[self.view[self.offset + position]]
+            values = [format_report_value(value) for value in row]
+            is_substitute = self.substitute_col is not None and row[self.substitute_col] == '替代插入'
+            tags = ('substitute',) if is_substitute else ()
+            if position < len(items):
+                self.tree.item(items[position], values=values, tags=tags)
+            else:
+                self.tree.insert('', 'end', values=values, tags=tags)
+
+        total = len(self.view)
+        if total:
+            self.y_scroll.set(self.offset / total, (self.offset + count) / total)
+        else:
+            self.y_scroll.set(0, 1)
+
+    def select_position(self, position):
+        """
+        选中view中指定位置的行（该行需在当前可见范围内）
+
+        滚动到末尾附近时refresh会把offset限制在最后一屏，目标行不一定是第一可见行。
+        """
+        items = self.tree.get_children()
+        index = position - self.offset
+        if 0 <= index < len(items):
+            self.tree.selection_set(items[index])
+
+def show_result_preview():
+    """显示结果预览窗口：虚拟滚动表格、按列筛选、只看替代料行和料号搜索"""
+    if not result_preview:
+        return
+
+    window = tk.Toplevel(root)
+    window.title('结果预览')
+    window.geometry('1000x600')
+    window.transient(root)
+
+    main_frame = ttk.Frame(window, padding=10)
+    main_frame.pack(fill='both', expand=True)
+
+    # 控制栏
+    control_frame = ttk.Frame(main_frame)
+    control_frame.pack(fill='x', pady=(0, 8))
+
+    sheet_var = tk.StringVar(value=result_preview[0]['title'])
+    if len(result_preview) > 1:
+        ttk.Label(control_frame, text='工作表:').pack(side='left', padx=(0, 5))
+        ttk.Combobox(control_frame, textvariable=sheet_var, state='readonly', width=12,
+                     values=[sheet['title'] for sheet in result_preview]).pack(side='left', padx=(0, 10))
+
+    ttk.Label(control_frame, text='筛选:').pack(side='left', padx=(0, 5))
+    column_var = tk.StringVar(value='全部列')
+    column_box = ttk.Combobox(control_frame, textvariable=column_var, state='readonly', width=14)
+    column_box.pack(side='left', padx=(0, 5))
+    filter_var = tk.StringVar()
+    ttk.Entry(control_frame, textvariable=filter_var, width=18).pack(side='left', padx=(0, 10))
+    substitute_only_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(control_frame, text='只看替代料行', variable=substitute_only_var).pack(side='left', padx=(0, 10))
+
+    ttk.Label(control_frame, text='料号:').pack(side='left', padx=(0, 5))
+    pn_var = tk.StringVar()
+    pn_entry = ttk.Entry(control_frame, textvariable=pn_var, width=16)
+    pn_entry.pack(side='left', padx=(0, 5))
+    ttk.Button(control_frame, text='查找下一个', width=10,
+               command=lambda: find_next_pn()).pack(side='left')
+
+    count_label = ttk.Label(main_frame, text='', foreground='#666666')
+    count_label.pack(fill='x', pady=(0, 5))
+
+    config = load_config()
+    table = VirtualTable(main_frame, config.get('highlight_color', 'FFFF00'))
+    table.frame.pack(fill='both', expand=True)
+
+    # 当前工作表的数据和按需建立的索引
+    state = {'sheet': None, 'texts': {}, 'pn_index': None, 'pn_key': None, 'pn_matches': [], 'pn_pos': -1,
+             'filter_job': None}
+
+    def column_texts(col_idx):
+        """某一列（col_idx为None时为整行）的小写文本，第一次筛选该列时生成并缓存"""
+        if col_idx not in state['texts']:
+            rows = state['sheet']['rows']
+            if col_idx is None:
+                state['texts'][col_idx] = [' '.join(format_report_value(value) for value in row).lower()
+                                           for row in rows]
+            else:
+                state['texts'][col_idx] = [format_report_value(row[col_idx]).lower() for row in rows]
+        return state['texts'][col_idx]
+
+    def update_count():
+        sheet = state['sheet']
+        text = f"显示 {len(table.view)} / 共 {len(sheet['rows'])} 行"
+        if sheet['truncated']:
+            text += f"（仅预览前{PREVIEW_MAX_ROWS}行）"
+        count_label.config(text=text)
+
+    def apply_filter():
+        state['filter_job'] = None
+        sheet = state['sheet']
+        columns = sheet['columns']
+        keyword = filter_var.get().strip().lower()
+        view = range(len(sheet['rows']))
+        if keyword:
+            col_idx = columns.index(column_var.get()) if column_var.get() in columns else None
+            texts = column_texts(col_idx)
+            view = [idx for idx in view if keyword in texts[idx]]
+        if substitute_only_var.get() and table.substitute_col is not None:
+            rows = sheet['rows']
+            view = [idx for idx in view if rows[idx][table.substitute_col] == '替代插入']
+        table.set_view(view)
+        # 料号匹配保存的是view中的位置，筛选结果变化后需要重新查找
+        state.update(pn_key=None, pn_matches=[], pn_pos=-1)
+        update_count()
+
+    def schedule_filter(*_):
+        if state['filter_job']:
+            window.after_cancel(state['filter_job'])
+        state['filter_job'] = window.after(PREVIEW_FILTER_DELAY_MS, apply_filter)
+
+    def load_sheet(*_):
+        sheet = next(sheet for sheet in result_preview if sheet['title'] == sheet_var.get())
+        state.update(sheet=sheet, texts={}, pn_index=None, pn_key=None, pn_matches=[], pn_pos=-1)
+        column_box.config(values=['全部列'] + sheet['columns'])
+        column_var.set('全部列')
+        table.set_data(sheet['columns'], sheet['rows'])
+        apply_filter()
+
+    def find_next_pn(*_):
+        """按料号前缀查找，索引为(小写料号, 行号)的有序列表，第一次查找时建立"""
+        sheet = state['sheet']
+        keyword = pn_var.get().strip().lower()
+        if not keyword or sheet['pn_column'] not in sheet['columns']:
+            return
+        if state['pn_index'] is None:
+            pn_texts = column_texts(sheet['columns'].index(sheet['pn_column']))
+            state['pn_index'] = sorted((text, idx) for idx, text in enumerate(pn_texts) if text)
+        if keyword != state['pn_key']:
+            index = state['pn_index']
+            start = bisect.bisect_left(index, (keyword,))
+            matches = []
+            for text, idx in itertools.islice(index, start, None):
+                if not text.startswith(keyword):
+                    break
+                matches.append(idx)
+            # 只保留当前筛选结果中的行，按行号排序后依次跳转
+            view = table.view
+            positions = []
+            for idx in sorted(matches):
+                position = bisect.bisect_left(view, idx)
+                if position < len(view) and view[position] == idx:
+                    positions.append(position)
+            state.update(pn_key=keyword, pn_matches=positions, pn_pos=-1)
+
+        if not state['pn_matches']:
+            count_label.config(text=f"未找到料号 {pn_var.get().strip()}")
+            return
+        state['pn_pos'] = (state['pn_pos'] + 1) % len(state['pn_matches'])
+        position = state['pn_matches'][state['pn_pos']]
+        table.scroll_to(position)
+        table.select_position(position)
+        update_count()
+        count_label.config(text=count_label.cget('text') +
+                           f"，料号匹配 {state['pn_pos'] + 1}/{len(state['pn_matches'])}")
+
+    filter_var.trace_add('write', schedule_filter)
+    column_var.trace_add('write', schedule_filter)
+    substitute_only_var.trace_add('write', lambda *_: apply_filter())
+    sheet_var.trace_add('write', load_sheet)
+    pn_var.trace_add('write', lambda *_: state.update(pn_key=None))
+    pn_entry.bind('<Return>', find_next_pn)
+    window.bind('<Escape>', lambda event: window.destroy())
+
+    load_sheet()
+
+# ==================== 批量处理队列 ====================
+# 一次加入多个BOM文件，按顺序或在多个常驻处理进程中同时处理，共用同一个替代料表
+job_queue = []  # 队列中的任务，元素为new_queue_job的返回值
+job_queue_lock = threading.Lock()  # 保护任务状态的读取和领取
+job_queue_ids = itertools.count(1)
+job_queue_tree = None  # 批量处理窗口中的任务表格
+job_queue_buttons = {}  # 批量处理窗口中空闲时可用('idle')和处理中可用('running')的按钮
+JOB_QUEUE_COLUMNS = [('文件', 240), ('状态', 70), ('进度', 60), ('用时', 80), ('输出文件', 260), ('说明', 220)]
+
+def new_queue_job(bom_path):
+    """创建一个等待处理的批量任务"""
+    return {
+        'id': next(job_queue_ids),
+        'bom_path': bom_path,
+        'status': '等待',
+        'progress': 0,
+        'elapsed': None,
+        'output_files': [],
+        'message': '',
+        'warnings': 0
+    }
+
+def is_queue_bom_file(path):
+    """判断文件是否可以加入批量处理队列：Excel文件，且不是本程序的输出文件或Excel临时文件"""
+    name = os.path.basename(path)
+    return (name.lower().endswith('.xlsx') and not name.startswith('~$')
+            and '_替代料' not in name and '.partial' not in name)
+
+def add_queue_paths(paths):
+    """
+    把文件或文件夹加入批量处理队列，文件夹中的Excel文件按文件名排序加入（不包括子文件夹）
+
+    Args:
+        paths: 文件或文件夹路径列表
+
+    Returns:
+        int: 新加入的任务数
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(entry.path for entry in os.scandir(path)
+                                if entry.is_file() and is_queue_bom_file(entry.path)))
+        elif os.path.isfile(path) and is_queue_bom_file(path):
+            files.append(path)
+
+    # 替代料表本身和队列中尚未处理的文件不重复加入
+    sub_path = os.path.normcase(os.path.abspath(sub_var.get())) if hasattr(sub_var, 'get') and sub_var.get() else None
+    added = 0
+    with job_queue_lock:
+        waiting = {os.path.normcase(os.path.abspath(job['bom_path']))
+                   for job in job_queue if job['status'] in ('等待', '处理中')}
+        for file_path in files:
+            key = os.path.normcase(os.path.abspath(file_path))
+            if key in waiting or key == sub_path:
+                continue
+            waiting.add(key)
+            job_queue.append(new_queue_job(file_path))
+            added += 1
+    render_job_queue()
+    return added
+
+def format_queue_job(job):
+    """生成任务在表格中显示的值"""
+    if job['elapsed'] is None:
+        elapsed = ''
+    elif job['elapsed'] < 60:
+        elapsed = f"{job['elapsed']:.1f}秒"
+    else:
+        elapsed = f"{int(job['elapsed'] // 60)}分{job['elapsed'] % 60:.0f}秒"
+    message = job['message']
+    if job['warnings'] and not message:
+        message = f"{job['warnings']}条警告"
+    return (os.path.basename(job['bom_path']), job['status'], f"{int(job['progress'])}%", elapsed,
+            ', '.join(os.path.basename(path) for path in job['output_files']), message)
+
+def render_queue_job(job_id):
+    """在Tk主线程中刷新一个任务所在的表格行"""
+    if job_queue_tree is None or not job_queue_tree.winfo_exists():
+        return
+    job = next((job for job in job_queue if job['id'] == job_id), None)
+    if job is not None and job_queue_tree.exists(job_id):
+        job_queue_tree.item(job_id, values=format_queue_job(job), tags=(job['status'],))
+
+def render_job_queue():
+    """在Tk主线程中按队列重建任务表格"""
+    if job_queue_tree is None or not job_queue_tree.winfo_exists():
+        return
+    job_queue_tree.delete(*job_queue_tree.get_children())
+    for job in job_queue:
+        job_queue_tree.insert('', 'end', iid=job['id'], values=format_queue_job(job), tags=(job['status'],))
+
+def open_path(path):
+    """用系统默认程序打开文件或文件夹"""
+    if sys.platform == 'win32':
+        os.startfile(path)
+    elif sys.platform == 'darwin':
+        subprocess.Popen(['open', path])
+    else:
+        subprocess.Popen(['xdg-open', path])
+
+def run_queue_job(job, worker, sub_path, config):
+    """
+    处理一个批量任务，更新任务状态、用时和输出文件
+
+    Args:
+        job: 批量任务
+        worker: 使用的常驻处理进程，为None时在当前进程中处理
+        sub_path: 替代料表路径
+        config: 本次批量处理使用的配置
+    """
+    def handle_event(kind, args):
+        # 多个任务同时处理时不在主界面显示各自的进度和统计，只记录到任务中；
+        # 直接放入界面事件队列，不经post_gui_event，避免在当前进程处理时又交回本函数
+        if kind == 'progress':
+            job['progress'] = args[0]
+            gui_event_queue.put(('queue_job', (job['id'],)))
+        elif kind == 'status':
+            for line, _ in args[0]:
+                if line.startswith('处理失败：'):
+                    job['message'] = line[len('处理失败：'):]
+        elif kind in ('error', 'custom_error'):
+            if not job['message']:
+                job['message'] = args[1]
+        elif kind == 'warning':
+            job['warnings'] += 1
+        elif kind == 'flush_warnings':
+            # 警告已计入任务，刷新任务行显示警告数
+            gui_event_queue.put(('queue_job', (job['id'],)))
+        elif kind == 'config_update':
+            gui_event_queue.put((kind, args))
+
+    start_time = time.time()
+    post_gui_event('queue_job', job['id'])
+    try:
+        if worker is not None:
+            output_files = worker.run_job(job['bom_path'], sub_path, config, event_handler=handle_event)
+        else:
+            # 在当前进程中处理时同样把事件记录到任务中
+            _event_sink.handler = handle_event
+            try:
+                output_files = process_files(job['bom_path'], sub_path, config=config)
+            finally:
+                _event_sink.handler = None
+    except Exception as e:
+        logging.error(f"批量处理 {job['bom_path']} 出错: {e}", exc_info=True)
+        output_files = None
+        job['message'] = translate_error_to_chinese(e)
+
+    job['elapsed'] = time.time() - start_time
+    if output_files:
+        job.update(status='完成', progress=100, output_files=output_files)
+    elif cancel_event.is_set():
+        job['status'] = '已取消'
+    else:
+        job['status'] = '失败'
+        if not job['message']:
+            job['message'] = '处理失败，详见状态区域'
+    logging.info(f"批量任务 {job['bom_path']} {job['status']}，用时{job['elapsed']:.2f}秒")
+    post_gui_event('queue_job', job['id'])
+
+def start_job_queue():
+    """在后台线程中依次处理队列中等待的任务；开启常驻进程时可同时使用多个处理进程"""
+    if not any(job['status'] == '等待' for job in job_queue):
+        tkinter.messagebox.showinfo('提示', '队列中没有等待处理的文件', parent=root)
+        return
+    sub_path = sub_var.get()
+    if not sub_path:
+        tkinter.messagebox.showerror('错误', '请先选择替代料表', parent=root)
+        return
+    if not processing_lock.acquire(blocking=False):
+        tkinter.messagebox.showinfo('提示', '当前任务正在处理中，请等待完成或先取消', parent=root)
+        return
+
+    cancel_event.clear()
+    render_job_state(True)
+    # 所有任务共用开始时的配置快照
+    config = get_config_snapshot()
+    use_worker = config.get('use_worker_process', True)
+    worker_count = max(1, int(config.get('queue_workers', 1))) if use_worker else 1
+    worker_count = min(worker_count, sum(job['status'] == '等待' for job in job_queue))
+    while len(queue_engine_workers) < worker_count:
+        worker = EngineWorker()
+        atexit.register(worker.stop)
+        queue_engine_workers.append(worker)
+    # 取消标志只在整批开始时清除，处理过程中的取消请求对之后的任务同样有效
+    for worker in queue_engine_workers:
+        worker.reset_cancel()
+
+    def take_next_job():
+        with job_queue_lock:
+            if cancel_event.is_set():
+                return None
+            job = next((job for job in job_queue if job['status'] == '等待'), None)
+            if job is not None:
+                job['status'] = '处理中'
+            return job
+
+    def run_worker(worker):
+        while True:
+            job = take_next_job()
+            if job is None:
+                return
+            run_queue_job(job, worker, sub_path, config)
+
+    def run():
+        start_time = time.time()
+        try:
+            update_status("-" * 40)
+            update_status(f'开始批量处理（{worker_count}个进程）...')
+            threads = [Thread(target=run_worker, args=(queue_engine_workers[idx] if use_worker else None,), daemon=True)
+                       for idx in range(worker_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # 取消后剩余的任务标记为已取消
+            with job_queue_lock:
+                for job in job_queue:
+                    if job['status'] == '等待' and cancel_event.is_set():
+                        job['status'] = '已取消'
+                        post_gui_event('queue_job', job['id'])
+            counts = {status: sum(job['status'] == status for job in job_queue) for status in ('完成', '失败', '已取消')}
+            update_status(f"批量处理结束：完成{counts['完成']}个，失败{counts['失败']}个，取消{counts['已取消']}个，"
+                          f"用时{time.time() - start_time:.2f}秒",
+                          '#FF8C00' if counts['失败'] or counts['已取消'] else None)
+        except Exception as e:
+            logging.error(f"批量处理出错: {e}", exc_info=True)
+            notify_error('批量处理失败', str(e))
+        finally:
+            processing_lock.release()
+            post_gui_event('job_state', False)
+
+    Thread(target=run, daemon=True).start()
+
+def show_job_queue():
+    """显示批量处理队列窗口"""
+    global job_queue_tree
+    if job_queue_tree is not None and job_queue_tree.winfo_exists():
+        job_queue_tree.winfo_toplevel().lift()
+        return
+
+    window = tk.Toplevel(root)
+    window.title('批量处理')
+    window.geometry('960x480')
+    window.transient(root)
+
+    main_frame = ttk.Frame(window, padding=10)
+    main_frame.pack(fill='both', expand=True)
+
+    def add_files():
+        config = load_config()
+        initial_dir = config['last_bom_dir'] if config['last_bom_dir'] and os.path.exists(config['last_bom_dir']) \
+            else os.path.expanduser("~")
+        filenames = filedialog.askopenfilenames(filetypes=[('Excel文件', '*.xlsx')], initialdir=initial_dir,
+                                                parent=window)
+        if filenames:
+            add_queue_paths(window.tk.splitlist(filenames) if isinstance(filenames, str) else filenames)
+
+    def add_folder():
+        folder = filedialog.askdirectory(parent=window)
+        if folder and not add_queue_paths([folder]):
+            tkinter.messagebox.showinfo('提示', '文件夹中没有可以加入的BOM文件', parent=window)
+
+    def remove_selected():
+        selected = {int(iid) for iid in job_queue_tree.selection()}
+        with job_queue_lock:
+            job_queue[:] = [job for job in job_queue if job['id'] not in selected or job['status'] == '处理中']
+        render_job_queue()
+
+    def clear_finished():
+        with job_queue_lock:
+            job_queue[:] = [job for job in job_queue if job['status'] in ('等待', '处理中')]
+        render_job_queue()
+
+    def open_output(event=None):
+        for iid in job_queue_tree.selection():
+            job = next((job for job in job_queue if job['id'] == int(iid)), None)
+            if job is None:
+                continue
+            try:
+                if job['output_files']:
+                    open_path(job['output_files'][0])
+                else:
+                    open_path(os.path.dirname(os.path.abspath(job['bom_path'])))
+            except Exception as e:
+                logging.error(f"打开输出文件失败: {e}")
+                tkinter.messagebox.showerror('错误', f'打开输出文件失败：{e}', parent=window)
+
+    # 按钮栏
+    button_frame = ttk.Frame(main_frame)
+    button_frame.pack(fill='x', pady=(0, 8))
+    add_button = ttk.Button(button_frame, text='添加文件', command=add_files, width=10)
+    add_button.pack(side='left')
+    folder_button = ttk.Button(button_frame, text='添加文件夹', command=add_folder, width=10)
+    folder_button.pack(side='left', padx=(8, 0))
+    remove_button = ttk.Button(button_frame, text='移除所选', command=remove_selected, width=10)
+    remove_button.pack(side='left', padx=(8, 0))
+    clear_button = ttk.Button(button_frame, text='清除已结束', command=clear_finished, width=10)
+    clear_button.pack(side='left', padx=(8, 0))
+    ttk.Button(button_frame, text='打开输出', command=open_output, width=10).pack(side='left', padx=(8, 0))
+    queue_cancel_button = ttk.Button(button_frame, text='取消', command=cancel_processing, width=8)
+    queue_cancel_button.pack(side='right')
+    queue_start_button = ttk.Button(button_frame, text='开始批量处理', command=start_job_queue,
+                                    style='Primary.TButton', width=12)
+    queue_start_button.pack(side='right', padx=(0, 8))
+    job_queue_buttons['idle'] = [queue_start_button, add_button, folder_button, remove_button, clear_button]
+    job_queue_buttons['running'] = [queue_cancel_button]
+
+    hint = '使用主窗口中的替代料表和当前配置；双击任务打开输出文件'
+    if TkinterDnD is not None:
+        hint += '；可直接把文件或文件夹拖入此窗口'
+    ttk.Label(main_frame, text=hint, foreground='#666666').pack(fill='x', pady=(0, 5))
+
+    # 任务表格
+    table_frame = ttk.Frame(main_frame)
+    table_frame.pack(fill='both', expand=True)
+    column_names = [name for name, _ in JOB_QUEUE_COLUMNS]
+    job_queue_tree = ttk.Treeview(table_frame, columns=column_names, show='headings')
+    for name, width in JOB_QUEUE_COLUMNS:
+        job_queue_tree.heading(name, text=name)
+        job_queue_tree.column(name, width=width, anchor='w')
+    job_queue_tree.tag_configure('处理中', foreground='#0078D4')
+    job_queue_tree.tag_configure('完成', foreground='#008000')
+    job_queue_tree.tag_configure('失败', foreground='#D83B01')
+    job_queue_tree.tag_configure('已取消', foreground='#FF8C00')
+    y_scroll = ttk.Scrollbar(table_frame, orient='vertical', command=job_queue_tree.yview)
+    job_queue_tree.configure(yscrollcommand=y_scroll.set)
+    y_scroll.pack(side='right', fill='y')
+    job_queue_tree.pack(fill='both', expand=True)
+    job_queue_tree.bind('<Double-1>', open_output)
+
+    if TkinterDnD is not None:
+        window.drop_target_register(DND_FILES)
+        window.dnd_bind('<<Drop>>', lambda event: add_queue_paths(window.tk.splitlist(event.data)))
+
+    render_job_queue()
+    render_job_state(processing_lock.locked())
+
+# ==================== 替代料表自动重新加载 ====================
+# 定时检查替代料表是否被修改（例如在Excel中编辑并保存），修改后在后台重新读取并建立索引，
+# 处理时直接使用新数据；界面中显示当前加载的替代料表版本
+SUB_WATCH_INTERVAL_MS = 2000  # 检查替代料表修改的间隔（毫秒）
+_watched_sub_signature = None  # 最近一次加载的替代料表文件签名
+sub_info_label = None
+
+def reload_substitute_table(sub_path):
+    """
+    在后台重新读取替代料表并建立索引（常驻处理进程中或后台线程中）
+
+    Args:
+        sub_path: 替代料表路径
+    """
+    global _watched_sub_signature
+    try:
+        _watched_sub_signature = get_file_signature(sub_path)
+    except OSError:
+        return
+    config = load_config()
+    render_substitute_info({'path': os.path.abspath(sub_path), 'loading': True})
+    if config.get('use_worker_process', True):
+        engine_worker.preload(sub_path, config)
+    else:
+        Thread(target=preload_substitute_table, args=(sub_path, config), daemon=True).start()
+
+def watch_substitute_table():
+    """定时检查替代料表是否被修改，修改后自动重新加载；处理中不重新加载，待处理结束后再检查"""
+    try:
+        sub_path = sub_var.get()
+        if sub_path and not processing_lock.locked():
+            try:
+                signature = get_file_signature(sub_path)
+            except OSError:
+                signature = None
+            if signature is not None and signature != _watched_sub_signature:
+                if _watched_sub_signature is not None and _watched_sub_signature[0] == signature[0]:
+                    logging.info(f"替代料表已修改，重新加载: {sub_path}")
+                    update_status('检测到替代料表已修改，正在后台重新加载...', '#0078D4')
+                reload_substitute_table(sub_path)
+    except Exception as e:
+        logging.error(f"检查替代料表修改时出错: {e}", exc_info=True)
+    finally:
+        if root and root.winfo_exists():
+            root.after(SUB_WATCH_INTERVAL_MS, watch_substitute_table)
+
+def render_substitute_info(info):
+    """在Tk主线程中显示替代料表的版本信息（修改时间、行数、替代组数）"""
+    if sub_info_label is None:
+        return
+    if info.get('loading'):
+        sub_info_label.config(text='正在加载替代料表...', foreground='#666666')
+    elif info.get('error'):
+        sub_info_label.config(text=f"替代料表加载失败：{info['error']}", foreground='#D83B01')
+    else:
+        mtime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['mtime']))
+        sub_info_label.config(text=f"已加载 {os.path.basename(info['path'])}（修改时间 {mtime}，"
+                                   f"{info['rows']}行，{info['groups']}个替代组）",
+                              foreground='#666666')
+
+def process_gui_events():
+    """定时取出界面事件队列中的事件并更新界面
+
+    同一轮中的多次进度更新只绘制最后一次，状态行一次性追加；弹出对话框前先刷新界面并显示暂存的警告。
+    """
+    latest_progress = None
+    latest_detail = None
+    status_lines = []
+
+    def apply_updates():
+        nonlocal latest_progress, latest_detail
+        if latest_progress is not None:
+            render_progress(latest_progress)
+            latest_progress = None
+        if latest_detail is not None:
+            render_progress_detail(latest_detail)
+            latest_detail = None
+        if status_lines:
+            render_status_lines(status_lines)
+            status_lines.clear()
+
+    try:
+        for _ in range(GUI_MAX_EVENTS_PER_POLL):
+            try:
+                kind, args = gui_event_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                latest_progress = args[0]
+            elif kind == 'progress_detail':
+                latest_detail = args[0]
+            elif kind == 'status':
+                status_lines.extend(args[0])
+            elif kind == 'merge_report':
+                set_merge_report(args[0])
+            elif kind == 'result_preview':
+                set_result_preview(args[0])
+            elif kind == 'queue_job':
+                render_queue_job(args[0])
+            elif kind == 'substitute_info':
+                render_substitute_info(args[0])
+            elif kind == 'job_state':
+                render_job_state(args[0])
+            elif kind == 'config_update':
+                update_config_values(args[0])
+            elif kind == 'warning':
+                _pending_warnings.append(args)
+            else:
+                apply_updates()
+                show_pending_warnings()
+                if kind == 'error':
+                    tkinter.messagebox.showerror(*args, parent=root)
+                elif kind == 'custom_error':
+                    show_custom_error(*args)
+        apply_updates()
+    except Exception as e:
+        logging.error(f"处理界面事件时出错: {e}", exc_info=True)
+    finally:
+        if root and root.winfo_exists():
+            root.after(GUI_POLL_INTERVAL_MS, process_gui_events)
+
+def show_help():
+    """显示使用帮助对话框，带有标签页和格式化文本"""
+    help_window = tk.Toplevel()
+    help_window.withdraw()  # 先隐藏窗口，避免闪烁
+    help_window.title("BOM替代料工具 - 使用帮助")
+
+    # 设置窗口尺寸和位置
+    window_width = 700
+    window_height = 550
+
+    # 计算窗口居中位置
+    screen_width = help_window.winfo_screenwidth()
+    screen_height = help_window.winfo_screenheight()
+    center_x = int((screen_width - window_width) / 2)
+    center_y = int((screen_height - window_height) / 2)
+
+    # 设置窗口位置
+    help_window.geometry(f"{window_width}x{window_height}+{center_x}+{center_y}")
+
+    # 设置窗口图标（如果可用）
+    try:
+        icon_path = resource_path('DSC01.ico')
+        if os.path.exists(icon_path):
+            help_window.iconbitmap(icon_path)
+    except Exception:
+        pass
+
+    # 设置样式
+    style = ttk.Style()
+    style.configure("Tab.TFrame", background="#f5f5f5")
+
+    # 创建主框架
+    main_frame = ttk.Frame(help_window, padding=10)
+    main_frame.pack(fill='both', expand=True)
+
+    # 创建标签页控件
+    tab_control = ttk.Notebook(main_frame)
+
+    # 创建各个标签页
+    tab_overview = ttk.Frame(tab_control, style="Tab.TFrame")
+    tab_updates = ttk.Frame(tab_control, style="Tab.TFrame")
+    tab_usage = ttk.Frame(tab_control, style="Tab.TFrame")
+    tab_contact = ttk.Frame(tab_control, style="Tab.TFrame")
+
+    tab_control.add(tab_overview, text=" 概览 ")
+    tab_control.add(tab_updates, text=" 更新说明 ")
+    tab_control.add(tab_usage, text=" 使用方法 ")
+    tab_control.add(tab_contact, text=" 技术支持 ")
+
+    tab_control.pack(fill="both", expand=True)
+
+    # === 概览标签页内容 ===
+    overview_frame = ttk.Frame(tab_overview, padding=15)
+    overview_frame.pack(fill='both', expand=True)
+
+    # 标题
+    title_label = ttk.Label(overview_frame,
+                         text="BOM替代料工具",
+                         font=('微软雅黑', 16, 'bold'))
+    title_label.pack(anchor='w', pady=(0, 10))
+
+    # 当前版本
+    version_frame = ttk.Frame(overview_frame)
+    version_frame.pack(fill='x', pady=(0, 15))
+
+    version_label = ttk.Label(version_frame,
+                            text="当前版本：v2.5",
+                            font=('微软雅黑', 10, 'bold'))
+    version_label.pack(side='left')
+
+    date_label = ttk.Label(version_frame,
+                         text="发布日期：2025年5月12日",
+                         font=('微软雅黑', 10))
+    date_label.pack(side='right')
+
+    ttk.Separator(overview_frame, orient='horizontal').pack(fill='x', pady=10)
+
+    # 工具概述
+    overview_text = tk.Text(overview_frame, wrap=tk.WORD, height=20,
+                          font=('微软雅黑', 10), background="#f9f9f9",
+                          padx=15, pady=15, borderwidth=1, relief="solid")
+    overview_text.pack(fill='both', expand=True)
+
+    overview_content = """BOM替代料工具是一款专业的电子制造业辅助软件，专为解决电子BOM（物料清单）管理过程中的替代料处理而设计。
+
+本工具能自动识别并处理BOM表中的替代料关系，显著提高物料管理效率和准确性。主要功能包括：
+
+• BOM自动重构 - 生成带完整替代料标识的新BOM
+• 相同料号智能合并 - 自动合并相同物料的多个条目
+• 位号统计精确化 - 准确计算每个物料的位号数量
+• 表头配置功能 - 支持自定义BOM表头字段名称
+
+推荐使用场景：
+- PCB生产物料清单处理
+- BOM标准化与一致性检查
+- 物料替代关系管理
+- 供应链物料优化
+"""
+
+    overview_text.insert(tk.END, overview_content)
+    overview_text.config(state=tk.DISABLED)
+
+    # === 更新说明标签页内容 ===
+    updates_frame = ttk.Frame(tab_updates, padding=15)
     updates_frame.pack(fill='both', expand=True)
 
     # 创建滚动条
@@ -1330,6 +2960,59 @@ def count_references(reference_text):
     references = [ref.strip() for ref in str(reference_text).split(',') if ref.strip()]
     return len(references)
 
+def read_header_values(file_path, header_row=1):
+    """
+    读取Excel第一个工作表中指定表头行的原始单元格值（与pandas默认读取的工作表一致）
+
+    Args:
+        file_path: Excel文件路径
+        header_row: 表头所在行号（从1开始）
+
+    Returns:
+        list: 表头行的原始值
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(min_row=header_row, max_row=header_row, values_only=True):
+            return list(row)
+        return []
+    finally:
+        wb.close()
+
+def resolve_read_columns(header_values, column_names, string_columns, prune_columns=False):
+    """
+    根据实际表头解析pandas读取时使用的列和数据类型
+
+    Args:
+        header_values: 表头行的原始单元格值
+        column_names: 需要读取的列名（映射列和保留列），比较时不区分大小写
+        string_columns: 需要显式按字符串读取的列名，比较时不区分大小写
+        prune_columns: 是否只读取column_names中的列
+
+    Returns:
+        tuple: (usecols, dtype)，usecols为None表示读取全部列
+    """
+    wanted = {str(name).strip().lower() for name in column_names if name}
+    as_string = {str(name).strip().lower() for name in string_columns if name}
+
+    # dtype的键必须与pandas读出的列名完全一致，因此使用表头行中的原始值
+    dtype = {
+        value: str for value in header_values
+        if value is not None and str(value).strip().lower() in as_string
+    }
+
+    usecols = ColumnNameFilter(wanted) if prune_columns else None
+
+    return usecols, dtype
+
+class ColumnNameFilter:
+    """pandas usecols使用的列筛选器，按列名（不区分大小写）筛选，可传给子进程"""
+    def __init__(self, wanted):
+        self.wanted = wanted
+
+    def __call__(self, col):
+        return str(col).strip().lower() in self.wanted
+
 def show_custom_error(title, message, parent=None):
     """显示自定义错误对话框
 
@@ -1480,991 +3163,2267 @@ def translate_error_to_chinese(error):
     # 如果没有匹配到任何已知错误，返回原始错误信息
     return f"程序错误：{error_str}"
 
-def process_files():
-    try:
-        # 记录开始时间
-        start_time = time.time()
+# ==================== 处理引擎 ====================
+# 以下函数按"行"处理数据（每行是一个字典），普通模式和分块模式共用同一套逻辑，
+# 保证两种模式生成的结果完全一致
 
-        # 获取全局变量
-        global bom_var, sub_var, status_var, progress, progress_percent
+# 与pandas默认na_values一致的空值字符串，分块读取时保持与pd.read_excel相同的解析结果
+EXCEL_NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
 
-        # 确保变量已初始化
-        if not hasattr(bom_var, 'get') or not hasattr(sub_var, 'get'):
-            tkinter.messagebox.showerror('错误', '请先选择文件')
-            return
+# 并行处理的最少行数，行数较少时进程启动和数据传输的开销超过并行收益
+PARALLEL_MIN_ROWS = 2000
 
-        # 初始化进度条
-        progress['maximum'] = 100
-        update_progress(0)
-        update_status("开始处理文件...")
+# 并行处理时每个进程分到的分区数，分区较小时取消后尚未开始的分区可以直接丢弃
+PARALLEL_PARTITIONS_PER_WORKER = 4
 
-        # 更新状态
-        update_status('正在处理中...')
+# 等待子进程结果时检查取消标志的间隔（秒）
+POOL_CANCEL_POLL_INTERVAL = 0.1
 
-        # 获取选择的文件路径
-        bom_path = bom_var.get()
-        sub_path = sub_var.get()
+# 展开替代料、合并相同料号时每处理多少行检查一次取消标志
+CANCEL_CHECK_ROWS = 1024
 
-        if not bom_path or not sub_path:
-            tkinter.messagebox.showerror('错误', '请先选择BOM文件和替代料表')
-            return
+# 进度刷新的最小间隔（秒），按固定帧率合并进度更新
+PROGRESS_FRAME_INTERVAL = 0.1
 
-        # 加载配置中的表头映射
-        config = load_config()
-        bom_header_mapping = config['bom_header_mapping']  # BOM表头映射
-        sub_header_mapping = config['sub_header_mapping']  # 替代料表表头映射
+class ProcessingCancelled(Exception):
+    """用户取消了当前处理任务"""
 
-        # 获取BOM文件必需列表头
-        required_bom_columns = [
-            bom_header_mapping['item'],           # Item编号字段
-            bom_header_mapping['pn'],             # 物料编号字段
-            bom_header_mapping['part'],           # 零件字段
-            bom_header_mapping['reference'],      # 位号字段
-            bom_header_mapping['quantity'],       # 数量字段
-            bom_header_mapping['description'],    # 描述字段
-            bom_header_mapping['mfr_pn'],         # 制造商料号字段
-            bom_header_mapping['manufacturer']    # 制造商字段
-        ]
+# 取消标志：界面点击"取消"时设置，处理引擎在阶段之间和行循环中检查
+cancel_event = threading.Event()
 
-        # 获取替代料表必需列表头
-        required_sub_columns = [
-            sub_header_mapping['pn'],             # 物料编号字段
-            sub_header_mapping['attribute']       # 替代料属性字段
-        ]
+def check_cancelled():
+    """如果用户已取消处理，抛出ProcessingCancelled"""
+    if cancel_event.is_set():
+        raise ProcessingCancelled()
 
-        # 识别项目信息行
-        logging.info("开始识别项目信息行")
-        update_status('正在识别项目信息行...')
+def get_partial_output_path(output_path):
+    """获取写出过程中使用的临时文件路径，与输出文件位于同一目录，写完后再重命名为输出文件"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + '.partial' + output_path.suffix)
 
-        # 读取原始Excel文件以获取格式信息
-        original_wb = openpyxl.load_workbook(bom_path)
-        original_ws = original_wb.active
-
-        # 找到第一个包含必需列的行
-        header_row = None
-
-        for row_idx, row in enumerate(original_ws.iter_rows(min_row=1, max_row=original_ws.max_row), 1):
-            row_values = [str(cell.value).strip() if cell.value is not None else '' for cell in row]
-            # 检查是否至少有一半的必需列存在于当前行
-            matches = sum(1 for col in required_bom_columns if any(col.lower() == val.lower() for val in row_values))
-            if matches >= len(required_bom_columns) / 2:  # 如果有至少一半的列匹配
-                header_row = row_idx
-                # 记录实际找到的表头，用于后续处理
-                found_headers = {val.lower(): val for val in row_values if val}
-                # 更新last_used_header_mapping，记录实际使用的表头
-                for key, expected_header in bom_header_mapping.items():
-                    if expected_header.lower() in found_headers:
-                        config['last_used_header_mapping'][key] = found_headers[expected_header.lower()]
-                save_config(config)
-                break
+class ProgressReporter:
+    """
+    按工作量汇报处理进度
 
-        if header_row is None:
-            raise ValueError("无法在BOM文件中找到必需列，请检查表头配置是否正确")
+    处理过程分为若干阶段，每个阶段占总进度的一段区间；阶段内按已完成的工作量
+    （展开的行数、重新编号的行数、设置样式的行数、复制的工作表数等）计算进度，
+    更新按固定帧率合并后再交给回调，同时给出本阶段的吞吐量和预计剩余时间。
+    每次汇报工作量时检查取消标志，因此也是处理引擎响应取消的检查点。
+    开始下一阶段时记录上一阶段的耗时（perf_counter）和处理行数，用于统计各阶段耗时。
+    """
 
-        # 保存项目信息行
-        project_info_rows = []
-        for row_idx in range(1, header_row):
-            row_data = {}
-            for col_idx, cell in enumerate(original_ws[row_idx], 1):
-                # 保存样式属性而不是样式对象
-                row_data[col_idx] = {
-                    'value': cell.value,
-                    'font_name': cell.font.name,
-                    'font_size': cell.font.size,
-                    'font_bold': cell.font.bold,
-                    'fill_type': cell.fill.fill_type,
-                    'fill_color': cell.fill.start_color.rgb if cell.fill.start_color else None,
-                    'border_left': cell.border.left.style if cell.border.left else None,
-                    'border_right': cell.border.right.style if cell.border.right else None,
-                    'border_top': cell.border.top.style if cell.border.top else None,
-                    'border_bottom': cell.border.bottom.style if cell.border.bottom else None,
-                    'alignment_horizontal': cell.alignment.horizontal,
-                    'alignment_vertical': cell.alignment.vertical,
-                    'number_format': cell.number_format
-                }
-            project_info_rows.append(row_data)
+    def __init__(self, progress_callback=None, detail_callback=None, frame_interval=PROGRESS_FRAME_INTERVAL,
+                 cancel_event=None):
+        """
+        Args:
+            progress_callback: 进度回调函数，接收一个参数(百分比)
+            detail_callback: 进度详情回调函数，接收一个参数(详情文本)
+            frame_interval: 两次刷新之间的最小间隔（秒）
+            cancel_event: 取消标志（threading.Event），设置后抛出ProcessingCancelled
+        """
+        self.progress_callback = progress_callback
+        self.detail_callback = detail_callback
+        self.frame_interval = frame_interval
+        self.cancel_event = cancel_event
+        self.stage_name = ''
+        self.start = 0
+        self.end = 0
+        self.total = 0
+        self.done = 0
+        self.unit = '行'
+        self.stage_started = time.monotonic()
+        self.last_emit = 0.0
+        self.stage_timer = None
+        self.stage_rows = None
+        self.timings = []  # 已结束的阶段：{'stage', 'seconds', 'rows', 'unit'}
+
+    def start_stage(self, name, start, end, total=0, unit='行'):
+        """
+        开始一个新阶段
+
+        Args:
+            name: 阶段名称
+            start: 阶段开始时的总进度百分比
+            end: 阶段结束时的总进度百分比
+            total: 本阶段的总工作量，未知时为0
+            unit: 工作量单位
+        """
+        self.check_cancelled()
+        self.finish_stage()
+        self.stage_name = name
+        self.start = start
+        self.end = end
+        self.total = total
+        self.done = 0
+        self.unit = unit
+        self.stage_started = time.monotonic()
+        self.stage_timer = time.perf_counter()
+        self.stage_rows = None
+        self.emit()
+
+    def set_stage_rows(self, rows):
+        """记录本阶段处理的行数，未记录时使用已完成的工作量或本阶段的总工作量"""
+        self.stage_rows = rows
+
+    def finish_stage(self):
+        """结束当前阶段，记录耗时和处理行数"""
+        if self.stage_timer is None:
+            return
+        rows = self.stage_rows if self.stage_rows is not None else (self.done or self.total)
+        self.timings.append({'stage': self.stage_name, 'seconds': time.perf_counter() - self.stage_timer,
+                             'rows': rows, 'unit': self.unit})
+        self.stage_timer = None
+
+    def stage_timings(self):
+        """
+        各阶段的耗时，同名阶段（如多个工作表的写出）合并
+
+        Returns:
+            list: 按首次出现顺序排列的{'stage', 'seconds', 'rows', 'unit'}
+        """
+        merged = {}
+        for timing in self.timings:
+            if timing['stage'] in merged:
+                merged[timing['stage']]['seconds'] += timing['seconds']
+                merged[timing['stage']]['rows'] += timing['rows']
+            else:
+                merged[timing['stage']] = dict(timing)
+        return list(merged.values())
+
+    def check_cancelled(self):
+        """如果取消标志已设置，抛出ProcessingCancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ProcessingCancelled()
+
+    def advance(self, units=1):
+        """完成一定工作量，距上次刷新超过帧间隔时才汇报"""
+        self.check_cancelled()
+        self.done += units
+        now = time.monotonic()
+        if now - self.last_emit >= self.frame_interval:
+            self.emit(now)
+
+    def percent(self):
+        """当前总进度百分比"""
+        if not self.total:
+            return self.start
+        return self.start + (self.end - self.start) * min(self.done / self.total, 1)
+
+    def emit(self, now=None):
+        """立即汇报当前进度和详情"""
+        now = now or time.monotonic()
+        self.last_emit = now
+        if self.progress_callback:
+            self.progress_callback(self.percent())
+        if self.detail_callback:
+            self.detail_callback(self.format_detail(now))
+
+    def format_detail(self, now):
+        """生成进度详情文本，包含已完成工作量、吞吐量和预计剩余时间"""
+        text = self.stage_name
+        if self.total:
+            text += f"：{self.done}/{self.total}{self.unit}"
+        elif self.done:
+            text += f"：{self.done}{self.unit}"
+
+        elapsed = now - self.stage_started
+        if self.done and elapsed > 0:
+            rate = self.done / elapsed
+            text += f"，{rate:.0f}{self.unit}/秒"
+            if self.total > self.done:
+                remaining = int((self.total - self.done) / rate)
+                if remaining >= 60:
+                    text += f"，预计剩余{remaining // 60}分{remaining % 60}秒"
+                else:
+                    text += f"，预计剩余{remaining}秒"
+        return text
 
-        # 更新进度
-        update_progress(10)
+def snapshot_cell_style(cell):
+    """
+    保存单元格的值和样式属性（保存属性而不是样式对象）
 
-        # 使用pandas读取BOM文件，跳过项目信息行
-        logging.info(f"读取BOM文件: {bom_path}，跳过前 {header_row-1} 行")
-        bom_df = pd.read_excel(bom_path, dtype={bom_header_mapping['item']: str}, skiprows=header_row-1)
-        logging.info(f"BOM文件列: {list(bom_df.columns)}")
+    Args:
+        cell: openpyxl单元格，支持只读模式下的单元格
 
-        # 单独读取替代料表，不应用项目信息行的跳过
-        logging.info(f"读取替代料表: {sub_path}")
-        try:
-            sub_df = pd.read_excel(sub_path, dtype={sub_header_mapping['pn']: str})
-            logging.info(f"替代料表列: {list(sub_df.columns)}")
-        except Exception as e:
-            error_msg = translate_error_to_chinese(e)
-            logging.error(f"读取替代料表失败: {e}")
+    Returns:
+        dict: 单元格的值和样式属性
+    """
+    # 只读模式下的空单元格没有样式对象
+    font = cell.font
+    fill = cell.fill
+    border = cell.border
+    alignment = cell.alignment
+    return {
+        'value': cell.value,
+        'font_name': font.name if font else None,
+        'font_size': font.size if font else None,
+        'font_bold': font.bold if font else None,
+        'fill_type': fill.fill_type if fill else None,
+        'fill_color': fill.start_color.rgb if fill and fill.start_color else None,
+        'border_left': border.left.style if border and border.left else None,
+        'border_right': border.right.style if border and border.right else None,
+        'border_top': border.top.style if border and border.top else None,
+        'border_bottom': border.bottom.style if border and border.bottom else None,
+        'alignment_horizontal': alignment.horizontal if alignment else None,
+        'alignment_vertical': alignment.vertical if alignment else None,
+        'number_format': cell.number_format or 'General'
+    }
 
-            # 使用自定义错误对话框
-            error_details = f"读取替代料表时出错：\n\n{error_msg}\n\n请检查文件格式是否正确。"
-            show_custom_error('读取文件错误', error_details)
-            return
+def restore_cell_style(cell, cell_data):
+    """
+    将snapshot_cell_style保存的值和样式恢复到单元格
 
-        # 确保BOM文件表头字段存在（不区分大小写）
-        missing_bom_fields = []
-        # 创建列名的小写映射，用于不区分大小写的匹配
-        columns_lower = {col.lower(): col for col in bom_df.columns}
-
-        for field, header in bom_header_mapping.items():
-            # 检查表头是否存在（不区分大小写）
-            if header.lower() in columns_lower:
-                # 如果存在但大小写不同，使用实际的列名替换配置中的列名
-                actual_column = columns_lower[header.lower()]
-                if actual_column != header:
-                    logging.info(f"表头大小写不同，使用实际列名: '{actual_column}' 替代 '{header}'")
-                    bom_header_mapping[field] = actual_column
-            else:
-                missing_bom_fields.append(header)
-                # 对于Description列，提供特殊处理
-                if field == 'description':
-                    tkinter.messagebox.showwarning('警告', f'BOM文件中未找到表头 "{header}"，请检查表头配置')
-                else:
-                    tkinter.messagebox.showwarning('警告', f'BOM文件中未找到表头 "{header}"，请检查表头配置')
+    Args:
+        cell: 目标单元格（普通单元格或WriteOnlyCell）
+        cell_data: snapshot_cell_style返回的字典
+    """
+    cell.value = cell_data['value']
 
-        if missing_bom_fields:
-            logging.warning(f"BOM文件缺少以下字段: {missing_bom_fields}")
+    # 恢复字体
+    cell.font = Font(
+        name=cell_data['font_name'],
+        size=cell_data['font_size'],
+        bold=cell_data['font_bold']
+    )
 
-            # 如果缺少Description列，添加一个空列以避免后续处理错误
-            if bom_header_mapping['description'] not in bom_df.columns:
-                bom_df[bom_header_mapping['description']] = ""
-                logging.info(f"已添加空的Description列: {bom_header_mapping['description']}")
+    # 恢复填充
+    if cell_data['fill_type'] and cell_data['fill_color']:
+        cell.fill = PatternFill(
+            fill_type=cell_data['fill_type'],
+            start_color=cell_data['fill_color'],
+            end_color=cell_data['fill_color']
+        )
 
-        # 确保替代料表表头字段存在（不区分大小写）
-        missing_sub_fields = {'required': [], 'optional': []}
-        # 创建列名的小写映射，用于不区分大小写的匹配
-        sub_columns_lower = {col.lower(): col for col in sub_df.columns}
-
-        for field, header in sub_header_mapping.items():
-            # 检查表头是否存在（不区分大小写）
-            if header.lower() in sub_columns_lower:
-                # 如果存在但大小写不同，使用实际的列名替换配置中的列名
-                actual_column = sub_columns_lower[header.lower()]
-                if actual_column != header:
-                    logging.info(f"替代料表表头大小写不同，使用实际列名: '{actual_column}' 替代 '{header}'")
-                    sub_header_mapping[field] = actual_column
-            else:
-                # 只检查必需的替代料表字段
-                if field in ['pn', 'attribute']:  # 只检查物料编号和属性字段
-                    missing_sub_fields['required'].append(header)
-                    tkinter.messagebox.showwarning('警告', f'替代料表中未找到必需的表头 "{header}"，请检查表头配置')
-                else:  # 其他字段为可选
-                    missing_sub_fields['optional'].append(header)
-                    tkinter.messagebox.showwarning('警告', f'替代料表中未找到可选的表头 "{header}"，部分信息可能无法显示')
+    # 恢复边框
+    border_styles = {
+        'left': cell_data['border_left'],
+        'right': cell_data['border_right'],
+        'top': cell_data['border_top'],
+        'bottom': cell_data['border_bottom']
+    }
+    cell.border = Border(**{
+        side: Side(style=style) if style else None
+        for side, style in border_styles.items()
+    })
+
+    # 恢复对齐
+    cell.alignment = Alignment(
+        horizontal=cell_data['alignment_horizontal'],
+        vertical=cell_data['alignment_vertical']
+    )
 
-        if missing_sub_fields['required'] or missing_sub_fields['optional']:
-            logging.warning(f"替代料表缺少字段: 必需={missing_sub_fields['required']}, 可选={missing_sub_fields['optional']}")
+    # 恢复数字格式
+    cell.number_format = cell_data['number_format']
 
-            # 如果缺少Description列，添加一个空列以避免后续处理错误
-            if sub_header_mapping['description'] not in sub_df.columns:
-                sub_df[sub_header_mapping['description']] = ""
-                logging.info(f"已添加空的Description列到替代料表: {sub_header_mapping['description']}")
-
-        # 先对原始BOM的item进行顺序编号
-        logging.info("开始对原始BOM进行item重新编号")
-        update_status('正在对原始BOM进行item重新编号...')
+def copy_cell_style(source_cell, target_cell):
+    """
+    复制单元格的字体、对齐、边框、填充和数字格式
 
-        # 创建临时列，提取主序号和子序号
-        item_col = bom_header_mapping['item']
-        bom_df['主序号'] = bom_df[item_col].apply(
-            lambda x: int(str(x).split('.')[0]) if not pd.isna(x) and '.' in str(x) else
-                     int(x) if not pd.isna(x) and str(x).isdigit() else 999999
+    Args:
+        source_cell: 源单元格
+        target_cell: 目标单元格（普通单元格或WriteOnlyCell）
+    """
+    # 复制字体
+    if source_cell.font:
+        target_cell.font = Font(
+            name=source_cell.font.name,
+            size=source_cell.font.size,
+            bold=source_cell.font.bold,
+            italic=source_cell.font.italic,
+            underline=source_cell.font.underline,
+            strike=source_cell.font.strike,
+            color=source_cell.font.color
         )
 
-        bom_df['子序号'] = bom_df[item_col].apply(
-            lambda x: int(str(x).split('.')[1]) if not pd.isna(x) and '.' in str(x) else 0
+    # 复制对齐方式
+    if source_cell.alignment:
+        target_cell.alignment = Alignment(
+            horizontal=source_cell.alignment.horizontal,
+            vertical=source_cell.alignment.vertical,
+            textRotation=source_cell.alignment.textRotation,
+            wrapText=source_cell.alignment.wrapText,
+            shrinkToFit=source_cell.alignment.shrinkToFit,
+            indent=source_cell.alignment.indent
         )
 
-        # 按主序号和子序号排序
-        bom_df = bom_df.sort_values(['主序号', '子序号'])
+    # 复制边框
+    if source_cell.border:
+        sides = {}
+        for side in ['left', 'right', 'top', 'bottom']:
+            side_obj = getattr(source_cell.border, side)
+            if side_obj and side_obj.style:
+                sides[side] = Side(style=side_obj.style, color=side_obj.color)
+            else:
+                sides[side] = None
 
-        # 重新编号（从1开始的连续数字）
-        new_items = []
-        current_item = 1
+        target_cell.border = Border(**sides)
 
-        for idx, row in bom_df.iterrows():
-            if row['子序号'] == 0:  # 普通行
-                new_items.append(str(current_item))
-                current_item += 1
-            else:  # 已有子序号的行也转为普通序号
-                new_items.append(str(current_item))
-                current_item += 1
+    # 复制填充
+    if source_cell.fill and source_cell.fill.fill_type != 'none':
+        try:
+            fill_type = source_cell.fill.fill_type
+
+            # 创建新的填充对象
+            if fill_type == 'solid':
+                if hasattr(source_cell.fill, 'start_color') and source_cell.fill.start_color:
+                    rgb = source_cell.fill.start_color.rgb if hasattr(source_cell.fill.start_color, 'rgb') else None
+                    if rgb:
+                        target_cell.fill = PatternFill(fill_type='solid', start_color=rgb)
+        except Exception as fill_error:
+            logging.warning(f"复制填充样式失败: {fill_error}")
+
+    # 复制数字格式
+    if source_cell.number_format:
+        target_cell.number_format = source_cell.number_format
+
+def detect_bom_header(rows, candidates):
+    """
+    查找BOM表头行，并保存表头之前的项目信息行；同时为所有候选表头配置打分，只扫描一遍工作表
 
-        # 更新Item列
-        bom_df[item_col] = new_items
+    每行的单元格值只转换一次，所有候选配置都用同一个集合计算匹配的必需列数；
+    第一个有候选配置匹配至少一半必需列的行即为表头行，该行上匹配列数最多的配置胜出，
+    列数相同时优先使用排在前面的配置。
 
-        # 删除临时列
-        bom_df = bom_df.drop(['主序号', '子序号'], axis=1)
+    Args:
+        rows: 工作表的行迭代器，如ws.iter_rows()
+        candidates: 有序字典，配置名 -> BOM必需列的表头名称
 
-        # 更新进度
-        update_progress(20)
+    Returns:
+        tuple: (表头行号, 表头原始值, 项目信息行, 匹配的配置名)，未找到表头时行号和配置名为None
+    """
+    candidates = {name: [str(col).lower() for col in columns] for name, columns in candidates.items()}
+    project_info_rows = []
+    for row_idx, row in enumerate(rows, 1):
+        row_values = {str(cell.value).strip().lower() for cell in row if cell.value is not None}
+        best_name, best_matches = None, 0
+        for name, columns in candidates.items():
+            matches = sum(1 for col in columns if col in row_values)
+            # 至少一半的必需列存在于当前行
+            if matches >= len(columns) / 2 and matches > best_matches:
+                best_name, best_matches = name, matches
+        if best_name is not None:
+            return row_idx, [cell.value for cell in row], project_info_rows, best_name
+
+        project_info_rows.append({col_idx: snapshot_cell_style(cell) for col_idx, cell in enumerate(row, 1)})
+
+    return None, [], [], None
+
+# 表头配置方案中保存的配置项：表头映射、高亮颜色和输出选项
+HEADER_PROFILE_KEYS = ('bom_header_mapping', 'sub_header_mapping', 'highlight_color', 'prune_columns',
+                       'passthrough_columns', 'variant_columns', 'dnp_markers')
+
+def get_required_bom_columns(bom_header_mapping):
+    """获取BOM文件必需列的表头名称，用于查找表头行"""
+    return [bom_header_mapping[key] for key in
+            ('item', 'pn', 'part', 'reference', 'quantity', 'description', 'mfr_pn', 'manufacturer')]
+
+def get_header_profile_candidates(config):
+    """
+    获取自动选择表头配置方案时的候选配置，当前配置排在最前面
 
-        # TODO: 实现核心处理逻辑
+    Args:
+        config: 配置
 
-        # 设置默认输出路径
-        output_path = Path(bom_path).parent / (Path(bom_path).stem + '_替代料.xlsx')
+    Returns:
+        dict: 配置名 -> BOM必需列（当前配置的名称为空字符串）
+    """
+    candidates = {'': get_required_bom_columns(config['bom_header_mapping'])}
+    if config.get('auto_select_profile', True):
+        for name, profile in config.get('header_profiles', {}).items():
+            try:
+                candidates[name] = get_required_bom_columns(profile['bom_header_mapping'])
+            except (KeyError, TypeError):
+                logging.warning(f"表头配置方案 {name} 不完整，跳过")
+    return candidates
 
-        # 更新进度（解析完成）
-        update_progress(30)
+def apply_header_profile(config, profile):
+    """
+    用表头配置方案中的配置项覆盖配置，返回新的只读配置快照
 
-        # 获取映射后的列名
-        pn_col = bom_header_mapping['pn']
-        ref_col = bom_header_mapping['reference']
-        desc_col = bom_header_mapping['description']
-        mfr_pn_col = bom_header_mapping['mfr_pn']
-        mfr_col = bom_header_mapping['manufacturer']
-        quantity_col = bom_header_mapping['quantity']
-        part_col = bom_header_mapping['part']
+    Args:
+        config: 当前配置快照
+        profile: 表头配置方案
 
-        # 替代料表列名
-        sub_pn_col = sub_header_mapping['pn']
-        sub_part_col = sub_header_mapping['part']  # 添加零件字段
-        sub_desc_col = sub_header_mapping['description']
-        sub_mfr_pn_col = sub_header_mapping['mfr_pn']
-        sub_mfr_col = sub_header_mapping['manufacturer']
-        attr_col = sub_header_mapping['attribute']
-
-        # 检查必需字段
-        if pn_col not in bom_df.columns:
-            error_msg = f"BOM文件缺少必需列：{pn_col}"
-            logging.error(error_msg)
-            tkinter.messagebox.showerror('错误', error_msg)
-            return
+    Returns:
+        FrozenConfig: 应用方案后的配置快照
+    """
+    values = dict(config)
+    values.update({key: profile[key] for key in HEADER_PROFILE_KEYS if key in profile})
+    # 方案中缺少的表头字段使用当前配置
+    for key in ('bom_header_mapping', 'sub_header_mapping'):
+        values[key] = {**config[key], **profile.get(key, {})}
+    return freeze_config(values)
+
+def parse_item_number(value):
+    """
+    将Item值拆分为主序号和子序号
 
-        # 检查替代料表必需字段
-        missing_cols = []
-        if sub_pn_col not in sub_df.columns:
-            missing_cols.append(sub_pn_col)
-        if attr_col not in sub_df.columns:
-            missing_cols.append(attr_col)
+    Args:
+        value: Item值，如"12"或"12.3"
 
-        if missing_cols:
-            error_msg = f"替代料表缺少必需列：{', '.join(missing_cols)}"
-            logging.error(error_msg)
-            tkinter.messagebox.showerror('错误', error_msg)
-            return
+    Returns:
+        tuple: (主序号, 子序号)，无法识别的Item主序号为999999
+    """
+    if pd.isna(value):
+        return 999999, 0
+    text = str(value)
+    if '.' in text:
+        parts = text.split('.')
+        return int(parts[0]), int(parts[1])
+    return (int(value) if text.isdigit() else 999999), 0
+
+def natural_sort_key(s):
+    """Item自然排序键，使"1.10"排在"1.2"之后"""
+    if pd.isna(s):
+        return [0, 0]
+    parts = str(s).split('.')
+    return [int(parts[0]) if parts[0].isdigit() else 0,
+            int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0]
+
+def get_engine_columns(bom_header_mapping, sub_header_mapping):
+    """
+    获取处理引擎使用的列名
 
-        # 记录当前使用的字段映射
-        logging.info(f"BOM 表头映射: {bom_header_mapping}")
-        logging.info(f"替代料表 表头映射: {sub_header_mapping}")
-        logging.info(f"替代料表列: {list(sub_df.columns)}")
+    Args:
+        bom_header_mapping: BOM表头映射（已按实际表头修正大小写）
+        sub_header_mapping: 替代料表表头映射
 
-        # 确定要合并的替代料表字段
-        sub_columns_to_merge = [sub_pn_col, attr_col]  # 必需字段
-        columns_mapping = {sub_pn_col: pn_col, attr_col: 'sub_attr'}
-
-        # 添加可选字段，如果它们存在于替代料表中
-        if sub_part_col in sub_df.columns:
-            sub_columns_to_merge.append(sub_part_col)
-            columns_mapping[sub_part_col] = part_col
-        if sub_desc_col in sub_df.columns:
-            sub_columns_to_merge.append(sub_desc_col)
-            columns_mapping[sub_desc_col] = desc_col
-        if sub_mfr_pn_col in sub_df.columns:
-            sub_columns_to_merge.append(sub_mfr_pn_col)
-            columns_mapping[sub_mfr_pn_col] = mfr_pn_col
-        if sub_mfr_col in sub_df.columns:
-            sub_columns_to_merge.append(sub_mfr_col)
-            columns_mapping[sub_mfr_col] = mfr_col
-
-        # 合并BOM表和替代料表
-        try:
-            # 确保列名有效且存在
-            sub_columns_filtered = [col for col in sub_columns_to_merge if col in sub_df.columns]
-            if sub_columns_filtered:
-                # 只使用有效列进行合并
-                merged = pd.merge(
-                    bom_df,
-                    sub_df[sub_columns_filtered].rename(columns={k: v for k, v in columns_mapping.items() if k in sub_columns_filtered}),
-                    on=pn_col,
-                    how='left'
-                )
-            else:
-                merged = bom_df.copy()
-                logging.warning("没有可合并的替代料列，使用原始BOM数据")
-        except Exception as e:
-            error_msg = translate_error_to_chinese(e)
-            logging.error(f"合并BOM和替代料表失败: {e}")
+    Returns:
+        dict: 引擎内部字段名到实际列名的映射
+    """
+    return {
+        'item': bom_header_mapping['item'],
+        'pn': bom_header_mapping['pn'],
+        'part': bom_header_mapping['part'],
+        'reference': bom_header_mapping['reference'],
+        'quantity': bom_header_mapping['quantity'],
+        'description': bom_header_mapping['description'],
+        'mfr_pn': bom_header_mapping['mfr_pn'],
+        'manufacturer': bom_header_mapping['manufacturer'],
+        'sub_part': sub_header_mapping['part'],
+        'attribute': sub_header_mapping['attribute']
+    }
 
-            # 使用自定义错误对话框
-            error_details = f"合并BOM和替代料表时出现问题：\n\n{error_msg}\n\n程序将使用原始BOM数据继续处理。"
-            show_custom_error('数据处理警告', error_details)
-            merged = bom_df.copy()  # 出错时使用原始BOM数据
+def build_substitute_index(sub_df, pn_col, attr_col):
+    """
+    建立替代料索引
 
-        # 更新进度（合并完成）
-        update_progress(60)
+    attribute值相同且至少有两个料号的记录构成一个有效替代组，索引记录每个料号所在的替代组，
+    查找时无需逐组扫描。
 
-        # 初始化替代料分组变量
-        valid_groups = []
-        valid_subs = pd.DataFrame()
+    Args:
+        sub_df: 替代料表DataFrame
+        pn_col: 料号列名
+        attr_col: 替代料属性列名
 
-        # 替代料分组处理 - 只有当替代料表中有必需字段时才执行
-        if sub_pn_col in sub_df.columns and attr_col in sub_df.columns:
-            logging.info(f"开始替代料分组处理，使用属性字段: {attr_col}")
+    Returns:
+        tuple: (有效替代组列表，每组为行字典列表, 料号到替代组序号列表的字典)
+    """
+    valid_groups = [group.to_dict('records') for _, group in sub_df.groupby(attr_col) if len(group) > 1]
 
-            try:
-                # 筛选有效替代料（相同attribute值）
-                # 根据替代料表的attribute值进行分组
-                sub_groups = sub_df.groupby(attr_col)
+    pn_index = {}
+    for group_idx, group in enumerate(valid_groups):
+        for sub_row in group:
+            pn = sub_row[pn_col]
+            if pd.isna(pn):
+                continue
+            group_ids = pn_index.setdefault(pn, [])
+            if not group_ids or group_ids[-1] != group_idx:
+                group_ids.append(group_idx)
+
+    return valid_groups, pn_index
+
+# 替代料表缓存：文件未修改时，重复处理直接复用已读取的数据和已建立的索引
+_substitute_table_cache = {}
+_substitute_index_cache = {}
+# 后台重新加载和处理任务可能同时读取替代料表，加锁后只读取一次，另一方等待后直接使用缓存
+_substitute_cache_lock = threading.RLock()
+
+def get_file_signature(path):
+    """文件的绝对路径、修改时间和大小，用于判断文件是否被修改"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def get_substitute_read_columns(sub_path, sub_header_mapping, bom_header_mapping, prune_columns=False):
+    """确定替代料表的读取列和按字符串读取的列，返回值同resolve_read_columns"""
+    # 替代行会按BOM列名取值，因此裁剪时同时保留两份映射中的列
+    return resolve_read_columns(
+        read_header_values(sub_path),
+        list(sub_header_mapping.values()) + list(bom_header_mapping.values()),
+        [sub_header_mapping['pn']],
+        prune_columns
+    )
 
-                # 优化：直接使用列表推导获取有效替代组
-                valid_groups = [group for _, group in sub_groups if len(group) > 1]
+def load_substitute_table(sub_path, sub_usecols, sub_dtype):
+    """
+    读取替代料表，文件未修改且读取方式相同时返回缓存的数据
 
-                # 如果有有效替代组，合并为一个DataFrame，避免空DataFrame的警告
-                if valid_groups:
-                    valid_subs = pd.concat(valid_groups).dropna(axis=1, how='all')
-                else:
-                    valid_subs = pd.DataFrame()
+    Args:
+        sub_path: 替代料表路径
+        sub_usecols: 列筛选函数
+        sub_dtype: 按字符串读取的列
 
-                logging.info(f"找到 {len(valid_groups)} 个有效替代组")
-            except Exception as e:
-                error_msg = translate_error_to_chinese(e)
-                logging.error(f"处理替代料分组时出错: {e}")
+    Returns:
+        tuple: (替代料表DataFrame, 缓存键)，返回的DataFrame可能被缓存共享，调用者不能原地修改
+    """
+    key = (
+        get_file_signature(sub_path),
+        tuple(sorted(sub_usecols.wanted)) if sub_usecols is not None else None,
+        tuple(sorted((sub_dtype or {}).items()))
+    )
+    with _substitute_cache_lock:
+        cached = _substitute_table_cache.get('table')
+        if cached is not None and cached[0] == key:
+            logging.info(f"替代料表未修改，使用缓存数据: {sub_path}")
+            return cached[1], key
+
+        sub_df = pd.read_excel(sub_path, dtype=sub_dtype, usecols=sub_usecols)
+        # 读取完成后整体替换缓存项，正在使用旧数据的任务不受影响
+        _substitute_table_cache['table'] = (key, sub_df)
+        return sub_df, key
+
+def get_substitute_index(sub_df, table_key, pn_col, attr_col):
+    """
+    获取替代料索引，同一份替代料表数据和列名只建立一次索引
 
-                # 使用自定义错误对话框
-                error_details = f"处理替代料分组时出错：\n\n{error_msg}\n\n程序将不应用替代料分组功能。"
-                show_custom_error('数据处理警告', error_details)
-                valid_groups = []
-                valid_subs = pd.DataFrame()
+    Args:
+        sub_df: 替代料表DataFrame
+        table_key: load_substitute_table返回的缓存键
+        pn_col: 料号列名
+        attr_col: 属性列名
+
+    Returns:
+        tuple: 同build_substitute_index
+    """
+    key = (table_key, tuple(sub_df.columns), pn_col, attr_col)
+    with _substitute_cache_lock:
+        cached = _substitute_index_cache.get('index')
+        if cached is not None and cached[0] == key:
+            logging.info("替代料表未修改，使用缓存的替代料索引")
+            return cached[1]
+
+        result = build_substitute_index(sub_df, pn_col, attr_col)
+        _substitute_index_cache['index'] = (key, result)
+        return result
+
+def match_substitute_headers(sub_header_mapping, columns):
+    """
+    按替代料表的实际列名修正表头映射（不区分大小写）
+
+    Args:
+        sub_header_mapping: 配置中的替代料表表头映射
+        columns: 替代料表的实际列名
+
+    Returns:
+        tuple: (修正后的表头映射, 缺失字段{'required': [...], 'optional': [...]})
+    """
+    sub_header_mapping = dict(sub_header_mapping)
+    missing_sub_fields = {'required': [], 'optional': []}
+    # 创建列名的小写映射，用于不区分大小写的匹配
+    sub_columns_lower = {col.lower(): col for col in columns}
+
+    for field, header in sub_header_mapping.items():
+        # 检查表头是否存在（不区分大小写）
+        if header.lower() in sub_columns_lower:
+            # 如果存在但大小写不同，使用实际的列名替换配置中的列名
+            actual_column = sub_columns_lower[header.lower()]
+            if actual_column != header:
+                logging.info(f"替代料表表头大小写不同，使用实际列名: '{actual_column}' 替代 '{header}'")
+                sub_header_mapping[field] = actual_column
+        elif field in ['pn', 'attribute']:  # 只检查物料编号和属性字段
+            missing_sub_fields['required'].append(header)
+        else:  # 其他字段为可选
+            missing_sub_fields['optional'].append(header)
+
+    return sub_header_mapping, missing_sub_fields
+
+def describe_substitute_table(table_key, sub_df, valid_groups):
+    """
+    生成替代料表的版本信息，用于在界面中显示当前使用的替代料表
+
+    Args:
+        table_key: load_substitute_table返回的缓存键
+        sub_df: 替代料表DataFrame
+        valid_groups: 有效替代组
+
+    Returns:
+        dict: 路径、修改时间、行数和替代组数
+    """
+    path, mtime_ns, _ = table_key[0]
+    return {'path': path, 'mtime': mtime_ns / 1e9, 'rows': len(sub_df), 'groups': len(valid_groups)}
+
+def publish_substitute_info(info):
+    """把替代料表的版本信息交给界面（线程安全）"""
+    if has_gui_events():
+        post_gui_event('substitute_info', info)
+
+def preload_substitute_table(sub_path, config):
+    """按当前配置预先读取替代料表并建立索引，完成后在界面中显示替代料表的版本信息"""
+    try:
+        sub_usecols, sub_dtype = get_substitute_read_columns(
+            sub_path, config['sub_header_mapping'], config['bom_header_mapping'], config.get('prune_columns', False)
+        )
+        sub_df, table_key = load_substitute_table(sub_path, sub_usecols, sub_dtype)
+
+        # 与process_files使用相同的列名，处理时直接命中索引缓存
+        sub_header_mapping, missing_sub_fields = match_substitute_headers(config['sub_header_mapping'], sub_df.columns)
+        if sub_header_mapping['description'] not in sub_df.columns:
+            sub_df = sub_df.assign(**{sub_header_mapping['description']: ""})
+        if missing_sub_fields['required']:
+            raise ValueError(f"替代料表缺少必需列：{', '.join(missing_sub_fields['required'])}")
+        cols = get_engine_columns(config['bom_header_mapping'], sub_header_mapping)
+        valid_groups, _ = get_substitute_index(sub_df, table_key, cols['pn'], cols['attribute'])
+    except Exception as e:
+        logging.warning(f"预加载替代料表失败: {e}")
+        publish_substitute_info({'path': os.path.abspath(sub_path), 'error': translate_error_to_chinese(e)})
+        return
+    logging.info(f"已预加载替代料表: {sub_path}")
+    publish_substitute_info(describe_substitute_table(table_key, sub_df, valid_groups))
+
+def new_expand_stats():
+    """创建替代料展开统计"""
+    return {
+        'total_count': 0,
+        'matched_count': 0,
+        'unmatched_count': 0,
+        'original_ref_count': 0,  # 原始物料总位号数
+        'substitute_count': 0     # 替代料的数量
+    }
+
+def expand_substitute_rows(rows, valid_groups, pn_index, cols, stats, progress=None):
+    """
+    为BOM行插入替代料行
+
+    有替代组的物料改为x.1编号并在其后插入x.2、x.3...替代料行，
+    所有行的Quantity按位号数量重新计算。
+
+    Args:
+        rows: BOM行字典的可迭代对象（Item已重新编号）
+        valid_groups: build_substitute_index返回的有效替代组
+        pn_index: build_substitute_index返回的料号索引
+        cols: get_engine_columns返回的列名
+        stats: new_expand_stats返回的统计字典，会被原地更新
+        progress: ProgressReporter，每处理一行汇报一次（可选）
+
+    Returns:
+        list: 展开后的行字典
+    """
+    item_col = cols['item']
+    pn_col = cols['pn']
+    part_col = cols['part']
+    ref_col = cols['reference']
+    quantity_col = cols['quantity']
+    desc_col = cols['description']
+    mfr_pn_col = cols['mfr_pn']
+    mfr_col = cols['manufacturer']
+    sub_part_col = cols['sub_part']
+    attr_col = cols['attribute']
+
+    new_items = []
+    for row in rows:
+        stats['total_count'] += 1
+        # 没有progress时（如在子进程中）也定期检查取消标志
+        if stats['total_count'] % CANCEL_CHECK_ROWS == 0:
+            check_cancelled()
+        # 计算原始物料的位号数
+        if not pd.isna(row[ref_col]) and str(row[ref_col]).strip():
+            stats['original_ref_count'] += count_references(row[ref_col])
+
+        # 查找所有包含当前物料的替代组
+        pn = row[pn_col]
+        matched_groups = [] if pd.isna(pn) else [valid_groups[idx] for idx in pn_index.get(pn, [])]
+
+        # 仅在存在替代组时修改原始行Item编号
+        if matched_groups:
+            new_row = dict(row)
+            # 确保 row[item_col] 是字符串类型，并处理可能的NaN值
+            if pd.isna(row[item_col]):
+                original_item = "0"  # 如果Item为NaN，使用默认值0
+            else:
+                original_item = str(row[item_col]).split('.')[0]
+
+            # 计算Reference中的位号数量
+            reference_text = str(row[ref_col]) if not pd.isna(row[ref_col]) else ''
+            ref_count = count_references(reference_text)
+
+            new_row[item_col] = f"{original_item}.1"
+            new_row['操作类型'] = '保留'  # 显式设置操作类型
+            new_row[ref_col] = reference_text
+            new_row[quantity_col] = ref_count  # 根据位号数量更新Quantity
+            new_items.append(new_row)
+
+            substitute_counter = 2
+
+            for group in matched_groups:
+                for sub_row in group:
+                    if sub_row[pn_col] != pn:
+                        # 计算Reference中的位号数量
+                        reference_text = row[ref_col] if not pd.isna(row[ref_col]) else ''
+                        ref_count = count_references(reference_text)
+
+                        # 统计替代料数量
+                        stats['substitute_count'] += 1
+
+                        # 创建具有必要字段的替代料项
+                        sub_dict = {
+                            item_col: f"{original_item}.{substitute_counter}",
+                            pn_col: sub_row[pn_col],
+                            part_col: sub_row[sub_part_col] if sub_part_col in sub_row else row[part_col],  # 优先使用替代料表中的零件字段
+                            ref_col: reference_text,
+                            quantity_col: ref_count,  # 基于位号数量设置Quantity
+                            '操作类型': '替代插入'
+                        }
+
+                        # 安全地添加可选字段
+                        # 描述字段
+                        if desc_col in sub_row:
+                            sub_dict[desc_col] = sub_row[desc_col]
+                        elif desc_col in row:
+                            sub_dict[desc_col] = row[desc_col]
+                        else:
+                            sub_dict[desc_col] = ""
+
+                        # 制造商料号字段
+                        if mfr_pn_col in sub_row:
+                            sub_dict[mfr_pn_col] = sub_row[mfr_pn_col]
+                        elif mfr_pn_col in row:
+                            sub_dict[mfr_pn_col] = row[mfr_pn_col]
+
+                        # 制造商字段
+                        if mfr_col in sub_row:
+                            sub_dict[mfr_col] = sub_row[mfr_col]
+                        elif mfr_col in row:
+                            sub_dict[mfr_col] = row[mfr_col]
+
+                        # 如果替代料表中存在属性列，添加到替代料项中
+                        if attr_col in sub_row:
+                            sub_dict[attr_col] = sub_row[attr_col]
+
+                        new_items.append(sub_dict)
+                        substitute_counter += 1
+
+            stats['matched_count'] += 1
         else:
-            # 缺少必需字段时发出警告
-            missing_fields = []
-            if sub_pn_col not in sub_df.columns:
-                missing_fields.append(sub_pn_col)
-            if attr_col not in sub_df.columns:
-                missing_fields.append(attr_col)
-
-            logging.warning(f"替代料表缺少必需字段: {', '.join(missing_fields)}，跳过替代料分组处理")
-            tkinter.messagebox.showwarning('警告', f'替代料表缺少必需字段: {", ".join(missing_fields)}，无法进行替代料处理')
-
-        # 初始化统计变量
-        total_count = 0
-        matched_count = 0
-        unmatched_count = 0
-
-        # 新增统计变量
-        original_ref_count = 0  # 原始物料总位号数
-        substitute_count = 0    # 替代料的数量
-
-        # 生成新Item序号（原始行+替代行）
-        new_items = []
-        for idx, row in bom_df.iterrows():
-            total_count += 1
-            # 计算原始物料的位号数
-            if not pd.isna(row[ref_col]) and str(row[ref_col]).strip():
-                original_ref_count += count_references(row[ref_col])
-
-            # 查找所有包含当前物料的替代组
-            matched_groups = [
-                group for group in valid_groups
-                if row[pn_col] in group[pn_col].values
-            ]
+            # 无替代组时保留原始Item
+            new_row = dict(row)
+            new_row['操作类型'] = ''  # 无替代组，操作类型为空
 
-            # 仅在存在替代组时修改原始行Item编号
-            if matched_groups:
-                new_row = row.copy()
-                # 确保 row[item_col] 是字符串类型，并处理可能的NaN值
-                if pd.isna(row[item_col]):
-                    original_item = "0"  # 如果Item为NaN，使用默认值0
-                else:
-                    # 尝试拆分Item值
-                    try:
-                        original_item = str(row[item_col]).split('.')[0]
-                    except:
-                        original_item = str(row[item_col])  # 如果拆分失败，使用完整值
-
-                # 计算Reference中的位号数量
-                reference_text = str(row[ref_col]) if not pd.isna(row[ref_col]) else ''
-                ref_count = count_references(reference_text)
-
-                new_row[item_col] = f"{original_item}.1"
-                new_row['操作类型'] = '保留'  # 显式设置操作类型
-                new_row[ref_col] = reference_text
-                new_row[quantity_col] = ref_count  # 根据位号数量更新Quantity
-                new_items.append(new_row)
-
-                substitute_counter = 2
-
-                for group in matched_groups:
-                    for sub_idx, sub_row in group.iterrows():
-                        if sub_row[pn_col] != row[pn_col]:
-                            # 计算Reference中的位号数量
-                            reference_text = row[ref_col] if not pd.isna(row[ref_col]) else ''
-                            ref_count = count_references(reference_text)
-
-                            # 统计替代料数量
-                            substitute_count += 1
-
-                            # 创建具有必要字段的替代料项
-                            sub_dict = {
-                                item_col: f"{original_item}.{substitute_counter}",
-                                pn_col: sub_row[pn_col],
-                                part_col: sub_row[sub_part_col] if sub_part_col in sub_row.index else row[part_col],  # 优先使用替代料表中的零件字段
-                                ref_col: reference_text,
-                                quantity_col: ref_count,  # 基于位号数量设置Quantity
-                                '操作类型': '替代插入'
-                            }
-
-                            # 安全地添加可选字段
-                            # 描述字段
-                            if desc_col in sub_row.index:
-                                sub_dict[desc_col] = sub_row[desc_col]
-                            elif desc_col in row.index:
-                                sub_dict[desc_col] = row[desc_col]
-                            else:
-                                sub_dict[desc_col] = ""
-
-                            # 制造商料号字段
-                            if mfr_pn_col in sub_row.index:
-                                sub_dict[mfr_pn_col] = sub_row[mfr_pn_col]
-                            elif mfr_pn_col in row.index:
-                                sub_dict[mfr_pn_col] = row[mfr_pn_col]
-
-                            # 制造商字段
-                            if mfr_col in sub_row.index:
-                                sub_dict[mfr_col] = sub_row[mfr_col]
-                            elif mfr_col in row.index:
-                                sub_dict[mfr_col] = row[mfr_col]
-
-                            # 如果替代料表中存在属性列，添加到替代料项中
-                            if attr_col in sub_row.index:
-                                sub_dict[attr_col] = sub_row[attr_col]
-
-                            sub_item = pd.Series(sub_dict)
-                            new_items.append(sub_item)
-                            substitute_counter += 1
+            # 计算Reference中的位号数量
+            reference_text = str(row[ref_col]) if not pd.isna(row[ref_col]) else ''
+
+            # 更新Reference和Quantity
+            new_row[ref_col] = reference_text
+            new_row[quantity_col] = count_references(reference_text)  # 根据位号数量更新Quantity
+
+            new_items.append(new_row)
+            stats['unmatched_count'] += 1
+
+        if progress:
+            progress.advance()
+
+    return new_items
+
+def collect_row_columns(rows, columns=None):
+    """
+    按首次出现的顺序收集行字典中的列名
+
+    Args:
+        rows: 行字典的可迭代对象
+        columns: 已收集的列名列表，会被原地追加
+
+    Returns:
+        list: 列名列表
+    """
+    if columns is None:
+        columns = []
+    seen = set(columns)
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+def merge_duplicate_rows(duplicate_rows, pn, cols):
+    """
+    合并料号相同的多行
+
+    以第一行为基础，按原顺序合并去重所有位号，Quantity等于合并后的位号数量。
+
+    Args:
+        duplicate_rows: 料号相同的行字典列表（按处理顺序）
+        pn: 料号
+        cols: get_engine_columns返回的列名
+
+    Returns:
+        dict: 合并后的行
+    """
+    ref_col = cols['reference']
+
+    # 创建合并后的行（基于第一行）
+    merged_row = dict(duplicate_rows[0])
+
+    # 收集所有Reference，维持原顺序
+    all_references = []
+    seen_references = set()
+    for row in duplicate_rows:
+        reference = row.get(ref_col, float('nan'))
+        if not pd.isna(reference) and str(reference).strip():
+            for ref in str(reference).split(','):
+                ref = ref.strip()
+                if ref and ref not in seen_references:  # 只添加非空且不重复的引用
+                    seen_references.add(ref)
+                    all_references.append(ref)
+
+    # 合并后的位号字符串
+    combined_references = ','.join(all_references)
+    reference_count = count_references(combined_references)
+
+    # 设置合并后的值 - Quantity等于位号的数量
+    merged_row[ref_col] = combined_references
+    merged_row[cols['quantity']] = reference_count
+
+    # 每个合并的料号记录一次，安静模式下不记录
+    if not _quiet_mode:
+        logging.info(f"合并料号 {pn}, 合并后位号数量: {reference_count}, 位号: {combined_references}")
+
+    return merged_row
+
+def build_merge_info(merged_row, pn, row_count, cols, columns):
+    """
+    生成合并物料的统计信息
+
+    Args:
+        merged_row: merge_duplicate_rows返回的合并后的行
+        pn: 料号
+        row_count: 合并前的行数
+        cols: get_engine_columns返回的列名
+        columns: 结果中的全部列名，行字典中缺少的列视为空值
+
+    Returns:
+        dict: 合并信息
+    """
+    desc_col = cols['description']
+    mfr_pn_col = cols['mfr_pn']
+    mfr_col = cols['manufacturer']
+
+    # 记录合并信息
+    merge_info = {
+        cols['pn']: pn,
+        '合并行数': row_count,
+        '合并后位号数': merged_row[cols['quantity']]
+    }
+
+    # 安全地添加可选字段
+    merge_info[desc_col] = merged_row.get(desc_col, float('nan')) if desc_col in columns else ''
+    if mfr_col in columns:
+        merge_info[mfr_col] = merged_row.get(mfr_col, float('nan'))
+    if mfr_pn_col in columns:
+        merge_info[mfr_pn_col] = merged_row.get(mfr_pn_col, float('nan'))
+
+    return merge_info
+
+def merge_same_pn_rows(rows, cols):
+    """
+    合并所有料号相同的行
+
+    Args:
+        rows: 行字典列表
+        cols: get_engine_columns返回的列名
+
+    Returns:
+        tuple: (合并后的行列表，合并行追加在末尾,
+                合并记录列表，元素为(料号, 合并后的行, 合并前行数, 首次出现的位置))
+    """
+    pn_col = cols['pn']
+
+    # 按料号分组，保持首次出现的顺序
+    pn_groups = {}
+    for position, row in enumerate(rows):
+        if position % CANCEL_CHECK_ROWS == 0:
+            check_cancelled()
+        pn = row.get(pn_col, float('nan'))
+        if pd.isna(pn):
+            continue
+        pn_groups.setdefault(pn, []).append(position)
+
+    merged_rows = []
+    merged_groups = []
+    processed_positions = set()
+
+    for pn, positions in pn_groups.items():
+        if len(positions) <= 1:
+            continue
+        if len(merged_rows) % CANCEL_CHECK_ROWS == 0:
+            check_cancelled()
+        merged_row = merge_duplicate_rows([rows[pos] for pos in positions], pn, cols)
+        processed_positions.update(positions)
+        merged_rows.append(merged_row)
+        merged_groups.append((pn, merged_row, len(positions), positions[0]))
+
+    result = [row for pos, row in enumerate(rows) if pos not in processed_positions]
+    result.extend(merged_rows)
+    return result, merged_groups
+
+def renumber_item_group(group_rows, new_seq, item_col):
+    """
+    为同一主序号的行分配新的连续序号
+
+    含替代料关系的组使用"新序号.子序号"格式，组内其余行依次使用后续序号；
+    其他行每行单独分配一个序号。
+
+    Args:
+        group_rows: 同一主序号的行，元素为(子序号, 行字典)，已按子序号排序
+        new_seq: 当前可用的新序号
+        item_col: Item列名
+
+    Returns:
+        tuple: (按输出顺序排列的行字典列表, 下一个可用的新序号)
+    """
+    sub_rows = [row for sub, row in group_rows if sub > 0]
+    regular_rows = [row for sub, row in group_rows if sub == 0]
+
+    # 如果存在'操作类型'为'替代插入'或'保留'的行，则认为是替代料关系
+    has_substitute = any(
+        row.get('操作类型') in ['替代插入', '保留'] for _, row in group_rows
+    )
+
+    if has_substitute and sub_rows:
+        # 只对真正的替代料关系使用x.1, x.2格式
+        for sub, row in group_rows:
+            if sub > 0:
+                row[item_col] = f"{new_seq}.{sub}"
+        new_seq += 1
+
+        # 单独处理没有子序号的行，即使主序号相同
+        for row in regular_rows:
+            row[item_col] = str(new_seq)
+            new_seq += 1
+        return sub_rows + regular_rows, new_seq
+
+    # 单行、相同物料的不同位号或其他情况，每行单独分配序号
+    ordered_rows = [row for _, row in group_rows]
+    for row in ordered_rows:
+        row[item_col] = str(new_seq)
+        new_seq += 1
+    return ordered_rows, new_seq
+
+def renumber_item_rows(rows, item_col, progress=None):
+    """
+    按原始Item排序并重新编号
+
+    Args:
+        rows: 行字典列表
+        item_col: Item列名
+        progress: ProgressReporter，每完成一组按组内行数汇报（可选）
+
+    Returns:
+        list: 按新Item顺序排列的行字典
+    """
+    keyed_rows = [(parse_item_number(row.get(item_col)), position, row) for position, row in enumerate(rows)]
+    keyed_rows.sort(key=lambda entry: (entry[0], entry[1]))
+
+    result = []
+    new_seq = 1
+    group_rows = []
+    current_main = None
+    for (main, sub), _, row in keyed_rows:
+        if group_rows and main != current_main:
+            ordered_rows, new_seq = renumber_item_group(group_rows, new_seq, item_col)
+            result.extend(ordered_rows)
+            if progress:
+                progress.advance(len(ordered_rows))
+            group_rows = []
+        current_main = main
+        group_rows.append((sub, row))
+    if group_rows:
+        ordered_rows, new_seq = renumber_item_group(group_rows, new_seq, item_col)
+        result.extend(ordered_rows)
+        if progress:
+            progress.advance(len(ordered_rows))
+
+    return result
+
+def build_partition_keys(valid_groups, pn_col):
+    """
+    计算替代组料号的分区键
+
+    有共同料号的替代组会连成一个整体，整体内所有料号使用同一个分区键，
+    保证展开后可能重复的料号都落在同一分区，分区内即可完成相同料号合并。
+
+    Args:
+        valid_groups: 有效替代组
+        pn_col: 料号列名
+
+    Returns:
+        dict: 料号到分区键的映射，不在替代组中的料号不包含在内
+    """
+    parents = list(range(len(valid_groups)))
+
+    def find(group_idx):
+        while parents[group_idx] != group_idx:
+            parents[group_idx] = parents[parents[group_idx]]
+            group_idx = parents[group_idx]
+        return group_idx
+
+    # 料号出现在多个替代组中时，把这些组并为一个整体
+    first_group = {}
+    for group_idx, group in enumerate(valid_groups):
+        for sub_row in group:
+            pn = sub_row[pn_col]
+            if pd.isna(pn):
+                continue
+            if pn in first_group:
+                root_a, root_b = find(first_group[pn]), find(group_idx)
+                if root_a != root_b:
+                    parents[max(root_a, root_b)] = min(root_a, root_b)
             else:
-                # 无替代组时保留原始Item
-                new_row = row.copy()
-                new_row['操作类型'] = ''  # 无替代组，操作类型为空
+                first_group[pn] = group_idx
 
-                # 计算Reference中的位号数量
-                reference_text = str(row[ref_col]) if not pd.isna(row[ref_col]) else ''
-                ref_count = count_references(reference_text)
+    return {pn: f'g:{find(group_idx)}' for pn, group_idx in first_group.items()}
 
-                # 更新Reference和Quantity
-                new_row[ref_col] = reference_text
-                new_row[quantity_col] = ref_count  # 根据位号数量更新Quantity
+def get_partition_index(pn, partition_keys, partition_count):
+    """
+    按料号哈希计算行所属的分区
 
-                new_items.append(new_row)
-                unmatched_count += 1
+    Args:
+        pn: 料号
+        partition_keys: build_partition_keys返回的分区键
+        partition_count: 分区数
 
-            # 更新匹配计数（如果有任何替代组）
-            if matched_groups:
-                matched_count += 1
+    Returns:
+        int: 分区序号
+    """
+    if pd.isna(pn):
+        return 0
+    key = partition_keys.get(pn) or ChunkStore.pn_key(pn)
+    # 使用crc32而不是hash()，分区结果不受进程哈希随机化影响
+    return zlib.crc32(key.encode('utf-8')) % partition_count
 
-        # 创建最终DataFrame
-        processed_df = pd.DataFrame(new_items)
+# 子进程中的替代料索引，由init_partition_worker设置
+_partition_context = None
 
-        # 更新完成进度
-        update_progress(90)
+def init_partition_worker(valid_groups, pn_index, cols, quiet_mode=False, pool_cancel_event=None, log_queue=None,
+                          log_level=logging.INFO):
+    """
+    进程池初始化函数：替代料索引只向每个子进程传递一次
 
-        # 计算处理后的总物料数（用于统计）
-        total_final_items = len(processed_df)
+    子进程的日志与常驻处理进程一样放入界面进程的日志队列，使用相同的日志级别；
+    取消标志替换本进程的cancel_event，展开和合并的行循环中通过check_cancelled检查。
+    """
+    global _partition_context, _quiet_mode, cancel_event
+    if log_queue is not None:
+        setup_logging(log_queue)
+        logging.getLogger().setLevel(log_level)
+    _partition_context = (valid_groups, pn_index, cols)
+    _quiet_mode = quiet_mode
+    if pool_cancel_event is not None:
+        cancel_event = pool_cancel_event
+
+def create_engine_pool(workers, valid_groups, pn_index, cols):
+    """
+    创建处理BOM的进程池
 
-        # 合并相同P/N的行
-        update_status('正在合并相同料号...')
+    Args:
+        workers: 进程数
+        valid_groups: 有效替代组
+        pn_index: 料号索引
+        cols: get_engine_columns返回的列名，多工作表处理时为None
 
-        # 获取P/N列中有重复的值
-        duplicate_pns = processed_df[pn_col][processed_df[pn_col].duplicated(keep=False)].unique()
+    Returns:
+        tuple: (ProcessPoolExecutor, 子进程共享的取消标志)
+    """
+    context = multiprocessing.get_context()
+    pool_cancel_event = context.Event()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_partition_worker,
+                                   initargs=(valid_groups, pn_index, cols, _quiet_mode, pool_cancel_event,
+                                             _log_queue, logging.getLogger().level))
+    return executor, pool_cancel_event
+
+def run_pool_tasks(executor, pool_cancel_event, func, task_args, on_done=None):
+    """
+    向进程池提交任务并等待全部完成，等待期间定期检查取消标志
 
-        # 用于存储合并后的数据
-        merged_rows = []
-        processed_indices = []
+    取消或出错时设置子进程的取消标志，正在执行的任务在下一个检查点停止，尚未开始的任务直接丢弃。
 
-        # 跟踪合并物料的详细信息
-        merged_materials = []
+    Args:
+        executor: create_engine_pool创建的进程池
+        pool_cancel_event: 子进程共享的取消标志
+        func: 任务函数
+        task_args: 每个任务的参数元组列表
+        on_done: 每完成一个任务时调用，参数为任务序号（可选）
 
-        # 处理每个重复的P/N
-        for pn in duplicate_pns:
-            # 获取具有相同P/N的所有行
-            duplicate_rows = processed_df[processed_df[pn_col] == pn]
+    Returns:
+        list: 按task_args顺序排列的任务结果
+    """
+    futures = {executor.submit(func, *args): idx for idx, args in enumerate(task_args)}
+    results = [None] * len(task_args)
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=POOL_CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+                if on_done:
+                    on_done(futures[future])
+            check_cancelled()
+    except BaseException:
+        pool_cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return results
+
+def process_bom_partition(indexed_rows):
+    """
+    在子进程中处理一个分区：展开替代料，合并分区内料号相同的行
 
-            if len(duplicate_rows) <= 1:
+    Args:
+        indexed_rows: (全局行号, 行字典)列表，按全局行号排列
+
+    Returns:
+        tuple: (结果行, 合并记录, 列名首次出现的位置, 统计信息, 展开后的行数)
+    """
+    valid_groups, pn_index, cols = _partition_context
+    stats = new_expand_stats()
+
+    rows = []
+    order_keys = []
+    for seq, row in indexed_rows:
+        for sub_idx, new_row in enumerate(expand_substitute_rows([row], valid_groups, pn_index, cols, stats)):
+            rows.append(new_row)
+            order_keys.append((seq, sub_idx))
+
+    # 记录每列首次出现的位置，汇总后按此恢复与单进程一致的列顺序
+    column_keys = {}
+    for order_key, row in zip(order_keys, rows):
+        for col_idx, col in enumerate(row):
+            if col not in column_keys:
+                column_keys[col] = order_key + (col_idx,)
+
+    expanded_count = len(rows)
+    rows, merged_groups = merge_same_pn_rows(rows, cols)
+    merged_groups = [(pn, merged_row, row_count, order_keys[first_position])
+                     for pn, merged_row, row_count, first_position in merged_groups]
+
+    # 确保所有行的Quantity都基于Reference位号计数
+    for row in rows:
+        row[cols['quantity']] = count_references(row.get(cols['reference'], float('nan')))
+
+    return rows, merged_groups, column_keys, stats, expanded_count
+
+def process_bom_rows(bom_rows, valid_groups, pn_index, cols, status_callback=None, progress=None):
+    """
+    单进程处理BOM行：展开替代料、合并相同料号并重新编号
+
+    Args:
+        bom_rows: 已重新编号的BOM行字典列表
+        valid_groups: 有效替代组
+        pn_index: 料号索引
+        cols: get_engine_columns返回的列名
+        status_callback: 状态回调函数，接收一个参数(状态消息)
+        progress: ProgressReporter（可选）
+
+    Returns:
+        tuple: (按输出顺序排列的行, 列名, 统计信息, 合并物料信息, 展开后的总物料数)
+    """
+    stats = new_expand_stats()
+    if progress:
+        progress.start_stage('展开替代料', 30, 60, total=len(bom_rows))
+    rows = expand_substitute_rows(bom_rows, valid_groups, pn_index, cols, stats, progress=progress)
+    total_final_items = len(rows)
+    columns = collect_row_columns(rows)
+
+    # 合并相同P/N的行
+    if status_callback:
+        status_callback('正在合并相同料号...')
+    if progress:
+        progress.start_stage('合并相同料号', 60, 65)
+        progress.set_stage_rows(len(rows))
+    rows, merged_groups = merge_same_pn_rows(rows, cols)
+    merged_materials = [build_merge_info(merged_row, pn, row_count, cols, columns)
+                        for pn, merged_row, row_count, _ in merged_groups]
+
+    # 确保所有行的Quantity都基于Reference位号计数
+    for row in rows:
+        row[cols['quantity']] = count_references(row.get(cols['reference'], float('nan')))
+
+    # 按原始Item排序并重新编号
+    logging.info("开始Item排序和重新编号")
+    if status_callback:
+        status_callback('正在排序和重新编号...')
+    if progress:
+        progress.start_stage('重新编号', 65, 75, total=len(rows))
+    rows = renumber_item_rows(rows, cols['item'], progress=progress)
+
+    return rows, columns, stats, merged_materials, total_final_items
+
+def process_bom_parallel(bom_rows, valid_groups, pn_index, cols, workers, status_callback=None, progress=None):
+    """
+    多进程处理BOM行，结果与process_bom_rows完全一致
+
+    BOM行按料号哈希分配到各分区（同一替代组整体内的料号分到同一分区），
+    各子进程分别展开替代料并合并相同料号，最后在主进程中统一排序和重新编号。
+    每个进程分到PARALLEL_PARTITIONS_PER_WORKER个分区，取消时尚未开始的分区不再处理。
+
+    Args:
+        bom_rows: 已重新编号的BOM行字典列表
+        valid_groups: 有效替代组
+        pn_index: 料号索引
+        cols: get_engine_columns返回的列名
+        workers: 进程数
+        status_callback: 状态回调函数，接收一个参数(状态消息)
+        progress: ProgressReporter，每完成一个分区按分区行数汇报（可选）
+
+    Returns:
+        tuple: (按输出顺序排列的行, 列名, 统计信息, 合并物料信息, 展开后的总物料数)
+    """
+    partition_keys = build_partition_keys(valid_groups, cols['pn'])
+    partition_count = workers * PARALLEL_PARTITIONS_PER_WORKER
+    partitions = [[] for _ in range(partition_count)]
+    for seq, row in enumerate(bom_rows):
+        partitions[get_partition_index(row.get(cols['pn']), partition_keys, partition_count)].append((seq, row))
+    partitions = [partition for partition in partitions if partition]
+    logging.info(f"并行处理：{len(bom_rows)} 行分为 {len(partitions)} 个分区，{workers} 个进程")
+
+    if status_callback:
+        status_callback(f'正在并行处理（{workers}个进程）...')
+    if progress:
+        progress.start_stage('并行展开替代料', 30, 65, total=len(bom_rows))
+    executor, pool_cancel_event = create_engine_pool(workers, valid_groups, pn_index, cols)
+    with executor:
+        results = run_pool_tasks(executor, pool_cancel_event, process_bom_partition,
+                                 [(partition,) for partition in partitions],
+                                 on_done=(lambda idx: progress.advance(len(partitions[idx]))) if progress else None)
+
+    # 汇总各分区结果
+    rows = []
+    merged_groups = []
+    column_keys = {}
+    stats = new_expand_stats()
+    total_final_items = 0
+    for part_rows, part_merged_groups, part_column_keys, part_stats, expanded_count in results:
+        rows.extend(part_rows)
+        merged_groups.extend(part_merged_groups)
+        for col, order_key in part_column_keys.items():
+            if col not in column_keys or order_key < column_keys[col]:
+                column_keys[col] = order_key
+        for key, value in part_stats.items():
+            stats[key] += value
+        total_final_items += expanded_count
+
+    columns = sorted(column_keys, key=column_keys.get)
+    # 合并物料信息按料号首次出现的顺序排列
+    merged_groups.sort(key=lambda group: group[3])
+    merged_materials = [build_merge_info(merged_row, pn, row_count, cols, columns)
+                        for pn, merged_row, row_count, _ in merged_groups]
+
+    # 按原始Item排序并重新编号
+    logging.info("开始Item排序和重新编号")
+    if status_callback:
+        status_callback('正在排序和重新编号...')
+    if progress:
+        progress.start_stage('重新编号', 65, 75, total=len(rows))
+    rows = renumber_item_rows(rows, cols['item'], progress=progress)
+
+    return rows, columns, stats, merged_materials, total_final_items
+
+def process_bom_sheet(bom_path, job, valid_groups, pn_index, parallel_workers=1, status_callback=None,
+                      progress=None):
+    """
+    处理一个BOM工作表：读取数据、重新编号、展开替代料、合并相同料号并过滤空白列
+
+    Args:
+        bom_path: BOM文件路径
+        job: 工作表任务，包含工作表名、表头行、读取方式和列名等
+        valid_groups: 有效替代组
+        pn_index: 料号索引
+        parallel_workers: 行数较多时按料号分区并行的进程数
+        status_callback: 状态回调函数，接收一个参数(状态消息)
+        progress: ProgressReporter（可选）
+
+    Returns:
+        dict: 处理结果，包含输出数据df和统计信息；未提供progress时（如在子进程中处理）还包含各阶段耗时timings
+    """
+    cols = job['cols']
+    item_col = cols['item']
+    # 未提供进度汇报时使用不带回调的ProgressReporter，只统计各阶段耗时
+    own_progress = progress is None
+    if own_progress:
+        progress = ProgressReporter(cancel_event=cancel_event)
+
+    # 使用pandas读取BOM文件，跳过项目信息行
+    logging.info(f"读取BOM文件: {bom_path}，工作表: {job['sheet_name']}，跳过前 {job['header_row']-1} 行")
+    progress.start_stage('读取BOM', 20, 30)
+    bom_df = pd.read_excel(bom_path, sheet_name=job['read_sheet'], dtype=job['dtype'],
+                           usecols=job['usecols'], skiprows=job['header_row']-1, nrows=job.get('max_rows'))
+    progress.set_stage_rows(len(bom_df))
+    logging.info(f"BOM文件列: {list(bom_df.columns)}")
+    for col, default in job['column_defaults'].items():
+        if col not in bom_df.columns:
+            bom_df[col] = default
+
+    # 先对原始BOM的item进行顺序编号
+    logging.info("开始对原始BOM进行item重新编号")
+    if status_callback:
+        status_callback('正在对原始BOM进行item重新编号...')
+    progress.start_stage('原始Item编号', 30, 30)
+    progress.set_stage_rows(len(bom_df))
+
+    # 按主序号和子序号排序（稳定排序），然后重新编号（从1开始的连续数字）
+    bom_rows = bom_df.to_dict('records')
+    del bom_df
+    bom_rows.sort(key=lambda row: parse_item_number(row[item_col]))
+    for current_item, row in enumerate(bom_rows, 1):
+        row[item_col] = str(current_item)
+
+    # 各变体不贴装的位号，替代料展开和合并只计算一次，之后按变体分别去除
+    dnp_designators = collect_dnp_designators(bom_rows, job['variant_columns'], cols['reference'],
+                                              job['dnp_markers'])
+
+    # 生成新Item序号（原始行+替代行），合并相同料号并重新编号
+    # 行数较多且配置了多个进程时，按料号分区并行处理
+    parallel_mode = parallel_workers > 1 and len(bom_rows) >= PARALLEL_MIN_ROWS
+    if parallel_mode:
+        processed_rows, columns, stats, merged_materials, total_final_items = process_bom_parallel(
+            bom_rows, valid_groups, pn_index, cols, parallel_workers, status_callback=status_callback,
+            progress=progress
+        )
+    else:
+        processed_rows, columns, stats, merged_materials, total_final_items = process_bom_rows(
+            bom_rows, valid_groups, pn_index, cols, status_callback=status_callback, progress=progress
+        )
+    del bom_rows
+    rebuild_variant_cells(processed_rows, job['variant_columns'], dnp_designators, cols['reference'])
+
+    # 过滤掉空白列
+    logging.info("开始过滤空白列")
+    if status_callback:
+        status_callback('正在过滤空白列...')
+    progress.start_stage('过滤空白列', 75, 80)
+    progress.set_stage_rows(len(processed_rows))
+    usage = new_column_usage()
+    update_column_usage(usage, processed_rows, columns)
+    output_columns = select_output_columns(columns, usage)
+    if len(output_columns) < len(columns):
+        logging.info(f"已移除 {len(columns) - len(output_columns)} 个空白列")
+
+    result = {
+        'df': pd.DataFrame(processed_rows, columns=output_columns),
+        'stats': stats,
+        'merged_materials': merged_materials,
+        'total_final_items': total_final_items,
+        # 计算处理后的总位号数（不含替代料）
+        'final_ref_count': count_final_references(processed_rows, cols['reference']),
+        'parallel_mode': parallel_mode,
+        'dnp_designators': dnp_designators
+    }
+    if own_progress:
+        progress.finish_stage()
+        result['timings'] = progress.stage_timings()
+    return result
+
+def process_bom_sheet_worker(bom_path, job):
+    """子进程中处理一个工作表，替代料索引由init_partition_worker设置"""
+    valid_groups, pn_index, _ = _partition_context
+    return process_bom_sheet(bom_path, job, valid_groups, pn_index)
+
+def collect_dnp_designators(bom_rows, variant_columns, ref_col, dnp_markers):
+    """
+    收集每个变体中不贴装(DNP)的位号
+
+    变体列的单元格为空表示该行全部贴装；内容为DNP标记（如"DNP"）表示该行所有位号都不贴装；
+    其他内容按逗号分隔的位号列表处理，表示只有这些位号不贴装。
+
+    Args:
+        bom_rows: BOM行字典列表
+        variant_columns: 变体名称到BOM实际列名的映射
+        ref_col: 位号列名
+        dnp_markers: 表示整行不贴装的标记
+
+    Returns:
+        dict: 变体名称到不贴装位号集合的映射
+    """
+    markers = {str(marker).strip().upper() for marker in dnp_markers}
+    dnp_designators = {variant: set() for variant in variant_columns}
+    for row in bom_rows:
+        for variant, column in variant_columns.items():
+            value = row.get(column)
+            if value is None or pd.isna(value) or not str(value).strip():
                 continue
+            if str(value).strip().upper() in markers:
+                designators = str(row.get(ref_col, '')) if not pd.isna(row.get(ref_col)) else ''
+            else:
+                designators = str(value).replace('，', ',')
+            dnp_designators[variant].update(ref.strip() for ref in designators.split(',') if ref.strip())
+    return dnp_designators
+
+def rebuild_variant_cells(rows, variant_columns, dnp_designators, ref_col):
+    """
+    按各变体不贴装的位号重新生成变体列的内容
+
+    合并相同料号后，合并行的变体列只保留了第一行的内容，与合并后的位号不再对应；
+    重新生成后变体列中为该行不贴装的位号，没有不贴装的位号时为空。
+
+    Args:
+        rows: 处理后的行字典列表，会被原地修改
+        variant_columns: 变体名称到BOM实际列名的映射
+        dnp_designators: collect_dnp_designators返回的各变体不贴装位号
+        ref_col: 位号列名
+    """
+    for variant, column in variant_columns.items():
+        designators = dnp_designators.get(variant) or set()
+        for row in rows:
+            reference = row.get(ref_col)
+            references = [] if pd.isna(reference) else [ref.strip() for ref in str(reference).split(',')]
+            dnp = [ref for ref in references if ref and ref in designators]
+            row[column] = ','.join(dnp) if dnp else float('nan')
+
+def apply_variant_dnp(processed_df, dnp_designators, cols, drop_columns=()):
+    """
+    从处理结果中去除某个变体不贴装的位号
+
+    位号全部不贴装的行（包括其替代料行）会被删除，其余行按剩余位号重新计算数量，
+    最后重新编号并过滤空白列。替代料展开和相同料号合并的结果直接复用，不再重复计算。
+
+    Args:
+        processed_df: 处理后的BOM数据
+        dnp_designators: 该变体不贴装的位号集合
+        cols: get_engine_columns返回的列名
+        drop_columns: 变体结果中不输出的列（变体列本身）
 
-            # 创建合并后的行（基于第一行）
-            merged_row = duplicate_rows.iloc[0].copy()
+    Returns:
+        tuple: (变体的BOM数据, 处理后物料总位号数, 去除的位号数)
+    """
+    ref_col = cols['reference']
+    quantity_col = cols['quantity']
+
+    rows = []
+    removed_count = 0
+    for row in processed_df.to_dict('records'):
+        reference = row.get(ref_col)
+        if dnp_designators and not pd.isna(reference) and str(reference).strip():
+            references = [ref.strip() for ref in str(reference).split(',') if ref.strip()]
+            fitted = [ref for ref in references if ref not in dnp_designators]
+            if len(fitted) != len(references):
+                if row.get('操作类型') != '替代插入':
+                    removed_count += len(references) - len(fitted)
+                if not fitted:
+                    continue
+                row[ref_col] = ','.join(fitted)
+                row[quantity_col] = len(fitted)
+        rows.append(row)
 
-            # 收集所有Reference，维持原顺序
-            all_references = []
+    rows = renumber_item_rows(rows, cols['item'])
 
-            for _, row in duplicate_rows.iterrows():
-                processed_indices.append(row.name)
+    columns = [col for col in processed_df.columns if col not in drop_columns]
+    usage = new_column_usage()
+    update_column_usage(usage, rows, columns)
+    output_columns = select_output_columns(columns, usage)
 
-                # 处理Reference，保持原顺序
-                if not pd.isna(row[ref_col]) and str(row[ref_col]).strip():
-                    refs = [ref.strip() for ref in str(row[ref_col]).split(',')]
-                    for ref in refs:
-                        if ref and ref not in all_references:  # 只添加非空且不重复的引用
-                            all_references.append(ref)
+    return pd.DataFrame(rows, columns=output_columns), count_final_references(rows, ref_col), removed_count
 
-            # 合并后的位号字符串
-            combined_references = ','.join(all_references)
+def get_variant_output_path(bom_path, variant):
+    """获取变体结果文件路径，变体名称中不能用于文件名的字符替换为下划线"""
+    safe_name = ''.join('_' if char in '\\/:*?"<>|' else char for char in str(variant)).strip() or 'variant'
+    return Path(bom_path).parent / (Path(bom_path).stem + f'_替代料_{safe_name}.xlsx')
 
-            # 设置合并后的值 - Quantity等于位号的数量
-            merged_row[ref_col] = combined_references
-            # 使用统一的函数计算位号数量
-            merged_row[quantity_col] = count_references(combined_references)
+def new_column_usage():
+    """创建列使用情况统计，用于过滤空白列"""
+    return {}
 
-            # 记录合并信息
-            merge_info = {
-                pn_col: pn,
-                '合并行数': len(duplicate_rows),
-                '合并后位号数': count_references(combined_references)
-            }
+def update_column_usage(usage, rows, columns):
+    """
+    统计各列是否包含空值和有效内容
 
-            # 安全地添加可选字段
-            if desc_col in merged_row:
-                merge_info[desc_col] = merged_row.get(desc_col, '')
+    Args:
+        usage: new_column_usage返回的字典，会被原地更新
+        rows: 行字典的可迭代对象
+        columns: 全部列名
+    """
+    for col in columns:
+        usage.setdefault(col, {'has_value': False, 'has_na': False, 'has_text': False})
+    for row in rows:
+        for col in columns:
+            col_usage = usage[col]
+            value = row.get(col)
+            if value is None or pd.isna(value):
+                col_usage['has_na'] = True
             else:
-                merge_info[desc_col] = ''
+                col_usage['has_value'] = True
+                if not col_usage['has_text'] and str(value).strip() != '':
+                    col_usage['has_text'] = True
 
-            if mfr_col in merged_row:
-                merge_info[mfr_col] = merged_row.get(mfr_col, '')
+def select_output_columns(columns, usage):
+    """
+    过滤空白列：全为空值、全为空字符串或列名为空的列不输出
 
-            if mfr_pn_col in merged_row:
-                merge_info[mfr_pn_col] = merged_row.get(mfr_pn_col, '')
+    Args:
+        columns: 全部列名
+        usage: update_column_usage统计的列使用情况
 
-            merged_materials.append(merge_info)
+    Returns:
+        list: 需要输出的列名
+    """
+    output_columns = []
+    for col in columns:
+        col_usage = usage.get(col, {'has_value': False, 'has_na': True, 'has_text': False})
+        if not col_usage['has_value']:
+            continue
+        if not col_usage['has_na'] and not col_usage['has_text']:
+            continue
+        if col is None or (isinstance(col, str) and col.strip() == ''):
+            continue
+        output_columns.append(col)
+    return output_columns
+
+def summarize_substitute_changes(rows, pn_col):
+    """
+    汇总最终结果中每个物料插入的替代料，用于预览统计的变更摘要
 
-            # 打印调试信息
-            logging.info(f"合并料号 {pn}, 合并后位号数量: {count_references(combined_references)}, 位号: {combined_references}")
+    Args:
+        rows: 最终行字典的可迭代对象（按输出顺序）
+        pn_col: 料号列名
 
-            merged_rows.append(merged_row)
+    Returns:
+        list: (主料号, 替代料号列表)，按输出顺序排列
+    """
+    changes = []
+    main_pn = None
+    for row in rows:
+        operation = row.get('操作类型', '')
+        if operation == '替代插入':
+            if not changes or changes[-1][0] != main_pn:
+                changes.append((main_pn, []))
+            changes[-1][1].append(row.get(pn_col))
+        elif operation == '保留':
+            main_pn = row.get(pn_col)
+    return changes
+
+def count_final_references(rows, ref_col):
+    """计算处理后物料总位号数（不含替代料）"""
+    return sum(count_references(str(row.get(ref_col, float('nan'))))
+               for row in rows if row.get('操作类型', '') != '替代插入')
+
+def get_output_styles(highlight_color):
+    """
+    获取输出BOM工作表使用的样式
 
-        # 从原始DataFrame中删除已处理的行
-        processed_df = processed_df.drop(processed_indices)
+    Args:
+        highlight_color: 替代料行的高亮颜色
 
-        # 添加合并后的行
-        if merged_rows:
-            merged_df = pd.DataFrame(merged_rows)
-            processed_df = pd.concat([processed_df, merged_df], ignore_index=True)
+    Returns:
+        dict: 样式名称到样式对象的映射
+    """
+    return {
+        'header_font': Font(name='Calibri', size=11, bold=True, color='FFFFFF'),
+        'data_font': Font(name='Calibri', size=11),
+        'substitute_font': Font(name='Calibri', size=11, italic=True),
+        # 表头样式
+        'header_fill': PatternFill(start_color='0078D4', end_color='0078D4', fill_type='solid'),  # 微软蓝
+        'substitute_fill': PatternFill(start_color=highlight_color, end_color=highlight_color, fill_type='solid'),
+        # 边框样式
+        'thin_border': Border(
+            left=Side(style='thin', color='D3D3D3'),
+            right=Side(style='thin', color='D3D3D3'),
+            top=Side(style='thin', color='D3D3D3'),
+            bottom=Side(style='thin', color='D3D3D3')
+        ),
+        'header_border': Border(
+            left=Side(style='thin', color='D3D3D3'),
+            right=Side(style='thin', color='D3D3D3'),
+            top=Side(style='thin', color='D3D3D3'),
+            bottom=Side(style='thin', color='005499')  # 底部边框使用深蓝色
+        ),
+        # 对齐样式
+        'center_alignment': Alignment(horizontal='center', vertical='center'),
+        'left_alignment': Alignment(horizontal='left', vertical='center'),
+        'right_alignment': Alignment(horizontal='right', vertical='center'),
+        'wrap_alignment': Alignment(horizontal='left', vertical='center')  # 移除wrap_text=True
+    }
 
-        # 确保所有行的Quantity都基于Reference位号计数
-        processed_df['Quantity_new'] = processed_df.apply(
-            lambda row: count_references(row[ref_col]),
-            axis=1
-        )
+def get_output_column_info(columns, bom_header_mapping):
+    """
+    根据表头映射获取输出列的宽度和位置
 
-        # 用新计算的Quantity替换原Quantity
-        processed_df[quantity_col] = processed_df['Quantity_new']
-        processed_df.drop('Quantity_new', axis=1, inplace=True)
+    Args:
+        columns: 输出列名
+        bom_header_mapping: BOM表头映射
 
-        # 更新完成进度
-        update_progress(95)
+    Returns:
+        dict: 字段到{'width': 列宽, 'index': 列序号(从1开始)或None}的映射
+    """
+    column_info = {
+        'item': {'width': 6, 'index': None},  # Item
+        'pn': {'width': 12, 'index': None},  # P/N
+        'part': {'width': 12, 'index': None},  # Part
+        'reference': {'width': 45, 'index': None},  # Reference
+        'quantity': {'width': 10, 'index': None},  # Quantity
+        'description': {'width': 50, 'index': None},  # Description
+        'mfr_pn': {'width': 22, 'index': None},  # ManuFacturer P/N
+        'manufacturer': {'width': 15, 'index': None}  # ManuFacturer
+    }
 
-        # 按原始Item排序并重新编号
-        try:
-            logging.info("开始Item排序和重新编号")
-            update_status('正在排序和重新编号...')
+    # 获取每个列的索引位置
+    for i, col_name in enumerate(columns):
+        for key, header in bom_header_mapping.items():
+            if col_name == header and key in column_info:
+                # 列索引从1开始
+                column_info[key]['index'] = i + 1
 
-            # 创建临时列，分别提取主序号和子序号
-            processed_df['主序号'] = processed_df[item_col].apply(
-                lambda x: int(str(x).split('.')[0]) if not pd.isna(x) and '.' in str(x) else
-                         int(x) if not pd.isna(x) and str(x).isdigit() else 999999
-            )
+    return column_info
 
-            processed_df['子序号'] = processed_df[item_col].apply(
-                lambda x: int(str(x).split('.')[1]) if not pd.isna(x) and '.' in str(x) else 0
-            )
+def get_output_alignment(col, column_info, styles, is_header=False):
+    """
+    获取输出单元格的对齐方式
 
-            # 先按主序号排序，再按子序号排序
-            processed_df = processed_df.sort_values(['主序号', '子序号'])
+    Args:
+        col: 列序号（从1开始）
+        column_info: get_output_column_info返回的列信息
+        styles: get_output_styles返回的样式
+        is_header: 是否为表头单元格
 
-            # 重置索引，便于按顺序处理
-            processed_df = processed_df.reset_index(drop=True)
+    Returns:
+        Alignment: 对齐样式
+    """
+    if col == column_info.get('item', {}).get('index'):
+        return styles['center_alignment']  # Item列居中
+    elif col == column_info.get('quantity', {}).get('index'):
+        return styles['right_alignment']  # 数量列靠右
+    elif col == column_info.get('reference', {}).get('index'):
+        return styles['wrap_alignment']  # 位号列自动换行
+    elif not is_header and col == column_info.get('description', {}).get('index'):
+        return styles['wrap_alignment']  # 描述列自动换行
+    return styles['left_alignment']  # 其他列靠左
+
+def trim_row_values(values):
+    """去掉行末尾的空单元格（与pandas读取Excel时的处理一致）"""
+    values = list(values)
+    while values and (values[-1] is None or values[-1] == ''):
+        values.pop()
+    return values
+
+def excel_column_names(header_values):
+    """
+    按pandas的规则由表头行生成列名（空表头为"Unnamed: 序号"，重复表头追加".1"等后缀）
 
-            # 获取所有唯一的主序号，并按顺序排列
-            unique_main_numbers = sorted(processed_df['主序号'].unique())
+    Args:
+        header_values: 表头行的原始单元格值
 
-            # 创建主序号映射（老序号->新序号）
-            main_number_map = {old: new+1 for new, old in enumerate(unique_main_numbers)}
+    Returns:
+        list: 列名列表
+    """
+    names = []
+    seen = {}
+    for idx, value in enumerate(header_values):
+        name = convert_excel_value(value)
+        if pd.isna(name):
+            name = f"Unnamed: {idx}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+def convert_excel_value(value):
+    """
+    按pandas读取Excel的规则转换单元格值（空单元格和空值字符串为NaN，整数值的浮点数转为整数）
 
-            # 创建新的DataFrame存储结果
-            result_df = pd.DataFrame(columns=processed_df.columns)
+    Args:
+        value: openpyxl读取的单元格值
 
-            # 新的连续序号
-            new_seq = 1
+    Returns:
+        转换后的值
+    """
+    if value is None:
+        return float('nan')
+    if isinstance(value, str):
+        return float('nan') if value in EXCEL_NA_STRINGS else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def iter_bom_rows(bom_path, header_row, header_values, usecols=None, dtype=None):
+    """
+    以只读方式逐行读取BOM数据，结果与pd.read_excel(skiprows=header_row-1)逐行一致
 
-            # 用于记录已经编号的物料组
-            processed_sub_groups = set()
+    Args:
+        bom_path: BOM文件路径
+        header_row: 表头所在行号
+        header_values: 表头行的原始单元格值
+        usecols: 列筛选函数，None表示读取全部列
+        dtype: 需要按字符串读取的列，格式同resolve_read_columns的返回值
+
+    Yields:
+        dict: 列名到单元格值的映射
+    """
+    names = excel_column_names(trim_row_values(header_values))
+    string_columns = set(excel_column_names(list(dtype or {})))
 
-            # 处理每个主序号组
-            for main_num in unique_main_numbers:
-                # 获取当前主序号的所有行
-                main_group = processed_df[processed_df['主序号'] == main_num].copy()
+    wb = openpyxl.load_workbook(bom_path, read_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # pandas会去掉末尾的空行，中间的空行保留为全空的行
+        pending_empty_rows = 0
+        for values in ws.iter_rows(min_row=header_row + 1, values_only=True):
+            values = trim_row_values(values)
+            if not values:
+                pending_empty_rows += 1
+                continue
 
-                # 新的主序号
-                new_main = main_number_map[main_num]
+            while len(names) < len(values):
+                names.append(f"Unnamed: {len(names)}")
+            keep = [idx for idx, name in enumerate(names) if usecols is None or usecols(name)]
+
+            for _ in range(pending_empty_rows):
+                yield {names[idx]: float('nan') for idx in keep}
+            pending_empty_rows = 0
+
+            row = {}
+            for idx in keep:
+                value = convert_excel_value(values[idx]) if idx < len(values) else float('nan')
+                if names[idx] in string_columns and not pd.isna(value):
+                    value = str(value)
+                row[names[idx]] = value
+            yield row
+    finally:
+        wb.close()
+
+class ChunkStore:
+    """
+    分块处理模式使用的临时磁盘存储
 
-                # 检查组内是否有替代料关系
-                # 如果存在'操作类型'列且有值为'替代插入'或'保留'的行，则认为是替代料关系
-                has_substitute = '操作类型' in main_group.columns and any(
-                    op_type in ['替代插入', '保留'] for op_type in main_group['操作类型'] if not pd.isna(op_type)
-                )
+    中间结果保存在临时目录下的SQLite数据库中，排序和按料号分组由SQLite在磁盘上完成，
+    内存占用只取决于页缓存大小和单个分块的大小。
+    """
+    def __init__(self, directory, cache_kb):
+        self.conn = sqlite3.connect(os.path.join(directory, 'chunks.db'))
+        self.conn.execute(f'PRAGMA cache_size = -{max(int(cache_kb), 1024)}')
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('PRAGMA temp_store = FILE')
+        self.conn.executescript("""
+            CREATE TABLE bom_rows (seq INTEGER PRIMARY KEY, main INTEGER, sub INTEGER, data BLOB);
+            CREATE TABLE expanded (pos INTEGER PRIMARY KEY, pn_key TEXT, main INTEGER, sub INTEGER, data BLOB);
+            CREATE TABLE merged (pos INTEGER PRIMARY KEY, main INTEGER, sub INTEGER, data BLOB);
+            CREATE TABLE final_rows (pos INTEGER PRIMARY KEY, data BLOB);
+        """)
+        self._next_pos = 0
+
+    @staticmethod
+    def pn_key(pn):
+        """料号的存储键，与Python中的相等比较保持一致，空料号返回None"""
+        if pn is None or pd.isna(pn):
+            return None
+        if isinstance(pn, str):
+            return 's:' + pn
+        if isinstance(pn, (int, float)) and float(pn).is_integer():
+            return f'n:{int(pn)}'
+        return 'o:' + repr(pn)
+
+    @staticmethod
+    def dumps(row):
+        return pickle.dumps(row, pickle.HIGHEST_PROTOCOL)
+
+    def add_bom_rows(self, start_seq, rows, item_col):
+        """保存原始BOM行，记录排序用的主序号和子序号"""
+        self.conn.executemany(
+            'INSERT INTO bom_rows VALUES (?, ?, ?, ?)',
+            ((start_seq + offset,) + parse_item_number(row.get(item_col)) + (self.dumps(row),)
+             for offset, row in enumerate(rows))
+        )
 
-                # 检查是否都是同一物料的不同位号
-                same_material = False
-                if len(main_group) > 1:
-                    # 检查所有行是否有相同的P/N
-                    unique_pns = main_group[pn_col].unique()
-                    same_material = len(unique_pns) == 1
-
-                # 分离带子序号的行和不带子序号的行
-                sub_rows = main_group[main_group['子序号'] > 0]
-                regular_rows = main_group[main_group['子序号'] == 0]
-
-                # 处理带有替代料标记的行
-                if has_substitute and not sub_rows.empty:
-                    # 只对真正的替代料关系使用x.1, x.2格式
-                    sub_rows_result = sub_rows.copy()
-                    for idx, row in sub_rows.iterrows():
-                        current_main = row['主序号']
-                        current_sub = row['子序号']
-                        group_id = f"{current_main}.{current_sub}"
-                        if group_id in processed_sub_groups:
-                            continue
-                        processed_sub_groups.add(group_id)
-
-                        sub_rows_result.loc[idx, item_col] = f"{new_seq}.{current_sub}"
-
-                    # 优化concat操作，避免FutureWarning
-                    if not sub_rows_result.empty:
-                        sub_rows_filtered = sub_rows_result.dropna(axis=1, how='all')
-                        result_df = pd.concat([result_df, sub_rows_filtered])
-                    new_seq += 1
-
-                    # 单独处理没有子序号的行，即使主序号相同
-                    if not regular_rows.empty:
-                        # 优化：批量创建DataFrame而不是逐行添加，减少连接操作次数
-                        regular_rows_copies = []
-                        for idx, row in regular_rows.iterrows():
-                            row_copy = row.copy()
-                            row_copy[item_col] = str(new_seq)
-                            regular_rows_copies.append(row_copy)
-                            new_seq += 1
-                        if regular_rows_copies:
-                            regular_df = pd.DataFrame(regular_rows_copies)
-                            result_df = pd.concat([result_df, regular_df.dropna(axis=1, how='all')])
-
-                # 不是替代料且是同样物料的不同位号 - 仍然按单独序号处理
-                elif same_material and main_group['子序号'].sum() == 0:
-                    # 相同物料的不同位号，每行单独分配序号
-                    # 优化：批量处理
-                    material_rows_copies = []
-                    for idx, row in main_group.iterrows():
-                        row_copy = row.copy()
-                        row_copy[item_col] = str(new_seq)
-                        material_rows_copies.append(row_copy)
-                        new_seq += 1
-                    if material_rows_copies:
-                        material_df = pd.DataFrame(material_rows_copies)
-                        result_df = pd.concat([result_df, material_df.dropna(axis=1, how='all')])
-
-                # 单行无子序号
-                elif len(main_group) == 1 and main_group.iloc[0]['子序号'] == 0:
-                    main_group[item_col] = str(new_seq)
-                    # 优化concat操作，避免FutureWarning
-                    if not main_group.empty:
-                        # 过滤掉全为NA的列
-                        main_group_filtered = main_group.dropna(axis=1, how='all')
-                        result_df = pd.concat([result_df, main_group_filtered])
-                    new_seq += 1
-
-                # 其他情况（有多行但没有替代料标记）
-                else:
-                    # 其他情况的多行，每行单独分配序号
-                    # 优化：批量处理
-                    other_rows_copies = []
-                    for idx, row in main_group.iterrows():
-                        row_copy = row.copy()
-                        row_copy[item_col] = str(new_seq)
-                        other_rows_copies.append(row_copy)
-                        new_seq += 1
-                    if other_rows_copies:
-                        other_df = pd.DataFrame(other_rows_copies)
-                        result_df = pd.concat([result_df, other_df.dropna(axis=1, how='all')])
-
-            # 使用处理后的DataFrame
-            processed_df = result_df.drop(['主序号', '子序号'], axis=1)
-
-            # 最后按Item排序确保顺序正确
-            try:
-                def natural_sort_key(s):
-                    if pd.isna(s):
-                        return [0, 0]
-                    parts = str(s).split('.')
-                    return [int(parts[0]) if parts[0].isdigit() else 0,
-                           int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0]
-
-                processed_df = processed_df.sort_values(item_col, key=lambda x: x.map(natural_sort_key))
-            except Exception as e:
-                logging.warning(f"最终排序失败: {e}，保持当前顺序")
+    def iter_sorted_bom_rows(self):
+        """按主序号、子序号排序（相同时保持原顺序）读取原始BOM行"""
+        cursor = self.conn.execute('SELECT data FROM bom_rows ORDER BY main, sub, seq')
+        for (data,) in cursor:
+            yield pickle.loads(data)
+
+    def add_expanded_rows(self, rows, cols):
+        """保存展开替代料后的行"""
+        records = []
+        for row in rows:
+            records.append((self._next_pos, self.pn_key(row.get(cols['pn'])))
+                           + parse_item_number(row.get(cols['item'])) + (self.dumps(row),))
+            self._next_pos += 1
+        self.conn.executemany('INSERT INTO expanded VALUES (?, ?, ?, ?, ?)', records)
+
+    def iter_duplicate_pn_groups(self):
+        """按首次出现的顺序读取料号重复的行组"""
+        self.conn.execute('CREATE INDEX idx_expanded_pn ON expanded (pn_key, pos)')
+        self.conn.execute("""
+            CREATE TABLE dup_keys AS
+            SELECT pn_key, MIN(pos) AS first_pos FROM expanded
+            WHERE pn_key IS NOT NULL GROUP BY pn_key HAVING COUNT(*) > 1
+        """)
+        keys = self.conn.execute('SELECT pn_key FROM dup_keys ORDER BY first_pos')
+        for (key,) in keys:
+            rows = self.conn.execute('SELECT data FROM expanded WHERE pn_key = ? ORDER BY pos', (key,))
+            yield [pickle.loads(data) for (data,) in rows]
+
+    def add_merged_row(self, row, item_col):
+        """保存合并后的行"""
+        self.conn.execute(
+            'INSERT INTO merged VALUES (?, ?, ?, ?)',
+            (self._next_pos,) + parse_item_number(row.get(item_col)) + (self.dumps(row),)
+        )
+        self._next_pos += 1
+
+    def iter_sorted_result_rows(self):
+        """按主序号、子序号读取合并后的全部行，元素为(主序号, 子序号, 行字典)"""
+        cursor = self.conn.execute("""
+            SELECT main, sub, pos, data FROM expanded
+            WHERE pn_key IS NULL OR pn_key NOT IN (SELECT pn_key FROM dup_keys)
+            UNION ALL
+            SELECT main, sub, pos, data FROM merged
+            ORDER BY 1, 2, 3
+        """)
+        for main, sub, _, data in cursor:
+            yield main, sub, pickle.loads(data)
+
+    def add_final_rows(self, start_pos, rows):
+        """保存最终输出顺序的行"""
+        self.conn.executemany(
+            'INSERT INTO final_rows VALUES (?, ?)',
+            ((start_pos + offset, self.dumps(row)) for offset, row in enumerate(rows))
+        )
 
-        except Exception as e:
-            logging.warning(f"重新编号过程中出现错误: {e}，使用备选排序方法")
+    def iter_final_rows(self):
+        """按输出顺序读取最终行"""
+        cursor = self.conn.execute('SELECT data FROM final_rows ORDER BY pos')
+        for (data,) in cursor:
+            yield pickle.loads(data)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def estimate_chunk_rows(sample_rows, memory_budget_mb, max_chunk_rows):
+    """
+    根据样本行的大小估算不超过内存预算的分块行数
+
+    Args:
+        sample_rows: 样本行字典列表
+        memory_budget_mb: 内存预算（MB）
+        max_chunk_rows: 配置的最大分块行数
+
+    Returns:
+        int: 分块行数
+    """
+    if not sample_rows:
+        return max_chunk_rows
+    # 序列化大小只反映数据量，Python对象和展开后的替代行约占其数倍内存
+    bytes_per_row = len(pickle.dumps(sample_rows, pickle.HIGHEST_PROTOCOL)) / len(sample_rows) * 8
+    # 分块数据最多使用一半预算，其余留给SQLite页缓存和替代料索引
+    budget_rows = int(memory_budget_mb * 1024 * 1024 / 2 / max(bytes_per_row, 1))
+    return max(100, min(max_chunk_rows, budget_rows))
+
+def process_bom_chunked(bom_path, header_row, header_values, usecols, dtype, column_defaults,
+                        valid_groups, pn_index, cols, chunk_rows, memory_budget_mb, status_callback=None,
+                        progress=None):
+    """
+    分块处理超大BOM
+
+    BOM行分批读取并展开替代料，中间结果写入临时SQLite数据库；跨分块的相同料号合并
+    和Item重新编号通过数据库的分组和外部排序完成，全程只有一个分块驻留在内存中。
+
+    Args:
+        bom_path: BOM文件路径
+        header_row: 表头所在行号
+        header_values: 表头行的原始单元格值
+        usecols: 列筛选函数
+        dtype: 按字符串读取的列
+        column_defaults: BOM中缺失时补充的列及默认值
+        valid_groups: 有效替代组
+        pn_index: 料号索引
+        cols: get_engine_columns返回的列名
+        chunk_rows: 最大分块行数
+        memory_budget_mb: 内存预算（MB）
+        status_callback: 状态回调函数，接收一个参数(状态消息)
+        progress: ProgressReporter（可选）
+
+    Returns:
+        dict: 处理结果，包含临时存储store、列名columns、输出行数final_count、统计信息等，
+              调用者写出结果后需要调用cleanup()删除临时文件
+    """
+    item_col = cols['item']
+    temp_dir = tempfile.mkdtemp(prefix='bomswap_')
+    # 四分之一预算用作SQLite页缓存
+    store = ChunkStore(temp_dir, memory_budget_mb * 1024 / 4)
+
+    def cleanup():
+        store.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    try:
+        # 第一遍：分块读取原始BOM并写入磁盘，由SQLite完成排序
+        effective_chunk_rows = min(chunk_rows, 1000)
+        chunk = []
+        row_count = 0
+        chunk_count = 0
+        if progress:
+            # 只读模式下max_row取自工作表的尺寸信息，作为读取阶段的工作量估计
+            estimate_wb = openpyxl.load_workbook(bom_path, read_only=True)
             try:
-                # 备选排序方法
-                def natural_sort_key(s):
-                    if pd.isna(s):
-                        return [0, 0]
-                    parts = str(s).split('.')
-                    return [int(parts[0]) if parts[0].isdigit() else 0,
-                           int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0]
-
-                processed_df = processed_df.sort_values(item_col, key=lambda x: x.map(natural_sort_key))
-            except Exception as e2:
-                logging.warning(f"备选排序也失败: {e2}，使用基本排序")
-                try:
-                    processed_df = processed_df.sort_values(item_col)
-                except:
-                    logging.warning("所有排序方法均失败，保持原有顺序")
-
-        # 过滤掉DataFrame中的空白列
-        logging.info("开始过滤空白列")
-        update_status('正在过滤空白列...')
-
-        # 移除所有列都为空的列
-        processed_df = processed_df.dropna(axis=1, how='all')
-
-        # 移除不包含任何数据的列（全为空值或者空字符串）
-        empty_cols = []
-        for col in processed_df.columns:
-            # 检查是否所有值都是空值或空字符串
-            if processed_df[col].isnull().all() or (processed_df[col].astype(str).str.strip() == '').all():
-                empty_cols.append(col)
-
-        # 检查无名列或列名为空格的列
-        for col in processed_df.columns:
-            if col is None or (isinstance(col, str) and col.strip() == ''):
-                empty_cols.append(col)
-
-        # 删除空列
-        if empty_cols:
-            processed_df = processed_df.drop(columns=empty_cols)
-            logging.info(f"已移除 {len(empty_cols)} 个空白列")
-
-        # 确保没有重复的列名
-        processed_df = processed_df.loc[:, ~processed_df.columns.duplicated()]
-        logging.info("已移除重复列")
-
-        # 检查操作类型列是否有有效数据，如果全为空则删除
-        if '操作类型' in processed_df.columns:
-            if processed_df['操作类型'].isnull().all() or (processed_df['操作类型'].astype(str).str.strip() == '').all():
-                processed_df = processed_df.drop(columns=['操作类型'])
-                logging.info("移除无数据的操作类型列")
-
-        # 保存结果
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            # 写入数据，不包含索引
-            processed_df.to_excel(writer, index=False, startrow=len(project_info_rows))
-
-            # 获取工作表
-            worksheet = writer.sheets['Sheet1']
-
-            # 获取实际数据列数
-            actual_column_count = len(processed_df.columns)
-
-            # 恢复项目信息行
-            for row_idx, row_data in enumerate(project_info_rows, 1):
-                for col_idx, cell_data in row_data.items():
-                    # 只处理实际数据列范围内的单元格
-                    if col_idx <= actual_column_count:
-                        cell = worksheet.cell(row=row_idx, column=col_idx)
-                        cell.value = cell_data['value']
-
-                        # 恢复字体
-                        cell.font = Font(
-                            name=cell_data['font_name'],
-                            size=cell_data['font_size'],
-                            bold=cell_data['font_bold']
-                        )
-
-                        # 恢复填充
-                        if cell_data['fill_type'] and cell_data['fill_color']:
-                            start_color = cell_data['fill_color']
-                            end_color = cell_data['fill_color']
-                            new_cell = PatternFill(
-                            fill_type=cell_data['fill_type'],
-                                start_color=start_color,
-                                end_color=end_color
-                        )
-                            cell.fill = new_cell
-
-                        # 恢复边框
-                        border_styles = {
-                            'left': cell_data['border_left'],
-                            'right': cell_data['border_right'],
-                            'top': cell_data['border_top'],
-                            'bottom': cell_data['border_bottom']
-                        }
-                        cell.border = Border(**{
-                            side: Side(style=style) if style else None
-                            for side, style in border_styles.items()
-                        })
-
-                        # 恢复对齐
-                        cell.alignment = Alignment(
-                            horizontal=cell_data['alignment_horizontal'],
-                            vertical=cell_data['alignment_vertical']
-                        )
-
-                        # 恢复数字格式
-                        cell.number_format = cell_data['number_format']
-
-            # 设置列宽 - 根据表头映射设置
-            column_info = {
-                'item': {'width': 6, 'index': None},  # Item
-                'pn': {'width': 12, 'index': None},  # P/N
-                'part': {'width': 12, 'index': None},  # Part
-                'reference': {'width': 45, 'index': None},  # Reference
-                'quantity': {'width': 10, 'index': None},  # Quantity
-                'description': {'width': 50, 'index': None},  # Description
-                'mfr_pn': {'width': 22, 'index': None},  # ManuFacturer P/N
-                'manufacturer': {'width': 15, 'index': None}  # ManuFacturer
-            }
-
-            # 获取每个列的索引位置
-            for i, col_name in enumerate(processed_df.columns):
-                for key, header in bom_header_mapping.items():
-                    if col_name == header and key in column_info:
-                        # 列索引从1开始
-                        column_info[key]['index'] = i + 1
-
-            # 设置列宽
-            for key, info in column_info.items():
-                if info['index'] is not None:
-                    col_letter = openpyxl.utils.get_column_letter(info['index'])
-                    worksheet.column_dimensions[col_letter].width = info['width']
-
-            # 定义样式
-            title_font = Font(name='Calibri', size=11, bold=True)
-            header_font = Font(name='Calibri', size=11, bold=True, color='FFFFFF')
-            data_font = Font(name='Calibri', size=11)
-            substitute_font = Font(name='Calibri', size=11, italic=True)
-
-            # 表头样式
-            header_fill = PatternFill(start_color='0078D4', end_color='0078D4', fill_type='solid')  # 微软蓝
-
-            # 从配置中获取高亮颜色
-            highlight_color = config.get('highlight_color', 'FFFF00')  # 默认黄色
-            substitute_fill = PatternFill(start_color=highlight_color, end_color=highlight_color, fill_type='solid')
-
-            # 边框样式
-            thin_border = Border(
-                left=Side(style='thin', color='D3D3D3'),
-                right=Side(style='thin', color='D3D3D3'),
-                top=Side(style='thin', color='D3D3D3'),
-                bottom=Side(style='thin', color='D3D3D3')
-            )
+                estimated_rows = max((estimate_wb.worksheets[0].max_row or 0) - header_row, 0)
+            finally:
+                estimate_wb.close()
+            progress.start_stage('分块读取BOM', 20, 35, total=estimated_rows)
+        for row in iter_bom_rows(bom_path, header_row, header_values, usecols, dtype):
+            for col, default in column_defaults.items():
+                row.setdefault(col, default)
+            chunk.append(row)
+            if progress:
+                progress.advance()
+            if len(chunk) >= effective_chunk_rows:
+                if chunk_count == 0:
+                    effective_chunk_rows = estimate_chunk_rows(chunk, memory_budget_mb, chunk_rows)
+                    logging.info(f"分块行数: {effective_chunk_rows}")
+                store.add_bom_rows(row_count, chunk, item_col)
+                row_count += len(chunk)
+                chunk_count += 1
+                chunk = []
+        if chunk:
+            store.add_bom_rows(row_count, chunk, item_col)
+            row_count += len(chunk)
+            chunk_count += 1
+        store.commit()
+        logging.info(f"分块读取完成，共 {row_count} 行，{chunk_count} 块")
+
+        # 第二遍：按排序结果重新编号原始Item并展开替代料
+        stats = new_expand_stats()
+        columns = []
+        total_final_items = 0
+        chunk = []
+        current_item = 1
+        if progress:
+            progress.start_stage('展开替代料', 35, 60, total=row_count)
+        for row in store.iter_sorted_bom_rows():
+            row[item_col] = str(current_item)
+            current_item += 1
+            chunk.append(row)
+            if len(chunk) >= effective_chunk_rows:
+                new_rows = expand_substitute_rows(chunk, valid_groups, pn_index, cols, stats, progress=progress)
+                collect_row_columns(new_rows, columns)
+                store.add_expanded_rows(new_rows, cols)
+                total_final_items += len(new_rows)
+                chunk = []
+        if chunk:
+            new_rows = expand_substitute_rows(chunk, valid_groups, pn_index, cols, stats, progress=progress)
+            collect_row_columns(new_rows, columns)
+            store.add_expanded_rows(new_rows, cols)
+            total_final_items += len(new_rows)
+        store.commit()
+
+        # 第三遍：由SQLite按料号分组，逐组合并相同料号
+        if status_callback:
+            status_callback('正在合并相同料号...')
+        if progress:
+            progress.start_stage('合并相同料号', 60, 65, unit='组')
+        merged_materials = []
+        for duplicate_rows in store.iter_duplicate_pn_groups():
+            pn = duplicate_rows[0].get(cols['pn'])
+            merged_row = merge_duplicate_rows(duplicate_rows, pn, cols)
+            store.add_merged_row(merged_row, item_col)
+            merged_materials.append(build_merge_info(merged_row, pn, len(duplicate_rows), cols, columns))
+            if progress:
+                progress.advance()
+        store.commit()
+
+        # 第四遍：按主序号、子序号外部排序后逐组重新编号，同时统计空白列
+        if status_callback:
+            status_callback('正在排序和重新编号...')
+        if progress:
+            # 合并后的行数不超过展开后的行数，以此作为总工作量
+            progress.start_stage('重新编号', 65, 80, total=total_final_items)
+        usage = new_column_usage()
+        final_count = 0
+        new_seq = 1
+        group_rows = []
+        current_main = None
+        for main, sub, row in store.iter_sorted_result_rows():
+            if group_rows and main != current_main:
+                ordered_rows, new_seq = renumber_item_group(group_rows, new_seq, item_col)
+                update_column_usage(usage, ordered_rows, columns)
+                store.add_final_rows(final_count, ordered_rows)
+                final_count += len(ordered_rows)
+                if progress:
+                    progress.advance(len(ordered_rows))
+                group_rows = []
+            current_main = main
+            # 确保所有行的Quantity都基于Reference位号计数
+            row[cols['quantity']] = count_references(row.get(cols['reference'], float('nan')))
+            group_rows.append((sub, row))
+        if group_rows:
+            ordered_rows, new_seq = renumber_item_group(group_rows, new_seq, item_col)
+            update_column_usage(usage, ordered_rows, columns)
+            store.add_final_rows(final_count, ordered_rows)
+            final_count += len(ordered_rows)
+        store.commit()
+
+        return {
+            'store': store,
+            'columns': select_output_columns(columns, usage),
+            'stats': stats,
+            'merged_materials': merged_materials,
+            'total_final_items': total_final_items,
+            'final_count': final_count,
+            'chunk_count': chunk_count,
+            'cleanup': cleanup
+        }
+    except Exception:
+        cleanup()
+        raise
+
+def write_bom_workbook_streaming(output_path, columns, rows, project_info_rows, bom_header_mapping,
+                                 highlight_color, bom_path, ref_col, row_count=0, progress=None,
+                                 progress_range=(80, 100)):
+    """
+    以只写模式流式写出结果工作簿，样式与普通模式一致
+
+    原始BOM中的其他工作表以只读方式逐行复制单元格和样式（只读模式无法获取列宽和合并单元格）。
+
+    Args:
+        output_path: 输出文件路径
+        columns: 输出列名
+        rows: 按输出顺序排列的行字典的可迭代对象
+        project_info_rows: 项目信息行
+        bom_header_mapping: BOM表头映射
+        highlight_color: 替代料行的高亮颜色
+        bom_path: 原始BOM文件路径
+        ref_col: 位号列名
+        row_count: 数据行数，用于计算进度
+        progress: ProgressReporter（可选）
+        progress_range: 写出阶段占总进度的区间，前80%用于数据行，其余用于复制工作表
 
-            header_border = Border(
-                left=Side(style='thin', color='D3D3D3'),
-                right=Side(style='thin', color='D3D3D3'),
-                top=Side(style='thin', color='D3D3D3'),
-                bottom=Side(style='thin', color='005499')  # 底部边框使用深蓝色
-            )
+    Returns:
+        int: 处理后物料总位号数（不含替代料）
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    worksheet = wb.create_sheet(title='BOM')
+
+    styles = get_output_styles(highlight_color)
+    column_info = get_output_column_info(columns, bom_header_mapping)
+    actual_column_count = len(columns)
+    header_row = len(project_info_rows) + 1
+
+    # 只写模式下列宽、冻结窗格必须在写入单元格前设置
+    for key, info in column_info.items():
+        if info['index'] is not None:
+            col_letter = openpyxl.utils.get_column_letter(info['index'])
+            worksheet.column_dimensions[col_letter].width = info['width']
+    worksheet.freeze_panes = f'A{header_row + 1}'
+
+    # 恢复项目信息行
+    for row_data in project_info_rows:
+        cells = []
+        for col_idx in range(1, actual_column_count + 1):
+            cell = WriteOnlyCell(worksheet)
+            if col_idx in row_data:
+                restore_cell_style(cell, row_data[col_idx])
+            cells.append(cell)
+        worksheet.append(cells)
+
+    # 表头行
+    worksheet.row_dimensions[header_row].height = 20
+    header_cells = []
+    for col, col_name in enumerate(columns, 1):
+        cell = WriteOnlyCell(worksheet, value=col_name)
+        cell.fill = styles['header_fill']
+        cell.border = styles['header_border']
+        cell.alignment = get_output_alignment(col, column_info, styles, is_header=True)
+        cell.font = styles['data_font']
+        header_cells.append(cell)
+    worksheet.append(header_cells)
+
+    # 数据行
+    range_start, range_end = progress_range
+    range_split = range_start + (range_end - range_start) * 0.8
+    if progress:
+        progress.start_stage('写出数据行', range_start, range_split, total=row_count)
+    final_ref_count = 0
+    row_idx = header_row
+    alignments = [get_output_alignment(col, column_info, styles) for col in range(1, actual_column_count + 1)]
+    for row in rows:
+        row_idx += 1
+        is_substitute = row.get('操作类型') == '替代插入'
+        if not is_substitute:
+            final_ref_count += count_references(str(row.get(ref_col, float('nan'))))
+
+        worksheet.row_dimensions[row_idx].height = 18
+        cells = []
+        for col_name, alignment in zip(columns, alignments):
+            value = row.get(col_name)
+            cell = WriteOnlyCell(worksheet, value='' if value is None or pd.isna(value) else value)
+            cell.border = styles['thin_border']
+            cell.alignment = alignment
+            if is_substitute:
+                cell.fill = styles['substitute_fill']
+                cell.font = styles['substitute_font']
+            else:
+                cell.font = styles['data_font']
+            cells.append(cell)
+        worksheet.append(cells)
+        if progress:
+            progress.advance()
+
+    # 复制原始BOM文件中的其他工作表
+    logging.info("开始复制原始BOM文件中的其他工作表（只读模式）")
+    source_wb = openpyxl.load_workbook(bom_path, read_only=True)
+    try:
+        active_title = source_wb.active.title
+        copy_names = [name for name in source_wb.sheetnames if name != active_title and name != 'BOM']
+        if progress:
+            progress.start_stage('复制工作表', range_split, range_end, total=len(copy_names), unit='个工作表')
+        for sheet_name in source_wb.sheetnames:
+            if sheet_name not in copy_names:
+                continue
+            source_sheet = source_wb[sheet_name]
+            target_sheet = wb.create_sheet(title=sheet_name)
+            for source_row in source_sheet.iter_rows():
+                cells = []
+                for source_cell in source_row:
+                    target_cell = WriteOnlyCell(target_sheet, value=source_cell.value)
+                    copy_cell_style(source_cell, target_cell)
+                    cells.append(target_cell)
+                target_sheet.append(cells)
+            logging.info(f"已复制工作表(含样式): {sheet_name}")
+            if progress:
+                progress.advance()
+    finally:
+        source_wb.close()
+
+    wb.save(output_path)
+    return final_ref_count
+
+def style_bom_worksheet(worksheet, processed_df, project_info_rows, bom_header_mapping, styles, progress=None):
+    """
+    为已写入数据的BOM工作表恢复项目信息行，并设置列宽、表头和数据行样式
 
-            # 对齐样式
-            center_alignment = Alignment(horizontal='center', vertical='center')
-            left_alignment = Alignment(horizontal='left', vertical='center')
-            right_alignment = Alignment(horizontal='right', vertical='center')
-            wrap_alignment = Alignment(horizontal='left', vertical='center')  # 移除wrap_text=True
-
-            # 获取操作类型列索引
-            op_type_col = processed_df.columns.get_loc('操作类型') + 1 if '操作类型' in processed_df.columns else -1
-
-            # 表头行
-            header_row = len(project_info_rows) + 1
-
-            # 应用表头样式（只处理实际数据列）
-            for col in range(1, actual_column_count + 1):
-                cell = worksheet.cell(row=header_row, column=col)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = header_border
-                cell.alignment = center_alignment
-
-                # 设置特定列的对齐方式
-                if col == column_info.get('item', {}).get('index'):
-                    cell.alignment = center_alignment  # Item列居中
-                elif col == column_info.get('quantity', {}).get('index'):
-                    cell.alignment = right_alignment  # 数量列靠右
-                elif col == column_info.get('reference', {}).get('index'):
-                    cell.alignment = wrap_alignment  # 位号列自动换行
-                else:
-                    cell.alignment = left_alignment  # 其他列靠左
+    Args:
+        worksheet: 目标工作表
+        processed_df: 写入的BOM数据
+        project_info_rows: 项目信息行
+        bom_header_mapping: BOM表头映射
+        styles: get_output_styles返回的样式
+        progress: ProgressReporter，每设置一行样式汇报一次（可选）
+    """
+    # 获取实际数据列数
+    actual_column_count = len(processed_df.columns)
+
+    # 恢复项目信息行
+    for row_idx, row_data in enumerate(project_info_rows, 1):
+        for col_idx, cell_data in row_data.items():
+            # 只处理实际数据列范围内的单元格
+            if col_idx <= actual_column_count:
+                restore_cell_style(worksheet.cell(row=row_idx, column=col_idx), cell_data)
+
+    # 设置列宽 - 根据表头映射设置
+    column_info = get_output_column_info(processed_df.columns, bom_header_mapping)
+    for key, info in column_info.items():
+        if info['index'] is not None:
+            col_letter = openpyxl.utils.get_column_letter(info['index'])
+            worksheet.column_dimensions[col_letter].width = info['width']
+
+    # 获取操作类型列索引
+    op_type_col = processed_df.columns.get_loc('操作类型') + 1 if '操作类型' in processed_df.columns else -1
+
+    # 表头行
+    header_row = len(project_info_rows) + 1
+
+    # 应用表头样式（只处理实际数据列）
+    for col in range(1, actual_column_count + 1):
+        cell = worksheet.cell(row=header_row, column=col)
+        cell.fill = styles['header_fill']
+        cell.border = styles['header_border']
+        cell.alignment = get_output_alignment(col, column_info, styles, is_header=True)
+        cell.font = styles['data_font']
+
+    # 应用数据行样式（只处理实际数据列）
+    for row in range(header_row + 1, worksheet.max_row + 1):
+        row_type = worksheet.cell(row=row, column=op_type_col).value if op_type_col > 0 else ''
+
+        for col in range(1, actual_column_count + 1):
+            cell = worksheet.cell(row=row, column=col)
+
+            # 设置基本样式
+            cell.border = styles['thin_border']
+            cell.alignment = get_output_alignment(col, column_info, styles)
+
+            # 替代料行的特殊样式
+            if row_type == '替代插入':
+                cell.fill = styles['substitute_fill']
+                cell.font = styles['substitute_font']
+            else:
+                cell.font = styles['data_font']
 
-                # 替代料行的特殊样式
-                row_type = worksheet.cell(row=header_row, column=op_type_col).value if op_type_col > 0 else ''
-                if row_type == '替代插入':
-                    cell.fill = substitute_fill
-                    cell.font = substitute_font
-                else:
-                    cell.font = data_font
-
-            # 应用数据行样式（只处理实际数据列）
-            for row in range(header_row + 1, worksheet.max_row + 1):
-                row_type = worksheet.cell(row=row, column=op_type_col).value if op_type_col > 0 else ''
-
-                for col in range(1, actual_column_count + 1):
-                    cell = worksheet.cell(row=row, column=col)
-
-                    # 设置基本样式
-                    cell.border = thin_border
-
-                    # 特定列的对齐方式
-                    if col == column_info.get('item', {}).get('index'):
-                        cell.alignment = center_alignment  # Item列居中
-                    elif col == column_info.get('quantity', {}).get('index'):
-                        cell.alignment = right_alignment  # 数量列靠右
-                    elif col == column_info.get('reference', {}).get('index'):
-                        cell.alignment = wrap_alignment  # 位号列自动换行
-                    elif col == column_info.get('description', {}).get('index'):
-                        cell.alignment = wrap_alignment  # 描述列自动换行
-                    else:
-                        cell.alignment = left_alignment  # 其他列靠左
+        if progress:
+            progress.advance()
 
-                    # 替代料行的特殊样式
-                    if row_type == '替代插入':
-                        cell.fill = substitute_fill
-                        cell.font = substitute_font
-                    else:
-                        cell.font = data_font
+    # 设置行高
+    for row in range(header_row, worksheet.max_row + 1):
+        if row == header_row:
+            worksheet.row_dimensions[row].height = 20  # 表头行稍高
+        else:
+            worksheet.row_dimensions[row].height = 18  # 数据行统一高度
 
-            # 设置行高
-            for row in range(header_row, worksheet.max_row + 1):
-                if row == header_row:
-                    worksheet.row_dimensions[row].height = 20  # 表头行稍高
-                else:
-                    worksheet.row_dimensions[row].height = 18  # 数据行统一高度
+    # 设置冻结窗格（冻结表头行）
+    worksheet.freeze_panes = f'A{header_row + 1}'
 
-            # 设置冻结窗格（冻结表头行）
-            worksheet.freeze_panes = f'A{header_row + 1}'
+def write_bom_workbook(output_path, bom_sheets, highlight_color, bom_path, progress=None, progress_range=(80, 100)):
+    """
+    写出结果工作簿：BOM数据、项目信息行、样式，并复制原始BOM中的其他工作表
 
-            # 添加自动筛选
-            # ref_cell = f'A{header_row}:{openpyxl.utils.get_column_letter(worksheet.max_column)}{header_row}'
-            # worksheet.auto_filter.ref = ref_cell
+    Args:
+        output_path: 输出文件路径
+        bom_sheets: 处理后的BOM工作表列表，每项包含source(原工作表名)、title(输出工作表名)、
+                    df(处理后的数据)、project_info_rows(项目信息行)和bom_header_mapping(表头映射)
+        highlight_color: 替代料行的高亮颜色
+        bom_path: 原始BOM文件路径
+        progress: ProgressReporter（可选）
+        progress_range: 写出阶段占总进度的区间，前80%用于设置样式，其余用于复制工作表
+    """
+    # 定义样式
+    styles = get_output_styles(highlight_color)
+    processed_sources = {sheet['source'] for sheet in bom_sheets}
+    range_start, range_end = progress_range
+    range_split = range_start + (range_end - range_start) * 0.8
 
-            # 设置工作表标题
-            worksheet.title = "BOM"
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        try:
+            row_count = sum(len(sheet['df']) for sheet in bom_sheets)
+            if progress:
+                progress.start_stage('写出数据', range_start, range_start)
+                progress.set_stage_rows(row_count)
+            for sheet in bom_sheets:
+                # 写入数据，不包含索引
+                sheet['df'].to_excel(writer, sheet_name=sheet['title'], index=False,
+                                     startrow=len(sheet['project_info_rows']))
+
+            if progress:
+                progress.start_stage('设置样式', range_start, range_split, total=row_count)
+            for sheet in bom_sheets:
+                style_bom_worksheet(writer.sheets[sheet['title']], sheet['df'], sheet['project_info_rows'],
+                                    sheet['bom_header_mapping'], styles, progress=progress)
 
             # 复制原始BOM文件中的其他工作表（包含样式）
             logging.info("开始复制原始BOM文件中的其他工作表（包含样式）")
             try:
                 # 打开原始BOM文件
                 original_wb = openpyxl.load_workbook(bom_path)
+                if progress:
+                    copy_count = sum(1 for name in original_wb.sheetnames if name not in processed_sources)
+                    progress.start_stage('复制工作表', range_split, range_end, total=copy_count, unit='个工作表')
 
                 # 遍历所有工作表
                 for sheet_name in original_wb.sheetnames:
-                    # 跳过主工作表（已处理）
-                    if sheet_name == original_wb.active.title:
+                    # 跳过已处理的BOM工作表
+                    if sheet_name in processed_sources:
                         continue
 
                     logging.info(f"复制工作表: {sheet_name}")
@@ -2482,59 +5441,7 @@ def process_files():
                             for col_idx, source_cell in enumerate(row, 1):
                                 # 创建新单元格并复制值
                                 target_cell = target_sheet.cell(row=row_idx, column=col_idx, value=source_cell.value)
-
-                                # 复制字体
-                                if source_cell.font:
-                                    target_cell.font = Font(
-                                        name=source_cell.font.name,
-                                        size=source_cell.font.size,
-                                        bold=source_cell.font.bold,
-                                        italic=source_cell.font.italic,
-                                        underline=source_cell.font.underline,
-                                        strike=source_cell.font.strike,
-                                        color=source_cell.font.color
-                                    )
-
-                                # 复制对齐方式
-                                if source_cell.alignment:
-                                    target_cell.alignment = Alignment(
-                                        horizontal=source_cell.alignment.horizontal,
-                                        vertical=source_cell.alignment.vertical,
-                                        textRotation=source_cell.alignment.textRotation,
-                                        wrapText=source_cell.alignment.wrapText,
-                                        shrinkToFit=source_cell.alignment.shrinkToFit,
-                                        indent=source_cell.alignment.indent
-                                    )
-
-                                # 复制边框
-                                if source_cell.border:
-                                    sides = {}
-                                    for side in ['left', 'right', 'top', 'bottom']:
-                                        side_obj = getattr(source_cell.border, side)
-                                        if side_obj and side_obj.style:
-                                            sides[side] = Side(style=side_obj.style, color=side_obj.color)
-                                        else:
-                                            sides[side] = None
-
-                                    target_cell.border = Border(**sides)
-
-                                # 复制填充
-                                if source_cell.fill and source_cell.fill.fill_type != 'none':
-                                    try:
-                                        fill_type = source_cell.fill.fill_type
-
-                                        # 创建新的填充对象
-                                        if fill_type == 'solid' or fill_type == 'solid':
-                                            if hasattr(source_cell.fill, 'start_color') and source_cell.fill.start_color:
-                                                rgb = source_cell.fill.start_color.rgb if hasattr(source_cell.fill.start_color, 'rgb') else None
-                                                if rgb:
-                                                    target_cell.fill = PatternFill(fill_type='solid', start_color=rgb)
-                                    except Exception as fill_error:
-                                        logging.warning(f"复制填充样式失败: {fill_error}")
-
-                                # 复制数字格式
-                                if source_cell.number_format:
-                                    target_cell.number_format = source_cell.number_format
+                                copy_cell_style(source_cell, target_cell)
 
                         # 复制工作表级别的属性
 
@@ -2577,6 +5484,11 @@ def process_files():
                             target_sheet.freeze_panes = source_sheet.freeze_panes
 
                         logging.info(f"已复制工作表(含样式): {sheet_name}")
+
+                    if progress:
+                        progress.advance()
+            except ProcessingCancelled:
+                raise
             except Exception as e:
                 logging.error(f"复制工作表时出错: {e}", exc_info=True)
                 logging.info("尝试使用备用方法复制工作表（仅数据）")
@@ -2607,15 +5519,552 @@ def process_files():
                         logging.info(f"已复制工作表(仅数据): {sheet_name}")
                 except Exception as backup_error:
                     logging.error(f"备用复制方法也失败: {backup_error}", exc_info=True)
+        except ProcessingCancelled:
+            # 取消时清空工作簿，避免退出with时仍然保存完整数据，临时文件由调用者删除
+            empty_sheet = writer.book.create_sheet('BOM_cancelled')
+            for worksheet in list(writer.book.worksheets):
+                if worksheet is not empty_sheet:
+                    writer.book.remove(worksheet)
+            raise
+
+DRY_RUN_MAX_CHANGE_LINES = 20  # 预览统计的变更摘要中最多列出的物料数
+
+def format_stage_timings(timings, total_seconds):
+    """
+    格式化各阶段耗时，用于统计信息显示
+
+    Args:
+        timings: ProgressReporter.stage_timings()的返回值
+        total_seconds: 处理总时长（秒）
+
+    Returns:
+        list: 每个阶段一行文本
+    """
+    lines = []
+    for timing in timings:
+        line = f"• {timing['stage']}: {timing['seconds']:.3f}秒"
+        if total_seconds > 0:
+            line += f"（{timing['seconds'] * 100 / total_seconds:.0f}%）"
+        if timing['rows']:
+            line += f"，{timing['rows']}{timing['unit']}"
+        lines.append(line)
+    return lines
+
+def get_run_summary_path():
+    """获取运行摘要文件路径，与日志文件在同一目录"""
+    return os.path.join(os.path.dirname(get_log_file_path()), RUN_SUMMARY_FILE_NAME)
+
+def write_run_summary(summary):
+    """
+    追加一行JSON格式的运行摘要（处理方式、行数和各阶段耗时），写入失败不影响处理结果
+
+    Args:
+        summary: 运行摘要
+    """
+    try:
+        with open(get_run_summary_path(), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False, default=str) + '\n')
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning(f"写入运行摘要失败: {e}")
+
+def process_files(bom_path=None, sub_path=None, dry_run=False, config=None):
+    """
+    处理BOM文件：读取BOM和替代料表，插入替代料、合并相同料号并写出结果
+
+    Args:
+        bom_path: BOM文件路径，默认使用界面中选择的文件
+        sub_path: 替代料表路径，默认使用界面中选择的文件
+        dry_run: 预览统计模式，只运行处理引擎并显示统计和变更摘要，不设置样式、不复制其他工作表、不写出文件
+        config: 本次处理使用的配置快照，默认取当前配置的快照
+
+    Returns:
+        list: 处理成功时返回输出文件路径列表（预览统计模式下为空列表），失败或取消时返回None
+    """
+    # 写出过程中的临时文件，处理完成后重命名为输出文件，取消或失败时删除
+    pending_outputs = []
+    try:
+        # 记录开始时间
+        start_time = time.time()
+
+        # 获取全局变量
+        global bom_var, sub_var, status_var, progress, progress_percent
+
+        # 未指定路径时使用界面中选择的文件
+        if bom_path is None or sub_path is None:
+            # 确保变量已初始化
+            if not hasattr(bom_var, 'get') or not hasattr(sub_var, 'get'):
+                notify_error('错误', '请先选择文件')
+                return
+            bom_path = bom_var.get() if bom_path is None else bom_path
+            sub_path = sub_var.get() if sub_path is None else sub_path
+
+        # 初始化进度条，进度按各阶段完成的工作量计算
+        update_progress(0)
+        reporter = ProgressReporter(update_progress, update_progress_detail, cancel_event=cancel_event)
+        update_status("-" * 40)
+        update_status("开始预览统计..." if dry_run else "开始处理文件...")
+        publish_merge_report([])
+        publish_result_preview([])
+
+        if not bom_path or not sub_path:
+            notify_error('错误', '请先选择BOM文件和替代料表')
+            return
+
+        # 加载配置中的表头映射，整个处理过程使用同一份只读快照
+        if config is None:
+            config = get_config_snapshot()
+        apply_logging_config(config)
+        bom_header_mapping = config['bom_header_mapping']  # BOM表头映射
+        sub_header_mapping = config['sub_header_mapping']  # 替代料表表头映射
+
+        # 分块模式：BOM分批处理，中间结果写入临时磁盘存储
+        chunked_mode = config.get('chunked_mode', False)
+        chunk_rows = max(int(config.get('chunk_rows', 5000)), 100)
+        memory_budget_mb = max(int(config.get('memory_budget_mb', 512)), 64)
+
+        # 并行进程数，0表示使用全部CPU核心，分块模式下不使用
+        parallel_workers = int(config.get('parallel_workers', 1))
+        if parallel_workers <= 0:
+            parallel_workers = os.cpu_count() or 1
+        parallel_mode = False
+
+        # 预览统计可只处理每个工作表的前N行，此时数据量很小，不使用分块处理
+        sample_rows = max(int(config.get('dry_run_sample_rows', 0)), 0) if dry_run else 0
+        if sample_rows and chunked_mode:
+            logging.info("预览统计只处理部分行，使用普通模式")
+            chunked_mode = False
+
+        # 获取BOM文件必需列表头，开启自动选择时同时匹配所有表头配置方案
+        header_candidates = get_header_profile_candidates(config)
+
+        # 获取替代料表必需列表头
+        required_sub_columns = [
+            sub_header_mapping['pn'],             # 物料编号字段
+            sub_header_mapping['attribute']       # 替代料属性字段
+        ]
+
+        # 多工作表模式：工作簿中每个包含BOM表头的工作表都单独处理
+        process_all_sheets = config.get('process_all_sheets', False)
+        if process_all_sheets and chunked_mode:
+            logging.info("多工作表模式不支持分块处理，使用普通模式")
+            chunked_mode = False
+
+        # 变体：每个变体列对应一个装配变体，单元格中标记该变体不贴装的位号
+        variant_names = [name for name in config.get('variant_columns', []) if str(name).strip()]
+        dnp_markers = config.get('dnp_markers', ['DNP', 'NC', 'NF', 'NP', '不贴'])
+        if variant_names and chunked_mode:
+            logging.info("变体处理不支持分块模式，使用普通模式")
+            chunked_mode = False
+
+        # 模块尚未导入时（第一次处理且后台预加载未完成）先导入，导入耗时单独统计，不计入识别表头
+        if not engine_modules_loaded():
+            reporter.start_stage('加载依赖', 0, 0)
+            preload_modules()
+
+        # 识别项目信息行
+        logging.info("开始识别项目信息行")
+        update_status('正在识别项目信息行...')
+        reporter.start_stage('识别表头', 0, 10)
+
+        # 读取原始Excel文件以获取格式信息，分块模式和预览统计下以只读方式读取，避免整个工作簿驻留内存
+        detected_sheets = []
+        original_wb = openpyxl.load_workbook(bom_path, read_only=chunked_mode or dry_run)
+        try:
+            active_title = original_wb.active.title
+            worksheets = original_wb.worksheets if process_all_sheets else [original_wb.active]
+            for original_ws in worksheets:
+                # 找到第一个包含必需列的行，并保存之前的项目信息行
+                header_row, header_values, project_info_rows, profile_name = detect_bom_header(
+                    original_ws.iter_rows(min_row=1, max_row=original_ws.max_row), header_candidates
+                )
+                if header_row is not None:
+                    # 第一个找到表头的工作表决定使用的方案，其他工作表只按该方案查找
+                    header_candidates = {profile_name: header_candidates[profile_name]}
+                    detected_sheets.append((original_ws.title, header_row, header_values, project_info_rows))
+                elif process_all_sheets:
+                    logging.info(f"工作表 {original_ws.title} 中没有BOM表头，按原样复制")
+        finally:
+            original_wb.close()
+
+        if not detected_sheets:
+            raise ValueError("无法在BOM文件中找到必需列，请检查表头配置是否正确")
+        # 表头行之前的行都已扫描
+        reporter.set_stage_rows(sum(header_row for _, header_row, _, _ in detected_sheets))
+
+        # 按表头匹配到了表头配置方案，本次处理改用方案中的表头映射、高亮颜色和输出选项
+        selected_profile = next(iter(header_candidates))
+        if selected_profile:
+            config = apply_header_profile(config, config['header_profiles'][selected_profile])
+            bom_header_mapping = config['bom_header_mapping']
+            sub_header_mapping = config['sub_header_mapping']
+            variant_names = [name for name in config.get('variant_columns', []) if str(name).strip()]
+            dnp_markers = config.get('dnp_markers', ['DNP', 'NC', 'NF', 'NP', '不贴'])
+            if variant_names and chunked_mode:
+                logging.info("变体处理不支持分块模式，使用普通模式")
+                chunked_mode = False
+            update_status(f'根据BOM表头自动选择表头配置方案: {selected_profile}')
+            logging.info(f"自动选择表头配置方案: {selected_profile}")
+
+        # 记录实际找到的表头，用于后续处理
+        header_values = detected_sheets[0][2]
+        found_headers = {str(val).strip().lower(): str(val).strip() for val in header_values
+                         if val is not None and str(val).strip()}
+        # 更新last_used_header_mapping，记录实际使用的表头
+        last_used_header_mapping = dict(config.get('last_used_header_mapping', {}))
+        for key, expected_header in bom_header_mapping.items():
+            if expected_header.lower() in found_headers:
+                last_used_header_mapping[key] = found_headers[expected_header.lower()]
+        update_config_values({'last_used_header_mapping': last_used_header_mapping})
+
+        # 更新进度
+        update_progress(10)
+
+        # 列裁剪：只读取映射列和配置的保留列，PN、Item、Reference显式按字符串读取
+        prune_columns = config.get('prune_columns', False)
+
+        # 根据每个工作表的表头确定读取方式和实际列名
+        sheet_jobs = []
+        for sheet_name, header_row, header_values, project_info_rows in detected_sheets:
+            sheet_label = f'工作表 "{sheet_name}" 中' if process_all_sheets else 'BOM文件中'
+            bom_usecols, bom_dtype = resolve_read_columns(
+                header_values,
+                list(bom_header_mapping.values()) + list(config.get('passthrough_columns', [])) + variant_names,
+                [bom_header_mapping['item'], bom_header_mapping['pn'], bom_header_mapping['reference']],
+                prune_columns
+            )
+            bom_columns = [name for name in excel_column_names(trim_row_values(header_values))
+                           if bom_usecols is None or bom_usecols(name)]
+            logging.info(f"{sheet_label}的列: {bom_columns}")
+
+            # 确保BOM文件表头字段存在（不区分大小写）
+            sheet_mapping = dict(bom_header_mapping)
+            missing_bom_fields = []
+            # 创建列名的小写映射，用于不区分大小写的匹配
+            columns_lower = {str(col).lower(): col for col in bom_columns}
+
+            for field, header in bom_header_mapping.items():
+                # 检查表头是否存在（不区分大小写）
+                if header.lower() in columns_lower:
+                    # 如果存在但大小写不同，使用实际的列名替换配置中的列名
+                    actual_column = columns_lower[header.lower()]
+                    if actual_column != header:
+                        logging.info(f"表头大小写不同，使用实际列名: '{actual_column}' 替代 '{header}'")
+                        sheet_mapping[field] = actual_column
+                else:
+                    missing_bom_fields.append(header)
+                    notify_warning('警告', f'{sheet_label}未找到表头 "{header}"，请检查表头配置')
+
+            # BOM中缺失时需要补充的列
+            column_defaults = {}
+            if missing_bom_fields:
+                logging.warning(f"{sheet_label}缺少以下字段: {missing_bom_fields}")
+
+                # 如果缺少Description列，添加一个空列以避免后续处理错误
+                if sheet_mapping['description'] not in bom_columns:
+                    column_defaults[sheet_mapping['description']] = ""
+                    logging.info(f"已添加空的Description列: {sheet_mapping['description']}")
+
+            # 检查必需字段
+            if sheet_mapping['pn'] not in bom_columns:
+                error_msg = f"{sheet_label}缺少必需列：{sheet_mapping['pn']}"
+                logging.error(error_msg)
+                if not process_all_sheets:
+                    notify_error('错误', error_msg)
+                    return
+                # 多工作表模式下跳过该工作表，按原样复制
+                continue
+
+            # 查找变体列（不区分大小写）
+            variant_columns = {}
+            for name in variant_names:
+                if str(name).lower() in columns_lower:
+                    variant_columns[name] = columns_lower[str(name).lower()]
+                else:
+                    logging.warning(f"{sheet_label}未找到变体列: {name}")
+                    notify_warning('警告', f'{sheet_label}未找到变体列 "{name}"，该变体将按全部贴装输出')
+
+            sheet_jobs.append({
+                'sheet_name': sheet_name,
+                # 单工作表模式与pd.read_excel默认行为一致，读取第一个工作表
+                'read_sheet': sheet_name if process_all_sheets else 0,
+                'title': sheet_name if process_all_sheets else 'BOM',
+                'header_row': header_row,
+                'header_values': header_values,
+                'project_info_rows': project_info_rows,
+                'usecols': bom_usecols,
+                'dtype': bom_dtype,
+                'column_defaults': column_defaults,
+                'bom_header_mapping': sheet_mapping,
+                'variant_columns': variant_columns,
+                'dnp_markers': dnp_markers,
+                'max_rows': sample_rows or None
+            })
+
+        if not sheet_jobs:
+            raise ValueError("工作簿中没有可以处理的BOM工作表，请检查表头配置是否正确")
+
+        # 单独读取替代料表，不应用项目信息行的跳过
+        logging.info(f"读取替代料表: {sub_path}")
+        reporter.start_stage('读取替代料表', 10, 20)
+        try:
+            sub_usecols, sub_dtype = get_substitute_read_columns(sub_path, sub_header_mapping, bom_header_mapping,
+                                                                 prune_columns)
+            # 替代料表未修改时直接使用缓存，返回的数据不能原地修改
+            sub_df, sub_table_key = load_substitute_table(sub_path, sub_usecols, sub_dtype)
+            reporter.set_stage_rows(len(sub_df))
+            logging.info(f"替代料表列: {list(sub_df.columns)}")
+        except Exception as e:
+            error_msg = translate_error_to_chinese(e)
+            logging.error(f"读取替代料表失败: {e}")
+
+            # 使用自定义错误对话框
+            error_details = f"读取替代料表时出错：\n\n{error_msg}\n\n请检查文件格式是否正确。"
+            notify_error('读取文件错误', error_details, custom=True)
+            return
+
+        # 确保替代料表表头字段存在（不区分大小写）
+        sub_header_mapping, missing_sub_fields = match_substitute_headers(sub_header_mapping, sub_df.columns)
+        for header in missing_sub_fields['required']:
+            notify_warning('警告', f'替代料表中未找到必需的表头 "{header}"，请检查表头配置')
+        for header in missing_sub_fields['optional']:
+            notify_warning('警告', f'替代料表中未找到可选的表头 "{header}"，部分信息可能无法显示')
+
+        if missing_sub_fields['required'] or missing_sub_fields['optional']:
+            logging.warning(f"替代料表缺少字段: 必需={missing_sub_fields['required']}, 可选={missing_sub_fields['optional']}")
+
+            # 如果缺少Description列，添加一个空列以避免后续处理错误
+            if sub_header_mapping['description'] not in sub_df.columns:
+                sub_df = sub_df.assign(**{sub_header_mapping['description']: ""})
+                logging.info(f"已添加空的Description列到替代料表: {sub_header_mapping['description']}")
+
+        # 设置默认输出路径
+        output_path = Path(bom_path).parent / (Path(bom_path).stem + '_替代料.xlsx')
+
+        # 获取映射后的列名
+        for job in sheet_jobs:
+            job['cols'] = get_engine_columns(job['bom_header_mapping'], sub_header_mapping)
+        cols = sheet_jobs[0]['cols']
+        pn_col = cols['pn']
+        ref_col = cols['reference']
+        desc_col = cols['description']
+        mfr_pn_col = cols['mfr_pn']
+        mfr_col = cols['manufacturer']
+
+        # 替代料表列名
+        sub_pn_col = sub_header_mapping['pn']
+        attr_col = cols['attribute']
+
+        # 检查替代料表必需字段
+        missing_cols = []
+        if sub_pn_col not in sub_df.columns:
+            missing_cols.append(sub_pn_col)
+        if attr_col not in sub_df.columns:
+            missing_cols.append(attr_col)
+
+        if missing_cols:
+            error_msg = f"替代料表缺少必需列：{', '.join(missing_cols)}"
+            logging.error(error_msg)
+            notify_error('错误', error_msg)
+            return
+
+        # 记录当前使用的字段映射
+        for job in sheet_jobs:
+            logging.info(f"BOM 表头映射({job['sheet_name']}): {job['bom_header_mapping']}")
+        logging.info(f"替代料表 表头映射: {sub_header_mapping}")
+        logging.info(f"替代料表列: {list(sub_df.columns)}")
+
+        # 更新进度（解析完成）
+        update_progress(20)
+
+        # 替代料分组处理：建立料号到替代组的索引
+        logging.info(f"开始替代料分组处理，使用属性字段: {attr_col}")
+        reporter.start_stage('建立替代料索引', 20, 20, unit='组')
+        try:
+            # 筛选有效替代料（相同attribute值）
+            valid_groups, pn_index = get_substitute_index(sub_df, sub_table_key, pn_col, attr_col)
+            reporter.set_stage_rows(len(valid_groups))
+            logging.info(f"找到 {len(valid_groups)} 个有效替代组")
+            # 界面中显示本次处理实际使用的替代料表版本
+            publish_substitute_info(describe_substitute_table(sub_table_key, sub_df, valid_groups))
+        except Exception as e:
+            error_msg = translate_error_to_chinese(e)
+            logging.error(f"处理替代料分组时出错: {e}")
+
+            # 使用自定义错误对话框
+            error_details = f"处理替代料分组时出错：\n\n{error_msg}\n\n程序将不应用替代料分组功能。"
+            notify_error('数据处理警告', error_details, custom=True)
+            valid_groups, pn_index = [], {}
+
+        # 替代料表已建立索引（数据和索引由缓存保留）
+        del sub_df
+        check_cancelled()
+
+        highlight_color = config.get('highlight_color', 'FFFF00')  # 默认黄色
+        chunk_count = 0
+        sheet_workers = 1
+        variant_results = []
+
+        if chunked_mode:
+            # 分块处理：读取、展开、合并、重新编号均在临时磁盘存储上完成
+            job = sheet_jobs[0]
+            logging.info(f"分块模式，分块行数上限: {chunk_rows}，内存预算: {memory_budget_mb}MB")
+            update_status('正在分块处理BOM...')
+            result = process_bom_chunked(
+                bom_path, job['header_row'], job['header_values'], job['usecols'], job['dtype'],
+                job['column_defaults'], valid_groups, pn_index, cols, chunk_rows, memory_budget_mb,
+                status_callback=update_status, progress=reporter
+            )
+            try:
+                stats = result['stats']
+                merged_materials = result['merged_materials']
+                total_final_items = result['total_final_items']
+                chunk_count = result['chunk_count']
+
+                if dry_run:
+                    final_ref_count = count_final_references(result['store'].iter_final_rows(), ref_col)
+                    substitute_changes = summarize_substitute_changes(result['store'].iter_final_rows(), pn_col)
+                    output_rows = result['final_count']
+                else:
+                    logging.info("开始写出结果（流式写入）")
+                    update_status('正在写出结果...')
+                    pending_outputs.append((get_partial_output_path(output_path), output_path))
+                    final_ref_count = write_bom_workbook_streaming(
+                        get_partial_output_path(output_path), result['columns'], result['store'].iter_final_rows(), job['project_info_rows'],
+                        job['bom_header_mapping'], highlight_color, bom_path, ref_col,
+                        row_count=result['final_count'], progress=reporter
+                    )
+                if has_gui_events():
+                    publish_result_preview([build_preview_sheet(
+                        job['title'], result['columns'],
+                        (tuple(row.get(col) for col in result['columns']) for row in result['store'].iter_final_rows()),
+                        pn_col
+                    )])
+            finally:
+                result['cleanup']()
+            sheet_results = []
+        else:
+            if len(sheet_jobs) == 1:
+                # 单个工作表在当前进程中处理，行数较多时可按料号分区并行
+                sheet_results = [process_bom_sheet(bom_path, sheet_jobs[0], valid_groups, pn_index,
+                                                   parallel_workers, status_callback=update_status,
+                                                   progress=reporter)]
+            else:
+                # 多个工作表互不相关，每个工作表由一个子进程处理
+                sheet_workers = min(len(sheet_jobs), os.cpu_count() or 1)
+                logging.info(f"多工作表模式：{len(sheet_jobs)} 个工作表，{sheet_workers} 个进程")
+                update_status(f'正在并行处理 {len(sheet_jobs)} 个工作表（{sheet_workers}个进程）...')
+                reporter.start_stage('处理工作表', 20, 80, total=len(sheet_jobs), unit='个工作表')
+                executor, pool_cancel_event = create_engine_pool(sheet_workers, valid_groups, pn_index, None)
+                with executor:
+                    sheet_results = run_pool_tasks(executor, pool_cancel_event, process_bom_sheet_worker,
+                                                   [(bom_path, job) for job in sheet_jobs],
+                                                   on_done=lambda idx: reporter.advance())
+
+            # 汇总各工作表的统计
+            stats = new_expand_stats()
+            merged_materials = []
+            total_final_items = 0
+            final_ref_count = 0
+            for job, result in zip(sheet_jobs, sheet_results):
+                for key, value in result['stats'].items():
+                    stats[key] += value
+                for mat in result['merged_materials']:
+                    if process_all_sheets:
+                        mat['工作表'] = job['sheet_name']
+                    merged_materials.append(mat)
+                total_final_items += result['total_final_items']
+                final_ref_count += result['final_ref_count']
+            parallel_mode = len(sheet_jobs) == 1 and sheet_results[0]['parallel_mode']
+
+            # 保存结果，写出阶段（80%-100%）由主输出和各变体输出平分
+            write_span = 20 / (1 + len(variant_names))
+            if dry_run:
+                substitute_changes = [change for job, result in zip(sheet_jobs, sheet_results)
+                                      for change in summarize_substitute_changes(
+                                          result['df'].to_dict('records'), job['cols']['pn'])]
+                output_rows = sum(len(result['df']) for result in sheet_results)
+            else:
+                update_status('正在写出结果...')
+                pending_outputs.append((get_partial_output_path(output_path), output_path))
+                write_bom_workbook(
+                    get_partial_output_path(output_path),
+                    [{
+                        'source': active_title if not process_all_sheets else job['sheet_name'],
+                        'title': job['title'],
+                        'df': result['df'],
+                        'project_info_rows': job['project_info_rows'],
+                        'bom_header_mapping': job['bom_header_mapping']
+                    } for job, result in zip(sheet_jobs, sheet_results)],
+                    highlight_color, bom_path, progress=reporter, progress_range=(80, 80 + write_span)
+                )
+
+            if has_gui_events():
+                publish_result_preview([
+                    build_preview_sheet(job['title'], result['df'].columns,
+                                        result['df'].itertuples(index=False, name=None), job['cols']['pn'])
+                    for job, result in zip(sheet_jobs, sheet_results)
+                ])
+
+            # 每个变体输出一个文件，复用上面的替代料展开和合并结果
+            for variant_idx, variant in enumerate(variant_names, 1):
+                if not dry_run:
+                    update_status(f'正在写出变体 {variant}...')
+                variant_sheets = []
+                variant_stats = {'name': variant, 'rows': 0, 'final_ref_count': 0, 'removed_count': 0,
+                                 'output_path': get_variant_output_path(bom_path, variant)}
+                for job, result in zip(sheet_jobs, sheet_results):
+                    variant_df, variant_ref_count, removed_count = apply_variant_dnp(
+                        result['df'], result['dnp_designators'].get(variant), job['cols'],
+                        drop_columns=list(job['variant_columns'].values())
+                    )
+                    variant_stats['rows'] += len(variant_df)
+                    variant_stats['final_ref_count'] += variant_ref_count
+                    variant_stats['removed_count'] += removed_count
+                    variant_sheets.append({
+                        'source': active_title if not process_all_sheets else job['sheet_name'],
+                        'title': job['title'],
+                        'df': variant_df,
+                        'project_info_rows': job['project_info_rows'],
+                        'bom_header_mapping': job['bom_header_mapping']
+                    })
+                variant_results.append(variant_stats)
+                if dry_run:
+                    continue
+                pending_outputs.append((get_partial_output_path(variant_stats['output_path']), variant_stats['output_path']))
+                write_bom_workbook(get_partial_output_path(variant_stats['output_path']), variant_sheets,
+                                   highlight_color, bom_path, progress=reporter,
+                                   progress_range=(80 + variant_idx * write_span, 80 + (variant_idx + 1) * write_span))
+                logging.info(f"变体 {variant} 已保存至：{variant_stats['output_path']}")
+
+        # 全部写出完成后再替换输出文件，取消的任务不会留下写了一半的结果文件
+        check_cancelled()
+        output_files = []
+        for partial_path, final_path in pending_outputs:
+            os.replace(partial_path, final_path)
+            output_files.append(str(final_path))
+        pending_outputs.clear()
+        reporter.finish_stage()
+        stage_timings = reporter.stage_timings()
 
         # 更新进度为100%完成
         update_progress(100)
 
-        logging.info(f'处理完成，输出文件已保存至：{output_path}')
+        if dry_run:
+            logging.info('预览统计完成，未写出结果文件')
+        else:
+            logging.info(f'处理完成，输出文件已保存至：{output_path}')
 
         # 计算处理时间
         end_time = time.time()
         process_duration = end_time - start_time
+        if chunked_mode:
+            process_mode = 'chunked'
+        elif parallel_mode:
+            process_mode = 'parallel'
+        elif process_all_sheets:
+            process_mode = 'sheets'
+        else:
+            process_mode = 'single'
         # 格式化时间显示
         if process_duration < 60:
             time_str = f"{process_duration:.2f}秒"
@@ -2628,28 +6077,60 @@ def process_files():
         stats_info = []
 
         # ===== 主标题 =====
-        stats_info.append("✅ 处理完成！")
+        stats_info.append("✅ 预览统计完成（未写出文件）！" if dry_run else "✅ 处理完成！")
         stats_info.append("-" * 40)
 
         # ===== 基本统计信息 =====
         stats_info.append("📊 基本统计")
-        stats_info.append(f"• 总物料数: {total_count}个")
-        stats_info.append(f"• 匹配替代料: {matched_count}个")
-        stats_info.append(f"• 未匹配物料: {unmatched_count}个")
+        stats_info.append(f"• 总物料数: {stats['total_count']}个")
+        stats_info.append(f"• 匹配替代料: {stats['matched_count']}个")
+        stats_info.append(f"• 未匹配物料: {stats['unmatched_count']}个")
         stats_info.append(f"• 处理时长: {time_str}")
-        stats_info.append(f"• 输出文件: {output_path}")
+        if chunked_mode:
+            stats_info.append(f"• 处理模式: 分块处理（{chunk_count}块）")
+        elif parallel_mode:
+            stats_info.append(f"• 处理模式: 并行处理（{parallel_workers}个进程）")
+        elif process_all_sheets:
+            stats_info.append(f"• 处理模式: 多工作表（{len(sheet_jobs)}个工作表，{sheet_workers}个进程）")
+        if dry_run:
+            stats_info.append(f"• 预览范围: {f'每个工作表前{sample_rows}行' if sample_rows else '全部行'}")
+        else:
+            stats_info.append(f"• 输出文件: {output_path}")
+
+        # ===== 阶段耗时 =====
+        stats_info.append("\n⏱ 阶段耗时")
+        stats_info.append("-" * 40)
+        stats_info.extend(format_stage_timings(stage_timings, process_duration))
 
         # ===== 替代料统计 =====
         stats_info.append("\n📋 替代料统计")
         stats_info.append("-" * 40)
-        stats_info.append(f"• 添加替代料数量: {substitute_count}个")
+        stats_info.append(f"• 添加替代料数量: {stats['substitute_count']}个")
         stats_info.append(f"• 添加替代料后总物料数: {total_final_items}个")
-        stats_info.append(f"• 原始物料总位号数: {original_ref_count}个")
-
-        # 计算处理后的总位号数（不含替代料）
-        final_ref_count = sum(count_references(str(row[ref_col])) for _, row in processed_df.iterrows() if row.get('操作类型', '') != '替代插入')
+        stats_info.append(f"• 原始物料总位号数: {stats['original_ref_count']}个")
         stats_info.append(f"• 处理后物料总位号数: {final_ref_count}个")
 
+        # ===== 变体统计 =====
+        if variant_results:
+            stats_info.append("\n🧩 变体输出")
+            stats_info.append("-" * 40)
+            for variant_stats in variant_results:
+                stats_info.append(f"• {variant_stats['name']}: 物料{variant_stats['rows']}行，"
+                                  f"位号{variant_stats['final_ref_count']}个，"
+                                  f"不贴装{variant_stats['removed_count']}个")
+                if not dry_run:
+                    stats_info.append(f"  输出文件: {variant_stats['output_path']}")
+
+        # ===== 工作表统计 =====
+        if process_all_sheets:
+            stats_info.append("\n📑 工作表统计")
+            stats_info.append("-" * 40)
+            for job, result in zip(sheet_jobs, sheet_results):
+                sheet_stats = result['stats']
+                stats_info.append(f"• {job['sheet_name']}: 物料{sheet_stats['total_count']}个，"
+                                  f"匹配替代料{sheet_stats['matched_count']}个，"
+                                  f"添加替代料{sheet_stats['substitute_count']}个")
+
         # ===== 物料合并信息 =====
         if merged_materials:
             stats_info.append("\n🔄 相同物料合并信息")
@@ -2661,30 +6142,72 @@ def process_files():
             stats_info.append(f"• 共合并{len(merged_materials)}种物料，{total_merged_rows}行 → {len(merged_materials)}行")
             stats_info.append(f"• 合并后总位号数: {total_merged_refs}个")
 
-            # 显示所有合并物料的详细信息
-            if merged_materials:
-                stats_info.append("\n详细合并信息:")
-
-            for idx, mat in enumerate(merged_materials, 1):
-                    stats_info.append(f"\n  物料 {idx}:")
-                    stats_info.append(f"  • {pn_col}: {str(mat[pn_col])}")
-                    if mat[desc_col]:
-                        # 裁剪描述文本，避免过长
-                        desc = str(mat[desc_col])  # 确保desc是字符串类型
-                        if len(desc) > 50:
-                            desc = desc[:47] + "..."
-                        stats_info.append(f"  • 描述: {desc}")
-                    if mat[mfr_pn_col]:
-                        stats_info.append(f"  • 制造商料号: {str(mat[mfr_pn_col])}")
-                    if mat[mfr_col]:
-                        stats_info.append(f"  • 制造商: {str(mat[mfr_col])}")
-                    stats_info.append(f"  • 合并: {str(mat['合并行数'])}行 → {str(mat['合并后位号数'])}个位号")
+            # 详细合并信息可能很多，放入可搜索的合并详情面板，不写入状态日志
+            publish_merge_report([(
+                idx,
+                mat.get('工作表', ''),
+                format_report_value(mat.get(pn_col)),
+                format_report_value(mat.get(desc_col)),
+                format_report_value(mat.get(mfr_pn_col)),
+                format_report_value(mat.get(mfr_col)),
+                mat['合并行数'],
+                mat['合并后位号数']
+            ) for idx, mat in enumerate(merged_materials, 1)])
+            stats_info.append("• 详细合并信息请点击\"合并详情\"按钮查看")
+
+        # ===== 预览统计的变更摘要 =====
+        if dry_run:
+            stats_info.append("\n🔍 变更摘要")
+            stats_info.append("-" * 40)
+            merged_away = sum(mat['合并行数'] for mat in merged_materials) - len(merged_materials)
+            stats_info.append(f"• 原始物料{stats['total_count']}行 → 输出{output_rows}行")
+            stats_info.append(f"• 插入替代料: {stats['substitute_count']}行，合并相同料号减少: {merged_away}行")
+            stats_info.append(f"• 输出中的替代料行: {sum(len(sub_pns) for _, sub_pns in substitute_changes)}行"
+                              f"（{len(substitute_changes)}种物料）")
+            for main_pn, sub_pns in substitute_changes[:DRY_RUN_MAX_CHANGE_LINES]:
+                stats_info.append(f"  {format_report_value(main_pn)} → "
+                                  f"{', '.join(format_report_value(pn) for pn in sub_pns)}")
+            if len(substitute_changes) > DRY_RUN_MAX_CHANGE_LINES:
+                stats_info.append(f"  ……其余{len(substitute_changes) - DRY_RUN_MAX_CHANGE_LINES}种物料"
+                                  f"请在\"结果预览\"中勾选只看替代料行查看")
 
         # 合并成格式化的文本
         formatted_stats = "\n".join(stats_info)
 
+        # 机器可读的运行摘要，每次处理追加一行，便于按阶段比较耗时
+        write_run_summary({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time)),
+            'version': APP_VERSION,
+            'bom_path': str(bom_path),
+            'sub_path': str(sub_path),
+            'dry_run': dry_run,
+            'mode': process_mode,
+            'workers': parallel_workers if parallel_mode else sheet_workers,
+            'seconds': round(process_duration, 4),
+            'rows': {
+                'total': stats['total_count'],
+                'matched': stats['matched_count'],
+                'substitutes': stats['substitute_count'],
+                'expanded': total_final_items,
+                'merged_materials': len(merged_materials)
+            },
+            'stages': [dict(timing, seconds=round(timing['seconds'], 4)) for timing in stage_timings],
+            # 多工作表模式下各工作表在子进程中处理，分别记录各阶段耗时
+            'sheets': [{'sheet': job['sheet_name'],
+                        'stages': [dict(timing, seconds=round(timing['seconds'], 4)) for timing in result['timings']]}
+                       for job, result in zip(sheet_jobs, sheet_results) if 'timings' in result],
+            'outputs': output_files
+        })
+
         # 更新状态文本
         update_status(formatted_stats)
+        return output_files
+
+    except ProcessingCancelled:
+        logging.info('用户取消了处理')
+        update_progress(0)
+        update_status('已取消处理，未生成输出文件', '#FF8C00')
+        return
 
     except Exception as e:
         error_msg = translate_error_to_chinese(e)
@@ -2694,11 +6217,24 @@ def process_files():
 
         # 使用自定义错误对话框显示错误
         error_details = f"错误类型：{type(e).__name__}\n\n错误描述：{error_msg}\n\n如果问题仍然存在，请联系开发者获取支持。"
-        show_custom_error('处理失败', error_details)
+        notify_error('处理失败', error_details, custom=True)
 
         # 不再抛出异常，避免程序崩溃
         return
 
+    finally:
+        # 删除未完成的临时输出文件
+        for partial_path, _ in pending_outputs:
+            try:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            except OSError as e:
+                logging.warning(f"删除临时输出文件失败: {partial_path}, {e}")
+
+        # 清空进度详情，本次处理产生的警告合并为一个对话框显示
+        update_progress_detail('')
+        flush_gui_warnings()
+
 def reset_default_sub_path():
     """重置默认替代料表路径"""
     config = load_config()
@@ -2712,7 +6248,6 @@ def reset_default_sub_path():
 
 def reset_all_config():
     """重置所有配置"""
-    global _config_cache
 
     # 使用内置默认配置，不从外部文件加载
     default_config = load_default_config(use_builtin_defaults=True)
@@ -2725,14 +6260,30 @@ def reset_all_config():
         'sub_header_mapping': default_config['sub_header_mapping'],
         'highlight_color': default_config['highlight_color'],
         'last_update_check': 0,  # 重置上次检查更新的时间戳
-        'last_used_header_mapping': {}  # 重置上次使用的表头映射
+        'update_cache': {},  # 清空缓存的发布信息
+        'last_used_header_mapping': {},  # 重置上次使用的表头映射
+        'prune_columns': default_config['prune_columns'],
+        'passthrough_columns': default_config['passthrough_columns'],
+        'chunked_mode': default_config['chunked_mode'],
+        'chunk_rows': default_config['chunk_rows'],
+        'memory_budget_mb': default_config['memory_budget_mb'],
+        'parallel_workers': default_config['parallel_workers'],
+        'process_all_sheets': default_config['process_all_sheets'],
+        'variant_columns': default_config['variant_columns'],
+        'dnp_markers': default_config['dnp_markers'],
+        'use_worker_process': default_config['use_worker_process'],
+        'queue_workers': default_config['queue_workers'],
+        'dry_run_sample_rows': default_config['dry_run_sample_rows'],
+        'header_profiles': default_config['header_profiles'],
+        'auto_select_profile': default_config['auto_select_profile'],
+        'log_level': default_config['log_level'],
+        'quiet_mode': default_config['quiet_mode'],
+        'prefetch_updates': default_config['prefetch_updates'],
+        'prefetch_limit_kbps': default_config['prefetch_limit_kbps']
     }
 
     try:
-        # 更新缓存
-        _config_cache = default_config
-
-        # 使用save_config函数保存配置，它会同时保存到用户配置文件和程序目录下的config.json文件
+        # 使用save_config函数更新缓存并保存配置，它会同时保存到用户配置文件和程序目录下的config.json文件
         save_config(default_config)
 
         # 显示成功消息
@@ -2751,19 +6302,19 @@ def show_header_config():
     sub_header_mapping = config.get('sub_header_mapping', {})
 
     # 打印当前配置，用于调试
-    print("显示表头配置对话框时的配置:")
-    print("BOM表头映射:", bom_header_mapping)
-    print("替代料表表头映射:", sub_header_mapping)
-    print("高亮颜色:", config.get('highlight_color', 'FFFF00'))
+    logging.debug("显示表头配置对话框时的配置:")
+    logging.debug(f"BOM表头映射: {bom_header_mapping}")
+    logging.debug(f"替代料表表头映射: {sub_header_mapping}")
+    logging.debug(f"高亮颜色: {config.get('highlight_color', 'FFFF00')}")
 
     # 创建配置窗口
     config_window = tk.Toplevel(root)
     config_window.title("表头配置")
-    config_window.geometry("600x550")  # 增加窗口高度以容纳颜色选择
+    config_window.geometry("600x590")  # 增加窗口高度以容纳颜色选择和表头配置方案
 
     # 设置窗口居中
     window_width = 600
-    window_height = 550  # 更新窗口高度
+    window_height = 590  # 更新窗口高度
     screen_width = config_window.winfo_screenwidth()
     screen_height = config_window.winfo_screenheight()
     center_x = int((screen_width - window_width) / 2)
@@ -2792,6 +6343,14 @@ def show_header_config():
     color_tab = ttk.Frame(tab_control, padding=10)
     tab_control.add(color_tab, text=" 颜色设置 ")
 
+    # 创建处理选项选项卡
+    options_tab = ttk.Frame(tab_control, padding=10)
+    tab_control.add(options_tab, text=" 处理选项 ")
+
+    # 创建运行选项选项卡
+    runtime_tab = ttk.Frame(tab_control, padding=10)
+    tab_control.add(runtime_tab, text=" 运行选项 ")
+
     # === BOM表头配置 ===
     ttk.Label(bom_tab, text="配置BOM文件各字段的表头名称",
               font=('微软雅黑', 10, 'bold')).grid(row=0, column=0, columnspan=2, sticky='w', pady=(0, 15))
@@ -2888,6 +6447,156 @@ def show_header_config():
                            variable=color_var, value=color_code)
         rb.pack(side='top')
 
+    # === 处理选项 ===
+    ttk.Label(options_tab, text="配置BOM读取和处理选项",
+              font=('微软雅黑', 10, 'bold')).grid(row=0, column=0, columnspan=2, sticky='w', pady=(0, 15))
+
+    option_vars = {
+        'prune_columns': tk.BooleanVar(value=config.get('prune_columns', False)),
+        'passthrough_columns': tk.StringVar(value=', '.join(config.get('passthrough_columns', []))),
+        'chunked_mode': tk.BooleanVar(value=config.get('chunked_mode', False)),
+        'chunk_rows': tk.StringVar(value=str(config.get('chunk_rows', 5000))),
+        'memory_budget_mb': tk.StringVar(value=str(config.get('memory_budget_mb', 512))),
+        'parallel_workers': tk.StringVar(value=str(config.get('parallel_workers', 1))),
+        'process_all_sheets': tk.BooleanVar(value=config.get('process_all_sheets', False)),
+        'variant_columns': tk.StringVar(value=', '.join(config.get('variant_columns', []))),
+        'dnp_markers': tk.StringVar(value=', '.join(config.get('dnp_markers', ['DNP', 'NC', 'NF', 'NP', '不贴']))),
+        'use_worker_process': tk.BooleanVar(value=config.get('use_worker_process', True)),
+        'queue_workers': tk.StringVar(value=str(config.get('queue_workers', 1))),
+        'dry_run_sample_rows': tk.StringVar(value=str(config.get('dry_run_sample_rows', 0))),
+        'auto_select_profile': tk.BooleanVar(value=config.get('auto_select_profile', True)),
+        'log_level': tk.StringVar(value=str(config.get('log_level', 'INFO')).upper()),
+        'quiet_mode': tk.BooleanVar(value=config.get('quiet_mode', False)),
+        'prefetch_updates': tk.BooleanVar(value=config.get('prefetch_updates', False)),
+        'prefetch_limit_kbps': tk.StringVar(value=str(config.get('prefetch_limit_kbps', 256)))
+    }
+
+    ttk.Checkbutton(options_tab, text="只读取表头映射中的列（适用于列很多的BOM）",
+                    variable=option_vars['prune_columns']).grid(row=1, column=0, columnspan=2, sticky='w', pady=5)
+
+    ttk.Label(options_tab, text="额外保留的列:",
+             anchor='e').grid(row=2, column=0, sticky='e', padx=(0, 10), pady=5)
+    ttk.Entry(options_tab, width=30,
+              textvariable=option_vars['passthrough_columns']).grid(row=2, column=1, sticky='w', pady=5)
+    ttk.Label(options_tab, text="多个列名用逗号分隔，仅在开启列裁剪时生效",
+              font=('微软雅黑', 9), foreground='#666666').grid(row=3, column=1, sticky='w')
+
+    ttk.Checkbutton(options_tab, text="分块处理超大BOM（中间结果写入临时文件，限制内存占用）",
+                    variable=option_vars['chunked_mode']).grid(row=4, column=0, columnspan=2, sticky='w', pady=(15, 5))
+
+    ttk.Label(options_tab, text="每块最大行数:",
+             anchor='e').grid(row=5, column=0, sticky='e', padx=(0, 10), pady=5)
+    ttk.Entry(options_tab, width=10,
+              textvariable=option_vars['chunk_rows']).grid(row=5, column=1, sticky='w', pady=5)
+
+    ttk.Label(options_tab, text="内存预算(MB):",
+             anchor='e').grid(row=6, column=0, sticky='e', padx=(0, 10), pady=5)
+    ttk.Entry(options_tab, width=10,
+              textvariable=option_vars['memory_budget_mb']).grid(row=6, column=1, sticky='w', pady=5)
+    ttk.Label(options_tab, text="实际每块行数会根据内存预算自动减小，分块模式下其他工作表不保留列宽和合并单元格",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=7, column=1, sticky='w')
+
+    ttk.Label(options_tab, text="并行进程数:",
+             anchor='e').grid(row=8, column=0, sticky='e', padx=(0, 10), pady=(15, 5))
+    ttk.Entry(options_tab, width=10,
+              textvariable=option_vars['parallel_workers']).grid(row=8, column=1, sticky='w', pady=(15, 5))
+    ttk.Label(options_tab, text=f"1为单进程，0为使用全部CPU核心；BOM超过{PARALLEL_MIN_ROWS}行时生效，分块模式下不使用",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=9, column=1, sticky='w')
+
+    ttk.Checkbutton(options_tab, text="处理工作簿中所有包含BOM表头的工作表（多个工作表同时处理）",
+                    variable=option_vars['process_all_sheets']).grid(row=10, column=0, columnspan=2, sticky='w', pady=(15, 5))
+
+    ttk.Label(options_tab, text="变体列:",
+             anchor='e').grid(row=11, column=0, sticky='e', padx=(0, 10), pady=(15, 5))
+    ttk.Entry(options_tab, width=30,
+              textvariable=option_vars['variant_columns']).grid(row=11, column=1, sticky='w', pady=(15, 5))
+    ttk.Label(options_tab, text="DNP标记:",
+             anchor='e').grid(row=12, column=0, sticky='e', padx=(0, 10), pady=5)
+    ttk.Entry(options_tab, width=30,
+              textvariable=option_vars['dnp_markers']).grid(row=12, column=1, sticky='w', pady=5)
+    ttk.Label(options_tab, text="每个变体列输出一个文件；单元格填DNP标记表示整行不贴装，填位号表示这些位号不贴装",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=13, column=1, sticky='w')
+
+    # === 运行选项 ===
+    ttk.Label(runtime_tab, text="配置程序运行方式",
+              font=('微软雅黑', 10, 'bold')).grid(row=0, column=0, columnspan=2, sticky='w', pady=(0, 15))
+
+    ttk.Checkbutton(runtime_tab, text="在常驻后台进程中处理（界面不卡顿，重复处理无需重新加载替代料表）",
+                    variable=option_vars['use_worker_process']).grid(row=1, column=0, columnspan=2, sticky='w', pady=5)
+
+    ttk.Label(runtime_tab, text="批量处理进程数:",
+             anchor='e').grid(row=2, column=0, sticky='e', padx=(0, 10), pady=(15, 5))
+    ttk.Entry(runtime_tab, width=10,
+              textvariable=option_vars['queue_workers']).grid(row=2, column=1, sticky='w', pady=(15, 5))
+    ttk.Label(runtime_tab, text="批量处理队列同时处理的文件数，每个文件使用一个常驻进程；未开启常驻后台进程时逐个处理",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=3, column=1, sticky='w')
+
+    ttk.Label(runtime_tab, text="预览统计行数:",
+             anchor='e').grid(row=4, column=0, sticky='e', padx=(0, 10), pady=(15, 5))
+    ttk.Entry(runtime_tab, width=10,
+              textvariable=option_vars['dry_run_sample_rows']).grid(row=4, column=1, sticky='w', pady=(15, 5))
+    ttk.Label(runtime_tab, text="点击\"预览统计\"时每个工作表只处理前N行，0为处理全部行；预览不写出结果文件",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=5, column=1, sticky='w')
+
+    ttk.Label(runtime_tab, text="日志级别:",
+             anchor='e').grid(row=6, column=0, sticky='e', padx=(0, 10), pady=(15, 5))
+    ttk.Combobox(runtime_tab, width=10, state='readonly', values=LOG_LEVELS,
+                 textvariable=option_vars['log_level']).grid(row=6, column=1, sticky='w', pady=(15, 5))
+    ttk.Checkbutton(runtime_tab, text="安静模式（不记录逐行处理日志，处理超大BOM时更快）",
+                    variable=option_vars['quiet_mode']).grid(row=7, column=0, columnspan=2, sticky='w', pady=5)
+    ttk.Label(runtime_tab, text=f"日志写入程序目录的{LOG_FILE_NAME}（不可写时写入用户目录），超过{LOG_MAX_BYTES // (1024 * 1024)}MB后自动滚动",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=8, column=1, sticky='w')
+
+    ttk.Checkbutton(runtime_tab, text="发现新版本时在后台预先下载（下载完成后提示，确认更新即可立即安装）",
+                    variable=option_vars['prefetch_updates']).grid(row=9, column=0, columnspan=2, sticky='w', pady=(15, 5))
+    ttk.Label(runtime_tab, text="预下载限速(KB/s):",
+             anchor='e').grid(row=10, column=0, sticky='e', padx=(0, 10), pady=5)
+    ttk.Entry(runtime_tab, width=10,
+              textvariable=option_vars['prefetch_limit_kbps']).grid(row=10, column=1, sticky='w', pady=5)
+    ttk.Label(runtime_tab, text="0为不限速；程序关闭时未下载完的更新在下次启动后继续下载",
+              font=('微软雅黑', 9), foreground='#666666', wraplength=360).grid(row=11, column=1, sticky='w')
+
+    # === 表头配置方案 ===
+    # 显示在选项卡上方：选择方案后立即把方案内容填入各选项卡，可将当前设置保存为方案
+    profile_frame = ttk.Frame(main_frame)
+    profile_frame.pack(fill='x', pady=(0, 10), before=tab_control)
+
+    ttk.Label(profile_frame, text="表头配置方案:").pack(side='left')
+    profile_var = tk.StringVar()
+    profile_box = ttk.Combobox(profile_frame, textvariable=profile_var, width=16,
+                               values=sorted(config.get('header_profiles', {})))
+    profile_box.pack(side='left', padx=5)
+
+    def load_selected_profile(event=None):
+        profile = load_config().get('header_profiles', {}).get(profile_var.get())
+        if profile:
+            fill_header_profile(profile, bom_header_entries, sub_header_entries, color_var, option_vars)
+
+    def save_current_profile():
+        name = profile_var.get().strip()
+        if not name:
+            tkinter.messagebox.showinfo('提示', '请先输入方案名称', parent=config_window)
+            return
+        save_header_profile(name, read_header_profile(bom_header_entries, sub_header_entries,
+                                                      color_var.get(), option_vars))
+        profile_box.configure(values=sorted(load_config()['header_profiles']))
+        tkinter.messagebox.showinfo('保存成功', f'已将当前设置保存为方案 "{name}"', parent=config_window)
+
+    def delete_current_profile():
+        name = profile_var.get().strip()
+        if name not in load_config().get('header_profiles', {}):
+            return
+        if tkinter.messagebox.askyesno('删除方案', f'是否删除方案 "{name}"？', parent=config_window):
+            delete_header_profile(name)
+            profile_box.configure(values=sorted(load_config()['header_profiles']))
+            profile_var.set('')
+
+    profile_box.bind('<<ComboboxSelected>>', load_selected_profile)
+    ttk.Button(profile_frame, text="保存为方案", command=save_current_profile).pack(side='left', padx=2)
+    ttk.Button(profile_frame, text="删除方案", command=delete_current_profile).pack(side='left', padx=2)
+    ttk.Checkbutton(profile_frame, text="处理时按表头自动选择",
+                    variable=option_vars['auto_select_profile']).pack(side='left', padx=(10, 0))
+
     # 按钮框架
     button_frame = ttk.Frame(main_frame)
     button_frame.pack(side='bottom', pady=10)
@@ -2896,7 +6605,7 @@ def show_header_config():
     save_button = ttk.Button(
         button_frame,
         text="保存配置",
-        command=lambda: save_header_config(bom_header_entries, sub_header_entries, config_window, color_var.get())
+        command=lambda: save_header_config(bom_header_entries, sub_header_entries, config_window, color_var.get(), option_vars)
     )
     save_button.pack(side='left', padx=5)
 
@@ -2924,7 +6633,79 @@ def show_header_config():
     )
     cancel_button.pack(side='left', padx=5)
 
-def save_header_config(bom_entries, sub_entries, window, highlight_color):
+def split_names(text):
+    """拆分逗号分隔的名称列表（支持中文逗号），去掉空白项"""
+    return [name.strip() for name in text.replace('，', ',').split(',') if name.strip()]
+
+def read_header_profile(bom_entries, sub_entries, highlight_color, option_vars):
+    """
+    读取设置窗口中的表头映射、高亮颜色和输出选项，生成表头配置方案
+
+    Args:
+        bom_entries: BOM表头输入框字典
+        sub_entries: 替代料表表头输入框字典
+        highlight_color: 高亮颜色
+        option_vars: 处理选项变量字典
+
+    Returns:
+        dict: 表头配置方案，表头输入框为空时使用当前配置中的表头
+    """
+    config = load_config()
+    return {
+        'bom_header_mapping': {key: entry.get().strip() or config['bom_header_mapping'].get(key, '')
+                               for key, entry in bom_entries.items()},
+        'sub_header_mapping': {key: entry.get().strip() or config['sub_header_mapping'].get(key, '')
+                               for key, entry in sub_entries.items()},
+        'highlight_color': highlight_color,
+        'prune_columns': bool(option_vars['prune_columns'].get()),
+        'passthrough_columns': split_names(option_vars['passthrough_columns'].get()),
+        'variant_columns': split_names(option_vars['variant_columns'].get()),
+        'dnp_markers': split_names(option_vars['dnp_markers'].get())
+    }
+
+def fill_header_profile(profile, bom_entries, sub_entries, color_var, option_vars):
+    """
+    把表头配置方案填入设置窗口
+
+    Args:
+        profile: 表头配置方案
+        bom_entries: BOM表头输入框字典
+        sub_entries: 替代料表表头输入框字典
+        color_var: 颜色变量
+        option_vars: 处理选项变量字典
+    """
+    for mapping_key, entries in (('bom_header_mapping', bom_entries), ('sub_header_mapping', sub_entries)):
+        mapping = profile.get(mapping_key, {})
+        for key, entry in entries.items():
+            if key in mapping:
+                entry.delete(0, tk.END)
+                entry.insert(0, mapping[key])
+    if 'highlight_color' in profile:
+        color_var.set(profile['highlight_color'])
+    if 'prune_columns' in profile:
+        option_vars['prune_columns'].set(bool(profile['prune_columns']))
+    for key in ('passthrough_columns', 'variant_columns', 'dnp_markers'):
+        if key in profile:
+            option_vars[key].set(', '.join(profile[key]))
+
+def save_header_profile(name, profile):
+    """保存表头配置方案，同名方案被覆盖"""
+    with _config_lock:
+        config = load_config()
+        config['header_profiles'] = {**config.get('header_profiles', {}), name: profile}
+        save_config(config)
+    logging.info(f"已保存表头配置方案: {name}")
+
+def delete_header_profile(name):
+    """删除表头配置方案"""
+    with _config_lock:
+        config = load_config()
+        config['header_profiles'] = {key: value for key, value in config.get('header_profiles', {}).items()
+                                     if key != name}
+        save_config(config)
+    logging.info(f"已删除表头配置方案: {name}")
+
+def save_header_config(bom_entries, sub_entries, window, highlight_color, option_vars=None):
     """保存表头配置"""
     config = load_config()
 
@@ -2943,8 +6724,28 @@ def save_header_config(bom_entries, sub_entries, window, highlight_color):
     # 保存高亮颜色设置
     config['highlight_color'] = highlight_color
 
+    # 保存处理选项
+    if option_vars:
+        config['prune_columns'] = bool(option_vars['prune_columns'].get())
+        config['chunked_mode'] = bool(option_vars['chunked_mode'].get())
+        config['process_all_sheets'] = bool(option_vars['process_all_sheets'].get())
+        config['use_worker_process'] = bool(option_vars['use_worker_process'].get())
+        config['auto_select_profile'] = bool(option_vars['auto_select_profile'].get())
+        config['quiet_mode'] = bool(option_vars['quiet_mode'].get())
+        config['prefetch_updates'] = bool(option_vars['prefetch_updates'].get())
+        config['log_level'] = option_vars['log_level'].get()
+        for key in ('passthrough_columns', 'variant_columns', 'dnp_markers'):
+            config[key] = split_names(option_vars[key].get())
+        for key in ('chunk_rows', 'memory_budget_mb', 'parallel_workers', 'queue_workers', 'dry_run_sample_rows',
+                    'prefetch_limit_kbps'):
+            try:
+                config[key] = int(option_vars[key].get().strip())
+            except ValueError:
+                logging.warning(f"无效的{key}设置: {option_vars[key].get()}，保持原值")
+
     # 使用save_config函数保存配置，它会同时保存到用户配置文件和程序目录下的config.json文件
     save_config(config)
+    apply_logging_config(config)
 
     # 显示成功消息
     tkinter.messagebox.showinfo("保存成功", "配置已保存")
@@ -2979,184 +6780,973 @@ def reset_header_config(bom_entries, sub_entries, color_var, window=None):
         entry.delete(0, tk.END)
         entry.insert(0, default_sub_header_mapping.get(key, ''))
 
-    # 使用内置默认颜色
-    color_var.set(default_config.get('highlight_color', 'FFFF00'))
+    # 使用内置默认颜色
+    color_var.set(default_config.get('highlight_color', 'FFFF00'))
+
+    # 自动保存配置
+    config = load_config()
+
+    # 更新配置
+    for key, entry in bom_entries.items():
+        config['bom_header_mapping'][key] = entry.get()
+
+    for key, entry in sub_entries.items():
+        config['sub_header_mapping'][key] = entry.get()
+
+    config['highlight_color'] = color_var.get()
+
+    # 保存配置
+    save_config(config)
+
+    # 显示成功消息
+    tkinter.messagebox.showinfo("恢复默认", "已恢复到程序内置默认配置并自动保存")
+
+    # 如果提供了窗口参数，关闭窗口
+    if window:
+        window.destroy()
+
+
+
+# 更新检测相关函数
+def summarize_release(data):
+    """
+    提取GitHub发布信息中检查更新需要的字段，用于缓存
+
+    Args:
+        data: GitHub API返回的发布信息
+
+    Returns:
+        dict: 精简后的发布信息
+    """
+    return {
+        'tag_name': data['tag_name'],
+        'body': data.get('body') or '',
+        'zipball_url': data.get('zipball_url', ''),
+        'assets': [{'name': asset['name'], 'browser_download_url': asset['browser_download_url'],
+                    'size': asset.get('size', 0), 'digest': asset.get('digest') or ''}
+                   for asset in data.get('assets', [])]
+    }
+
+def parse_release(release, current_version):
+    """
+    比较发布信息与当前版本
+
+    Args:
+        release: summarize_release返回的发布信息
+        current_version: 当前版本号
+
+    Returns:
+        tuple: (是否有更新, 最新版本, 下载链接, 更新日志, 是否为exe更新)
+    """
+    from packaging import version as pkg_version
+
+    latest_version = release["tag_name"].lstrip("v")
+    logging.info(f"发现版本: {latest_version}")
 
-    # 自动保存配置
-    config = load_config()
+    # 使用packaging.version进行版本比较
+    if pkg_version.parse(latest_version) <= pkg_version.parse(current_version):
+        return False, current_version, "", "", False
+    logging.info(f"发现新版本: {latest_version}")
 
-    # 更新配置
-    for key, entry in bom_entries.items():
-        config['bom_header_mapping'][key] = entry.get()
+    # 查找exe资源文件
+    download_url = ""
+    is_exe_update = False
 
-    for key, entry in sub_entries.items():
-        config['sub_header_mapping'][key] = entry.get()
+    for asset in release["assets"]:
+        if asset["name"].endswith(".exe"):
+            download_url = asset["browser_download_url"]
+            is_exe_update = True
+            logging.info(f"找到exe更新: {asset['name']}")
+            break
 
-    config['highlight_color'] = color_var.get()
+    # 如果没有资源文件，使用源代码下载链接
+    if not download_url:
+        download_url = release["zipball_url"]
+        logging.info("使用源代码链接作为备用")
 
-    # 保存配置
-    save_config(config)
+    # 获取更新日志
+    changelog = release["body"] or "无可用的更新日志"
 
-    # 显示成功消息
-    tkinter.messagebox.showinfo("恢复默认", "已恢复到程序内置默认配置并自动保存")
+    return True, latest_version, download_url, changelog, is_exe_update
 
-    # 如果提供了窗口参数，关闭窗口
-    if window:
-        window.destroy()
+def get_release_sha256(download_url):
+    """
+    查找下载文件发布的SHA-256校验和，依次使用：GitHub资源的digest字段、同名的.sha256资源文件、更新日志中
+    文件名所在行的64位十六进制校验和
 
+    Args:
+        download_url: 下载链接
+
+    Returns:
+        str: SHA-256校验和，没有发布时返回空字符串
+    """
+    release = load_config().get('update_cache', {}).get('release') or {}
+    asset = next((item for item in release.get('assets', []) if item['browser_download_url'] == download_url), None)
+    if asset is None:
+        return ''
+    if asset.get('digest', '').startswith('sha256:'):
+        return asset['digest'][len('sha256:'):]
+
+    checksum_asset = next((item for item in release['assets'] if item['name'] == asset['name'] + '.sha256'), None)
+    if checksum_asset is not None:
+        try:
+            import requests
+            response = requests.get(checksum_asset['browser_download_url'],
+                                    timeout=(UPDATE_CONNECT_TIMEOUT, UPDATE_READ_TIMEOUT))
+            if response.status_code == 200:
+                match = re.search(r'\b[0-9a-fA-F]{64}\b', response.text)
+                if match:
+                    return match.group(0)
+        except Exception as e:
+            logging.warning(f"获取校验和文件失败: {e}")
 
+    for line in release.get('body', '').splitlines():
+        match = re.search(r'\b[0-9a-fA-F]{64}\b', line)
+        if match and asset['name'] in line:
+            return match.group(0)
+    return ''
 
-# 更新检测相关函数
-def check_for_updates(current_version):
+def is_update_check_due(config, now=None):
     """
-    检查GitHub上是否有新版本
+    判断启动时是否需要检查更新：距离上次成功检查已满UPDATE_CHECK_INTERVAL天，且不在失败退避期内
 
     Args:
-        current_version: 当前版本号
+        config: 配置
+        now: 当前时间戳，默认为当前时间
 
     Returns:
-        tuple: (是否有更新, 最新版本, 下载链接, 更新日志, 是否为exe更新)
+        bool: 是否需要检查更新
     """
-    try:
-        print(f"检查更新，当前版本: {current_version}")
+    now = time.time() if now is None else now
+    if now - config.get('last_update_check', 0) < UPDATE_CHECK_INTERVAL * 24 * 60 * 60:
+        return False
+    return now >= config.get('update_cache', {}).get('retry_after', 0)
 
-        # 设置请求头，避免API限制
-        headers = {
-            "User-Agent": "BOM-Tool-Update-Checker"
-        }
+def record_update_check_failure(cache):
+    """记录检查更新失败，下次启动检查的时间按连续失败次数指数退避"""
+    failures = cache.get('failures', 0) + 1
+    delay = min(UPDATE_RETRY_BASE * 2 ** (failures - 1), UPDATE_CHECK_INTERVAL * 24 * 60 * 60)
+    update_config_values({'update_cache': {**cache, 'failures': failures, 'retry_after': time.time() + delay}})
+    logging.info(f"检查更新连续失败{failures}次，{delay / 3600:.0f}小时内启动时不再检查")
 
-        # 添加超时设置，避免长时间等待
-        response = requests.get(GITHUB_API_URL, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+def fetch_latest_release(api_url=None):
+    """
+    获取最新发布信息：带上缓存的ETag发送有条件请求，发布信息未变化时服务器返回304，直接使用缓存
 
-        if response.status_code == 200:
-            data = response.json()
-            latest_version = data["tag_name"].lstrip("v")
-            print(f"发现版本: {latest_version}")
+    Args:
+        api_url: 发布信息接口地址，默认为UPDATE_API_URL
 
-            # 使用packaging.version进行版本比较
-            if pkg_version.parse(latest_version) > pkg_version.parse(current_version):
-                print(f"发现新版本: {latest_version}")
+    Returns:
+        dict: summarize_release格式的发布信息
+    """
+    import requests
 
-                # 查找exe资源文件
-                download_url = ""
-                is_exe_update = False
+    cache = dict(load_config().get('update_cache', {}))
+    # 设置请求头，避免API限制
+    headers = {
+        "User-Agent": "BOM-Tool-Update-Checker"
+    }
+    if cache.get('etag') and cache.get('release'):
+        headers['If-None-Match'] = cache['etag']
 
-                for asset in data.get("assets", []):
-                    if asset["name"].endswith(".exe"):
-                        download_url = asset["browser_download_url"]
-                        is_exe_update = True
-                        print(f"找到exe更新: {asset['name']}")
-                        break
+    try:
+        # 连接超时很短，离线时不会长时间等待
+        response = requests.get(api_url or UPDATE_API_URL, headers=headers,
+                                timeout=(UPDATE_CONNECT_TIMEOUT, UPDATE_READ_TIMEOUT))
+        if response.status_code == 304:
+            logging.info("发布信息未变化，使用缓存的发布信息")
+            release = cache['release']
+        elif response.status_code == 200:
+            release = summarize_release(response.json())
+            cache['etag'] = response.headers.get('ETag', '')
+        else:
+            raise Exception(f"检查更新失败，HTTP状态码: {response.status_code}")
+    except Exception:
+        record_update_check_failure(cache)
+        raise
 
-                # 如果没有资源文件，使用源代码下载链接
-                if not download_url:
-                    download_url = data["zipball_url"]
-                    print("使用源代码链接作为备用")
+    update_config_values({'last_update_check': time.time(),
+                          'update_cache': {'etag': cache.get('etag', ''), 'release': release}})
+    return release
 
-                # 获取更新日志
-                changelog = data["body"] if "body" in data else "无可用的更新日志"
+def check_for_updates(current_version, api_url=None):
+    """
+    检查GitHub上是否有新版本
 
-                return True, latest_version, download_url, changelog, is_exe_update
+    Args:
+        current_version: 当前版本号
+        api_url: 发布信息接口地址，默认为UPDATE_API_URL
 
-        # 如果没有新版本或请求失败
-        return False, current_version, "", "", False
+    Returns:
+        tuple: (是否有更新, 最新版本, 下载链接, 更新日志, 是否为exe更新)
+    """
+    try:
+        logging.info(f"检查更新，当前版本: {current_version}")
+        return parse_release(fetch_latest_release(api_url), current_version)
     except Exception as e:
         error_msg = translate_error_to_chinese(e)
-        print(f"检查更新失败: {str(e)}")
         logging.error(f"检查更新失败: {str(e)}")
         return False, current_version, "", f"检查更新失败: {error_msg}", False
 
-def download_with_resume(url, dest_file, progress_callback=None, status_callback=None):
+def create_download_session():
+    """创建下载用的会话，连接池大小与分段数一致，各分段复用连接"""
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=DOWNLOAD_SEGMENTS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = "BOM-Tool-Update-Checker"
+    return session
+
+class RateLimiter:
     """
-    支持断点续传的下载函数
+    限制下载速度，同一文件的多个分段下载线程共享一个限速器
+
+    max_bytes_per_second为0时不限速，下载过程中可以修改（如用户确认更新后取消后台预下载的限速）。
+    """
+    def __init__(self, max_bytes_per_second=0):
+        self.max_bytes_per_second = max_bytes_per_second
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def chunk_limit(self):
+        """限速时每次读取的最大字节数，使每块的等待时间不超过约0.25秒"""
+        rate = self.max_bytes_per_second
+        return max(DOWNLOAD_CHUNK_SIZE, int(rate / 4)) if rate > 0 else DOWNLOAD_MAX_CHUNK_SIZE
+
+    def consume(self, size):
+        """记录已读取size字节，超过限速时等待"""
+        rate = self.max_bytes_per_second
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next_time = max(self._next_time, now) + size / rate
+            wait_until = self._next_time
+        # 分段等待，取消限速后立即继续
+        while self.max_bytes_per_second > 0:
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.1))
+
+def iter_adaptive_chunks(response, rate_limiter=None):
+    """
+    按下载速度调整块大小读取响应内容：读取很快时加大块，读取很慢时减小块
+
+    Args:
+        response: 以stream=True发起的响应
+        rate_limiter: RateLimiter，为None时不限速
+
+    Yields:
+        bytes: 数据块
+    """
+    chunk_size = max(DOWNLOAD_CHUNK_SIZE, 64 * 1024)
+    raw = response.raw
+    while True:
+        start = time.perf_counter()
+        limit = rate_limiter.chunk_limit() if rate_limiter else DOWNLOAD_MAX_CHUNK_SIZE
+        chunk = raw.read(min(chunk_size, limit), decode_content=True)
+        elapsed = time.perf_counter() - start
+        if not chunk:
+            return
+        if rate_limiter:
+            rate_limiter.consume(len(chunk))
+        yield chunk
+        if elapsed < 0.05 and chunk_size < DOWNLOAD_MAX_CHUNK_SIZE:
+            chunk_size *= 2
+        elif elapsed > 0.5 and chunk_size > DOWNLOAD_CHUNK_SIZE:
+            chunk_size //= 2
+
+def probe_download(session, url):
+    """
+    请求第一个字节，确定文件大小和服务器是否支持Range请求
+
+    Returns:
+        tuple: (文件总大小, 是否支持Range请求)，无法确定大小时为0
+    """
+    response = session.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                           timeout=(UPDATE_CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT))
+    try:
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code == 206 and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            return (int(total) if total.isdigit() else 0), True
+        if response.status_code == 200:
+            return int(response.headers.get('content-length', 0)), False
+        raise Exception(f"下载失败，HTTP状态码: {response.status_code}")
+    finally:
+        response.close()
+
+class DownloadSegment:
+    """下载文件中的一段：[start, end)，done为从start开始已连续写入的字节数"""
+    def __init__(self, start, end, done=0):
+        self.start = start
+        self.end = end
+        self.done = done
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.start + self.done >= self.end
+
+def plan_download_segments(total, state_file, url):
+    """
+    划分下载分段；有上次未完成下载的状态文件时从各分段已下载的位置继续
+
+    Args:
+        total: 文件总大小
+        state_file: 分段状态文件路径
+        url: 下载链接，与状态文件中的不一致时重新下载
+
+    Returns:
+        tuple: (DownloadSegment列表, 是否从上次的进度继续)
+    """
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('url') == url and state.get('total') == total:
+            return [DownloadSegment(*segment) for segment in state['segments']], True
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    count = max(1, min(DOWNLOAD_SEGMENTS, total // DOWNLOAD_MIN_SEGMENT_SIZE))
+    bounds = [total * i // count for i in range(count + 1)]
+    return [DownloadSegment(bounds[i], bounds[i + 1]) for i in range(count)], False
+
+def save_download_state(state_file, url, total, segments):
+    """保存各分段的下载进度，程序重启后可继续下载"""
+    temp_path = state_file + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'total': total,
+                   'segments': [[segment.start, segment.end, segment.done] for segment in segments]}, f)
+    os.replace(temp_path, state_file)
+
+def download_segment(session, url, dest_file, segment, status_callback=None, rate_limiter=None):
+    """
+    在后台线程中下载一个分段，失败时从已下载的位置重试
 
     Args:
+        session: 下载会话
         url: 下载链接
-        dest_file: 目标文件路径
-        progress_callback: 进度回调函数，接收三个参数(已下载大小, 总大小, 进度百分比)
-        status_callback: 状态回调函数，接收一个参数(状态消息)
+        dest_file: 目标文件路径（已创建为完整大小）
+        segment: DownloadSegment
+        status_callback: 状态回调函数
+        rate_limiter: RateLimiter，为None时不限速
+    """
+    retries = 0
+    # 不使用缓冲，写入后其他线程立即可以读到，用于边下载边计算校验和
+    with open(dest_file, 'r+b', buffering=0) as f:
+        while not segment.finished:
+            try:
+                headers = {'Range': f'bytes={segment.start + segment.done}-{segment.end - 1}'}
+                with session.get(url, headers=headers, stream=True,
+                                 timeout=(UPDATE_CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT)) as response:
+                    if response.status_code != 206:
+                        raise Exception(f"分段下载失败，HTTP状态码: {response.status_code}")
+                    f.seek(segment.start + segment.done)
+                    for chunk in iter_adaptive_chunks(response, rate_limiter):
+                        chunk = chunk[:segment.end - segment.start - segment.done]
+                        f.write(chunk)
+                        segment.done += len(chunk)
+                        if segment.finished:
+                            break
+                if not segment.finished:
+                    raise IOError("连接提前关闭")
+            except Exception as e:
+                retries += 1
+                if retries >= DOWNLOAD_MAX_RETRIES:
+                    segment.error = e
+                    return
+                if status_callback:
+                    status_callback(f"下载出错，正在重试 ({retries}/{DOWNLOAD_MAX_RETRIES}): {str(e)}")
+                time.sleep(2 * retries)  # 指数退避
+
+def get_contiguous_size(segments):
+    """获取从文件开头起已连续下载的字节数"""
+    for segment in segments:
+        if not segment.finished:
+            return segment.start + segment.done
+    return segments[-1].end if segments else 0
+
+def download_segmented(session, url, dest_file, total, progress_callback=None, status_callback=None,
+                       rate_limiter=None):
+    """
+    分段并行下载：各分段在线程中用Range请求同时下载，写入文件中各自的位置；
+    主线程按间隔报告进度、保存分段状态，并对已连续下载的部分边下载边计算SHA-256
 
     Returns:
-        bool: 下载是否成功
+        str: 下载成功时返回文件的SHA-256，失败时返回None
     """
-    # 检查是否存在部分下载的文件
-    file_size = 0
-    if os.path.exists(dest_file):
-        file_size = os.path.getsize(dest_file)
+    state_file = dest_file + '.download'
+    segments, resumed = plan_download_segments(total, state_file, url)
+    if not resumed or not os.path.exists(dest_file):
+        # 新下载：先创建完整大小的文件，各分段写入各自的位置
+        segments = [DownloadSegment(segment.start, segment.end) for segment in segments]
+        with open(dest_file, 'wb') as f:
+            f.truncate(total)
+    elif status_callback:
+        status_callback(f"发现未完成的下载({sum(segment.done for segment in segments)/1024:.1f}KB)，继续下载...")
+    save_download_state(state_file, url, total, segments)
+
+    threads = [Thread(target=download_segment, args=(session, url, dest_file, segment, status_callback, rate_limiter),
+                      daemon=True)
+               for segment in segments if not segment.finished]
+    for thread in threads:
+        thread.start()
+    if status_callback:
+        status_callback(f"正在分{len(segments)}段下载...")
+
+    sha256 = hashlib.sha256()
+    hashed = 0
+    # 不使用缓冲，避免预读到尚未写入的部分
+    with open(dest_file, 'rb', buffering=0) as reader:
+        while True:
+            running = any(thread.is_alive() for thread in threads)
+            # 对已连续下载的部分计算校验和
+            contiguous = get_contiguous_size(segments)
+            while hashed < contiguous:
+                reader.seek(hashed)
+                data = reader.read(min(contiguous - hashed, DOWNLOAD_MAX_CHUNK_SIZE))
+                if not data:
+                    break
+                sha256.update(data)
+                hashed += len(data)
+            downloaded = sum(segment.done for segment in segments)
+            if progress_callback:
+                progress_callback(downloaded, total, int(downloaded * 100 / total) if total else 0)
+            if not running:
+                break
+            save_download_state(state_file, url, total, segments)
+            time.sleep(DOWNLOAD_PROGRESS_INTERVAL)
+
+    save_download_state(state_file, url, total, segments)
+    failed = [segment.error for segment in segments if not segment.finished]
+    if failed:
         if status_callback:
-            status_callback(f"发现已下载的文件({file_size/1024:.1f}KB)，继续下载...")
+            status_callback(f"下载失败，超过最大重试次数: {failed[0]}")
+        return None
+    os.remove(state_file)
+    return sha256.hexdigest()
+
+def file_sha256(path):
+    """计算文件的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(DOWNLOAD_MAX_CHUNK_SIZE), b''):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+def download_sequential(session, url, dest_file, progress_callback=None, status_callback=None, rate_limiter=None,
+                        total=0):
+    """
+    单连接下载，已有部分下载的文件时用Range请求续传；服务器不支持续传时重新下载
 
-    # 设置HTTP头，支持断点续传
-    headers = {}
-    if file_size > 0:
-        headers['Range'] = f'bytes={file_size}-'
+    分段下载留下的文件已预先扩展为完整大小，文件大小不代表已下载的字节数，不能续传，从头下载。
 
-    # 打开文件，使用追加模式
-    with open(dest_file, 'ab' if file_size > 0 else 'wb') as f:
-        retries = 0
-        while retries < DOWNLOAD_MAX_RETRIES:
-            try:
-                # 发起请求
-                response = requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    Args:
+        total: probe_download得到的文件总大小，未知时为0
+
+    Returns:
+        str: 下载成功时返回文件的SHA-256，失败时返回None
+    """
+    import requests
+    state_file = dest_file + '.download'
+    if os.path.exists(state_file):
+        logging.info(f"发现分段下载的状态文件，改为单连接下载时从头下载: {dest_file}")
+        for path in (dest_file, state_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    retries = 0
+    while retries < DOWNLOAD_MAX_RETRIES:
+        # 检查是否存在部分下载的文件，比文件总大小还大的文件不可信，重新下载
+        file_size = os.path.getsize(dest_file) if os.path.exists(dest_file) else 0
+        if total and file_size > total:
+            os.remove(dest_file)
+            file_size = 0
+        if file_size > 0 and status_callback:
+            status_callback(f"发现已下载的文件({file_size/1024:.1f}KB)，继续下载...")
 
-                # 检查响应状态码
+        # 设置HTTP头，支持断点续传
+        headers = {'Range': f'bytes={file_size}-'} if file_size > 0 else {}
+        try:
+            with session.get(url, headers=headers, stream=True,
+                             timeout=(UPDATE_CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT)) as response:
                 if file_size > 0 and response.status_code == 416:
-                    # 范围请求错误，文件可能已经完整下载
+                    if not total or file_size != total:
+                        # 无法确认文件已完整下载，重新下载
+                        os.remove(dest_file)
+                        continue
+                    # 范围请求错误，文件大小与总大小一致，已经完整下载
                     if status_callback:
                         status_callback("文件已完整下载")
-                    return True
                 elif file_size > 0 and response.status_code != 206:
                     # 不支持断点续传，重新下载
                     if status_callback:
                         status_callback("服务器不支持断点续传，重新下载...")
-                    f.close()
                     os.remove(dest_file)
-                    return download_with_resume(url, dest_file, progress_callback, status_callback)
+                    continue
                 elif response.status_code not in [200, 206]:
-                    # 其他错误
                     raise Exception(f"下载失败，HTTP状态码: {response.status_code}")
+                else:
+                    # 获取文件总大小
+                    total_size = int(response.headers.get('content-length', 0)) + file_size
+                    downloaded = file_size
+                    last_report = 0
+                    with open(dest_file, 'ab' if file_size > 0 else 'wb') as f:
+                        for chunk in iter_adaptive_chunks(response, rate_limiter):
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            # 限制进度回调频率
+                            now = time.perf_counter()
+                            if progress_callback and now - last_report >= DOWNLOAD_PROGRESS_INTERVAL:
+                                last_report = now
+                                progress_callback(downloaded, total_size,
+                                                  int(downloaded * 100 / total_size) if total_size else 0)
+                    if progress_callback:
+                        progress_callback(downloaded, max(total_size, downloaded), 100)
+
+            # 续传的文件需要从头计算校验和
+            return file_sha256(dest_file)
+
+        except (requests.exceptions.RequestException, IOError) as e:
+            retries += 1
+            if status_callback:
+                status_callback(f"下载出错，正在重试 ({retries}/{DOWNLOAD_MAX_RETRIES}): {str(e)}")
+
+            # 如果不是最后一次重试，等待一段时间再重试
+            if retries < DOWNLOAD_MAX_RETRIES:
+                time.sleep(2 * retries)  # 指数退避
+
+    # 超过最大重试次数
+    if status_callback:
+        status_callback("下载失败，超过最大重试次数")
+    return None
+
+def download_with_resume(url, dest_file, progress_callback=None, status_callback=None, expected_sha256=None,
+                         rate_limiter=None):
+    """
+    支持断点续传的下载函数
 
-                # 获取文件总大小
-                total_size = int(response.headers.get('content-length', 0)) + file_size
-                if total_size == 0:
-                    total_size = file_size  # 如果无法获取总大小，使用已下载大小
+    服务器支持Range请求且文件较大时分段并行下载，否则单连接下载；下载过程中计算SHA-256，
+    提供了发布的校验和时下载完成后核对，不一致时删除文件。
 
-                # 已下载大小
-                downloaded = file_size
+    Args:
+        url: 下载链接
+        dest_file: 目标文件路径
+        progress_callback: 进度回调函数，接收三个参数(已下载大小, 总大小, 进度百分比)，最多每DOWNLOAD_PROGRESS_INTERVAL秒调用一次
+        status_callback: 状态回调函数，接收一个参数(状态消息)
+        expected_sha256: 发布的SHA-256校验和，为空时不校验
+        rate_limiter: RateLimiter，为None时不限速
 
-                # 下载文件
-                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                    if chunk:  # 过滤掉保持连接的空块
-                        f.write(chunk)
-                        downloaded += len(chunk)
+    Returns:
+        bool: 下载是否成功
+    """
+    session = create_download_session()
+    try:
+        try:
+            total, supports_range = probe_download(session, url)
+        except Exception as e:
+            logging.warning(f"获取下载文件大小失败，使用单连接下载: {e}")
+            total, supports_range = 0, False
 
-                        # 计算进度
-                        progress = 0
-                        if total_size > 0:
-                            progress = int(downloaded * 100 / total_size)
+        if supports_range and total >= 2 * DOWNLOAD_MIN_SEGMENT_SIZE:
+            digest = download_segmented(session, url, dest_file, total, progress_callback, status_callback,
+                                        rate_limiter)
+        else:
+            digest = download_sequential(session, url, dest_file, progress_callback, status_callback, rate_limiter,
+                                         total)
+    finally:
+        session.close()
 
-                        # 更新进度
-                        if progress_callback:
-                            progress_callback(downloaded, total_size, progress)
+    if digest is None:
+        return False
+    if expected_sha256 and digest.lower() != expected_sha256.lower():
+        logging.error(f"下载文件校验失败: {dest_file}，期望SHA-256 {expected_sha256}，实际 {digest}")
+        os.remove(dest_file)
+        if status_callback:
+            status_callback("下载的文件校验失败，已删除，请重新下载")
+        return False
 
-                # 下载完成
-                if status_callback:
-                    status_callback("下载完成")
-                return True
+    # 下载完成
+    if status_callback:
+        status_callback("下载完成，校验通过" if expected_sha256 else "下载完成")
+    return True
 
-            except (requests.exceptions.RequestException, IOError) as e:
-                retries += 1
-                if status_callback:
-                    status_callback(f"下载出错，正在重试 ({retries}/{DOWNLOAD_MAX_RETRIES}): {str(e)}")
+def get_delta_asset_name(old_version, new_version):
+    """增量更新包的资源文件名，发布新版本时按此名称上传"""
+    return f"BOMSwap_v{old_version}_to_v{new_version}.delta"
 
-                # 如果不是最后一次重试，等待一段时间再重试
-                if retries < DOWNLOAD_MAX_RETRIES:
-                    time.sleep(2 * retries)  # 指数退避
+def find_delta_download_url(current_version, latest_version):
+    """
+    在缓存的发布信息中查找从当前版本到最新版本的增量更新包
+
+    Args:
+        current_version: 当前版本号
+        latest_version: 最新版本号
+
+    Returns:
+        str: 增量更新包的下载链接，没有发布时返回空字符串
+    """
+    release = load_config().get('update_cache', {}).get('release') or {}
+    name = get_delta_asset_name(current_version, latest_version)
+    for asset in release.get('assets', []):
+        if asset['name'] == name:
+            return asset['browser_download_url']
+    return ''
+
+def rolling_block_hashes(data, block_size):
+    """
+    计算data中每个位置开始、长度为block_size的窗口的弱校验和（Adler-32风格的两个16位累加和）
+
+    Args:
+        data: 文件内容
+        block_size: 窗口大小
+
+    Returns:
+        numpy.ndarray: 第i项为data[i:i+block_size]的弱校验和
+    """
+    import numpy as np
+    count = len(data) - block_size + 1
+    hashes = np.empty(max(count, 0), dtype=np.int64)
+    # 分批计算，控制累加数组的内存
+    step = 4 * 1024 * 1024
+    for start in range(0, count, step):
+        stop = min(start + step, count)
+        x = np.frombuffer(data, dtype=np.uint8, count=stop - start + block_size - 1, offset=start).astype(np.int64)
+        s1 = np.concatenate(([0], np.cumsum(x)))
+        s2 = np.concatenate(([0], np.cumsum(x * np.arange(len(x), dtype=np.int64))))
+        a = s1[block_size:] - s1[:-block_size]
+        b = (np.arange(len(a), dtype=np.int64) + block_size) * a - (s2[block_size:] - s2[:-block_size])
+        hashes[start:stop] = (a & 0xffff) | ((b & 0xffff) << 16)
+    return hashes
+
+def delta_match_forward(old, old_pos, new, new_pos, limit, block_size):
+    """返回old[old_pos:]与new[new_pos:]相同部分的长度，最多limit"""
+    length = 0
+    while (length + block_size <= limit and
+           old[old_pos + length:old_pos + length + block_size] == new[new_pos + length:new_pos + length + block_size]):
+        length += block_size
+    # 在最后一个不同的块内二分查找
+    low, high = length, min(length + block_size, limit)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old[old_pos + length:old_pos + mid] == new[new_pos + length:new_pos + mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def delta_match_backward(old, old_pos, new, new_pos, limit, block_size):
+    """返回old[:old_pos]与new[:new_pos]末尾相同部分的长度，最多limit"""
+    length = 0
+    while (length + block_size <= limit and
+           old[old_pos - length - block_size:old_pos - length] == new[new_pos - length - block_size:new_pos - length]):
+        length += block_size
+    low, high = length, min(length + block_size, limit)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if old[old_pos - mid:old_pos - length] == new[new_pos - mid:new_pos - length]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def create_binary_delta(old_file, new_file, delta_file, block_size=DELTA_BLOCK_SIZE):
+    """
+    生成从旧版本程序到新版本程序的增量更新包，发布新版本时使用
+
+    按block_size对齐索引旧版本的数据块，在新版本的每个位置用滚动弱校验和查找相同的块并向前后扩展，
+    相同部分记录为从旧版本复制，其余部分记录为新增数据，整个更新包用LZMA压缩。
+    更新包中记录新旧版本的大小和SHA-256，应用时校验。
+
+    Args:
+        old_file: 旧版本程序
+        new_file: 新版本程序
+        delta_file: 增量更新包保存路径
+        block_size: 匹配的块大小
+
+    Returns:
+        tuple: (新版本大小, 增量更新包大小)
+    """
+    import numpy as np
+    with open(old_file, 'rb') as f:
+        old = f.read()
+    with open(new_file, 'rb') as f:
+        new = f.read()
+
+    # 索引旧版本按块对齐的弱校验和，相同的块只记录第一次出现的位置
+    index = {}
+    old_hashes = rolling_block_hashes(old, block_size)[::block_size].tolist()
+    for offset, weak in zip(range(0, len(old), block_size), old_hashes):
+        index.setdefault(weak, offset)
+
+    # 用24位的查找表筛选候选位置，误判的位置在字典中查不到
+    new_hashes = rolling_block_hashes(new, block_size)
+    table = np.zeros(1 << 24, dtype=bool)
+    table[np.fromiter(index, dtype=np.int64, count=len(index)) & 0xffffff] = True
+    candidates = np.flatnonzero(table[new_hashes & 0xffffff])
+
+    with lzma.open(delta_file, 'wb') as out:
+        out.write(DELTA_MAGIC)
+        out.write(struct.pack('<Q32sQ32s', len(old), hashlib.sha256(old).digest(),
+                              len(new), hashlib.sha256(new).digest()))
+
+        def write_literal(start, stop):
+            for pos in range(start, stop, DELTA_LITERAL_CHUNK):
+                end = min(pos + DELTA_LITERAL_CHUNK, stop)
+                out.write(b'I' + struct.pack('<Q', end - pos))
+                out.write(new[pos:end])
+
+        literal_start = 0
+        i = 0
+        while i < len(candidates):
+            pos = int(candidates[i])
+            offset = index.get(int(new_hashes[pos]))
+            if offset is None or old[offset:offset + block_size] != new[pos:pos + block_size]:
+                i += 1
+                continue
+            # 向前后扩展相同的部分
+            back = delta_match_backward(old, offset, new, pos, min(offset, pos - literal_start), block_size)
+            length = delta_match_forward(old, offset, new, pos, min(len(old) - offset, len(new) - pos), block_size)
+            write_literal(literal_start, pos - back)
+            out.write(b'C' + struct.pack('<QQ', offset - back, back + length))
+            literal_start = pos + length
+            i = int(np.searchsorted(candidates, literal_start))
+        write_literal(literal_start, len(new))
+        out.write(b'E')
+
+    return len(new), os.path.getsize(delta_file)
+
+def apply_binary_delta(base_file, delta_file, dest_file):
+    """
+    用当前版本程序和增量更新包还原新版本程序，先写入临时文件，校验通过后替换目标文件
+
+    Args:
+        base_file: 当前版本程序
+        delta_file: 增量更新包
+        dest_file: 新版本程序保存路径
+
+    Returns:
+        str: 新版本程序的SHA-256
+
+    Raises:
+        ValueError: 更新包格式错误、当前程序与更新包的旧版本不一致或还原结果校验失败
+    """
+    header_format = '<Q32sQ32s'
+    temp_file = dest_file + '.tmp'
+    sha256 = hashlib.sha256()
+    try:
+        with lzma.open(delta_file, 'rb') as delta, open(base_file, 'rb') as base, open(temp_file, 'wb') as out:
+            if delta.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+                raise ValueError("增量更新包格式错误")
+            old_size, old_sha, new_size, new_sha = struct.unpack(header_format,
+                                                                 delta.read(struct.calcsize(header_format)))
+            if os.path.getsize(base_file) != old_size or file_sha256(base_file) != old_sha.hex():
+                raise ValueError("当前程序与增量更新包的旧版本不一致")
+
+            while True:
+                op = delta.read(1)
+                if op == b'C':
+                    offset, length = struct.unpack('<QQ', delta.read(16))
+                    base.seek(offset)
+                    source = base
+                elif op == b'I':
+                    length, = struct.unpack('<Q', delta.read(8))
+                    source = delta
+                elif op == b'E':
+                    break
+                else:
+                    raise ValueError("增量更新包格式错误")
+                while length > 0:
+                    data = source.read(min(length, DOWNLOAD_MAX_CHUNK_SIZE))
+                    if not data:
+                        raise ValueError("增量更新包格式错误")
+                    out.write(data)
+                    sha256.update(data)
+                    length -= len(data)
+
+        if os.path.getsize(temp_file) != new_size or sha256.digest() != new_sha:
+            raise ValueError("增量更新还原的程序校验失败")
+        os.replace(temp_file, dest_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+    return sha256.hexdigest()
+
+def download_delta_update(delta_url, dest_file, base_file, progress_callback=None, status_callback=None,
+                          expected_sha256=None, rate_limiter=None):
+    """
+    下载增量更新包，用当前版本程序还原新版本程序
+
+    Args:
+        delta_url: 增量更新包下载链接
+        dest_file: 新版本程序保存路径
+        base_file: 当前版本程序
+        progress_callback: 进度回调函数，同download_with_resume
+        status_callback: 状态回调函数，同download_with_resume
+        expected_sha256: 新版本程序发布的SHA-256，为空时只使用更新包中记录的校验和
+        rate_limiter: RateLimiter，为None时不限速
 
-        # 超过最大重试次数
+    Returns:
+        bool: 是否成功，失败时应改为下载完整程序
+    """
+    delta_file = dest_file + '.delta'
+    try:
+        if not download_with_resume(delta_url, delta_file, progress_callback, status_callback,
+                                    expected_sha256=get_release_sha256(delta_url), rate_limiter=rate_limiter):
+            return False
         if status_callback:
-            status_callback("下载失败，超过最大重试次数")
+            status_callback("正在应用增量更新...")
+        delta_size = os.path.getsize(delta_file)
+        digest = apply_binary_delta(base_file, delta_file, dest_file)
+        os.remove(delta_file)
+        if expected_sha256 and digest != expected_sha256.lower():
+            os.remove(dest_file)
+            raise ValueError("增量更新还原的程序与发布的校验和不一致")
+    except Exception as e:
+        logging.warning(f"增量更新失败: {e}")
+        if os.path.exists(delta_file):
+            os.remove(delta_file)
+        return False
+
+    logging.info(f"增量更新完成: 下载{delta_size}字节，还原程序{os.path.getsize(dest_file)}字节")
+    if status_callback:
+        status_callback("增量更新完成，校验通过")
+    return True
+
+def get_update_stage_dir():
+    """后台预下载的更新文件所在的临时目录"""
+    return os.path.join(tempfile.gettempdir(), 'BOMSwap_updates')
+
+def get_staged_update_path(latest_version, download_url, is_exe_update):
+    """
+    获取新版本下载完成后的文件路径，各版本分别保存在临时目录下以版本号命名的子目录中
+
+    Args:
+        latest_version: 最新版本号
+        download_url: 下载链接
+        is_exe_update: 是否为exe更新
+
+    Returns:
+        str: 文件路径，文件存在即表示已完整下载并通过校验
+    """
+    if is_exe_update:
+        # 从URL中提取文件名，URL中没有文件名时使用默认文件名
+        file_name = os.path.basename(download_url)
+        if not file_name.endswith('.exe'):
+            file_name = f"BOM替代料工具_v{latest_version}.exe"
+    else:
+        file_name = f"BOM替代料工具_v{latest_version}.zip"
+    return os.path.join(get_update_stage_dir(), f"v{latest_version}", file_name)
+
+def clean_update_stage(keep_version):
+    """删除临时目录中其他版本的更新文件"""
+    stage_dir = get_update_stage_dir()
+    if not os.path.isdir(stage_dir):
+        return
+    for name in os.listdir(stage_dir):
+        if name != f"v{keep_version}":
+            shutil.rmtree(os.path.join(stage_dir, name), ignore_errors=True)
+
+def fetch_update(current_version, latest_version, download_url, is_exe_update, dest_file,
+                 progress_callback=None, status_callback=None, rate_limiter=None):
+    """
+    下载新版本：打包的程序优先下载增量更新包并在本地还原，没有增量更新包或还原失败时下载完整文件
+
+    先下载到dest_file.part（中断后再次调用时继续下载），校验通过后原子替换为dest_file，
+    同时在dest_file.json中记录下载链接、大小、SHA-256和是否经过校验，供is_staged_update_ready检查。
+
+    Args:
+        current_version: 当前版本号
+        latest_version: 最新版本号
+        download_url: 完整文件的下载链接
+        is_exe_update: 是否为exe更新
+        dest_file: 下载完成后的文件路径
+        progress_callback: 进度回调函数，同download_with_resume
+        status_callback: 状态回调函数，同download_with_resume
+        rate_limiter: RateLimiter，为None时不限速
+
+    Returns:
+        bool: 下载是否成功
+    """
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    part_file = dest_file + '.part'
+    expected_sha256 = get_release_sha256(download_url)
+    success = False
+
+    # 打包的程序优先下载从当前版本到新版本的增量更新包，在本地还原新版本
+    delta_url = ''
+    if is_exe_update and getattr(sys, 'frozen', False):
+        delta_url = find_delta_download_url(current_version, latest_version)
+    if delta_url:
+        success = download_delta_update(delta_url, part_file, sys.executable, progress_callback, status_callback,
+                                        expected_sha256=expected_sha256, rate_limiter=rate_limiter)
+        if not success and status_callback:
+            status_callback("增量更新失败，下载完整程序...")
+
+    # 下载文件，发布了校验和时下载完成后核对，校验通过才安装
+    if not success:
+        success = download_with_resume(download_url, part_file, progress_callback, status_callback,
+                                       expected_sha256=expected_sha256, rate_limiter=rate_limiter)
+    if success:
+        # 发布了校验和，或由增量更新包还原（还原结果已按更新包中记录的校验和核对）时视为已校验
+        manifest = {
+            'url': download_url,
+            'size': os.path.getsize(part_file),
+            'sha256': file_sha256(part_file),
+            'verified': bool(expected_sha256) or bool(delta_url),
+            'etag': load_config().get('update_cache', {}).get('etag', '')
+        }
+        temp_path = dest_file + '.json.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, dest_file + '.json')
+        os.replace(part_file, dest_file)
+    return success
+
+def is_staged_update_ready(staged_path, download_url):
+    """
+    检查临时目录中已下载的新版本能否直接安装，不能安装时删除，之后重新下载
+
+    文件须与fetch_update的记录一致（下载链接、大小、SHA-256），并且满足其一：下载时经过校验且与当前发布的
+    校验和一致；发布信息中有文件大小且一致；没有校验和和大小时，发布信息的ETag与下载时相同。
+
+    Args:
+        staged_path: get_staged_update_path返回的文件路径
+        download_url: 当前发布的下载链接
+
+    Returns:
+        bool: 是否可以直接安装
+    """
+    if not os.path.exists(staged_path):
         return False
+    manifest_path = staged_path + '.json'
+    ready = False
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if (manifest.get('url') == download_url and manifest.get('size') == os.path.getsize(staged_path)
+                and manifest.get('sha256') == file_sha256(staged_path)):
+            cache = load_config().get('update_cache', {})
+            asset = next((item for item in (cache.get('release') or {}).get('assets', [])
+                          if item['browser_download_url'] == download_url), None)
+            published_sha256 = get_release_sha256(download_url)
+            if published_sha256:
+                ready = manifest.get('verified', False) and manifest['sha256'] == published_sha256.lower()
+            elif asset is not None and asset.get('size'):
+                ready = manifest['size'] == asset['size']
+            else:
+                ready = bool(manifest.get('etag')) and manifest['etag'] == cache.get('etag')
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"读取已下载更新的记录失败: {e}")
+
+    if not ready:
+        logging.warning(f"已下载的更新无法确认完整，删除后重新下载: {staged_path}")
+        for path in (staged_path, manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return ready
 
 def show_update_notification(parent, current_version, latest_version, changelog, download_url, is_exe_update):
     """
@@ -3269,9 +7859,10 @@ class UpdateManager:
     """
     更新管理器类，负责检查更新、下载更新和安装更新
     """
-    def __init__(self, master):
+    def __init__(self, master, status_callback=None):
         self.master = master
         self.version = APP_VERSION
+        self.status_callback = status_callback  # 状态回调函数，接收(消息, 颜色)
 
         # 更新状态
         self.update_available = False
@@ -3283,29 +7874,43 @@ class UpdateManager:
         # 更新窗口状态
         self.update_window_open = False
 
+        # 后台预下载状态：下载线程、限速器、预下载的版本，以及用户确认更新后接收进度的回调函数
+        self.prefetch_thread = None
+        self.prefetch_limiter = None
+        self.prefetch_version = ""
+        self.prefetch_callbacks = None
+
         # 文本颜色
         self.text_color = "#000000"
 
-    def check_updates_on_startup(self):
-        """程序启动时检查更新"""
-        # 延迟几秒，让主界面先加载完成
-        time.sleep(2)
+    def check_updates_on_startup(self, delay=UPDATE_STARTUP_DELAY):
+        """
+        程序启动时检查更新
 
-        # 检查上次更新时间，如果距离上次检查时间不足UPDATE_CHECK_INTERVAL天，则不检查
-        config = load_config()
-        last_check = config.get('last_update_check', 0)
-        now = time.time()
+        Args:
+            delay: 开始检查前等待的秒数，让主界面先加载完成
+        """
+        if delay > 0:
+            time.sleep(delay)
 
-        if now - last_check < UPDATE_CHECK_INTERVAL * 24 * 60 * 60:
+        config = load_config()
+        release = config.get('update_cache', {}).get('release')
+        if is_update_check_due(config):
+            # 检查更新，检查时间和发布信息缓存由fetch_latest_release记录
+            has_update, latest_version, download_url, changelog, is_exe_update = check_for_updates(self.version)
+            notify = True
+        elif config.get('prefetch_updates', False) and release:
+            # 距离上次检查不足UPDATE_CHECK_INTERVAL天时不联网检查，但上次发现的新版本尚未预下载完成时继续下载
+            try:
+                has_update, latest_version, download_url, changelog, is_exe_update = parse_release(release, self.version)
+            except Exception as e:
+                logging.warning(f"读取缓存的发布信息失败: {e}")
+                return
+            notify = False
+        else:
+            # 距离上次检查不足UPDATE_CHECK_INTERVAL天，或上次检查失败后仍在退避期内，则不检查
             return
 
-        # 检查更新
-        has_update, latest_version, download_url, changelog, is_exe_update = check_for_updates(self.version)
-
-        # 更新最后检查时间
-        config['last_update_check'] = now
-        save_config(config)
-
         if has_update:
             # 保存更新信息
             self.update_available = True
@@ -3314,7 +7919,62 @@ class UpdateManager:
             self.update_changelog = changelog
             self.is_exe_update = is_exe_update
 
-            # 显示更新提示
+            if config.get('prefetch_updates', False):
+                # 后台预下载，下载完成后再提示，用户确认后立即安装
+                self.start_prefetch(config.get('prefetch_limit_kbps', 256), notify)
+            elif notify:
+                # 显示更新提示
+                self.master.after(0, self.show_update_notification)
+
+    def start_prefetch(self, limit_kbps, notify=True):
+        """
+        在后台限速下载新版本到临时目录；下载中断（如程序关闭）后下次启动时继续
+
+        Args:
+            limit_kbps: 限速（KB/s），0为不限速
+            notify: 新版本此前已下载完成时是否提示更新；本次下载完成时总是提示
+        """
+        staged_path = get_staged_update_path(self.latest_version, self.download_url, self.is_exe_update)
+        if is_staged_update_ready(staged_path, self.download_url):
+            if notify:
+                self.master.after(0, self.show_update_notification)
+            return
+        if self.prefetch_thread is not None and self.prefetch_thread.is_alive():
+            return
+
+        self.prefetch_limiter = RateLimiter(max(0, int(limit_kbps)) * 1024)
+        self.prefetch_version = self.latest_version
+        self.prefetch_callbacks = None
+        self.prefetch_thread = Thread(target=self._prefetch_thread,
+                                      args=(self.latest_version, self.download_url, self.is_exe_update,
+                                            staged_path, notify),
+                                      daemon=True)
+        self.prefetch_thread.start()
+
+    def _prefetch_thread(self, latest_version, download_url, is_exe_update, staged_path, notify):
+        """后台预下载的线程函数，用户确认更新后进度转给下载对话框"""
+        def progress_callback(*args):
+            if self.prefetch_callbacks:
+                self.prefetch_callbacks[0](*args)
+
+        def status_callback(message):
+            logging.debug(f"后台下载更新: {message}")
+            if self.prefetch_callbacks:
+                self.prefetch_callbacks[1](message)
+
+        logging.info(f"开始后台下载新版本 {latest_version}，限速 {self.prefetch_limiter.max_bytes_per_second // 1024}KB/s")
+        try:
+            clean_update_stage(latest_version)
+            success = fetch_update(self.version, latest_version, download_url, is_exe_update, staged_path,
+                                   progress_callback, status_callback, self.prefetch_limiter)
+        except Exception as e:
+            logging.error(f"后台下载新版本失败: {str(e)}")
+            success = False
+
+        if success:
+            logging.info(f"新版本 {latest_version} 已在后台下载完成: {staged_path}")
+        # 用户已确认更新时由下载对话框继续处理
+        if self.prefetch_callbacks is None and (success or notify):
             self.master.after(0, self.show_update_notification)
 
     def check_updates_manually(self):
@@ -3323,7 +7983,7 @@ class UpdateManager:
         self._update_status("正在检查更新...", "#0078D4")
 
         # 在新线程中检查更新
-        Thread(target=self._check_updates_thread, args=(True,)).start()
+        Thread(target=self._check_updates_thread, args=(True,), daemon=True).start()
 
     def _check_updates_thread(self, is_manual_check=False):
         """检查更新的线程函数"""
@@ -3352,7 +8012,6 @@ class UpdateManager:
                                                             f"当前版本 {self.version} 已是最新版本。"))
         except Exception as e:
             error_msg = translate_error_to_chinese(e)
-            print(f"检查更新时出错: {str(e)}")
             logging.error(f"检查更新时出错: {str(e)}")
             if is_manual_check:
                 self._update_status("检查更新失败", "#FF0000")
@@ -3366,8 +8025,12 @@ class UpdateManager:
         if self.update_window_open:
             return
 
-        if messagebox.askyesno("发现新版本",
-                            f"发现新版本 v{self.latest_version}，当前版本 v{self.version}。\n\n是否查看更新内容并更新？"):
+        staged_path = get_staged_update_path(self.latest_version, self.download_url, self.is_exe_update)
+        if is_staged_update_ready(staged_path, self.download_url):
+            message = f"新版本 v{self.latest_version} 已在后台下载完成，当前版本 v{self.version}。\n\n是否查看更新内容并安装？"
+        else:
+            message = f"发现新版本 v{self.latest_version}，当前版本 v{self.version}。\n\n是否查看更新内容并更新？"
+        if messagebox.askyesno("发现新版本", message):
             self.show_update_dialog()
 
     def show_update_dialog(self):
@@ -3390,18 +8053,13 @@ class UpdateManager:
 
     def _download_update(self, latest_version, download_url, is_exe_update):
         """下载更新"""
-        # 确定下载路径
+        # 确定下载路径：先下载到临时目录，已在后台下载完成时直接安装
+        staged_path = get_staged_update_path(latest_version, download_url, is_exe_update)
         if is_exe_update:
-            # 如果是可执行文件，下载到临时目录
-            download_dir = tempfile.gettempdir()
-            # 从URL中提取文件名
-            file_name = os.path.basename(download_url)
-            if not file_name.endswith('.exe'):
-                # 如果URL中没有文件名，使用默认文件名
-                file_name = f"BOM替代料工具_v{latest_version}.exe"
-            download_path = os.path.join(download_dir, file_name)
+            # 如果是可执行文件，在临时目录中运行
+            download_path = staged_path
         else:
-            # 如果是源代码，下载到用户选择的目录
+            # 如果是源代码，复制到用户选择的目录
             download_dir = filedialog.askdirectory(title="选择保存目录")
             if not download_dir:
                 # 用户取消选择，取消下载
@@ -3409,6 +8067,13 @@ class UpdateManager:
                 return
             download_path = os.path.join(download_dir, f"BOM替代料工具_v{latest_version}.zip")
 
+        if is_staged_update_ready(staged_path, download_url):
+            try:
+                self._install_update(latest_version, staged_path, download_path, is_exe_update)
+            finally:
+                self.update_window_open = False
+            return
+
         # 创建进度对话框
         progress_dialog = tk.Toplevel(self.master)
         progress_dialog.title("下载更新")
@@ -3465,30 +8130,23 @@ class UpdateManager:
         # 在新线程中下载
         def download_thread():
             try:
-                # 下载文件
-                success = download_with_resume(download_url, download_path,
-                                             update_progress_callback, status_callback)
+                # 后台预下载仍在进行时取消限速，在本对话框中显示进度并等待下载完成
+                prefetch = self.prefetch_thread
+                if prefetch is not None and prefetch.is_alive() and self.prefetch_version == latest_version:
+                    self.prefetch_callbacks = (update_progress_callback, status_callback)
+                    self.prefetch_limiter.max_bytes_per_second = 0
+                    status_callback("继续后台下载...")
+                    prefetch.join()
+
+                success = is_staged_update_ready(staged_path, download_url) or fetch_update(
+                    self.version, latest_version, download_url, is_exe_update, staged_path,
+                    update_progress_callback, status_callback)
 
                 # 如果下载成功
                 if success:
                     # 关闭进度对话框
                     progress_dialog.destroy()
-
-                    # 显示下载完成对话框
-                    if is_exe_update:
-                        # 如果是可执行文件，询问用户是否关闭当前程序并运行新版本
-                        if messagebox.askyesno("更新完成",
-                                            f"新版本 {latest_version} 已下载完成。\n\n"
-                                            f"是否关闭当前程序并运行新版本？"):
-                            # 启动新版本并关闭当前程序
-                            subprocess.Popen([download_path])
-                            self.master.quit()
-                            self.master.destroy()
-                            sys.exit(0)
-                    else:
-                        # 如果是源代码包，提示用户下载完成
-                        messagebox.showinfo("下载完成",
-                                         f"新版本 {latest_version} 已下载到:\n{download_path}")
+                    self._install_update(latest_version, staged_path, download_path, is_exe_update)
                 else:
                     # 如果下载失败，显示错误消息
                     messagebox.showerror("下载失败",
@@ -3509,47 +8167,88 @@ class UpdateManager:
         # 启动下载线程
         Thread(target=download_thread).start()
 
+    def _install_update(self, latest_version, staged_path, download_path, is_exe_update):
+        """
+        安装已下载完成的新版本
+
+        Args:
+            latest_version: 最新版本号
+            staged_path: 临时目录中下载完成的文件
+            download_path: exe更新时与staged_path相同；源代码包为用户选择的保存路径
+            is_exe_update: 是否为exe更新
+        """
+        # 显示下载完成对话框
+        if is_exe_update:
+            # 如果是可执行文件，询问用户是否关闭当前程序并运行新版本
+            if messagebox.askyesno("更新完成",
+                                f"新版本 {latest_version} 已下载完成。\n\n"
+                                f"是否关闭当前程序并运行新版本？"):
+                # 启动新版本并关闭当前程序
+                subprocess.Popen([download_path])
+                self.master.quit()
+                self.master.destroy()
+                sys.exit(0)
+        else:
+            # 如果是源代码包，复制到用户选择的目录并提示用户下载完成
+            shutil.copy2(staged_path, download_path)
+            messagebox.showinfo("下载完成",
+                             f"新版本 {latest_version} 已下载到:\n{download_path}")
+
     def _update_status(self, message, color=None):
         """更新状态栏"""
-        # 这个方法需要在主应用程序中实现
-        # 在这里只是一个占位符
-        pass
+        if self.status_callback:
+            self.status_callback(message, color)
 
 # 修改主程序入口
-if __name__ == '__main__':
-    setup_logging()
-
-    # 打印系统信息，帮助诊断
-    print("\n=== 系统信息 ===")
-    print(f"Python版本: {sys.version}")
-    print(f"操作系统: {platform.platform()}")
-    print(f"系统架构: {platform.architecture()}")
-    print(f"当前工作目录: {os.getcwd()}")
+def log_system_info():
+    """记录系统信息，帮助诊断（在后台线程中运行，不影响主窗口显示）"""
+    logging.info("=== 系统信息 ===")
+    logging.info(f"Python版本: {sys.version}")
+    logging.info(f"操作系统: {platform.platform()}")
+    logging.info(f"系统架构: {platform.architecture()}")
+    logging.debug(f"当前工作目录: {os.getcwd()}")
 
     # 检查是否是打包环境
     is_frozen = getattr(sys, 'frozen', False)
-    print(f"是否是打包环境: {is_frozen}")
+    logging.info(f"是否是打包环境: {is_frozen}")
     if is_frozen:
-        print(f"可执行文件路径: {sys.executable}")
-        print(f"可执行文件目录: {os.path.dirname(sys.executable)}")
+        logging.info(f"可执行文件路径: {sys.executable}")
+        logging.info(f"可执行文件目录: {os.path.dirname(sys.executable)}")
 
     # 尝试获取用户目录信息
     try:
-        print(f"用户主目录: {os.path.expanduser('~')}")
-        print(f"用户文档目录: {os.path.join(os.path.expanduser('~'), 'Documents')}")
+        logging.info(f"用户主目录: {os.path.expanduser('~')}")
+        logging.info(f"用户文档目录: {os.path.join(os.path.expanduser('~'), 'Documents')}")
     except Exception as e:
-        print(f"获取用户目录信息失败: {e}")
+        logging.warning(f"获取用户目录信息失败: {e}")
+
+    logging.info("=== 系统信息结束 ===")
+
+_module_loaded_time = time.perf_counter()  # 模块加载完成的时间
 
-    print("=== 系统信息结束 ===\n")
+if __name__ == '__main__':
+    # 打包后的程序启动子进程时需要此调用，否则子进程会再次打开主界面
+    multiprocessing.freeze_support()
+    setup_logging()
 
     # 检查启动参数
     reset_config = False
 
     # 检查是否有命令行参数
     if len(sys.argv) > 1:
-        print(f"命令行参数: {sys.argv[1:]}")
+        logging.info(f"命令行参数: {sys.argv[1:]}")
         if sys.argv[1] == '--reset-config' or sys.argv[1] == '-r':
             reset_config = True
+        elif sys.argv[1] == '--startup-benchmark':
+            startup_benchmark = True
+        elif sys.argv[1] == '--make-delta' and len(sys.argv) == 5:
+            # 发布新版本时生成增量更新包: --make-delta 旧版本程序 新版本程序 增量更新包
+            new_size, delta_size = create_binary_delta(sys.argv[2], sys.argv[3], sys.argv[4])
+            print(f"增量更新包: {sys.argv[4]}，{delta_size}字节（新版本程序{new_size}字节）")
+            sys.exit(0)
+
+    if not startup_benchmark:
+        Thread(target=log_system_info, daemon=True).start()
 
     # 检查是否同时按下Shift键
     import ctypes
@@ -3558,11 +8257,9 @@ if __name__ == '__main__':
         # 检查Shift键状态
         shift_state = ctypes.windll.user32.GetAsyncKeyState(0x10) & 0x8000 != 0
         if shift_state:
-            print("检测到Shift键被按下")
             logging.info("检测到Shift键被按下")
             reset_by_key = True
     except Exception as e:
-        print(f"检查Shift键状态失败: {e}")
         logging.error(f"检查Shift键状态失败: {e}")
 
     # 重置配置
@@ -3570,88 +8267,34 @@ if __name__ == '__main__':
         # 删除配置文件，完全重置
         try:
             if os.path.exists(CONFIG_FILE):
-                print(f"正在删除配置文件: {CONFIG_FILE}")
+                logging.info(f"正在删除配置文件: {CONFIG_FILE}")
                 os.remove(CONFIG_FILE)
                 msg = "配置文件已删除，将使用默认配置"
-                print(msg)
                 logging.info(msg)
                 # 如果是按键触发的，显示消息框
                 if reset_by_key:
                     tkinter.messagebox.showinfo('重置成功', msg)
             else:
                 msg = f"未找到配置文件: {CONFIG_FILE}，将使用默认配置"
-                print(msg)
                 logging.info(msg)
 
             # 创建默认配置并保存
             default_config = get_builtin_default_config()
             save_result = save_config(default_config)
-            print(f"创建默认配置文件结果: {save_result}")
             logging.info(f"创建默认配置文件结果: {save_result}")
         except Exception as e:
             error_msg = f"重置配置失败: {e}"
-            print(error_msg)
             logging.error(error_msg)
 
-    # 检查程序目录是否可写
-    print("\n=== 配置文件目录检查 ===")
-
-    # 检查程序目录
-    program_dir = get_program_dir()
-    print(f"程序目录: {program_dir}")
-    program_dir_writable = check_directory_writable(program_dir)
-    print(f"程序目录可写: {program_dir_writable}")
-    logging.info(f"程序目录可写: {program_dir_writable}")
-
-    # 检查CONFIG_FILE目录
-    config_dir = os.path.dirname(CONFIG_FILE)
-    print(f"配置文件目录: {config_dir}")
-    config_dir_writable = check_directory_writable(config_dir)
-    print(f"配置文件目录可写: {config_dir_writable}")
-    logging.info(f"配置文件目录可写: {config_dir_writable}")
-
-    if not program_dir_writable:
-        print("警告: 程序目录不可写，配置文件将无法保存到程序目录！")
-        logging.warning("程序目录不可写，配置文件将无法保存到程序目录！")
-
-        # 检查当前工作目录
-        current_dir = os.getcwd()
-        if program_dir != current_dir:
-            current_dir_writable = check_directory_writable(current_dir)
-            print(f"当前工作目录: {current_dir}")
-            print(f"当前工作目录可写: {current_dir_writable}")
-            logging.info(f"当前工作目录可写: {current_dir_writable}")
-
-            if current_dir_writable:
-                print(f"将尝试保存配置到当前工作目录: {current_dir}")
-                logging.info(f"将尝试保存配置到当前工作目录: {current_dir}")
-            else:
-                print("警告: 当前工作目录也不可写，配置文件将无法保存！")
-                logging.warning("当前工作目录也不可写，配置文件将无法保存！")
+    # 确定配置文件位置（每个进程只确定一次，不再逐个目录写入测试文件）
+    apply_logging_config(load_config())
+    config_location = _config_file_path or CONFIG_FILE
+    config_writable = check_directory_writable(os.path.dirname(config_location))
+    logging.info(f"配置文件: {config_location}, 目录可写: {config_writable}")
 
-                # 尝试用户目录
-                try:
-                    user_home = os.path.expanduser("~")
-                    user_home_writable = check_directory_writable(user_home)
-                    print(f"用户主目录: {user_home}")
-                    print(f"用户主目录可写: {user_home_writable}")
-                    logging.info(f"用户主目录可写: {user_home_writable}")
-
-                    if user_home_writable:
-                        print(f"将尝试保存配置到用户主目录: {user_home}")
-                        logging.info(f"将尝试保存配置到用户主目录: {user_home}")
-                except Exception as e:
-                    print(f"检查用户主目录失败: {e}")
-                    logging.error(f"检查用户主目录失败: {e}")
-
-    print("=== 配置文件目录检查完成 ===\n")
-
-    # 创建GUI
+    # 创建GUI（启动时在后台线程中检查更新）
     create_gui()
 
-    # 启动时检查更新（在新线程中运行）
-    Thread(target=update_manager.check_updates_on_startup).start()
-
     # 处理完成时播放提示音
     import winsound
     winsound.MessageBeep()
@@ -0,0 +1,225 @@
+"""测试公用的本地发布服务器和配置隔离"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import BOMSwap  # noqa: E402
+
+
+class ReleaseServer:
+    """
+    本地替代的发布服务器：/api返回发布信息（支持ETag有条件请求），其他路径下载files中的文件（支持Range请求）
+    """
+    def __init__(self):
+        self.files = {}          # 路径 -> 文件内容
+        self.release = None      # /api返回的发布信息
+        self.etag = '"r1"'
+        self.no_range = set()    # 不支持Range请求的路径，总是返回200和完整内容
+        self.rate = 0            # 限速（字节/秒），0为不限速
+        self.requests = []       # 收到的请求：(路径, Range请求头)
+        self.not_modified = 0    # /api返回304的次数
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get('Range')))
+                if self.path == '/api':
+                    server.send_release(self)
+                elif self.path in server.files:
+                    server.send_file(self)
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def add_file(self, path, data):
+        """添加可下载的文件，返回下载链接"""
+        self.files[path] = data
+        return self.url(path)
+
+    def asset(self, path, digest=True):
+        """生成GitHub格式的资源信息"""
+        asset = {'name': path.lstrip('/'), 'browser_download_url': self.url(path), 'size': len(self.files[path])}
+        if digest:
+            asset['digest'] = 'sha256:' + hashlib.sha256(self.files[path]).hexdigest()
+        return asset
+
+    def send_release(self, handler):
+        if handler.headers.get('If-None-Match') == self.etag:
+            self.not_modified += 1
+            handler.send_response(304)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        body = json.dumps(self.release).encode('utf-8')
+        handler.send_response(200)
+        handler.send_header('ETag', self.etag)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def send_file(self, handler):
+        data = self.files[handler.path]
+        match = re.match(r'bytes=(\d+)-(\d*)', handler.headers.get('Range') or '')
+        if match and handler.path not in self.no_range:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            if start >= len(data):
+                handler.send_response(416)
+                handler.send_header('Content-Range', f'bytes */{len(data)}')
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+                return
+            body = data[start:end + 1]
+            handler.send_response(206)
+            handler.send_header('Content-Range', f'bytes {start}-{start + len(body) - 1}/{len(data)}')
+        else:
+            body = data
+            handler.send_response(200)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        try:
+            for pos in range(0, len(body), 64 * 1024):
+                piece = body[pos:pos + 64 * 1024]
+                handler.wfile.write(piece)
+                if self.rate:
+                    time.sleep(len(piece) / self.rate)
+        except OSError:
+            pass
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def release_server():
+    server = ReleaseServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def update_config(monkeypatch):
+    """用内存中的字典代替配置文件，检查更新和下载只读写这份配置"""
+    config = BOMSwap.get_builtin_default_config()
+    monkeypatch.setattr(BOMSwap, 'load_config', lambda: config)
+    monkeypatch.setattr(BOMSwap, 'update_config_values', config.update)
+    return config
+
+
+BOM_HEADER = ['Item', 'PN', 'Part', 'Reference', 'Quantity', 'Description', 'ManufacturerPN', 'Manufacturer']
+SUB_HEADER = ['PN', 'Part', 'Description', 'ManufacturerPN', 'Manufacturer', 'attribute']
+
+
+def write_workbook(path, header, rows, info_rows=()):
+    """写出测试用的Excel文件：项目信息行、表头行和数据行，返回文件路径"""
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in list(info_rows) + [header] + list(rows):
+        sheet.append(list(row))
+    workbook.save(path)
+    return str(path)
+
+
+def read_output(path, header_first='Item'):
+    """读取输出文件第一个工作表中表头行及之后的内容，返回(表头, 数据行列表)"""
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+    start = next(idx for idx, row in enumerate(rows) if row and row[0] == header_first)
+    return rows[start], rows[start + 1:]
+
+
+@pytest.fixture
+def run_engine(update_config, monkeypatch, tmp_path):
+    """
+    在当前进程中无界面运行process_files，返回输出文件路径列表
+
+    对话框和运行摘要被替换，配置使用内存中的默认配置，可按关键字参数覆盖。
+    """
+    messages = []
+    monkeypatch.setattr(BOMSwap, 'root', None)
+    monkeypatch.setattr(BOMSwap, '_worker_conn', None)
+    for name in ('showwarning', 'showerror', 'showinfo'):
+        monkeypatch.setattr(BOMSwap.tkinter.messagebox, name,
+                            lambda *args, _name=name, **kwargs: messages.append((_name, args)))
+    monkeypatch.setattr(BOMSwap, 'show_custom_error', lambda *args, **kwargs: messages.append(('custom', args)))
+    monkeypatch.setattr(BOMSwap, 'get_run_summary_path', lambda: str(tmp_path / 'runs.jsonl'))
+
+    def run(bom_path, sub_path, **overrides):
+        config = dict(update_config, **overrides)
+        output_files = BOMSwap.process_files(bom_path, sub_path, config=config)
+        assert output_files, messages
+        return output_files
+
+    run.messages = messages
+    return run
+
+
+def make_bom_tables(row_count, seed=1):
+    """
+    生成测试用的BOM和替代料表数据行
+
+    料号中有文本和数字两种，BOM中同一料号出现多次；替代组随机选取料号，部分料号属于多个替代组，
+    另有只在替代料表中出现的替代料。
+
+    Returns:
+        tuple: (BOM数据行, 替代料表数据行)
+    """
+    import random
+    rng = random.Random(seed)
+    pool = [f'P{idx:03d}' for idx in range(60)] + [100000 + idx for idx in range(20)]
+    sub_rows = []
+    for group in range(25):
+        members = rng.sample(pool, rng.randint(1, 3)) + [f'S{group:03d}']
+        for pn in members:
+            sub_rows.append([pn, f'Part{pn}', f'替代{pn}', f'M{pn}', f'F{group % 4}', f'attr{group}'])
+    bom_rows = []
+    for idx in range(row_count):
+        pn = rng.choice(pool)
+        refs = ','.join(f'R{idx}_{ref}' for ref in range(rng.randint(1, 3)))
+        bom_rows.append([str(idx + 1), pn, f'Part{pn}', refs, refs.count(',') + 1, f'描述{pn}', f'M{pn}', 'F'])
+    return bom_rows, sub_rows
+
+
+@pytest.fixture
+def generated_tables(tmp_path):
+    """生成的BOM和替代料表文件路径"""
+    bom_rows, sub_rows = make_bom_tables(600)
+    bom = write_workbook(tmp_path / 'bom.xlsx', BOM_HEADER, bom_rows, info_rows=[['项目', '测试板'], ['版本', 'A']])
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, sub_rows)
+    return bom, sub
+
+
+def run_to_rows(run_engine, bom, sub, **overrides):
+    """运行一次处理，返回主结果的(表头, 数据行)，输出文件改名保留，避免下一次运行覆盖"""
+    output = run_engine(bom, sub, **overrides)[0]
+    kept = str(output).replace('.xlsx', f'_{len(os.listdir(os.path.dirname(bom)))}.xlsx')
+    os.replace(output, kept)
+    return read_output(kept)
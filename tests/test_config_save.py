@@ -0,0 +1,66 @@
+"""延迟保存配置：并发修改时不会用较早的配置覆盖较新的保存"""
+import threading
+import time
+
+import pytest
+
+import BOMSwap
+
+
+@pytest.fixture
+def written(monkeypatch):
+    """记录写入配置文件的内容，不实际写文件"""
+    texts = []
+    monkeypatch.setattr(BOMSwap, 'write_config_text', lambda text: texts.append(text) or True)
+    monkeypatch.setattr(BOMSwap, 'CONFIG_SAVE_DELAY', 60)
+    monkeypatch.setattr(BOMSwap, '_config_cache', None)
+    yield texts
+    with BOMSwap._config_save_lock:
+        BOMSwap.cancel_config_save_timer()
+        BOMSwap._pending_config_text = None
+
+
+def test_pending_changes_are_merged(written):
+    BOMSwap.mark_config_dirty({'version': 1})
+    BOMSwap.mark_config_dirty({'version': 2})
+    assert written == []
+    assert BOMSwap.flush_config()
+    assert written == [BOMSwap.serialize_config({'version': 2})]
+    assert BOMSwap.flush_config() and len(written) == 1
+
+
+class YieldingLock:
+    """包装_config_save_lock：延迟保存的线程取得锁前先等待立即保存完成（最多timeout秒），放大两次加锁之间的间隙"""
+    def __init__(self, lock, marker_name, saved, timeout=0.5):
+        self.lock, self.marker_name, self.saved, self.timeout = lock, marker_name, saved, timeout
+
+    def __enter__(self):
+        if threading.current_thread().name == self.marker_name:
+            self.saved.wait(self.timeout)
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+def test_save_during_delayed_save_wins(written, monkeypatch):
+    """延迟保存修改配置时立即保存了新配置，之后写入文件的应是新配置"""
+    saved = threading.Event()
+    save_config = BOMSwap.save_config
+
+    def save_and_signal(config):
+        save_config(config)
+        saved.set()
+
+    monkeypatch.setattr(BOMSwap, '_config_save_lock', YieldingLock(BOMSwap._config_save_lock, 'marker', saved))
+    marker = threading.Thread(target=BOMSwap.mark_config_dirty, args=({'version': 1},), name='marker')
+    saver = threading.Thread(target=save_and_signal, args=({'version': 2},))
+    marker.start()
+    time.sleep(0.05)
+    saver.start()
+    marker.join(5)
+    saver.join(5)
+    BOMSwap.flush_config()
+
+    assert written[-1] == BOMSwap.serialize_config({'version': 2})
+    assert BOMSwap.load_config() == {'version': 2}
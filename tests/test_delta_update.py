@@ -0,0 +1,104 @@
+"""增量更新：生成和还原的往返一致性、旧版本校验，以及打包程序优先下载增量更新包"""
+import hashlib
+import json
+import os
+import random
+import sys
+import zlib
+
+import pytest
+
+import BOMSwap
+
+
+def make_versions():
+    """模拟打包的单文件程序：大量独立压缩的模块，新版本修改、插入少数模块"""
+    rng = random.Random(1)
+    modules = [zlib.compress(rng.randbytes(rng.randint(2000, 40000))) for _ in range(60)]
+    old = b'MZ' + rng.randbytes(50000) + b''.join(modules)
+    changed = list(modules)
+    changed[5] = zlib.compress(rng.randbytes(20000))
+    changed.insert(30, zlib.compress(rng.randbytes(8000)))
+    new = b'MZ' + rng.randbytes(1000) + old[1002:50002] + b''.join(changed)
+    return old, new
+
+
+@pytest.fixture
+def versions(tmp_path):
+    old, new = make_versions()
+    (tmp_path / 'old.exe').write_bytes(old)
+    (tmp_path / 'new.exe').write_bytes(new)
+    BOMSwap.create_binary_delta(str(tmp_path / 'old.exe'), str(tmp_path / 'new.exe'), str(tmp_path / 'up.delta'))
+    return tmp_path, old, new
+
+
+def test_round_trip(versions):
+    path, old, new = versions
+    assert os.path.getsize(path / 'up.delta') < len(new) / 4
+    digest = BOMSwap.apply_binary_delta(str(path / 'old.exe'), str(path / 'up.delta'), str(path / 'out.exe'))
+    assert digest == hashlib.sha256(new).hexdigest()
+    assert (path / 'out.exe').read_bytes() == new
+
+
+@pytest.mark.parametrize('old, new', [(b'', b'abc'), (b'abc', b''), (b'x' * 5000, b'x' * 9000),
+                                      (b'0123456789', b'9876543210')])
+def test_round_trip_small_files(tmp_path, old, new):
+    (tmp_path / 'a').write_bytes(old)
+    (tmp_path / 'b').write_bytes(new)
+    BOMSwap.create_binary_delta(str(tmp_path / 'a'), str(tmp_path / 'b'), str(tmp_path / 'ab.delta'))
+    BOMSwap.apply_binary_delta(str(tmp_path / 'a'), str(tmp_path / 'ab.delta'), str(tmp_path / 'c'))
+    assert (tmp_path / 'c').read_bytes() == new
+
+
+def test_wrong_base_is_rejected(versions):
+    path, _, _ = versions
+    with pytest.raises(ValueError):
+        BOMSwap.apply_binary_delta(str(path / 'new.exe'), str(path / 'up.delta'), str(path / 'out.exe'))
+    assert not os.path.exists(path / 'out.exe') and not os.path.exists(path / 'out.exe.tmp')
+
+
+def test_truncated_delta_is_rejected(versions):
+    path, _, _ = versions
+    data = (path / 'up.delta').read_bytes()
+    (path / 'up.delta').write_bytes(data[:len(data) // 2])
+    with pytest.raises(Exception):
+        BOMSwap.apply_binary_delta(str(path / 'old.exe'), str(path / 'up.delta'), str(path / 'out.exe'))
+    assert not os.path.exists(path / 'out.exe')
+
+
+@pytest.fixture
+def frozen_release(versions, release_server, update_config, monkeypatch):
+    """当前程序为打包的旧版本，发布了新版本程序和从当前版本到新版本的增量更新包"""
+    path, old, new = versions
+    delta_name = BOMSwap.get_delta_asset_name('2.5', '9.0')
+    release_server.add_file('/new.exe', new)
+    release_server.add_file('/' + delta_name, (path / 'up.delta').read_bytes())
+    release_server.release = {'tag_name': 'v9.0', 'body': '', 'zipball_url': '',
+                              'assets': [release_server.asset('/new.exe'), release_server.asset('/' + delta_name)]}
+    BOMSwap.fetch_latest_release(release_server.url('/api'))
+    monkeypatch.setattr(sys, 'frozen', True, raising=False)
+    monkeypatch.setattr(sys, 'executable', str(path / 'old.exe'))
+    release_server.requests.clear()
+    return release_server
+
+
+def test_fetch_update_prefers_delta(frozen_release, versions):
+    path, _, new = versions
+    dest = str(path / 'stage' / 'new.exe')
+    assert BOMSwap.fetch_update('2.5', '9.0', frozen_release.url('/new.exe'), True, dest)
+    assert open(dest, 'rb').read() == new
+    assert all(request[0] != '/new.exe' for request in frozen_release.requests)
+    with open(dest + '.json', encoding='utf-8') as f:
+        assert json.load(f)['verified']
+    assert BOMSwap.is_staged_update_ready(dest, frozen_release.url('/new.exe'))
+
+
+def test_fetch_update_falls_back_to_full_download(frozen_release, versions, monkeypatch):
+    """当前程序与增量更新包的旧版本不一致时下载完整程序"""
+    path, _, new = versions
+    monkeypatch.setattr(sys, 'executable', str(path / 'new.exe'))
+    dest = str(path / 'stage' / 'new.exe')
+    assert BOMSwap.fetch_update('2.5', '9.0', frozen_release.url('/new.exe'), True, dest)
+    assert open(dest, 'rb').read() == new
+    assert any(request[0] == '/new.exe' for request in frozen_release.requests)
+    assert not os.path.exists(dest + '.part.delta')
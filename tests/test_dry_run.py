@@ -0,0 +1,25 @@
+"""预览统计：运行处理引擎并记录统计，不写出结果文件"""
+import json
+
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, write_workbook
+
+
+def test_dry_run_writes_no_output(tmp_path, run_engine, update_config):
+    rows = [[str(idx), 'P1' if idx % 2 else f'X{idx}', 'R', f'R{idx}', 1, '电阻', 'M1', 'F1'] for idx in range(1, 9)]
+    bom = write_workbook(tmp_path / 'bom.xlsx', BOM_HEADER, rows)
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, [
+        ['P1', 'R', '电阻', 'M1', 'F1', 'g1'],
+        ['P2', 'R', '电阻', 'M2', 'F2', 'g1'],
+    ])
+
+    for sample_rows in (0, 3):
+        config = dict(update_config, dry_run_sample_rows=sample_rows)
+        assert BOMSwap.process_files(bom, sub, dry_run=True, config=config) == []
+    assert sorted(path.name for path in tmp_path.glob('*.xlsx')) == ['bom.xlsx', 'sub.xlsx']
+
+    summaries = [json.loads(line) for line in (tmp_path / 'runs.jsonl').read_text(encoding='utf-8').splitlines()]
+    assert [summary['dry_run'] for summary in summaries] == [True, True]
+    assert [summary['rows']['total'] for summary in summaries] == [8, 3]
+    assert summaries[0]['rows']['substitutes'] > 0
+    assert all(summary['outputs'] == [] for summary in summaries)
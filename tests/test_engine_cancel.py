@@ -0,0 +1,61 @@
+"""取消处理：并行和多工作表处理的子进程在行循环中检查取消标志，尚未开始的分区不再处理"""
+import threading
+import time
+
+import pytest
+
+import BOMSwap
+
+
+def slow_task(seconds):
+    """在子进程中模拟耗时的分区处理，期间像展开替代料一样定期检查取消标志"""
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        BOMSwap.check_cancelled()
+        time.sleep(0.01)
+    return seconds
+
+
+@pytest.fixture
+def parent_cancel(monkeypatch):
+    """本测试使用单独的取消标志，不影响其他测试"""
+    event = threading.Event()
+    monkeypatch.setattr(BOMSwap, 'cancel_event', event)
+    return event
+
+
+def test_pool_tasks_return_in_order(parent_cancel):
+    executor, pool_cancel_event = BOMSwap.create_engine_pool(2, [], {}, None)
+    done = []
+    with executor:
+        results = BOMSwap.run_pool_tasks(executor, pool_cancel_event, slow_task, [(0.3,), (0.1,), (0.2,)],
+                                         on_done=done.append)
+    assert results == [0.3, 0.1, 0.2]
+    assert sorted(done) == [0, 1, 2]
+
+
+def test_cancel_reaches_running_children(parent_cancel):
+    threading.Timer(0.5, parent_cancel.set).start()
+    start = time.monotonic()
+    executor, pool_cancel_event = BOMSwap.create_engine_pool(2, [], {}, None)
+    with pytest.raises(BOMSwap.ProcessingCancelled):
+        with executor:
+            BOMSwap.run_pool_tasks(executor, pool_cancel_event, slow_task, [(30,)] * 8)
+    # 正在执行的任务在下一个检查点停止，其余任务被丢弃，不会等到任务完成
+    assert time.monotonic() - start < 10
+    assert pool_cancel_event.is_set()
+
+
+def test_partition_worker_checks_pool_cancel_event(monkeypatch):
+    """子进程初始化后，展开替代料的行循环检查父进程设置的取消标志"""
+    monkeypatch.setattr(BOMSwap, 'cancel_event', threading.Event())
+    monkeypatch.setattr(BOMSwap, '_partition_context', None)
+    pool_cancel_event = threading.Event()
+    pool_cancel_event.set()
+    cols = BOMSwap.get_engine_columns(BOMSwap.get_builtin_default_config()['bom_header_mapping'],
+                                      BOMSwap.get_builtin_default_config()['sub_header_mapping'])
+    BOMSwap.init_partition_worker([], {}, cols, pool_cancel_event=pool_cancel_event)
+    rows = [(seq, {cols['item']: str(seq + 1), cols['pn']: f'P{seq}', cols['reference']: f'R{seq}'})
+            for seq in range(BOMSwap.CANCEL_CHECK_ROWS * 2)]
+    with pytest.raises(BOMSwap.ProcessingCancelled):
+        BOMSwap.process_bom_partition(rows)
@@ -0,0 +1,78 @@
+"""表头配置方案：一次扫描中为各方案打分，自动选择匹配的方案"""
+import openpyxl
+
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, read_output, write_workbook
+
+PLM_MAPPING = {'item': '序号', 'pn': '物料编码', 'part': '型号', 'reference': '位号', 'quantity': '数量',
+               'description': '描述', 'mfr_pn': '厂家型号', 'manufacturer': '厂家'}
+PLM_HEADER = [PLM_MAPPING[key] for key in
+              ('item', 'pn', 'part', 'reference', 'quantity', 'description', 'mfr_pn', 'manufacturer')]
+
+
+def sheet_rows(*rows):
+    sheet = openpyxl.Workbook().active
+    for row in rows:
+        sheet.append(list(row))
+    return sheet.iter_rows()
+
+
+def candidates(config=None):
+    config = config or BOMSwap.get_builtin_default_config()
+    config['header_profiles'] = {'PLM': {'bom_header_mapping': PLM_MAPPING}}
+    return BOMSwap.get_header_profile_candidates(config)
+
+
+def test_detects_header_after_project_rows():
+    row_idx, header, info_rows, name = BOMSwap.detect_bom_header(
+        sheet_rows(['项目', '主板'], ['版本', 'A'], [' item ', 'PN', 'PART', 'Reference', 'Quantity']), candidates())
+    assert (row_idx, name) == (3, '')
+    assert header[0] == ' item ' and len(info_rows) == 2
+
+
+def test_selects_best_matching_profile():
+    row_idx, _, _, name = BOMSwap.detect_bom_header(sheet_rows(['项目', '主板'], PLM_HEADER), candidates())
+    assert (row_idx, name) == (2, 'PLM')
+
+
+def test_tie_prefers_current_config():
+    # 两个方案都只匹配一半必需列时使用排在前面的当前配置
+    row = BOM_HEADER[:4] + PLM_HEADER[:4]
+    assert BOMSwap.detect_bom_header(sheet_rows(row), candidates())[3] == ''
+
+
+def test_no_header_found():
+    assert BOMSwap.detect_bom_header(sheet_rows(['a', 'b'], ['Item', 'PN']), candidates()) == (None, [], [], None)
+
+
+def test_candidates_respect_auto_select_and_skip_incomplete():
+    config = BOMSwap.get_builtin_default_config()
+    config['header_profiles'] = {'PLM': {'bom_header_mapping': PLM_MAPPING}, '坏方案': {'bom_header_mapping': {}}}
+    assert list(BOMSwap.get_header_profile_candidates(config)) == ['', 'PLM']
+    config['auto_select_profile'] = False
+    assert list(BOMSwap.get_header_profile_candidates(config)) == ['']
+
+
+def test_apply_header_profile_keeps_missing_fields():
+    config = BOMSwap.freeze_config(BOMSwap.get_builtin_default_config())
+    applied = BOMSwap.apply_header_profile(config, {'bom_header_mapping': {'pn': '物料编码'}, 'highlight_color': '00FF00'})
+    assert applied['bom_header_mapping']['pn'] == '物料编码'
+    assert applied['bom_header_mapping']['item'] == 'Item'
+    assert applied['highlight_color'] == '00FF00'
+
+
+def test_process_files_uses_matching_profile(tmp_path, run_engine):
+    bom = write_workbook(tmp_path / 'bom.xlsx', PLM_HEADER, [
+        ['1', 'P1', 'R', 'R1', 1, '电阻', 'M1', 'F1'],
+        ['2', 'P1', 'R', 'R2', 1, '电阻', 'M1', 'F1'],
+    ], info_rows=[['项目', '主板']])
+    sub = write_workbook(tmp_path / 'sub.xlsx', ['物料编码'] + SUB_HEADER[1:], [
+        ['P1', 'R', '电阻', 'M1', 'F1', 'g1'],
+        ['P2', 'R', '电阻', 'M2', 'F2', 'g1'],
+    ])
+    # 替代料分组按BOM料号列名读取替代料表，方案需同时给出替代料表映射
+    sub_mapping = dict(BOMSwap.get_builtin_default_config()['sub_header_mapping'], pn='物料编码')
+    profiles = {'PLM': {'bom_header_mapping': PLM_MAPPING, 'sub_header_mapping': sub_mapping}}
+    columns, rows = read_output(run_engine(bom, sub, header_profiles=profiles)[0], header_first='序号')
+    assert [row[columns.index('物料编码')] for row in rows] == ['P1', 'P2']
+    assert rows[0][columns.index('位号')] in ('R1,R2', 'R2,R1')
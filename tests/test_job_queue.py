@@ -0,0 +1,136 @@
+"""批量处理队列：按顺序处理、单个任务失败不影响其他任务，任务事件记录到任务中，取消请求在任务之间保持有效"""
+import queue
+import threading
+
+import pytest
+
+import BOMSwap
+
+
+@pytest.fixture
+def gui_events(monkeypatch):
+    """模拟已创建主窗口，返回界面事件队列"""
+    events = queue.Queue()
+    monkeypatch.setattr(BOMSwap, 'root', object())
+    monkeypatch.setattr(BOMSwap, 'gui_event_queue', events)
+    BOMSwap.cancel_event.clear()
+    yield events
+    BOMSwap.cancel_event.clear()
+
+
+def drain(events):
+    items = []
+    while not events.empty():
+        items.append(events.get())
+    return items
+
+
+def test_in_process_job_events_go_to_job(gui_events, monkeypatch):
+    def fake_process_files(bom_path, sub_path, dry_run=False, config=None):
+        BOMSwap.update_progress(40)
+        BOMSwap.update_status('正在处理...')
+        BOMSwap.update_progress_detail('读取BOM')
+        BOMSwap.notify_warning('警告', '未找到表头')
+        BOMSwap.notify_warning('警告', '未找到变体列')
+        BOMSwap.flush_gui_warnings()
+        BOMSwap.notify_error('保存失败', '文件被占用', custom=True)
+        return None
+
+    monkeypatch.setattr(BOMSwap, 'process_files', fake_process_files)
+    job = BOMSwap.new_queue_job('a.xlsx')
+    BOMSwap.run_queue_job(job, None, 'sub.xlsx', {})
+
+    assert job['progress'] == 40
+    assert job['warnings'] == 2
+    assert job['message'] == '文件被占用'
+    assert job['status'] == '失败'
+    # 主界面只收到任务行的刷新
+    assert {kind for kind, _ in drain(gui_events)} == {'queue_job'}
+    assert getattr(BOMSwap._event_sink, 'handler', None) is None
+
+
+def test_events_outside_job_thread_reach_main_window(gui_events, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def fake_process_files(bom_path, sub_path, dry_run=False, config=None):
+        started.set()
+        release.wait(5)
+        return ['out.xlsx']
+
+    monkeypatch.setattr(BOMSwap, 'process_files', fake_process_files)
+    job = BOMSwap.new_queue_job('a.xlsx')
+    thread = threading.Thread(target=BOMSwap.run_queue_job, args=(job, None, 'sub.xlsx', {}))
+    thread.start()
+    started.wait(5)
+    BOMSwap.update_status('其他线程的消息')
+    release.set()
+    thread.join(5)
+    assert 'status' in {kind for kind, _ in drain(gui_events)}
+    assert job['status'] == '完成'
+
+
+def test_worker_job_keeps_pending_cancel(monkeypatch):
+    """取消请求在下一个任务开始前到达时，该任务不会清除取消标志"""
+    worker = BOMSwap.EngineWorker()
+    worker.cancel_event = threading.Event()
+    monkeypatch.setattr(worker, 'start', lambda: None)
+    monkeypatch.setattr(worker, 'request', lambda message, event_handler=None: worker.cancel_event.is_set())
+    worker.cancel()
+    assert worker.run_job('a.xlsx', 'sub.xlsx', {}) is True
+    worker.reset_cancel()
+    assert worker.run_job('a.xlsx', 'sub.xlsx', {}) is False
+
+
+@pytest.fixture
+def job_queue(gui_events, update_config, monkeypatch):
+    """在当前进程中处理的批量队列，替代料表已选择"""
+    update_config['use_worker_process'] = False
+    jobs = []
+    monkeypatch.setattr(BOMSwap, 'job_queue', jobs)
+    monkeypatch.setattr(BOMSwap, 'sub_var', type('Var', (), {'get': lambda self: 'sub.xlsx'})(), raising=False)
+    return jobs
+
+
+def run_queue(jobs):
+    BOMSwap.start_job_queue()
+    # 批量处理在后台线程中进行，结束时释放processing_lock
+    for _ in range(500):
+        if not BOMSwap.processing_lock.locked():
+            break
+        threading.Event().wait(0.01)
+    assert not BOMSwap.processing_lock.locked()
+    return {job['bom_path']: job for job in jobs}
+
+
+def test_queue_runs_in_order_and_isolates_failures(job_queue, monkeypatch):
+    calls = []
+
+    def fake_process_files(bom_path, sub_path, dry_run=False, config=None):
+        calls.append(bom_path)
+        if bom_path == 'b.xlsx':
+            raise ValueError('表头不匹配')
+        if bom_path == 'c.xlsx':
+            BOMSwap.notify_error('错误', '缺少必需列：PN')
+            return None
+        return [bom_path.replace('.xlsx', '_替代料.xlsx')]
+
+    monkeypatch.setattr(BOMSwap, 'process_files', fake_process_files)
+    job_queue.extend(BOMSwap.new_queue_job(path) for path in ('a.xlsx', 'b.xlsx', 'c.xlsx', 'd.xlsx'))
+    jobs = run_queue(job_queue)
+
+    assert calls == ['a.xlsx', 'b.xlsx', 'c.xlsx', 'd.xlsx']
+    assert [jobs[path]['status'] for path in calls] == ['完成', '失败', '失败', '完成']
+    assert jobs['b.xlsx']['message'].endswith('表头不匹配')
+    assert jobs['c.xlsx']['message'] == '缺少必需列：PN'
+    assert jobs['d.xlsx']['output_files'] == ['d_替代料.xlsx']
+
+
+def test_cancel_skips_remaining_jobs(job_queue, monkeypatch):
+    def fake_process_files(bom_path, sub_path, dry_run=False, config=None):
+        BOMSwap.cancel_event.set()
+        return None
+
+    monkeypatch.setattr(BOMSwap, 'process_files', fake_process_files)
+    job_queue.extend(BOMSwap.new_queue_job(path) for path in ('a.xlsx', 'b.xlsx', 'c.xlsx'))
+    jobs = run_queue(job_queue)
+    assert [job['status'] for job in jobs.values()] == ['已取消', '已取消', '已取消']
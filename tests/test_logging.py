@@ -0,0 +1,43 @@
+"""日志：处理进程池的子进程把日志放入界面进程的日志队列，使用配置的日志级别"""
+import logging
+import multiprocessing
+import queue
+
+import pytest
+
+import BOMSwap
+
+
+def log_in_child(message):
+    logging.debug(message)
+    logging.warning(message)
+    return multiprocessing.current_process().name
+
+
+@pytest.fixture
+def log_queue(monkeypatch):
+    """模拟界面进程的日志队列，日志级别为DEBUG"""
+    records = multiprocessing.get_context('spawn').Queue(-1)
+    monkeypatch.setattr(BOMSwap, '_log_queue', records)
+    root_logger = logging.getLogger()
+    level = root_logger.level
+    root_logger.setLevel(logging.DEBUG)
+    yield records
+    root_logger.setLevel(level)
+
+
+def test_pool_children_log_to_queue(log_queue):
+    executor, pool_cancel_event = BOMSwap.create_engine_pool(1, [], {}, None)
+    with executor:
+        child_name, = BOMSwap.run_pool_tasks(executor, pool_cancel_event, log_in_child, [('子进程日志',)])
+
+    received = []
+    while len(received) < 2:
+        try:
+            record = log_queue.get(timeout=5)
+        except queue.Empty:
+            break
+        if record.getMessage() == '子进程日志':
+            received.append(record)
+    assert [record.levelname for record in received] == ['DEBUG', 'WARNING']
+    assert all(record.processName == child_name for record in received)
@@ -0,0 +1,51 @@
+"""数字料号：BOM和替代料表中以数字保存的料号按字符串读取，能匹配替代组并合并；列裁剪只保留映射列和保留列"""
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, read_output, write_workbook
+
+
+def column(columns, rows, name):
+    return [row[columns.index(name)] for row in rows]
+
+
+def test_numeric_part_numbers_match_and_merge(tmp_path, run_engine):
+    bom = write_workbook(tmp_path / 'bom.xlsx', BOM_HEADER, [
+        [1, 100200, 'R', 'R1', 1, '电阻', 'M1', 'F1'],
+        [2, '00123', 'C', 'C1', 1, '电容', 'M2', 'F2'],
+        [3, 100200, 'R', 'R2,R3', 2, '电阻', 'M1', 'F1'],
+    ])
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, [
+        [100200, 'R', '电阻', 'M1', 'F1', 'g1'],
+        [100201, 'R', '电阻', 'M9', 'F9', 'g1'],
+    ])
+    columns, rows = read_output(run_engine(bom, sub)[0])
+
+    pns = column(columns, rows, 'PN')
+    # 两行100200合并为一行，并插入替代料100201；文本料号的前导零保留
+    assert pns.count('100200') == 1 and '100201' in pns and '00123' in pns
+    merged = rows[pns.index('100200')]
+    assert sorted(merged[columns.index('Reference')].split(',')) == ['R1', 'R2', 'R3']
+    assert int(merged[columns.index('Quantity')]) == 3
+    assert rows[pns.index('100201')][columns.index('操作类型')] == '替代插入'
+
+
+def test_prune_columns_keeps_mapped_and_passthrough(tmp_path, run_engine):
+    header = BOM_HEADER + ['Note', 'Extra']
+    bom = write_workbook(tmp_path / 'bom.xlsx', header, [
+        [1, 'P1', 'R', 'R1', 1, '电阻', 'M1', 'F1', '备注', '多余'],
+    ])
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, [
+        ['P1', 'R', '电阻', 'M1', 'F1', 'g1'],
+        ['P2', 'R', '电阻', 'M2', 'F2', 'g1'],
+    ])
+    columns, _ = read_output(run_engine(bom, sub, prune_columns=True, passthrough_columns=['note'])[0])
+    assert 'Note' in columns and 'Extra' not in columns
+
+    columns, _ = read_output(run_engine(bom, sub)[0])
+    assert 'Note' in columns and 'Extra' in columns
+
+
+def test_resolve_read_columns_uses_raw_header_values():
+    usecols, dtype = BOMSwap.resolve_read_columns(['Item', ' pn ', 'Qty', None], ['PN', 'Item'], ['pn'], True)
+    assert dtype == {' pn ': str}
+    assert usecols('Item') and usecols(' pn ') and not usecols('Qty')
+    assert BOMSwap.resolve_read_columns(['Item'], ['Item'], [], False)[0] is None
@@ -0,0 +1,61 @@
+"""并行处理：按料号分区并行的结果与单进程处理完全一致"""
+import copy
+import re
+
+import pandas as pd
+import pytest
+
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, make_bom_tables, run_to_rows
+
+COLS = BOMSwap.get_engine_columns(BOMSwap.get_builtin_default_config()['bom_header_mapping'],
+                                  BOMSwap.get_builtin_default_config()['sub_header_mapping'])
+
+
+@pytest.fixture
+def engine_input():
+    """按process_bom_sheet读取后的形式准备BOM行和替代料索引（料号按字符串读取）"""
+    bom_rows, sub_rows = make_bom_tables(600)
+    rows = [dict(zip(BOM_HEADER, [str(value) if idx < 4 else value for idx, value in enumerate(row)]))
+            for row in bom_rows]
+    sub_df = pd.DataFrame([[str(row[0])] + row[1:] for row in sub_rows], columns=SUB_HEADER)
+    valid_groups, pn_index = BOMSwap.build_substitute_index(sub_df, 'PN', 'attribute')
+    return rows, valid_groups, pn_index
+
+
+def test_chained_groups_share_partition_key(engine_input):
+    _, valid_groups, _ = engine_input
+    keys = BOMSwap.build_partition_keys(valid_groups, 'PN')
+    for group in valid_groups:
+        assert len({keys[row['PN']] for row in group}) == 1
+    # 生成的替代组确有相互连接的，且分区键不止一个
+    assert len(set(keys.values())) < len(valid_groups)
+    assert len(set(keys.values())) > 1
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_matches_serial(engine_input, workers):
+    rows, valid_groups, pn_index = engine_input
+    expected = BOMSwap.process_bom_rows(copy.deepcopy(rows), valid_groups, pn_index, COLS)
+    result = BOMSwap.process_bom_parallel(copy.deepcopy(rows), valid_groups, pn_index, COLS, workers)
+
+    expected_rows, expected_columns, expected_stats, expected_merged, expected_total = expected
+    result_rows, result_columns, result_stats, result_merged, result_total = result
+    assert result_columns == expected_columns
+    assert [[row.get(col) for col in expected_columns] for row in result_rows] == \
+           [[row.get(col) for col in expected_columns] for row in expected_rows]
+    assert dict(result_stats) == dict(expected_stats)
+    assert result_merged == expected_merged
+    assert result_total == expected_total
+
+
+def test_parallel_workbook_matches_serial(generated_tables, run_engine, monkeypatch, caplog):
+    """通过process_files比较两个进程和单进程的输出文件"""
+    monkeypatch.setattr(BOMSwap, 'PARALLEL_MIN_ROWS', 100)
+    bom, sub = generated_tables
+    expected = run_to_rows(run_engine, bom, sub)
+    with caplog.at_level('INFO'):
+        parallel = run_to_rows(run_engine, bom, sub, parallel_workers=2)
+    assert parallel == expected
+    counts = [re.search(r'分为 (\d+) 个分区', record.getMessage()) for record in caplog.records]
+    assert next(int(match.group(1)) for match in counts if match) > 2
@@ -0,0 +1,56 @@
+"""多工作表模式：每个包含BOM表头的工作表在子进程中分别处理，输出保持工作表顺序"""
+import openpyxl
+
+from conftest import BOM_HEADER, SUB_HEADER, write_workbook
+
+SUB_ROWS = [
+    ['P1', 'R', '电阻', 'M1', 'F1', 'g1'],
+    ['P2', 'R', '电阻', 'M2', 'F2', 'g1'],
+]
+
+
+def write_sheets(path):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = '主板'
+    workbook.active.append(BOM_HEADER)
+    workbook.active.append(['1', 'P1', 'R', 'R1', 1, '电阻', 'M1', 'F1'])
+    workbook.active.append(['2', 'P1', 'R', 'R2', 1, '电阻', 'M1', 'F1'])
+    notes = workbook.create_sheet('说明')
+    notes.append(['本工作表没有BOM表头'])
+    power = workbook.create_sheet('电源板')
+    power.append(['项目', '电源板'])
+    power.append(BOM_HEADER)
+    power.append(['1', 'P3', 'C', 'C1', 1, '电容', 'M3', 'F3'])
+    workbook.save(path)
+    return str(path)
+
+
+def read_sheets(path):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def test_process_all_sheets(tmp_path, run_engine):
+    bom = write_sheets(tmp_path / 'bom.xlsx')
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    sheets = read_sheets(run_engine(bom, sub, process_all_sheets=True)[0])
+
+    assert list(sheets)[:2] == ['主板', '电源板']
+    main_pns = [row[1] for row in sheets['主板'][1:]]
+    assert main_pns == ['P1', 'P2']
+    assert sheets['主板'][1][3] in ('R1,R2', 'R2,R1')
+    assert sheets['电源板'][0][:2] == ['项目', '电源板']
+    assert [row[1] for row in sheets['电源板'][2:]] == ['P3']
+
+
+def test_single_sheet_by_default(tmp_path, run_engine):
+    bom = write_sheets(tmp_path / 'bom.xlsx')
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    sheets = read_sheets(run_engine(bom, sub)[0])
+    # 只处理活动工作表，输出为BOM工作表，其余工作表原样保留
+    assert list(sheets) == ['BOM', '说明', '电源板']
+    assert [row[1] for row in sheets['BOM'][1:]] == ['P1', 'P2']
+    assert [row[1] for row in sheets['电源板'][2:]] == ['P3']
@@ -0,0 +1,27 @@
+"""阶段耗时：依赖模块的导入单独统计"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_engine_modules_are_lazy_until_preloaded():
+    """启动时不导入pandas、openpyxl，preload_modules之后都已导入"""
+    script = (
+        "import sys, BOMSwap\n"
+        "assert not BOMSwap.engine_modules_loaded()\n"
+        "assert 'pandas' not in sys.modules\n"
+        "BOMSwap.preload_modules()\n"
+        "assert BOMSwap.engine_modules_loaded()\n"
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True, timeout=120)
+
+
+def test_format_stage_timings_shares_and_rows():
+    import BOMSwap
+    lines = BOMSwap.format_stage_timings([
+        {'stage': '加载依赖', 'seconds': 0.5, 'rows': 0, 'unit': '行'},
+        {'stage': '读取BOM', 'seconds': 1.5, 'rows': 300, 'unit': '行'},
+    ], 2.0)
+    assert lines == ['• 加载依赖: 0.500秒（25%）', '• 读取BOM: 1.500秒（75%），300行']
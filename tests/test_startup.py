@@ -0,0 +1,38 @@
+"""启动耗时：导入本模块不加载处理和网络模块，--startup-benchmark输出可比较的耗时"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def program_dir(tmp_path):
+    """复制程序到临时目录运行，配置文件和日志写在临时目录中"""
+    shutil.copy(os.path.join(ROOT, 'BOMSwap.py'), tmp_path)
+    return tmp_path
+
+
+def test_import_does_not_load_heavy_modules(program_dir):
+    script = (
+        "import sys, BOMSwap\n"
+        "loaded = [name for name in ('pandas', 'openpyxl', 'requests', 'numpy') if name in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=program_dir, check=True, timeout=60)
+
+
+@pytest.mark.skipif(sys.platform != 'win32' and not os.environ.get('DISPLAY'), reason='需要图形界面')
+def test_startup_benchmark_reports_timings(program_dir):
+    result = subprocess.run([sys.executable, 'BOMSwap.py', '--startup-benchmark'], cwd=program_dir,
+                            capture_output=True, text=True, encoding='utf-8', timeout=60,
+                            env={**os.environ, 'PYTHONIOENCODING': 'utf-8'})
+    assert result.returncode == 0, result.stderr
+    module_time = float(re.search(r'模块加载: ([\d.]+)秒', result.stdout).group(1))
+    window_time = float(re.search(r'主窗口显示: ([\d.]+)秒', result.stdout).group(1))
+    assert 0 <= module_time <= window_time
+    assert 'pandas=False, openpyxl=False, requests=False' in result.stdout
@@ -0,0 +1,81 @@
+"""替代料表缓存：文件未修改时复用数据和索引，修改时间变化后重新读取"""
+import os
+
+import pytest
+
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, read_output, write_workbook
+
+SUB_ROWS = [['P1', 'R', '电阻', 'M1', 'F1', 'g1'], ['P2', 'R', '电阻', 'M2', 'F2', 'g1']]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(BOMSwap, '_substitute_table_cache', {})
+    monkeypatch.setattr(BOMSwap, '_substitute_index_cache', {})
+
+
+def touch_later(path, seconds=10):
+    """把文件修改时间往后调整，模拟文件被再次保存"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def load(path):
+    sub_df, key = BOMSwap.load_substitute_table(path, None, {'PN': str})
+    return sub_df, key, BOMSwap.get_substitute_index(sub_df, key, 'PN', 'attribute')
+
+
+def test_unchanged_file_reuses_table_and_index(tmp_path):
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    first_df, first_key, first_index = load(sub)
+    second_df, second_key, second_index = load(sub)
+    assert second_df is first_df and second_key == first_key and second_index is first_index
+
+
+def test_mtime_change_reloads_table_and_index(tmp_path):
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    first_df, first_key, first_index = load(sub)
+
+    # 内容和大小不变，只有修改时间变化，也重新读取
+    touch_later(sub)
+    second_df, second_key, second_index = load(sub)
+    assert second_df is not first_df and second_key != first_key and second_index is not first_index
+
+    write_workbook(sub, SUB_HEADER, SUB_ROWS + [['P3', 'R', '电阻', 'M3', 'F3', 'g1']])
+    touch_later(sub, 20)
+    third_df, _, (valid_groups, pn_index) = load(sub)
+    assert len(third_df) == 3 and 'P3' in pn_index
+
+
+def test_modified_table_changes_next_result(tmp_path, run_engine):
+    bom = write_workbook(tmp_path / 'bom.xlsx', BOM_HEADER, [['1', 'P1', 'R', 'R1', 1, '电阻', 'M1', 'F1']])
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    columns, rows = read_output(run_engine(bom, sub)[0])
+    assert [row[columns.index('PN')] for row in rows] == ['P1', 'P2']
+
+    write_workbook(sub, SUB_HEADER, SUB_ROWS + [['P3', 'R', '电阻', 'M3', 'F3', 'g1']])
+    touch_later(sub)
+    columns, rows = read_output(run_engine(bom, sub)[0])
+    assert [row[columns.index('PN')] for row in rows] == ['P1', 'P2', 'P3']
+
+
+def test_watch_reloads_only_after_change(tmp_path, monkeypatch):
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, SUB_ROWS)
+    reloads = []
+
+    def fake_reload(path):
+        BOMSwap._watched_sub_signature = BOMSwap.get_file_signature(path)
+        reloads.append(path)
+
+    monkeypatch.setattr(BOMSwap, 'sub_var', type('Var', (), {'get': lambda self: sub})(), raising=False)
+    monkeypatch.setattr(BOMSwap, 'root', None)
+    monkeypatch.setattr(BOMSwap, '_watched_sub_signature', None)
+    monkeypatch.setattr(BOMSwap, 'reload_substitute_table', fake_reload)
+
+    BOMSwap.watch_substitute_table()
+    BOMSwap.watch_substitute_table()
+    assert reloads == [sub]
+    touch_later(sub)
+    BOMSwap.watch_substitute_table()
+    assert reloads == [sub, sub]
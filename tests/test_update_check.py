@@ -0,0 +1,78 @@
+"""检查更新：ETag有条件请求、检查间隔和失败后的指数退避"""
+import socket
+import time
+
+import pytest
+
+import BOMSwap
+
+
+@pytest.fixture
+def release(release_server, update_config):
+    release_server.add_file('/BOMSwap.exe', b'new version')
+    release_server.release = {'tag_name': 'v9.0', 'body': '修复问题', 'zipball_url': '',
+                              'assets': [release_server.asset('/BOMSwap.exe')]}
+    return release_server
+
+
+def unused_url():
+    """一个没有服务监听的地址，连接立即被拒绝"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/api'
+
+
+def test_release_is_cached_with_etag(release, update_config):
+    result = BOMSwap.check_for_updates('2.5', release.url('/api'))
+    assert result[:2] == (True, '9.0') and result[2] == release.url('/BOMSwap.exe')
+    assert update_config['update_cache']['etag'] == release.etag
+    assert release.not_modified == 0
+
+    # 发布信息未变化时服务器返回304，结果来自缓存
+    release.release = None
+    assert BOMSwap.check_for_updates('2.5', release.url('/api')) == result
+    assert release.not_modified == 1
+
+
+def test_changed_release_replaces_cache(release, update_config):
+    BOMSwap.check_for_updates('2.5', release.url('/api'))
+    release.etag = '"r2"'
+    release.release = dict(release.release, tag_name='v9.1')
+    assert BOMSwap.check_for_updates('2.5', release.url('/api'))[1] == '9.1'
+    assert update_config['update_cache']['etag'] == '"r2"'
+
+
+def test_check_interval(update_config):
+    now = time.time()
+    update_config['last_update_check'] = now - 60
+    assert not BOMSwap.is_update_check_due(update_config, now)
+    update_config['last_update_check'] = now - BOMSwap.UPDATE_CHECK_INTERVAL * 24 * 60 * 60
+    assert BOMSwap.is_update_check_due(update_config, now)
+
+
+def test_failures_back_off_exponentially(release, update_config):
+    url = unused_url()
+    has_update, _, _, message, _ = BOMSwap.check_for_updates('2.5', url)
+    assert not has_update and message.startswith('检查更新失败')
+    cache = update_config['update_cache']
+    assert cache['failures'] == 1
+    assert cache['retry_after'] == pytest.approx(time.time() + BOMSwap.UPDATE_RETRY_BASE, abs=5)
+    assert not BOMSwap.is_update_check_due(update_config)
+    assert BOMSwap.is_update_check_due(update_config, cache['retry_after'])
+
+    BOMSwap.check_for_updates('2.5', url)
+    cache = update_config['update_cache']
+    assert cache['failures'] == 2
+    assert cache['retry_after'] == pytest.approx(time.time() + 2 * BOMSwap.UPDATE_RETRY_BASE, abs=5)
+
+    # 成功后清除失败记录
+    assert BOMSwap.check_for_updates('2.5', release.url('/api'))[0]
+    assert 'failures' not in update_config['update_cache']
+    assert BOMSwap.is_update_check_due(update_config) is False
+
+
+def test_backoff_is_capped_at_check_interval(update_config):
+    BOMSwap.record_update_check_failure({'failures': 30})
+    cap = BOMSwap.UPDATE_CHECK_INTERVAL * 24 * 60 * 60
+    assert update_config['update_cache']['retry_after'] == pytest.approx(time.time() + cap, abs=5)
@@ -0,0 +1,99 @@
+"""更新下载：分段并行下载、断点续传和SHA-256校验"""
+import hashlib
+import os
+
+import BOMSwap
+
+DATA = bytes(range(256)) * (5 * 4096 + 7)  # 超过2个分段的最小大小，服务器支持Range时分段下载
+SMALL = bytes(range(256)) * 1024           # 小文件单连接下载
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_segmented_download(release_server, tmp_path):
+    url = release_server.add_file('/app.exe', DATA)
+    dest = str(tmp_path / 'app.exe')
+    assert BOMSwap.download_with_resume(url, dest, expected_sha256=sha256(DATA))
+    assert read(dest) == DATA
+    assert not os.path.exists(dest + '.download')
+    ranged = [header for path, header in release_server.requests if header and header != 'bytes=0-0']
+    assert len(ranged) == BOMSwap.DOWNLOAD_SEGMENTS
+
+
+def test_sequential_download_without_range_support(release_server, tmp_path):
+    url = release_server.add_file('/app.exe', DATA)
+    release_server.no_range.add('/app.exe')
+    dest = str(tmp_path / 'app.exe')
+    assert BOMSwap.download_with_resume(url, dest, expected_sha256=sha256(DATA))
+    assert read(dest) == DATA
+
+
+def test_digest_mismatch_deletes_file(release_server, tmp_path):
+    url = release_server.add_file('/app.exe', DATA)
+    dest = str(tmp_path / 'app.exe')
+    assert not BOMSwap.download_with_resume(url, dest, expected_sha256='0' * 64)
+    assert not os.path.exists(dest)
+
+
+def test_resume_segmented_download(release_server, tmp_path):
+    """上次各分段只下载了一半：只请求剩余的部分，完成后校验通过"""
+    url = release_server.add_file('/app.exe', DATA)
+    dest = str(tmp_path / 'app.exe')
+    segments, _ = BOMSwap.plan_download_segments(len(DATA), dest + '.download', url)
+    with open(dest, 'wb') as f:
+        f.truncate(len(DATA))
+        for segment in segments:
+            segment.done = (segment.end - segment.start) // 2
+            f.seek(segment.start)
+            f.write(DATA[segment.start:segment.start + segment.done])
+    BOMSwap.save_download_state(dest + '.download', url, len(DATA), segments)
+
+    assert BOMSwap.download_with_resume(url, dest, expected_sha256=sha256(DATA))
+    assert read(dest) == DATA
+    expected = {f'bytes={segment.start + segment.done}-{segment.end - 1}' for segment in segments}
+    ranged = {header for path, header in release_server.requests if header and header != 'bytes=0-0'}
+    assert ranged == expected
+
+
+def test_resume_sequential_download(release_server, tmp_path):
+    url = release_server.add_file('/small.bin', SMALL)
+    dest = str(tmp_path / 'small.bin')
+    with open(dest, 'wb') as f:
+        f.write(SMALL[:1000])
+    assert BOMSwap.download_with_resume(url, dest, expected_sha256=sha256(SMALL))
+    assert read(dest) == SMALL
+    assert ('/small.bin', 'bytes=1000-') in release_server.requests
+
+
+def test_fallback_from_segmented_restarts_from_zero(release_server, tmp_path):
+    """分段下载中断后服务器不再支持Range：预先扩展为完整大小的文件不能当作已下载，从头下载"""
+    url = release_server.add_file('/app.exe', DATA)
+    dest = str(tmp_path / 'app.exe')
+    segments, _ = BOMSwap.plan_download_segments(len(DATA), dest + '.download', url)
+    with open(dest, 'wb') as f:
+        f.truncate(len(DATA))
+        f.write(DATA[:1000])
+    segments[0].done = 1000
+    BOMSwap.save_download_state(dest + '.download', url, len(DATA), segments)
+
+    release_server.no_range.add('/app.exe')
+    assert BOMSwap.download_with_resume(url, dest)  # 没有发布校验和，只能依靠下载本身正确
+    assert read(dest) == DATA
+    assert not os.path.exists(dest + '.download')
+
+
+def test_range_not_satisfiable_with_wrong_size_restarts(release_server, tmp_path):
+    """已有文件比服务器上的文件大（如旧版本残留），不能因为416就认为已下载完成"""
+    url = release_server.add_file('/small.bin', SMALL)
+    dest = str(tmp_path / 'small.bin')
+    with open(dest, 'wb') as f:
+        f.write(b'\0' * (len(SMALL) + 10))
+    assert BOMSwap.download_with_resume(url, dest)
+    assert read(dest) == SMALL
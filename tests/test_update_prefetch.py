@@ -0,0 +1,137 @@
+"""后台预下载：限速、临时目录中的原子落盘、重启后继续下载和安装前的完整性检查"""
+import hashlib
+import os
+import time
+
+import pytest
+
+import BOMSwap
+
+DATA = bytes(range(256)) * 2400  # 约600KB，单连接下载
+
+
+class FakeMaster:
+    """代替Tk主窗口，after中的函数立即执行"""
+    def after(self, ms, func):
+        func()
+
+
+@pytest.fixture
+def stage_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(BOMSwap, 'get_update_stage_dir', lambda: str(tmp_path / 'stage'))
+    return tmp_path / 'stage'
+
+
+@pytest.fixture
+def release(release_server, update_config):
+    """发布了v9.0，当前版本的发布信息已缓存"""
+    release_server.add_file('/new.exe', DATA)
+    release_server.release = {'tag_name': 'v9.0', 'body': '', 'zipball_url': '',
+                              'assets': [release_server.asset('/new.exe')]}
+    BOMSwap.fetch_latest_release(release_server.url('/api'))
+    return release_server
+
+
+def new_manager():
+    manager = BOMSwap.UpdateManager(FakeMaster())
+    manager.notifications = []
+    manager.show_update_notification = lambda: manager.notifications.append(manager.latest_version)
+    return manager
+
+
+def staged_path(release_server):
+    return BOMSwap.get_staged_update_path('9.0', release_server.url('/new.exe'), True)
+
+
+def test_rate_limiter_paces_consumption():
+    limiter = BOMSwap.RateLimiter(100 * 1024)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.consume(10 * 1024)
+    assert time.monotonic() - start >= 0.4
+
+
+def test_fetch_update_stages_verified_file(release, stage_dir):
+    path = staged_path(release)
+    url = release.url('/new.exe')
+    assert BOMSwap.fetch_update('2.5', '9.0', url, True, path)
+    assert open(path, 'rb').read() == DATA
+    assert not os.path.exists(path + '.part')
+    assert BOMSwap.is_staged_update_ready(path, url)
+
+
+def test_corrupt_staged_file_is_deleted(release, stage_dir):
+    path = staged_path(release)
+    url = release.url('/new.exe')
+    assert BOMSwap.fetch_update('2.5', '9.0', url, True, path)
+    with open(path, 'r+b') as f:
+        f.write(b'\0' * 100)
+    assert not BOMSwap.is_staged_update_ready(path, url)
+    assert not os.path.exists(path) and not os.path.exists(path + '.json')
+
+
+def test_staged_file_without_record_is_deleted(release, stage_dir):
+    path = staged_path(release)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(DATA)
+    assert not BOMSwap.is_staged_update_ready(path, release.url('/new.exe'))
+    assert not os.path.exists(path)
+
+
+def test_unverified_staged_file_needs_matching_size(release, stage_dir, update_config):
+    """没有发布校验和时，文件大小与发布信息不一致的下载不能安装"""
+    path = staged_path(release)
+    url = release.url('/new.exe')
+    asset = update_config['update_cache']['release']['assets'][0]
+    asset['digest'] = ''
+    assert BOMSwap.fetch_update('2.5', '9.0', url, True, path)
+    assert BOMSwap.is_staged_update_ready(path, url)
+    assert BOMSwap.fetch_update('2.5', '9.0', url, True, path)
+    asset['size'] = len(DATA) + 1
+    assert not BOMSwap.is_staged_update_ready(path, url)
+
+
+def test_prefetch_is_rate_limited_and_notifies(release, stage_dir):
+    manager = new_manager()
+    manager.latest_version, manager.download_url, manager.is_exe_update = '9.0', release.url('/new.exe'), True
+    start = time.monotonic()
+    manager.start_prefetch(limit_kbps=400)
+    manager.prefetch_thread.join(30)
+    elapsed = time.monotonic() - start
+    assert elapsed >= 0.8 * len(DATA) / (400 * 1024)
+    assert manager.notifications == ['9.0']
+    assert BOMSwap.is_staged_update_ready(staged_path(release), release.url('/new.exe'))
+
+
+def test_accepting_lifts_rate_limit(release, stage_dir):
+    manager = new_manager()
+    manager.latest_version, manager.download_url, manager.is_exe_update = '9.0', release.url('/new.exe'), True
+    start = time.monotonic()
+    manager.start_prefetch(limit_kbps=20)  # 不取消限速时约需30秒
+    time.sleep(0.5)
+    manager.prefetch_callbacks = (lambda *args: None, lambda message: None)
+    manager.prefetch_limiter.max_bytes_per_second = 0
+    manager.prefetch_thread.join(30)
+    assert time.monotonic() - start < 5
+    assert manager.notifications == []  # 用户已确认更新，由下载对话框继续处理
+    assert open(staged_path(release), 'rb').read() == DATA
+
+
+def test_prefetch_resumes_after_restart(release, stage_dir, update_config):
+    """程序关闭时留下的.part文件在下次启动时继续下载，且不重新联网检查更新"""
+    path = staged_path(release)
+    os.makedirs(os.path.dirname(path))
+    with open(path + '.part', 'wb') as f:
+        f.write(DATA[:4096])
+    update_config.update({'prefetch_updates': True, 'prefetch_limit_kbps': 0})
+    release.requests.clear()
+
+    manager = new_manager()
+    manager.check_updates_on_startup(delay=0)
+    manager.prefetch_thread.join(30)
+
+    assert ('/api', None) not in release.requests
+    assert ('/new.exe', 'bytes=4096-') in release.requests
+    assert open(path, 'rb').read() == DATA
+    assert manager.notifications == ['9.0']
@@ -0,0 +1,59 @@
+"""变体：不贴装位号的收集和去除，合并相同料号后变体列与位号一致"""
+import pandas as pd
+
+import BOMSwap
+from conftest import BOM_HEADER, SUB_HEADER, read_output, write_workbook
+
+COLS = BOMSwap.get_engine_columns(BOMSwap.get_builtin_default_config()['bom_header_mapping'],
+                                  BOMSwap.get_builtin_default_config()['sub_header_mapping'])
+
+
+def test_collect_dnp_designators():
+    rows = [
+        {'Reference': 'R1,R2', 'VarA': 'dnp', 'VarB': None},
+        {'Reference': 'C1,C2,C3', 'VarA': 'C2，C3', 'VarB': float('nan')},
+        {'Reference': 'U1', 'VarA': '  ', 'VarB': '不贴'},
+    ]
+    dnp = BOMSwap.collect_dnp_designators(rows, {'A': 'VarA', 'B': 'VarB'}, 'Reference', ['DNP', '不贴'])
+    assert dnp == {'A': {'R1', 'R2', 'C2', 'C3'}, 'B': {'U1'}}
+
+
+def test_apply_variant_dnp_removes_designators():
+    df = pd.DataFrame([
+        {'Item': '1.1', 'PN': 'P1', 'Reference': 'R1,R2', 'Quantity': 2, '操作类型': '保留', 'VarA': 'R1,R2'},
+        {'Item': '1.2', 'PN': 'S1', 'Reference': 'R1,R2', 'Quantity': 2, '操作类型': '替代插入', 'VarA': 'R1,R2'},
+        {'Item': '2', 'PN': 'P2', 'Reference': 'C1,C2', 'Quantity': 2, '操作类型': None, 'VarA': 'C2'},
+    ])
+    variant_df, ref_count, removed = BOMSwap.apply_variant_dnp(df, {'R1', 'R2', 'C2'}, COLS, drop_columns=['VarA'])
+    assert variant_df.to_dict('records') == [{'Item': '1', 'PN': 'P2', 'Reference': 'C1', 'Quantity': 1}]
+    assert (ref_count, removed) == (1, 3)
+
+
+def test_merged_row_variant_cell_matches_designators(tmp_path, run_engine):
+    """合并行的变体列来自多个原始行，主结果中应为合并后仍不贴装的位号，变体结果中保留贴装的位号"""
+    header = BOM_HEADER + ['VarA']
+    bom = write_workbook(tmp_path / 'bom.xlsx', header, [
+        ['1', 'P1', 'R', 'R1,R2', 2, '电阻', 'M1', 'F1', 'DNP'],
+        ['2', 'P2', 'C', 'C1', 1, '电容', 'M2', 'F2', None],
+        ['3', 'P1', 'R', 'R9', 1, '电阻', 'M1', 'F1', None],
+    ])
+    sub = write_workbook(tmp_path / 'sub.xlsx', SUB_HEADER, [
+        ['P2', 'C', '电容', 'M2', 'F2', 'g1'],
+        ['S2', 'C', '电容', 'M3', 'F3', 'g1'],
+    ])
+    output_files = run_engine(bom, sub, variant_columns=['VarA'])
+
+    columns, rows = read_output(output_files[0])
+    main = {row[columns.index('PN')]: row for row in rows}
+    merged = main['P1']
+    assert sorted(merged[columns.index('Reference')].split(',')) == ['R1', 'R2', 'R9']
+    assert merged[columns.index('VarA')] == 'R1,R2'
+    assert main['P2'][columns.index('VarA')] is None
+
+    variant_path = str(BOMSwap.get_variant_output_path(bom, 'VarA'))
+    assert variant_path in [str(path) for path in output_files]
+    columns, rows = read_output(variant_path)
+    assert 'VarA' not in columns
+    variant = {row[columns.index('PN')]: row for row in rows}
+    assert variant['P1'][columns.index('Reference')] == 'R9'
+    assert int(variant['P1'][columns.index('Quantity')]) == 1